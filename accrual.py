@@ -0,0 +1,262 @@
+"""Year-end accrual: close a leave year and open the next one.
+
+For every employee the job reads the closing balance from the leave ledger
+(see ``ledger.py``) and posts, in the ledger and in ``employees``:
+
+* ``expire`` of the whole closing balance, dated 31 December
+* ``carry_forward`` of up to ``LEAVE_CARRY_FORWARD_CAP`` unused days and a
+  ``grant`` of the annual allowance, dated 1 January of the new year
+* ``total_leaves`` = allowance + carried days, ``used_leaves`` = the days
+  already consumed in the new year (approvals made before the job ran)
+
+The allowance is what the employee was granted in the closing year, or
+``LEAVE_ANNUAL_ALLOWANCE`` if nothing was. A negative closing balance
+expires as well: overdrawn days are not taken from the next year.
+
+Employees are processed in ``emp_id`` order, ``LEAVE_ACCRUAL_CHUNK`` at a
+time, each chunk in its own short ``BEGIN IMMEDIATE`` transaction so the apps
+keep writing in between. The transaction also advances the year's row in
+``accrual_runs``; a crashed or interrupted run resumes after the last
+committed chunk, and a finished year is never closed twice::
+
+    python accrual.py --year 2026 --dry-run    # report the changes only
+    python accrual.py --year 2026              # run (or resume) the close
+"""
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date
+
+import numpy as np
+
+from database import begin_immediate, configure_connection
+from ledger import ALLOWANCE_KINDS, USAGE_KINDS
+
+ANNUAL_ALLOWANCE = int(os.environ.get('LEAVE_ANNUAL_ALLOWANCE', '20'))
+CARRY_FORWARD_CAP = int(os.environ.get('LEAVE_CARRY_FORWARD_CAP', '5'))
+ACCRUAL_CHUNK = int(os.environ.get('LEAVE_ACCRUAL_CHUNK', '500'))
+# Pause between chunks: SQLite wakes waiting writers by polling, so a job that
+# takes the lock again at once would starve the apps' writes
+ACCRUAL_PAUSE = float(os.environ.get('LEAVE_ACCRUAL_PAUSE', '0.05'))
+
+ACCRUAL_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS accrual_runs (
+        leave_year INTEGER PRIMARY KEY,
+        carry_cap INTEGER NOT NULL,
+        default_allowance INTEGER NOT NULL,
+        last_emp_id,
+        employees INTEGER NOT NULL DEFAULT 0,
+        carried INTEGER NOT NULL DEFAULT 0,
+        expired INTEGER NOT NULL DEFAULT 0,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+'''
+
+# Per employee of one chunk: current figures and what the ledger says about the year
+CHUNK_QUERY = f'''
+    WITH chunk AS (
+        SELECT emp_id, total_leaves, used_leaves FROM employees
+        {{where}}
+        ORDER BY emp_id LIMIT :limit
+    )
+    SELECT c.emp_id, c.total_leaves, c.used_leaves,
+           COUNT(CASE WHEN l.entry_date <= :close THEN 1 END),
+           COALESCE(SUM(CASE WHEN l.entry_date <= :close THEN l.days END), 0),
+           COALESCE(SUM(CASE WHEN l.kind = 'grant' AND l.entry_date BETWEEN :open AND :close
+                             THEN l.days END), 0),
+           COALESCE(SUM(CASE WHEN l.kind IN {ALLOWANCE_KINDS} AND l.entry_date > :close
+                             THEN l.days END), 0),
+           COALESCE(-SUM(CASE WHEN l.kind IN {USAGE_KINDS} AND l.entry_date > :close
+                              THEN l.days END), 0)
+    FROM chunk c
+    LEFT JOIN leave_ledger l ON l.emp_id = c.emp_id
+    GROUP BY c.emp_id
+    ORDER BY c.emp_id
+'''
+
+
+def install_accrual(conn):
+    """Checkpoint table of the year-end runs"""
+    conn.execute(ACCRUAL_SCHEMA)
+
+
+def get_run(conn, year):
+    """``(carry_cap, default_allowance, last_emp_id, employees, carried, expired, finished_at)`` or ``None``"""
+    return conn.execute('''
+        SELECT carry_cap, default_allowance, last_emp_id, employees, carried, expired, finished_at
+        FROM accrual_runs WHERE leave_year = ?
+    ''', (year,)).fetchone()
+
+
+def plan_chunk(conn, year, after, chunk_size, carry_cap, default_allowance):
+    """Read the next chunk after ``after`` and compute its close; ``None`` when done
+
+    Returns a dict of arrays over the employees that have ledger history up
+    to the end of ``year`` (employees who joined later already have their
+    opening grant), plus ``last_emp_id`` - the chunk's last key, which
+    includes skipped employees.
+    """
+    where = 'WHERE emp_id > :after' if after is not None else ''
+    rows = conn.execute(CHUNK_QUERY.format(where=where), {
+        'after': after, 'limit': chunk_size,
+        'open': f'{year}-01-01', 'close': f'{year}-12-31',
+    }).fetchall()
+    if not rows:
+        return None
+    emp_ids = np.array([row[0] for row in rows], dtype=object)
+    total, used, history, closing, granted, new_allowance, new_usage = (
+        np.array([row[1:] for row in rows], dtype=np.int64).T)
+    keep = history > 0
+    closing, granted = closing[keep], granted[keep]
+    allowance = np.where(granted > 0, granted, default_allowance)
+    carried = np.clip(closing, 0, carry_cap)
+    return {
+        'last_emp_id': rows[-1][0],
+        'emp_ids': emp_ids[keep],
+        'old_total': total[keep], 'old_used': used[keep],
+        'closing': closing, 'carried': carried, 'allowance': allowance,
+        'new_total': allowance + carried + new_allowance[keep],
+        'new_used': new_usage[keep],
+    }
+
+
+def apply_chunk(conn, year, plan):
+    """Post the chunk's ledger entries and new balances (inside the caller's transaction)"""
+    close, new_year = f'{year}-12-31', f'{year + 1}-01-01'
+    note = f'year-end {year}'
+    entries = []
+    for i, emp_id in enumerate(plan['emp_ids']):
+        if plan['closing'][i]:
+            entries.append((emp_id, close, 'expire', -int(plan['closing'][i]), note))
+        if plan['carried'][i]:
+            entries.append((emp_id, new_year, 'carry_forward', int(plan['carried'][i]), note))
+        entries.append((emp_id, new_year, 'grant', int(plan['allowance'][i]), note))
+    conn.executemany('INSERT INTO leave_ledger (emp_id, entry_date, kind, days, note) VALUES (?, ?, ?, ?, ?)',
+                     entries)
+    conn.executemany('UPDATE employees SET total_leaves = ?, used_leaves = ? WHERE emp_id = ?',
+                     zip(plan['new_total'].tolist(), plan['new_used'].tolist(), plan['emp_ids']))
+    # The balance is zero once the year is closed; later snapshots now miss the new entries
+    conn.executemany('DELETE FROM leave_balance_snapshots WHERE emp_id = ? AND snapshot_date > ?',
+                     ((emp_id, close) for emp_id in plan['emp_ids']))
+    conn.executemany('INSERT OR REPLACE INTO leave_balance_snapshots (emp_id, snapshot_date, balance) '
+                     'VALUES (?, ?, 0)', ((emp_id, close) for emp_id in plan['emp_ids']))
+
+
+def close_year(conn, year, chunk_size=ACCRUAL_CHUNK, carry_cap=CARRY_FORWARD_CAP,
+               default_allowance=ANNUAL_ALLOWANCE, dry_run=False, on_chunk=None, pause=ACCRUAL_PAUSE):
+    """Close ``year`` chunk by chunk, resuming from its checkpoint; returns run statistics
+
+    With ``dry_run`` nothing is written and the per-chunk plans are passed to
+    ``on_chunk(plan, stats)`` for reporting; otherwise ``on_chunk`` gets each
+    committed chunk. A resumed run keeps the carry cap and default allowance
+    it was started with.
+    """
+    run = get_run(conn, year)
+    if run and run[6]:
+        raise ValueError(f'Leave year {year} was already closed on {run[6]}')
+    if run:
+        carry_cap, default_allowance, after = run[0], run[1], run[2]
+    else:
+        after = None
+        if not dry_run:
+            with conn:
+                conn.execute('INSERT INTO accrual_runs (leave_year, carry_cap, default_allowance) VALUES (?, ?, ?)',
+                             (year, carry_cap, default_allowance))
+
+    stats = {'year': year, 'resumed': bool(run), 'chunks': 0, 'employees': 0, 'carried': 0,
+             'expired': 0, 'lock_ms': [], 'seconds': 0.0}
+    started = time.perf_counter()
+    while True:
+        chunk_started = time.perf_counter()
+        if dry_run:
+            plan = plan_chunk(conn, year, after, chunk_size, carry_cap, default_allowance)
+        else:
+            begin_immediate(conn)
+            try:
+                plan = plan_chunk(conn, year, after, chunk_size, carry_cap, default_allowance)
+                if plan is None:
+                    conn.execute("UPDATE accrual_runs SET finished_at = CURRENT_TIMESTAMP WHERE leave_year = ?",
+                                 (year,))
+                else:
+                    apply_chunk(conn, year, plan)
+                    conn.execute('''
+                        UPDATE accrual_runs
+                        SET last_emp_id = ?, employees = employees + ?,
+                            carried = carried + ?, expired = expired + ?
+                        WHERE leave_year = ?
+                    ''', (plan['last_emp_id'], len(plan['emp_ids']), int(plan['carried'].sum()),
+                          int((plan['closing'] - plan['carried']).sum()), year))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if plan is None:
+            break
+        after = plan['last_emp_id']
+        stats['chunks'] += 1
+        stats['employees'] += len(plan['emp_ids'])
+        stats['carried'] += int(plan['carried'].sum())
+        stats['expired'] += int((plan['closing'] - plan['carried']).sum())
+        stats['lock_ms'].append((time.perf_counter() - chunk_started) * 1000)
+        stats['seconds'] = time.perf_counter() - started
+        if on_chunk:
+            on_chunk(plan, stats)
+        if not dry_run:
+            time.sleep(pause)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Close a leave year: carry forward and grant allowances')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--year', type=int, default=date.today().year - 1, help='leave year to close')
+    parser.add_argument('--dry-run', action='store_true', help='report the changes without writing')
+    parser.add_argument('--chunk-size', type=int, default=ACCRUAL_CHUNK)
+    parser.add_argument('--carry-cap', type=int, default=CARRY_FORWARD_CAP)
+    parser.add_argument('--allowance', type=int, default=ANNUAL_ALLOWANCE,
+                        help='allowance of employees granted nothing in the closing year')
+    parser.add_argument('--limit', type=int, default=20, help='employees to list in a dry run')
+    args = parser.parse_args()
+    if date(args.year, 12, 31) >= date.today():
+        parser.error(f'Leave year {args.year} has not ended yet')
+
+    from database import DB_PATH
+    from migrations import run_migrations
+
+    listed = []
+
+    def report(plan, stats):
+        if args.dry_run and len(listed) < args.limit:
+            for i in range(min(len(plan['emp_ids']), args.limit - len(listed))):
+                listed.append(f"employee {plan['emp_ids'][i]}: total {plan['old_total'][i]} -> "
+                              f"{plan['new_total'][i]}, used {plan['old_used'][i]} -> {plan['new_used'][i]}, "
+                              f"closing balance {plan['closing'][i]}, carried {plan['carried'][i]}")
+                print(listed[-1])
+        if stats['chunks'] % 10 == 0:
+            print(f"  {stats['employees']:,} employees, "
+                  f"{stats['employees'] / max(stats['seconds'], 1e-9):,.0f}/s", flush=True)
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        run_migrations(conn)
+        try:
+            stats = close_year(conn, args.year, args.chunk_size, args.carry_cap, args.allowance,
+                               args.dry_run, report)
+        except ValueError as e:
+            parser.error(str(e))
+    finally:
+        conn.close()
+
+    lock_ms = np.array(stats['lock_ms'] or [0.0])
+    print(f"{'Would close' if args.dry_run else 'Closed'} {args.year}{' (resumed)' if stats['resumed'] else ''}: "
+          f"{stats['employees']:,} employees in {stats['chunks']} chunks, {stats['carried']:,} days carried, "
+          f"{stats['expired']:,} days expired, {stats['seconds']:.2f}s "
+          f"({stats['employees'] / max(stats['seconds'], 1e-9):,.0f} employees/s, per chunk "
+          f"p50 {np.percentile(lock_ms, 50):.1f} ms, max {lock_ms.max():.1f} ms)")
+
+
+if __name__ == '__main__':
+    main()
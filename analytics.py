@@ -0,0 +1,238 @@
+"""Department analytics from pre-aggregated monthly rollups.
+
+``leave_rollups`` holds one row per department, month, leave type and status
+with the number of requests and their days. A request counts in the month it
+starts and under its employee's department. Triggers on ``leave_requests``
+(insert, delete, and updates of status, days, type, start date or employee)
+and on ``employees`` (department changes) keep the rows exact in the same
+transaction as the change, so reports over years of data read a few
+thousand rollup rows instead of scanning ``leave_requests``. Requests of
+archived years (see ``archive``) stay in the rollups, under the department
+their employee had when the year was archived.
+
+Check the rollups against the requests, or rebuild them, with::
+
+    python analytics.py --check
+    python analytics.py --rebuild
+    python analytics.py --report 2026-01 2026-12
+"""
+import argparse
+import sqlite3
+from itertools import chain
+
+import database
+from archive import hot_exclusion, iter_archived, read_catalog, read_snapshot
+from database import configure_connection, execute_script
+
+DIMENSIONS = ('department', 'month', 'leave_type', 'status')
+
+# Department of the request's employee ('' if the employee is missing)
+_DEPARTMENT = "COALESCE((SELECT department FROM employees WHERE emp_id = {row}.emp_id), '')"
+
+ROLLUP_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS leave_rollups (
+        department TEXT NOT NULL,
+        month TEXT NOT NULL,
+        leave_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        requests INTEGER NOT NULL,
+        days INTEGER NOT NULL,
+        PRIMARY KEY (department, month, leave_type, status)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_rollups_insert
+    AFTER INSERT ON leave_requests
+    BEGIN
+        INSERT INTO leave_rollups (department, month, leave_type, status, requests, days)
+        VALUES ({_DEPARTMENT.format(row='NEW')}, substr(NEW.start_date, 1, 7),
+                NEW.leave_type, NEW.status, 1, NEW.days)
+        ON CONFLICT (department, month, leave_type, status) DO UPDATE
+        SET requests = requests + 1, days = days + excluded.days;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_rollups_delete
+    AFTER DELETE ON leave_requests
+    BEGIN
+        UPDATE leave_rollups SET requests = requests - 1, days = days - OLD.days
+        WHERE department = {_DEPARTMENT.format(row='OLD')} AND month = substr(OLD.start_date, 1, 7)
+          AND leave_type = OLD.leave_type AND status = OLD.status;
+        DELETE FROM leave_rollups WHERE requests = 0
+          AND department = {_DEPARTMENT.format(row='OLD')} AND month = substr(OLD.start_date, 1, 7)
+          AND leave_type = OLD.leave_type AND status = OLD.status;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_rollups_update
+    AFTER UPDATE OF status, days, leave_type, start_date, emp_id ON leave_requests
+    WHEN OLD.status IS NOT NEW.status OR OLD.days IS NOT NEW.days OR OLD.leave_type IS NOT NEW.leave_type
+      OR substr(OLD.start_date, 1, 7) IS NOT substr(NEW.start_date, 1, 7) OR OLD.emp_id IS NOT NEW.emp_id
+    BEGIN
+        UPDATE leave_rollups SET requests = requests - 1, days = days - OLD.days
+        WHERE department = {_DEPARTMENT.format(row='OLD')} AND month = substr(OLD.start_date, 1, 7)
+          AND leave_type = OLD.leave_type AND status = OLD.status;
+        DELETE FROM leave_rollups WHERE requests = 0
+          AND department = {_DEPARTMENT.format(row='OLD')} AND month = substr(OLD.start_date, 1, 7)
+          AND leave_type = OLD.leave_type AND status = OLD.status;
+        INSERT INTO leave_rollups (department, month, leave_type, status, requests, days)
+        VALUES ({_DEPARTMENT.format(row='NEW')}, substr(NEW.start_date, 1, 7),
+                NEW.leave_type, NEW.status, 1, NEW.days)
+        ON CONFLICT (department, month, leave_type, status) DO UPDATE
+        SET requests = requests + 1, days = days + excluded.days;
+    END;
+
+    -- Moving an employee moves their requests to the new department
+    CREATE TRIGGER IF NOT EXISTS trg_leave_rollups_department
+    AFTER UPDATE OF department ON employees
+    WHEN OLD.department IS NOT NEW.department
+    BEGIN
+        UPDATE leave_rollups
+        SET requests = requests - moved.moved_requests, days = days - moved.moved_days
+        FROM (SELECT substr(start_date, 1, 7) AS month, leave_type, status,
+                     COUNT(*) AS moved_requests, SUM(days) AS moved_days
+              FROM leave_requests WHERE emp_id = NEW.emp_id
+              GROUP BY 1, 2, 3) AS moved
+        WHERE leave_rollups.department = OLD.department AND leave_rollups.month = moved.month
+          AND leave_rollups.leave_type = moved.leave_type AND leave_rollups.status = moved.status;
+        DELETE FROM leave_rollups WHERE department = OLD.department AND requests = 0;
+        INSERT INTO leave_rollups (department, month, leave_type, status, requests, days)
+        SELECT NEW.department, substr(start_date, 1, 7), leave_type, status, COUNT(*), SUM(days)
+        FROM leave_requests WHERE emp_id = NEW.emp_id
+        GROUP BY 2, 3, 4
+        ON CONFLICT (department, month, leave_type, status) DO UPDATE
+        SET requests = requests + excluded.requests, days = days + excluded.days;
+    END;
+'''
+
+# The rollup of the hot table computed from scratch, without the rows of {where}
+ROLLUP_QUERY = '''
+    SELECT COALESCE(e.department, ''), substr(lr.start_date, 1, 7), lr.leave_type, lr.status,
+           COUNT(*), SUM(lr.days)
+    FROM leave_requests lr
+    LEFT JOIN employees e ON e.emp_id = lr.emp_id
+    {where}
+    GROUP BY 1, 2, 3, 4
+'''
+
+# The rollup of an archived year, under the departments its employees had when it was archived
+ARCHIVED_ROLLUP_QUERY = '''
+    SELECT COALESCE(d.department, ''), substr(lr.start_date, 1, 7), lr.leave_type, lr.status,
+           COUNT(*), SUM(lr.days)
+    FROM leave_requests lr
+    LEFT JOIN employee_departments d ON d.emp_id = lr.emp_id
+    GROUP BY 1, 2, 3, 4
+'''
+
+
+def install_rollups(conn):
+    """Create the rollup table and triggers, then fill it from the data"""
+    execute_script(conn, ROLLUP_SCHEMA)
+    rebuild_rollups(conn)
+
+
+def expected_rollups(conn, catalog):
+    """``{key: (requests, days)}`` computed from the hot table and the archived years of ``catalog``"""
+    clauses, params = hot_exclusion(catalog)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    expected = {}
+    for row in chain(conn.execute(ROLLUP_QUERY.format(where=where), params),
+                     iter_archived(conn, catalog, ARCHIVED_ROLLUP_QUERY)):
+        requests, days = expected.get(row[:4], (0, 0))
+        expected[row[:4]] = (requests + row[4], days + row[5])
+    return expected
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup row from ``leave_requests`` and the archived years"""
+    expected = expected_rollups(conn, read_catalog(conn))
+    conn.execute('DELETE FROM leave_rollups')
+    conn.executemany('''
+        INSERT INTO leave_rollups (department, month, leave_type, status, requests, days)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [key + totals for key, totals in sorted(expected.items())])
+
+
+def check_rollups(conn):
+    """Rollup rows that differ from a from-scratch aggregate, as ``(key, stored, expected)``"""
+    with read_snapshot(conn) as catalog:
+        stored = {row[:4]: row[4:] for row in conn.execute(
+            'SELECT department, month, leave_type, status, requests, days FROM leave_rollups')}
+        expected = expected_rollups(conn, catalog)
+    return [(key, stored.get(key), expected.get(key))
+            for key in sorted(stored.keys() | expected.keys())
+            if stored.get(key) != expected.get(key)]
+
+
+def query_rollups(conn, month_from, month_to, department=None, group_by=DIMENSIONS):
+    """Requests and days per ``group_by`` combination for months ``month_from``..``month_to``
+
+    Months are ``YYYY-MM`` strings (or dates). Returns ``(*group_by values,
+    requests, days)`` tuples ordered by the grouping columns.
+    """
+    group_by = tuple(group_by)
+    if not group_by or any(column not in DIMENSIONS for column in group_by):
+        raise ValueError(f'group_by must be a non-empty subset of {", ".join(DIMENSIONS)}')
+    columns = ', '.join(group_by)
+    clauses, params = ['month BETWEEN ? AND ?'], [str(month_from)[:7], str(month_to)[:7]]
+    if department is not None:
+        clauses.append('department = ?')
+        params.append(department)
+    return conn.execute(f'''
+        SELECT {columns}, SUM(requests), SUM(days)
+        FROM leave_rollups
+        WHERE {' AND '.join(clauses)}
+        GROUP BY {columns}
+        ORDER BY {columns}
+    ''', params).fetchall()
+
+
+def department_balances(conn, exclude=()):
+    """Head count and summed balances per department, computed in SQL
+
+    Returns ``(department, employees, total, used, reserved, available)``
+    tuples; ``exclude`` lists employee ids left out (e.g. the admin account).
+    """
+    placeholders = ', '.join('?' * len(exclude))
+    where = f'WHERE emp_id NOT IN ({placeholders})' if exclude else ''
+    return conn.execute(f'''
+        SELECT department, COUNT(*), SUM(total_leaves), SUM(used_leaves), SUM(reserved_leaves),
+               SUM(total_leaves - used_leaves - reserved_leaves)
+        FROM employees
+        {where}
+        GROUP BY department
+        ORDER BY department
+    ''', tuple(exclude)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or repair the department analytics rollups')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--check', action='store_true', help='compare the rollups with the requests')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from scratch')
+    parser.add_argument('--report', nargs=2, metavar=('FROM', 'TO'),
+                        help='approved days per department and month, e.g. 2026-01 2026-12')
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        if args.rebuild:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_rollups(conn)
+            conn.commit()
+            print('Rollups rebuilt')
+        if args.check:
+            problems = check_rollups(conn)
+            for key, stored, expected in problems[:50]:
+                print(f'{key}: stored {stored}, expected {expected}')
+            print(f'{len(problems)} rollup rows differ from the requests')
+            if problems:
+                raise SystemExit(1)
+        if args.report:
+            for department, month, status, requests, days in query_rollups(
+                    conn, *args.report, group_by=('department', 'month', 'status')):
+                if status == 'Approved':
+                    print(f'{department:<20} {month}  {requests:6,} requests  {days:8,} days')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
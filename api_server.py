@@ -0,0 +1,490 @@
+"""Headless JSON HTTP API over ``leave_service``.
+
+HR integrations call this instead of driving the Streamlit UI. It is built
+on the standard library only: an ``HTTPServer`` whose accepted connections
+are handled by a bounded ``ThreadPoolExecutor``, with database access going
+through the shared connection pool and query cache of the service layer.
+When the pool is saturated the accept loop blocks, so excess clients wait in
+the listen backlog instead of piling up threads.
+
+Endpoints (all bodies and responses are JSON):
+
+    GET  /api/health
+    GET  /api/leaves?emp_id=&manager_id=&status=&leave_type=&department=&date_from=&date_to=&cursor=&page_size=
+    POST /api/leaves                     {emp_id, leave_type, start_date, end_date, reason}
+    POST /api/leaves/<id>/approve        {manager_id}
+    POST /api/leaves/<id>/reject         {manager_id}
+    POST /api/leaves/decisions           {manager_id, decisions: [{request_id, status}, ...]}
+    GET  /api/inbox?manager_id=&department=&cursor=&page_size=   (requests awaiting that approver, oldest first)
+    GET  /api/stats[?emp_id=]
+    GET  /api/balance?emp_id=&date=       (balance at the end of a date, default today)
+    GET  /api/calendar?department=&start=&end=   (defaults to the current month)
+    GET  /api/analytics?from=&to=&department=&group_by=   (months as YYYY-MM, default this year)
+    GET  /api/export?format=csv|xlsx&status=&department=&date_from=&date_to=&manager_id=   (file download)
+
+``status``/``leave_type`` accept comma-separated lists; ``manager_id`` limits
+lists and exports to that manager's direct and indirect reports. Employee ids
+are numbers (``1002``) or, for employees created by ``app.py``, text
+(``EMP001``); both are accepted wherever an ``emp_id`` or ``manager_id`` is
+expected. Decisions act
+on the request's current approval step (see ``workflow``): an approval with a
+further step in the chain is forwarded (202) and the request stays pending;
+decisions on steps waiting for someone else are refused (403).
+Exports are streamed as they are encoded, without a Content-Length; the end
+of the body is marked by closing the connection. List responses carry an
+opaque ``next_cursor`` to pass back for the following page. If
+``LEAVE_API_TOKEN`` is set, requests must send ``Authorization: Bearer <token>``.
+
+Usage:
+    python api_server.py [--host 127.0.0.1] [--port 8080] [--workers N] [--db PATH]
+"""
+import argparse
+import base64
+import hmac
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import database
+import leave_service
+from analytics import DIMENSIONS
+from batch_updates import CONFLICT, FORBIDDEN, FORWARDED, INVALID, NOT_FOUND, UPDATED, summarize_batch
+from database import PoolTimeout
+from export import CONTENT_TYPES, FORMATS
+from leave_queries import PAGE_SIZE
+from storage import employee_key
+from team_calendar import calendar_to_json, month_bounds
+
+# Configuration (overridable through the environment)
+API_HOST = os.environ.get('LEAVE_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('LEAVE_API_PORT', '8080'))
+API_WORKERS = int(os.environ.get('LEAVE_API_WORKERS', str(database.POOL_SIZE)))
+API_TOKEN = os.environ.get('LEAVE_API_TOKEN')
+MAX_PAGE_SIZE = 500
+MAX_BODY_BYTES = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+# Batch outcome -> HTTP status for single-request decisions
+DECISION_STATUS = {
+    UPDATED: HTTPStatus.OK,
+    CONFLICT: HTTPStatus.CONFLICT,
+    NOT_FOUND: HTTPStatus.NOT_FOUND,
+    INVALID: HTTPStatus.BAD_REQUEST,
+    FORBIDDEN: HTTPStatus.FORBIDDEN,
+    FORWARDED: HTTPStatus.ACCEPTED,
+}
+
+
+class ApiError(Exception):
+    """An error that is reported to the client with ``status``"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class FileDownload:
+    """Endpoint payload sent as an attachment: ``first`` then the rest of ``blocks``
+
+    ``blocks`` is a generator; it is closed once sent or when the client goes away.
+    """
+
+    def __init__(self, filename, content_type, first, blocks):
+        self.filename = filename
+        self.content_type = content_type
+        self.first = first
+        self.blocks = blocks
+
+
+def encode_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        applied_date, request_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return applied_date, int(request_id)
+    except (ValueError, TypeError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'Invalid cursor')
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'{name} must be an integer')
+
+
+def _emp_id(value, name):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'{name} must be an employee id')
+    return employee_key(value)
+
+
+def _date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'{name} must be a YYYY-MM-DD date')
+
+
+def _str(value, name):
+    if not isinstance(value, str):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'{name} must be a string')
+    return value
+
+
+def _require_manager(manager_id):
+    manager = leave_service.get_employee(_emp_id(manager_id, 'manager_id'))
+    if manager is None or (manager['role'] != 'Manager'
+                           and not leave_service.get_approver_stages(manager['emp_id'])):
+        raise ApiError(HTTPStatus.FORBIDDEN, 'manager_id is not a manager or approver')
+    return manager['emp_id']
+
+
+# Endpoint implementations: (query, body, *path groups) -> (status, payload)
+def health(query, body):
+    return HTTPStatus.OK, {'status': 'ok'}
+
+
+def _values(query, name):
+    if name not in query:
+        return None
+    return sorted({item for value in query[name] for item in value.split(',') if item})
+
+
+def list_leaves(query, body):
+    def values(name):
+        return _values(query, name)
+
+    def single(name):
+        return query[name][-1] if name in query else None
+
+    cursor = decode_cursor(single('cursor'))
+    page_size = _int(single('page_size') or PAGE_SIZE, 'page_size')
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'page_size must be between 1 and {MAX_PAGE_SIZE}')
+    statuses = values('status')
+    if single('emp_id') is not None:
+        if any(name in query for name in ('department', 'date_from', 'date_to', 'manager_id')):
+            raise ApiError(HTTPStatus.BAD_REQUEST,
+                           'department/date/manager filters are not supported together with emp_id')
+        records, next_cursor = leave_service.list_employee_leaves(
+            _emp_id(single('emp_id'), 'emp_id'), statuses, values('leave_type'), cursor, page_size)
+    else:
+        if 'leave_type' in query:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'leave_type filter requires emp_id')
+        date_from, date_to = single('date_from'), single('date_to')
+        manager_id = single('manager_id')
+        records, next_cursor = leave_service.list_leave_requests(
+            statuses, single('department'),
+            _date(date_from, 'date_from') if date_from else None,
+            _date(date_to, 'date_to') if date_to else None,
+            cursor, page_size,
+            _emp_id(manager_id, 'manager_id') if manager_id is not None else None)
+    return HTTPStatus.OK, {'items': records, 'next_cursor': encode_cursor(next_cursor)}
+
+
+def inbox(query, body):
+    def single(name):
+        return query[name][-1] if name in query else None
+
+    manager_id = _require_manager(single('manager_id'))
+    cursor = decode_cursor(single('cursor'))
+    page_size = _int(single('page_size') or PAGE_SIZE, 'page_size')
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'page_size must be between 1 and {MAX_PAGE_SIZE}')
+    department = single('department')
+    records, next_cursor = leave_service.list_inbox(manager_id, department, cursor, page_size)
+    return HTTPStatus.OK, {'items': records, 'next_cursor': encode_cursor(next_cursor),
+                           'total': leave_service.count_inbox_requests(manager_id, department)}
+
+
+def create_leave(query, body):
+    for name in ('emp_id', 'leave_type', 'start_date', 'end_date', 'reason'):
+        if name not in body:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f'{name} is required')
+    request_id = leave_service.apply_leave(
+        _emp_id(body['emp_id'], 'emp_id'), _str(body['leave_type'], 'leave_type'),
+        _date(body['start_date'], 'start_date'), _date(body['end_date'], 'end_date'),
+        _str(body['reason'], 'reason'))
+    return HTTPStatus.CREATED, {'request_id': request_id}
+
+
+def decide_leave(query, body, request_id, action):
+    manager_id = _require_manager(body.get('manager_id'))
+    status = 'Approved' if action == 'approve' else 'Rejected'
+    result, = leave_service.update_leave_statuses([(int(request_id), status)], manager_id)
+    return DECISION_STATUS[result['result']], result
+
+
+def decide_leaves(query, body):
+    manager_id = _require_manager(body.get('manager_id'))
+    decisions = body.get('decisions')
+    if not isinstance(decisions, list):
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'decisions must be a list')
+    try:
+        pairs = [(_int(item['request_id'], 'request_id'), item['status']) for item in decisions]
+    except (KeyError, TypeError):
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'each decision needs request_id and status')
+    results = leave_service.update_leave_statuses(pairs, manager_id)
+    return HTTPStatus.OK, {'results': results, 'summary': summarize_batch(results)}
+
+
+def stats(query, body):
+    if 'emp_id' not in query:
+        return HTTPStatus.OK, {'requests': leave_service.get_leave_counters()}
+    emp_id = _emp_id(query['emp_id'][-1], 'emp_id')
+    balance = leave_service.get_leave_statistics(emp_id)
+    if balance is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f'Unknown employee {emp_id}')
+    return HTTPStatus.OK, {'balance': balance, 'requests': leave_service.get_leave_counters(emp_id)}
+
+
+def balance(query, body):
+    if 'emp_id' not in query:
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'emp_id is required')
+    emp_id = _emp_id(query['emp_id'][-1], 'emp_id')
+    on_date = _date(query['date'][-1], 'date') if 'date' in query else date.today()
+    result = leave_service.get_balance_on(emp_id, on_date)
+    if result is None:
+        raise ApiError(HTTPStatus.NOT_FOUND, f'Unknown employee {emp_id}')
+    return HTTPStatus.OK, {'emp_id': emp_id, 'date': on_date.isoformat(), 'balance': result}
+
+
+def analytics(query, body):
+    def month(name, default):
+        value = query[name][-1] if name in query else default
+        if not re.fullmatch(r'\d{4}-\d{2}', value):
+            raise ApiError(HTTPStatus.BAD_REQUEST, f'{name} must be a YYYY-MM month')
+        return value
+
+    year = date.today().year
+    group_by = query['group_by'][-1].split(',') if 'group_by' in query else list(DIMENSIONS)
+    department = query['department'][-1] if 'department' in query else None
+    try:
+        rows = leave_service.get_department_analytics(
+            month('from', f'{year}-01'), month('to', f'{year}-12'), department, tuple(group_by))
+    except ValueError as e:
+        raise ApiError(HTTPStatus.BAD_REQUEST, str(e))
+    return HTTPStatus.OK, {'items': rows, 'departments': leave_service.get_department_balances()}
+
+
+def export(query, body):
+    fmt = query['format'][-1] if 'format' in query else 'csv'
+    if fmt not in FORMATS:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f'format must be one of {", ".join(FORMATS)}')
+    date_from = _date(query['date_from'][-1], 'date_from') if 'date_from' in query else None
+    date_to = _date(query['date_to'][-1], 'date_to') if 'date_to' in query else None
+    department = query['department'][-1] if 'department' in query else None
+    manager_id = _emp_id(query['manager_id'][-1], 'manager_id') if 'manager_id' in query else None
+    blocks = leave_service.export_leaves(fmt, _values(query, 'status'), department, date_from, date_to,
+                                         manager_id)
+    # Start the query here so that a busy pool is still reported as a JSON error
+    first = next(blocks)
+    return HTTPStatus.OK, FileDownload(f'leave_requests_{date.today():%Y%m%d}.{fmt}',
+                                       CONTENT_TYPES[fmt], first, blocks)
+
+
+def calendar(query, body):
+    if 'department' not in query:
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'department is required')
+    today = date.today()
+    first, last = month_bounds(today.year, today.month)
+    start = _date(query['start'][-1], 'start') if 'start' in query else first
+    end = _date(query['end'][-1], 'end') if 'end' in query else last
+    try:
+        result = leave_service.get_team_calendar(query['department'][-1], start, end)
+    except ValueError as e:
+        raise ApiError(HTTPStatus.BAD_REQUEST, str(e))
+    return HTTPStatus.OK, calendar_to_json(result)
+
+
+ROUTES = [
+    ('GET', re.compile(r'/api/health'), health),
+    ('GET', re.compile(r'/api/leaves'), list_leaves),
+    ('POST', re.compile(r'/api/leaves'), create_leave),
+    ('POST', re.compile(r'/api/leaves/decisions'), decide_leaves),
+    ('POST', re.compile(r'/api/leaves/(\d+)/(approve|reject)'), decide_leave),
+    ('GET', re.compile(r'/api/inbox'), inbox),
+    ('GET', re.compile(r'/api/stats'), stats),
+    ('GET', re.compile(r'/api/balance'), balance),
+    ('GET', re.compile(r'/api/calendar'), calendar),
+    ('GET', re.compile(r'/api/analytics'), analytics),
+    ('GET', re.compile(r'/api/export'), export),
+]
+
+
+class LeaveAPIHandler(BaseHTTPRequestHandler):
+    """Routes requests to the endpoint functions and serializes their results"""
+
+    server_version = 'LeaveAPI/1.0'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        try:
+            if API_TOKEN and not hmac.compare_digest(
+                    self.headers.get('Authorization', ''), f'Bearer {API_TOKEN}'):
+                raise ApiError(HTTPStatus.UNAUTHORIZED, 'Missing or invalid API token')
+            endpoint, groups = self._route(method, url.path)
+            body = self._read_body() if method == 'POST' else {}
+            status, payload = endpoint(parse_qs(url.query), body, *groups)
+        except ApiError as e:
+            status, payload = e.status, {'error': str(e)}
+        except leave_service.LeaveValidationError as e:
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+        except PoolTimeout:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Database busy, retry later'}
+        except Exception:
+            logger.exception('Unhandled error for %s %s', method, self.path)
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error'}
+        if isinstance(payload, FileDownload):
+            self._send_file(status, payload)
+        else:
+            self._send_json(status, payload)
+
+    def _route(self, method, path):
+        allowed = False
+        for route_method, pattern, endpoint in ROUTES:
+            match = pattern.fullmatch(path)
+            if match:
+                if route_method == method:
+                    return endpoint, match.groups()
+                allowed = True
+        if allowed:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, f'{method} not allowed on {path}')
+        raise ApiError(HTTPStatus.NOT_FOUND, f'No endpoint {path}')
+
+    def _read_body(self):
+        length = _int(self.headers.get('Content-Length') or 0, 'Content-Length')
+        if length > MAX_BODY_BYTES:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Body is not valid JSON')
+        if not isinstance(body, dict):
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'Body must be a JSON object')
+        return body
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_file(self, status, download):
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', download.content_type)
+            self.send_header('Content-Disposition', f'attachment; filename="{download.filename}"')
+            self.end_headers()
+            self.wfile.write(download.first)
+            for block in download.blocks:
+                self.wfile.write(block)
+        except ConnectionError:
+            logger.info('%s - download aborted by the client', self.address_string())
+            self.close_connection = True
+        except Exception:
+            # The headers are already sent; all that is left is to drop the connection
+            logger.exception('Download to %s failed', self.address_string())
+            self.close_connection = True
+        finally:
+            download.blocks.close()
+
+    def log_message(self, format, *args):
+        logger.info('%s - %s', self.address_string(), format % args)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that hands each connection to a fixed-size worker pool
+
+    At most ``workers`` connections are handled at once and ``workers`` more
+    may wait for a worker; beyond that the accept loop blocks.
+    """
+
+    # socketserver's default listen backlog of 5 resets connections under bursts
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=API_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self._in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def process_request(self, request, client_address):
+        self._in_flight.acquire()
+        self.executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._in_flight.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+
+def make_server(host=API_HOST, port=API_PORT, workers=API_WORKERS):
+    """Create (but do not start) the API server; ``port=0`` picks a free port"""
+    return PooledHTTPServer((host, port), LeaveAPIHandler, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the leave JSON API')
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--workers', type=int, default=API_WORKERS,
+                        help='worker threads (keep <= LEAVE_DB_POOL_SIZE)')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    if args.db:
+        database.set_db_path(args.db)
+    leave_service.ensure_schema()
+
+    server = make_server(args.host, args.port, args.workers)
+    print(f'Leave API listening on http://{args.host}:{server.server_port} '
+          f'({args.workers} workers, database {database.DB_PATH})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,27 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
 from datetime import datetime, timedelta
 import hashlib
 
+from bootstrap import bootstrap, script_run, startup_report
+from schema import CANONICAL
+from styles import APP_STYLE
+from passwords import HashingBusy
+from cache import query_cache
+from batch_updates import FORWARDED, UPDATED, summarize_batch
+from analytics import DIMENSIONS
+from leave_queries import PAGE_SIZE
+from team_calendar import calendar_frames
+from export import CONTENT_TYPES, spool_export
+# Business logic lives in the service layer, shared with leave_management.py and the JSON API
+import leave_service
+from leave_service import (
+    APP_LEAVE_TYPES, EMPLOYEE_BALANCE_COLUMNS, EMPLOYEE_LEAVE_COLUMNS, INBOX_COLUMNS, LEAVE_REQUEST_COLUMNS,
+    LeaveValidationError, apply_leave, authenticate_employee, count_inbox_requests, count_leave_requests,
+    get_approver_stages, get_department_analytics, get_department_names, get_leave_counters,
+    get_leave_statistics, get_report_count, get_team_calendar, list_employee_balances, list_employee_leaves,
+    list_inbox, list_leave_requests,
+)
+
 # Page configuration
 st.set_page_config(
     page_title="ACME Leave Management System",
@@ -12,390 +30,113 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Custom CSS for modern styling
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    * {
-        font-family: 'Inter', sans-serif;
-    }
-    
-    .main {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 2rem;
-    }
-    
-    .stApp {
-        background: transparent;
-    }
-    
-    .block-container {
-        background: rgba(255, 255, 255, 0.95);
-        border-radius: 20px;
-        padding: 2rem;
-        box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-        backdrop-filter: blur(10px);
-    }
-    
-    h1 {
-        color: #667eea;
-        font-weight: 700;
-        text-align: center;
-        margin-bottom: 2rem;
-        font-size: 2.5rem;
-        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.1);
-    }
-    
-    h2 {
-        color: #764ba2;
-        font-weight: 600;
-        margin-top: 2rem;
-        margin-bottom: 1rem;
-    }
-    
-    h3 {
-        color: #667eea;
-        font-weight: 500;
-    }
-    
-    .stButton>button {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        color: white;
-        border: none;
-        border-radius: 10px;
-        padding: 0.75rem 2rem;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
-    }
-    
-    .stButton>button:hover {
-        transform: translateY(-2px);
-        box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
-    }
-    
-    .stTextInput>div>div>input, .stSelectbox>div>div>select, .stDateInput>div>div>input, .stTextArea>div>div>textarea {
-        border-radius: 10px;
-        border: 2px solid #e0e0e0;
-        padding: 0.75rem;
-        transition: all 0.3s ease;
-    }
-    
-    .stTextInput>div>div>input:focus, .stSelectbox>div>div>select:focus, .stDateInput>div>div>input:focus, .stTextArea>div>div>textarea:focus {
-        border-color: #667eea;
-        box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
-    }
-    
-    .metric-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 1.5rem;
-        border-radius: 15px;
-        color: white;
-        text-align: center;
-        box-shadow: 0 8px 20px rgba(102, 126, 234, 0.3);
-        margin-bottom: 1rem;
-        transition: transform 0.3s ease;
-    }
-    
-    .metric-card:hover {
-        transform: translateY(-5px);
-    }
-    
-    .metric-value {
-        font-size: 2.5rem;
-        font-weight: 700;
-        margin: 0.5rem 0;
-    }
-    
-    .metric-label {
-        font-size: 0.9rem;
-        opacity: 0.9;
-        text-transform: uppercase;
-        letter-spacing: 1px;
-    }
-    
-    .status-pending {
-        background: #fbbf24;
-        color: #78350f;
-        padding: 0.25rem 0.75rem;
-        border-radius: 20px;
-        font-weight: 600;
-        font-size: 0.85rem;
-    }
-    
-    .status-approved {
-        background: #34d399;
-        color: #064e3b;
-        padding: 0.25rem 0.75rem;
-        border-radius: 20px;
-        font-weight: 600;
-        font-size: 0.85rem;
-    }
-    
-    .status-rejected {
-        background: #f87171;
-        color: #7f1d1d;
-        padding: 0.25rem 0.75rem;
-        border-radius: 20px;
-        font-weight: 600;
-        font-size: 0.85rem;
-    }
-    
-    .sidebar .sidebar-content {
-        background: linear-gradient(180deg, #667eea 0%, #764ba2 100%);
-    }
-    
-    .stDataFrame {
-        border-radius: 10px;
-        overflow: hidden;
-    }
-    
-    div[data-testid="stMetricValue"] {
-        font-size: 2rem;
-        font-weight: 700;
-        color: #667eea;
-    }
-    
-    .success-message {
-        background: #d1fae5;
-        color: #065f46;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #10b981;
-        margin: 1rem 0;
-    }
-    
-    .error-message {
-        background: #fee2e2;
-        color: #991b1b;
-        padding: 1rem;
-        border-radius: 10px;
-        border-left: 4px solid #ef4444;
-        margin: 1rem 0;
-    }
-    
-    .info-card {
-        background: linear-gradient(135deg, #f0f9ff 0%, #e0f2fe 100%);
-        padding: 1.5rem;
-        border-radius: 15px;
-        border-left: 4px solid #0284c7;
-        margin: 1rem 0;
-    }
-    </style>
-""", unsafe_allow_html=True)
-
-# Database initialization
-def init_db():
-    conn = sqlite3.connect('leave_management.db')
-    c = conn.cursor()
-    
-    # Create employees table
-    c.execute('''CREATE TABLE IF NOT EXISTS employees
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  emp_id TEXT UNIQUE NOT NULL,
-                  name TEXT NOT NULL,
-                  email TEXT NOT NULL,
-                  department TEXT NOT NULL,
-                  position TEXT NOT NULL,
-                  password TEXT NOT NULL,
-                  total_leaves INTEGER DEFAULT 20,
-                  used_leaves INTEGER DEFAULT 0)''')
-    
-    # Create leave_requests table
-    c.execute('''CREATE TABLE IF NOT EXISTS leave_requests
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  emp_id TEXT NOT NULL,
-                  leave_type TEXT NOT NULL,
-                  start_date DATE NOT NULL,
-                  end_date DATE NOT NULL,
-                  days INTEGER NOT NULL,
-                  reason TEXT,
-                  status TEXT DEFAULT 'Pending',
-                  applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  approved_by TEXT,
-                  approved_date TIMESTAMP,
-                  FOREIGN KEY (emp_id) REFERENCES employees(emp_id))''')
-    
-    conn.commit()
-    conn.close()
-
-# Insert sample data
-def insert_sample_data():
-    conn = sqlite3.connect('leave_management.db')
-    c = conn.cursor()
-    
-    # Check if data already exists
-    c.execute("SELECT COUNT(*) FROM employees")
-    if c.fetchone()[0] == 0:
-        # Sample employees
-        employees = [
-            ('EMP001', 'John Doe', 'john.doe@acme.com', 'Engineering', 'Senior Developer', hashlib.md5('password123'.encode()).hexdigest(), 20, 5),
-            ('EMP002', 'Jane Smith', 'jane.smith@acme.com', 'Marketing', 'Marketing Manager', hashlib.md5('password123'.encode()).hexdigest(), 20, 3),
-            ('EMP003', 'Mike Johnson', 'mike.johnson@acme.com', 'HR', 'HR Specialist', hashlib.md5('password123'.encode()).hexdigest(), 20, 8),
-            ('EMP004', 'Sarah Williams', 'sarah.williams@acme.com', 'Engineering', 'Junior Developer', hashlib.md5('password123'.encode()).hexdigest(), 20, 2),
-            ('EMP005', 'Robert Brown', 'robert.brown@acme.com', 'Sales', 'Sales Executive', hashlib.md5('password123'.encode()).hexdigest(), 20, 10),
-            ('ADMIN', 'Admin User', 'admin@acme.com', 'Management', 'Administrator', hashlib.md5('admin123'.encode()).hexdigest(), 20, 0),
-        ]
-        
-        c.executemany('''INSERT INTO employees 
-                        (emp_id, name, email, department, position, password, total_leaves, used_leaves)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', employees)
-        
-        # Sample leave requests
-        leave_requests = [
-            ('EMP001', 'Sick Leave', '2025-11-15', '2025-11-17', 3, 'Medical appointment', 'Approved', 'ADMIN'),
-            ('EMP001', 'Vacation', '2025-12-20', '2025-12-22', 2, 'Family vacation', 'Pending', None),
-            ('EMP002', 'Personal Leave', '2025-11-20', '2025-11-22', 3, 'Personal matters', 'Approved', 'ADMIN'),
-            ('EMP003', 'Sick Leave', '2025-11-10', '2025-11-17', 8, 'Flu recovery', 'Approved', 'ADMIN'),
-            ('EMP004', 'Vacation', '2025-12-15', '2025-12-16', 2, 'Short trip', 'Pending', None),
-            ('EMP005', 'Sick Leave', '2025-11-01', '2025-11-05', 5, 'Surgery recovery', 'Approved', 'ADMIN'),
-            ('EMP005', 'Vacation', '2025-12-10', '2025-12-14', 5, 'Year-end vacation', 'Rejected', 'ADMIN'),
-        ]
-        
-        c.executemany('''INSERT INTO leave_requests 
-                        (emp_id, leave_type, start_date, end_date, days, reason, status, approved_by)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', leave_requests)
-        
-        conn.commit()
-    
-    conn.close()
+# Custom CSS for modern styling (minified once per process, no web font download)
+st.markdown(APP_STYLE, unsafe_allow_html=True)
 
-# Authentication functions
-def authenticate_user(emp_id, password):
-    conn = sqlite3.connect('leave_management.db')
+# Insert sample data (bootstrap runs this on an empty database and commits it)
+def insert_sample_data(conn):
     c = conn.cursor()
-    hashed_password = hashlib.md5(password.encode()).hexdigest()
-    c.execute("SELECT * FROM employees WHERE emp_id=? AND password=?", (emp_id, hashed_password))
-    user = c.fetchone()
-    conn.close()
-    return user
-
-def get_employee_info(emp_id):
-    conn = sqlite3.connect('leave_management.db')
-    c = conn.cursor()
-    c.execute("SELECT * FROM employees WHERE emp_id=?", (emp_id,))
-    employee = c.fetchone()
-    conn.close()
-    return employee
-
-# Leave management functions
-def apply_leave(emp_id, leave_type, start_date, end_date, reason):
-    conn = sqlite3.connect('leave_management.db')
-    c = conn.cursor()
-    
-    # Calculate number of days
-    days = (end_date - start_date).days + 1
-    
-    # Check available leaves
-    employee = get_employee_info(emp_id)
-    available_leaves = employee[6] - employee[7]  # total_leaves - used_leaves
-    
-    if days > available_leaves:
-        conn.close()
-        return False, f"Insufficient leave balance. Available: {available_leaves} days"
-    
-    c.execute('''INSERT INTO leave_requests 
-                 (emp_id, leave_type, start_date, end_date, days, reason)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (emp_id, leave_type, start_date, end_date, days, reason))
-    
-    conn.commit()
-    conn.close()
-    return True, "Leave application submitted successfully!"
-
-def get_employee_leaves(emp_id):
-    conn = sqlite3.connect('leave_management.db')
-    df = pd.read_sql_query(
-        "SELECT * FROM leave_requests WHERE emp_id=? ORDER BY applied_date DESC",
-        conn, params=(emp_id,))
-    conn.close()
-    return df
-
-def get_all_leaves():
-    conn = sqlite3.connect('leave_management.db')
-    df = pd.read_sql_query(
-        """SELECT lr.*, e.name, e.department 
-           FROM leave_requests lr 
-           JOIN employees e ON lr.emp_id = e.emp_id 
-           ORDER BY lr.applied_date DESC""", conn)
-    conn.close()
-    return df
-
-def update_leave_status(leave_id, status, approved_by):
-    conn = sqlite3.connect('leave_management.db')
-    c = conn.cursor()
-    
-    # Get leave details
-    c.execute("SELECT emp_id, days, status FROM leave_requests WHERE id=?", (leave_id,))
-    leave = c.fetchone()
     
-    if leave:
-        emp_id, days, old_status = leave
-        
-        # Update leave status
-        c.execute('''UPDATE leave_requests 
-                     SET status=?, approved_by=?, approved_date=CURRENT_TIMESTAMP 
-                     WHERE id=?''', (status, approved_by, leave_id))
-        
-        # Update employee's used leaves if approved
-        if status == 'Approved' and old_status != 'Approved':
-            c.execute("UPDATE employees SET used_leaves = used_leaves + ? WHERE emp_id=?",
-                     (days, emp_id))
-        elif status == 'Rejected' and old_status == 'Approved':
-            c.execute("UPDATE employees SET used_leaves = used_leaves - ? WHERE emp_id=?",
-                     (days, emp_id))
-        
-        conn.commit()
-    
-    conn.close()
+    # Sample employees (role: Manager for the admin and anyone with reports)
+    employees = [
+        ('EMP001', 'John Doe', 'john.doe@acme.com', 'Engineering', 'Senior Developer', hashlib.md5('password123'.encode()).hexdigest(), 20, 5, 'ADMIN', 'Manager'),
+        ('EMP002', 'Jane Smith', 'jane.smith@acme.com', 'Marketing', 'Marketing Manager', hashlib.md5('password123'.encode()).hexdigest(), 20, 3, 'ADMIN', 'Employee'),
+        ('EMP003', 'Mike Johnson', 'mike.johnson@acme.com', 'HR', 'HR Specialist', hashlib.md5('password123'.encode()).hexdigest(), 20, 8, 'ADMIN', 'Employee'),
+        ('EMP004', 'Sarah Williams', 'sarah.williams@acme.com', 'Engineering', 'Junior Developer', hashlib.md5('password123'.encode()).hexdigest(), 20, 2, 'EMP001', 'Employee'),
+        ('EMP005', 'Robert Brown', 'robert.brown@acme.com', 'Sales', 'Sales Executive', hashlib.md5('password123'.encode()).hexdigest(), 20, 10, 'ADMIN', 'Employee'),
+        ('ADMIN', 'Admin User', 'admin@acme.com', 'Management', 'Administrator', hashlib.md5('admin123'.encode()).hexdigest(), 20, 0, None, 'Manager'),
+    ]
+    
+    c.executemany('''INSERT INTO employees 
+                    (emp_id, name, email, department, position, password, total_leaves, used_leaves, manager_id, role)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', employees)
+    # HR approves long and parental leave after the manager (see workflow)
+    c.execute("INSERT INTO approval_groups (stage, emp_id) VALUES ('hr', 'EMP003')")
+    
+    # Sample leave requests
+    leave_requests = [
+        ('EMP001', 'Sick Leave', '2025-11-15', '2025-11-17', 3, 'Medical appointment', 'Approved', 'ADMIN'),
+        ('EMP001', 'Vacation', '2025-12-20', '2025-12-22', 2, 'Family vacation', 'Pending', None),
+        ('EMP002', 'Personal Leave', '2025-11-20', '2025-11-22', 3, 'Personal matters', 'Approved', 'ADMIN'),
+        ('EMP003', 'Sick Leave', '2025-11-10', '2025-11-17', 8, 'Flu recovery', 'Approved', 'ADMIN'),
+        ('EMP004', 'Vacation', '2025-12-15', '2025-12-16', 2, 'Short trip', 'Pending', None),
+        ('EMP005', 'Sick Leave', '2025-11-01', '2025-11-05', 5, 'Surgery recovery', 'Approved', 'ADMIN'),
+        ('EMP005', 'Vacation', '2025-12-10', '2025-12-14', 5, 'Year-end vacation', 'Rejected', 'ADMIN'),
+    ]
+    
+    c.executemany('''INSERT INTO leave_requests 
+                    (emp_id, leave_type, start_date, end_date, days, reason, status, approved_by)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', leave_requests)
+
+# Leave list functions (DataFrames for the Streamlit pages); the data comes
+# from the service layer shared with leave_management.py and the JSON API
+def get_employee_leaves_page(emp_id, cursor=None, page_size=PAGE_SIZE):
+    import pandas as pd
+    records, next_cursor = list_employee_leaves(emp_id, cursor=cursor, page_size=page_size)
+    return pd.DataFrame(records, columns=EMPLOYEE_LEAVE_COLUMNS), next_cursor
+
+def get_leaves_page(statuses=None, department=None, date_from=None, date_to=None,
+                    cursor=None, page_size=PAGE_SIZE, manager_id=None):
+    import pandas as pd
+    records, next_cursor = list_leave_requests(statuses, department, date_from, date_to,
+                                               cursor, page_size, manager_id)
+    return pd.DataFrame(records, columns=LEAVE_REQUEST_COLUMNS), next_cursor
+
+# Requests waiting for this approver's step of their approval chain, oldest first
+def get_inbox_page(approver_id, department=None, cursor=None, page_size=PAGE_SIZE):
+    import pandas as pd
+    records, next_cursor = list_inbox(approver_id, department, cursor, page_size)
+    return pd.DataFrame(records, columns=INBOX_COLUMNS), next_cursor
+
+# The admin decides any pending request, everyone else only their own steps
+def update_leave_statuses(decisions, approved_by):
+    return leave_service.update_leave_statuses(decisions, approved_by, unrestricted=approved_by == 'ADMIN')
+
+def get_employee_overview(department=None):
+    # Filter and balance are computed by SQLite; pandas only receives the rows to show
+    import pandas as pd
+    return pd.DataFrame(list_employee_balances(department, exclude=('ADMIN',)), columns=EMPLOYEE_BALANCE_COLUMNS)
+
+def get_department_balances():
+    import pandas as pd
+    return pd.DataFrame([list(row.values()) for row in leave_service.get_department_balances(exclude=('ADMIN',))],
+                        columns=['Department', 'Employees', 'Total Leaves', 'Used Leaves', 'Pending Days', 'Available Leaves'])
+
+def get_leave_rollups(month_from, month_to, department=None, group_by=DIMENSIONS):
+    import pandas as pd
+    return pd.DataFrame(get_department_analytics(month_from, month_to, department, group_by),
+                        columns=list(group_by) + ['requests', 'days'])
+
+def export_leaves(fmt, statuses=None, department=None, date_from=None, date_to=None, manager_id=None):
+    # Encoded chunk by chunk into a temporary file instead of going through a DataFrame
+    return spool_export(leave_service.export_leaves(fmt, statuses, department, date_from, date_to, manager_id))
 
 def get_dashboard_stats(emp_id=None):
-    conn = sqlite3.connect('leave_management.db')
-    c = conn.cursor()
-    
     if emp_id:
-        # Employee-specific stats
-        employee = get_employee_info(emp_id)
-        total_leaves = employee[6]
-        used_leaves = employee[7]
-        available_leaves = total_leaves - used_leaves
-        
-        c.execute("SELECT COUNT(*) FROM leave_requests WHERE emp_id=? AND status='Pending'", (emp_id,))
-        pending_requests = c.fetchone()[0]
-        
-        conn.close()
+        # Employee-specific stats; pending days count against the available balance
+        balance = get_leave_statistics(emp_id)
+        if balance is None:
+            # Unknown (e.g. deleted) employee: nothing to show
+            return {'total_leaves': 0, 'used_leaves': 0, 'available_leaves': 0, 'pending_requests': 0}
         return {
-            'total_leaves': total_leaves,
-            'used_leaves': used_leaves,
-            'available_leaves': available_leaves,
-            'pending_requests': pending_requests
+            'total_leaves': balance['total'],
+            'used_leaves': balance['used'],
+            'available_leaves': balance['available'],
+            'pending_requests': get_leave_counters(emp_id)['pending']
         }
     else:
-        # Admin stats
-        c.execute("SELECT COUNT(*) FROM leave_requests WHERE status='Pending'")
-        pending_requests = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM employees")
-        total_employees = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM leave_requests WHERE status='Approved'")
-        approved_leaves = c.fetchone()[0]
-        
-        c.execute("SELECT COUNT(*) FROM leave_requests")
-        total_requests = c.fetchone()[0]
-        
-        conn.close()
+        # Admin stats, read from the trigger-maintained counters
+        counters = get_leave_counters()
         return {
-            'pending_requests': pending_requests,
-            'total_employees': total_employees,
-            'approved_leaves': approved_leaves,
-            'total_requests': total_requests
+            'pending_requests': counters['pending'],
+            'total_employees': counters['employees'],
+            'approved_leaves': counters['approved'],
+            'total_requests': counters['total']
         }
 
-# Initialize database and sample data
-init_db()
-insert_sample_data()
+# Create, migrate and seed the database once per process (the seed fills
+# manager_id and approval_groups, which come from migrations)
+bootstrap(CANONICAL, insert_sample_data, migrate_first=True)
 
 # Session state initialization
 if 'logged_in' not in st.session_state:
@@ -407,6 +148,29 @@ if 'user_name' not in st.session_state:
 if 'is_admin' not in st.session_state:
     st.session_state.is_admin = False
 
+# Paging helpers
+def page_cursor(key, filters):
+    state = st.session_state.setdefault(key, {'filters': None, 'cursors': [None]})
+    if state['filters'] != filters:
+        # Filters changed, start again from the first page
+        state['filters'] = filters
+        state['cursors'] = [None]
+    return state['cursors'][-1]
+
+def page_controls(key, next_cursor):
+    state = st.session_state[key]
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if len(state['cursors']) > 1 and st.button("← Previous", key=f"{key}_prev", use_container_width=True):
+            state['cursors'].pop()
+            st.rerun(scope="fragment")
+    with col2:
+        st.markdown(f"<p style='text-align: center;'>Page {len(state['cursors'])}</p>", unsafe_allow_html=True)
+    with col3:
+        if next_cursor is not None and st.button("Next →", key=f"{key}_next", use_container_width=True):
+            state['cursors'].append(next_cursor)
+            st.rerun(scope="fragment")
+
 # Login page
 def login_page():
     st.markdown("<h1>🏢 ACME Leave Management System</h1>", unsafe_allow_html=True)
@@ -429,14 +193,18 @@ def login_page():
         with col_a:
             if st.button("Login", use_container_width=True):
                 if emp_id and password:
-                    user = authenticate_user(emp_id, password)
+                    try:
+                        user = authenticate_employee(emp_id, password)
+                    except HashingBusy:
+                        st.warning("Many people are signing in right now. Please try again in a moment.")
+                        user = False
                     if user:
                         st.session_state.logged_in = True
-                        st.session_state.user_id = user[1]
-                        st.session_state.user_name = user[2]
-                        st.session_state.is_admin = (user[1] == 'ADMIN')
+                        st.session_state.user_id = user['emp_id']
+                        st.session_state.user_name = user['name']
+                        st.session_state.is_admin = (user['emp_id'] == 'ADMIN')
                         st.rerun()
-                    else:
+                    elif user is None:
                         st.error("Invalid credentials!")
                 else:
                     st.warning("Please enter both Employee ID and Password")
@@ -450,221 +218,362 @@ def login_page():
             </div>
         """, unsafe_allow_html=True)
 
+# Fragments: each one reruns on its own when its widgets are used, so an
+# action only recomputes the data that fragment depends on
+STATS_REFRESH = timedelta(seconds=15)
+
+def metric_card(label, value, background=None):
+    style = f' style="background: {background};"' if background else ''
+    st.markdown(f"""
+        <div class="metric-card"{style}>
+            <div class="metric-label">{label}</div>
+            <div class="metric-value">{value}</div>
+        </div>
+    """, unsafe_allow_html=True)
+
+# Employee stat cards, refreshed periodically from the O(1) counters
+@st.fragment(run_every=STATS_REFRESH)
+def employee_stat_cards(emp_id):
+    stats = get_dashboard_stats(emp_id)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        metric_card("Total Leaves", stats['total_leaves'])
+    
+    with col2:
+        metric_card("Used Leaves", stats['used_leaves'], "linear-gradient(135deg, #f59e0b 0%, #d97706 100%)")
+    
+    with col3:
+        metric_card("Available Leaves", stats['available_leaves'], "linear-gradient(135deg, #10b981 0%, #059669 100%)")
+    
+    with col4:
+        metric_card("Pending Requests", stats['pending_requests'], "linear-gradient(135deg, #3b82f6 0%, #2563eb 100%)")
+
+@st.fragment
+def apply_leave_form(emp_id):
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        leave_type = st.selectbox("Leave Type", APP_LEAVE_TYPES)
+        start_date = st.date_input("Start Date", min_value=datetime.now().date())
+    
+    with col2:
+        reason = st.text_area("Reason", placeholder="Please provide a reason for your leave request")
+        end_date = st.date_input("End Date", min_value=datetime.now().date())
+    
+    if st.button("Submit Leave Request", use_container_width=True):
+        if start_date and end_date and reason:
+            if end_date >= start_date:
+                try:
+                    apply_leave(emp_id, leave_type, start_date, end_date, reason)
+                except LeaveValidationError as e:
+                    st.markdown(f'<div class="error-message">❌ {e}</div>', unsafe_allow_html=True)
+                else:
+                    st.markdown('<div class="success-message">✅ Leave application submitted successfully!</div>',
+                                unsafe_allow_html=True)
+                    # Balance cards and history depend on the new request
+                    st.rerun()
+            else:
+                st.error("End date must be after or equal to start date!")
+        else:
+            st.warning("Please fill in all fields!")
+
+@st.fragment
+def leave_history(emp_id):
+    cursor = page_cursor('history_page', None)
+    leaves_df, next_cursor = get_employee_leaves_page(emp_id, cursor=cursor)
+    
+    if not leaves_df.empty:
+        # Format the dataframe for display
+        display_df = leaves_df[['leave_type', 'start_date', 'end_date', 'days', 'reason', 'status', 'applied_date']].copy()
+        display_df.columns = ['Leave Type', 'Start Date', 'End Date', 'Days', 'Reason', 'Status', 'Applied Date']
+        
+        st.dataframe(display_df, use_container_width=True, hide_index=True)
+        page_controls('history_page', next_cursor)
+    else:
+        st.info("No leave requests found.")
+
 # Employee dashboard
 def employee_dashboard():
     st.markdown(f"<h1>👋 Welcome, {st.session_state.user_name}!</h1>", unsafe_allow_html=True)
     
     # Dashboard stats
-    stats = get_dashboard_stats(st.session_state.user_id)
+    employee_stat_cards(st.session_state.user_id)
+    
+    st.markdown("---")
+    
+    # Tabs for different sections; managers and approval group members also get the approval queue
+    is_manager = get_report_count(st.session_state.user_id) > 0 or bool(get_approver_stages(st.session_state.user_id))
+    tabs = st.tabs(["📝 Apply Leave", "📊 My Leave History"] + (["✅ Team Requests"] if is_manager else []))
+    
+    with tabs[0]:
+        st.markdown("## Apply for Leave")
+        apply_leave_form(st.session_state.user_id)
+    
+    with tabs[1]:
+        st.markdown("## My Leave History")
+        leave_history(st.session_state.user_id)
+    
+    if is_manager:
+        with tabs[2]:
+            st.markdown("## Team Leave Requests")
+            leave_request_queue(st.session_state.user_id)
+
+# Bulk approval grid: one batch, one rerun
+BULK_PAGE_SIZE = 500
+
+def bulk_approval_grid(pending_df):
+    with st.form("bulk_approval_form"):
+        grid = pending_df[['request_id', 'name', 'department', 'leave_type', 'start_date', 'end_date', 'days']].copy()
+        grid.insert(0, 'select', False)
+        edited = st.data_editor(
+            grid,
+            column_config={
+                "select": st.column_config.CheckboxColumn("Select"),
+                "request_id": "Request ID",
+                "name": "Employee",
+                "department": "Department",
+                "leave_type": "Leave Type",
+                "start_date": "Start Date",
+                "end_date": "End Date",
+                "days": "Days"
+            },
+            disabled=[c for c in grid.columns if c != 'select'],
+            hide_index=True,
+            use_container_width=True
+        )
+        col_a, col_b = st.columns(2)
+        with col_a:
+            approve = st.form_submit_button("✅ Approve Selected", use_container_width=True)
+        with col_b:
+            reject = st.form_submit_button("❌ Reject Selected", use_container_width=True)
+    
+    if approve or reject:
+        selected = edited.loc[edited['select'], 'request_id'].tolist()
+        if not selected:
+            st.warning("Select at least one request.")
+            return
+        status = 'Approved' if approve else 'Rejected'
+        results = update_leave_statuses([(leave_id, status) for leave_id in selected], st.session_state.user_id)
+        summary = summarize_batch(results)
+        decided = summary.get(UPDATED, 0) + summary.get(FORWARDED, 0)
+        st.session_state.bulk_message = (
+            f"{status} {decided} request(s), {summary.get(FORWARDED, 0)} of them forwarded to the next approver; "
+            f"{len(results) - decided} skipped (already decided, missing or not yours)"
+        )
+        st.rerun(scope="fragment")
+
+@st.fragment(run_every=STATS_REFRESH)
+def admin_stat_cards():
+    stats = get_dashboard_stats()
     
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.markdown(f"""
-            <div class="metric-card">
-                <div class="metric-label">Total Leaves</div>
-                <div class="metric-value">{stats['total_leaves']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+        metric_card("Pending Requests", stats['pending_requests'])
     
     with col2:
-        st.markdown(f"""
-            <div class="metric-card" style="background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);">
-                <div class="metric-label">Used Leaves</div>
-                <div class="metric-value">{stats['used_leaves']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+        metric_card("Total Employees", stats['total_employees'], "linear-gradient(135deg, #10b981 0%, #059669 100%)")
     
     with col3:
-        st.markdown(f"""
-            <div class="metric-card" style="background: linear-gradient(135deg, #10b981 0%, #059669 100%);">
-                <div class="metric-label">Available Leaves</div>
-                <div class="metric-value">{stats['available_leaves']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+        metric_card("Approved Leaves", stats['approved_leaves'], "linear-gradient(135deg, #3b82f6 0%, #2563eb 100%)")
     
     with col4:
-        st.markdown(f"""
-            <div class="metric-card" style="background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%);">
-                <div class="metric-label">Pending Requests</div>
-                <div class="metric-value">{stats['pending_requests']}</div>
-            </div>
-        """, unsafe_allow_html=True)
-    
-    st.markdown("---")
-    
-    # Tabs for different sections
-    tab1, tab2 = st.tabs(["📝 Apply Leave", "📊 My Leave History"])
+        metric_card("Total Requests", stats['total_requests'], "linear-gradient(135deg, #f59e0b 0%, #d97706 100%)")
+
+# Button callback: runs before the row fragment reruns
+def decide_leave(leave_id, status):
+    result, = update_leave_statuses([(leave_id, status)], st.session_state.user_id)
+    outcome = {UPDATED: status, FORWARDED: result['detail']}.get(result['result'], f"Not decided: {result['detail']}")
+    st.session_state.setdefault('decided_leaves', {})[leave_id] = outcome
+
+# One request; its buttons rerun only this row
+@st.fragment
+def leave_request_row(row):
+    status = st.session_state.get('decided_leaves', {}).get(row['request_id'], row['status'])
     
-    with tab1:
-        st.markdown("## Apply for Leave")
-        
-        col1, col2 = st.columns(2)
+    with st.expander(f"🗓️ {row['name']} - {row['leave_type']} ({row['start_date']} to {row['end_date']})"):
+        col1, col2, col3 = st.columns(3)
         
         with col1:
-            leave_type = st.selectbox(
-                "Leave Type",
-                ["Sick Leave", "Vacation", "Personal Leave", "Emergency Leave", "Other"]
-            )
-            start_date = st.date_input("Start Date", min_value=datetime.now().date())
+            st.write(f"**Employee:** {row['name']}")
+            st.write(f"**Department:** {row['department']}")
+            st.write(f"**Leave Type:** {row['leave_type']}")
         
         with col2:
-            reason = st.text_area("Reason", placeholder="Please provide a reason for your leave request")
-            end_date = st.date_input("End Date", min_value=datetime.now().date())
+            st.write(f"**Start Date:** {row['start_date']}")
+            st.write(f"**End Date:** {row['end_date']}")
+            st.write(f"**Days:** {row['days']}")
         
-        if st.button("Submit Leave Request", use_container_width=True):
-            if start_date and end_date and reason:
-                if end_date >= start_date:
-                    success, message = apply_leave(
-                        st.session_state.user_id,
-                        leave_type,
-                        start_date,
-                        end_date,
-                        reason
-                    )
-                    if success:
-                        st.markdown(f'<div class="success-message">✅ {message}</div>', unsafe_allow_html=True)
-                        st.rerun()
-                    else:
-                        st.markdown(f'<div class="error-message">❌ {message}</div>', unsafe_allow_html=True)
-                else:
-                    st.error("End date must be after or equal to start date!")
-            else:
-                st.warning("Please fill in all fields!")
-    
-    with tab2:
-        st.markdown("## My Leave History")
+        with col3:
+            st.write(f"**Status:** {status}")
+            st.write(f"**Applied:** {row['applied_date']}")
+            if row.get('stage'):
+                st.write(f"**Waiting for:** {row['stage']} approval")
         
-        leaves_df = get_employee_leaves(st.session_state.user_id)
+        st.write(f"**Reason:** {row['reason']}")
         
-        if not leaves_df.empty:
-            # Format the dataframe for display
-            display_df = leaves_df[['leave_type', 'start_date', 'end_date', 'days', 'reason', 'status', 'applied_date']].copy()
-            display_df.columns = ['Leave Type', 'Start Date', 'End Date', 'Days', 'Reason', 'Status', 'Applied Date']
-            
-            # Apply styling to status
-            def highlight_status(row):
-                if row['Status'] == 'Approved':
-                    return ['background-color: #d1fae5'] * len(row)
-                elif row['Status'] == 'Rejected':
-                    return ['background-color: #fee2e2'] * len(row)
-                else:
-                    return ['background-color: #fef3c7'] * len(row)
-            
-            st.dataframe(display_df, use_container_width=True, hide_index=True)
-        else:
-            st.info("No leave requests found.")
+        if status == 'Pending':
+            col_a, col_b, col_c = st.columns([1, 1, 2])
+            with col_a:
+                st.button("✅ Approve", key=f"approve_{row['request_id']}",
+                          on_click=decide_leave, args=(row['request_id'], 'Approved'))
+            with col_b:
+                st.button("❌ Reject", key=f"reject_{row['request_id']}",
+                          on_click=decide_leave, args=(row['request_id'], 'Rejected'))
 
-# Admin dashboard
-def admin_dashboard():
-    st.markdown(f"<h1>🔧 Admin Dashboard</h1>", unsafe_allow_html=True)
+def export_button(statuses, department, manager_id=None):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        fmt = st.radio("Format", ["csv", "xlsx"], format_func=lambda f: "Excel" if f == "xlsx" else "CSV",
+                       horizontal=True, key="export_format")
+    with col2:
+        date_from = st.date_input("From", value=None, key="export_from")
+    with col3:
+        date_to = st.date_input("To", value=None, key="export_to")
+    # The callable runs only when the button is clicked
+    st.download_button("⬇️ Download", on_click="ignore", mime=CONTENT_TYPES[fmt],
+                       file_name=f"leave_requests_{datetime.now():%Y%m%d}.{fmt}",
+                       data=lambda: export_leaves(fmt, statuses, department, date_from, date_to, manager_id))
+
+# manager_id limits the queue to that manager's direct and indirect reports (None: everyone)
+# and adds the requests waiting for their approval
+@st.fragment
+def leave_request_queue(manager_id=None):
+    # Filter options
+    col1, col2 = st.columns(2)
+    with col1:
+        status_options = (["Awaiting Me"] if manager_id is not None else []) + ["All", "Pending", "Approved", "Rejected"]
+        status_filter = st.selectbox("Filter by Status", status_options)
+    with col2:
+        department_filter = st.selectbox("Filter by Department", ["All"] + get_department_names())
+    
+    awaiting = status_filter == "Awaiting Me"
+    statuses = None if status_filter == "All" else ['Pending'] if awaiting else [status_filter]
+    department = None if department_filter == "All" else department_filter
+    cursor = page_cursor('requests_page', (status_filter, department_filter))
+    if awaiting:
+        leaves_df, next_cursor = get_inbox_page(manager_id, department, cursor)
+    else:
+        leaves_df, next_cursor = get_leaves_page(statuses=statuses, department=department, cursor=cursor,
+                                                 manager_id=manager_id)
     
-    # Dashboard stats
-    stats = get_dashboard_stats()
+    if 'bulk_message' in st.session_state:
+        st.markdown(f'<div class="success-message">✅ {st.session_state.pop("bulk_message")}</div>', unsafe_allow_html=True)
     
-    col1, col2, col3, col4 = st.columns(4)
+    if status_filter in ("Awaiting Me", "All", "Pending"):
+        # Approvers bulk-decide their own steps, the admin any pending request
+        if manager_id is not None:
+            pending_df, _ = get_inbox_page(manager_id, department, page_size=BULK_PAGE_SIZE)
+        else:
+            pending_df, _ = get_leaves_page(statuses=['Pending'], department=department, page_size=BULK_PAGE_SIZE)
+        if not pending_df.empty:
+            with st.expander(f"☑️ Bulk approve / reject ({len(pending_df)} pending)"):
+                bulk_approval_grid(pending_df)
     
-    with col1:
-        st.markdown(f"""
-            <div class="metric-card">
-                <div class="metric-label">Pending Requests</div>
-                <div class="metric-value">{stats['pending_requests']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+    with st.expander("⬇️ Export requests"):
+        export_button(statuses, department, manager_id)
     
+    if not leaves_df.empty:
+        if awaiting:
+            st.caption(f"{count_inbox_requests(manager_id, department)} requests awaiting your approval")
+        else:
+            st.caption(f"{count_leave_requests(statuses=statuses, department=department, manager_id=manager_id)} matching requests")
+        for row in leaves_df.to_dict('records'):
+            leave_request_row(row)
+        
+        page_controls('requests_page', next_cursor)
+    else:
+        st.info("No leave requests found.")
+
+@st.fragment
+def employee_overview():
+    department_filter = st.selectbox("Filter by Department", ["All"] + get_department_names(), key="overview_department")
+    employees_df = get_employee_overview(None if department_filter == "All" else department_filter)
+    
+    if not employees_df.empty:
+        # The cached frame is shared between sessions, so rename on a copy
+        employees_df = employees_df.set_axis(['Employee ID', 'Name', 'Email', 'Department', 'Position', 'Total Leaves', 'Used Leaves', 'Pending Days', 'Available Leaves'], axis=1)
+        st.dataframe(employees_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("No employees found.")
+
+@st.fragment
+def analytics_view():
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        department_filter = st.selectbox("Department", ["All"] + get_department_names(), key="analytics_department")
     with col2:
-        st.markdown(f"""
-            <div class="metric-card" style="background: linear-gradient(135deg, #10b981 0%, #059669 100%);">
-                <div class="metric-label">Total Employees</div>
-                <div class="metric-value">{stats['total_employees']}</div>
-            </div>
-        """, unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown(f"""
-            <div class="metric-card" style="background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%);">
-                <div class="metric-label">Approved Leaves</div>
-                <div class="metric-value">{stats['approved_leaves']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+        year = st.number_input("Year", min_value=2000, max_value=2100, value=datetime.now().year, step=1, key="analytics_year")
+    department = None if department_filter == "All" else department_filter
+    month_from, month_to = f"{year}-01", f"{year}-12"
+    
+    st.markdown("#### Balances by Department")
+    st.dataframe(get_department_balances(), use_container_width=True, hide_index=True)
+    
+    # Rollup rows are small; pandas only reshapes them
+    monthly_df = get_leave_rollups(month_from, month_to, department, ('department', 'month', 'status'))
+    approved_df = monthly_df[monthly_df['status'] == 'Approved']
+    if approved_df.empty:
+        st.info(f"No approved leave starting in {year}.")
+    else:
+        st.markdown("#### Approved Days per Month")
+        st.bar_chart(approved_df.pivot_table(index='month', columns='department', values='days', aggfunc='sum', fill_value=0), height=300)
+    
+    by_type_df = get_leave_rollups(month_from, month_to, department, ('leave_type', 'status'))
+    if not by_type_df.empty:
+        st.markdown("#### Requests by Leave Type and Status")
+        st.dataframe(by_type_df.pivot_table(index='leave_type', columns='status', values='requests', aggfunc='sum', fill_value=0),
+                     use_container_width=True)
+
+@st.fragment
+def team_calendar_view():
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        department = st.selectbox("Department", get_department_names(), key="calendar_department")
+    with col2:
+        month = st.date_input("Month", value=datetime.now().date().replace(day=1), key="calendar_month")
+    
+    if department is None:
+        st.info("No departments found.")
+        return
+    start = month.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    calendar = get_team_calendar(department, start, end)
+    
+    grid_df, headcount_df = calendar_frames(calendar)
+    st.caption(f"Most out on one day: {calendar['out'].max()} of {len(calendar['emp_ids'])} · 🟢 Approved · 🟡 Pending")
+    st.bar_chart(headcount_df, color=["#28a745", "#ffc107"], height=200)
+    st.dataframe(grid_df, use_container_width=True)
+
+# Admin dashboard
+def admin_dashboard():
+    st.markdown(f"<h1>🔧 Admin Dashboard</h1>", unsafe_allow_html=True)
     
-    with col4:
-        st.markdown(f"""
-            <div class="metric-card" style="background: linear-gradient(135deg, #f59e0b 0%, #d97706 100%);">
-                <div class="metric-label">Total Requests</div>
-                <div class="metric-value">{stats['total_requests']}</div>
-            </div>
-        """, unsafe_allow_html=True)
+    # Dashboard stats
+    admin_stat_cards()
     
     st.markdown("---")
     
     # Tabs for different sections
-    tab1, tab2 = st.tabs(["📋 All Leave Requests", "👥 Employee Overview"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 All Leave Requests", "👥 Employee Overview", "📅 Team Calendar", "📈 Analytics"])
     
     with tab1:
         st.markdown("## Manage Leave Requests")
-        
-        # Filter options
-        col1, col2 = st.columns(2)
-        with col1:
-            status_filter = st.selectbox("Filter by Status", ["All", "Pending", "Approved", "Rejected"])
-        
-        leaves_df = get_all_leaves()
-        
-        if status_filter != "All":
-            leaves_df = leaves_df[leaves_df['status'] == status_filter]
-        
-        if not leaves_df.empty:
-            for idx, row in leaves_df.iterrows():
-                with st.expander(f"🗓️ {row['name']} - {row['leave_type']} ({row['start_date']} to {row['end_date']})"):
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        st.write(f"**Employee:** {row['name']}")
-                        st.write(f"**Department:** {row['department']}")
-                        st.write(f"**Leave Type:** {row['leave_type']}")
-                    
-                    with col2:
-                        st.write(f"**Start Date:** {row['start_date']}")
-                        st.write(f"**End Date:** {row['end_date']}")
-                        st.write(f"**Days:** {row['days']}")
-                    
-                    with col3:
-                        st.write(f"**Status:** {row['status']}")
-                        st.write(f"**Applied:** {row['applied_date']}")
-                    
-                    st.write(f"**Reason:** {row['reason']}")
-                    
-                    if row['status'] == 'Pending':
-                        col_a, col_b, col_c = st.columns([1, 1, 2])
-                        with col_a:
-                            if st.button("✅ Approve", key=f"approve_{row['id']}"):
-                                update_leave_status(row['id'], 'Approved', st.session_state.user_id)
-                                st.success("Leave approved!")
-                                st.rerun()
-                        with col_b:
-                            if st.button("❌ Reject", key=f"reject_{row['id']}"):
-                                update_leave_status(row['id'], 'Rejected', st.session_state.user_id)
-                                st.error("Leave rejected!")
-                                st.rerun()
-        else:
-            st.info("No leave requests found.")
+        leave_request_queue()
     
     with tab2:
         st.markdown("## Employee Overview")
-        
-        conn = sqlite3.connect('leave_management.db')
-        employees_df = pd.read_sql_query(
-            "SELECT emp_id, name, email, department, position, total_leaves, used_leaves FROM employees WHERE emp_id != 'ADMIN'",
-            conn)
-        conn.close()
-        
-        if not employees_df.empty:
-            employees_df['available_leaves'] = employees_df['total_leaves'] - employees_df['used_leaves']
-            employees_df.columns = ['Employee ID', 'Name', 'Email', 'Department', 'Position', 'Total Leaves', 'Used Leaves', 'Available Leaves']
-            st.dataframe(employees_df, use_container_width=True, hide_index=True)
-        else:
-            st.info("No employees found.")
+        employee_overview()
+    
+    with tab3:
+        st.markdown("## Team Calendar")
+        team_calendar_view()
+    
+    with tab4:
+        st.markdown("## Department Analytics")
+        analytics_view()
 
 # Main app logic
 def main():
@@ -683,7 +592,25 @@ def main():
                 st.session_state.user_name = None
                 st.session_state.is_admin = False
                 st.rerun()
-        
+
+            if st.session_state.is_admin:
+                with st.expander("⚙️ Query cache"):
+                    cache_stats = query_cache.stats()
+                    st.write(f"**Entries:** {cache_stats['entries']} / {cache_stats['max_entries']}")
+                    st.write(f"**Hits / Misses:** {cache_stats['hits']} / {cache_stats['misses']} "
+                             f"({cache_stats['hit_rate']:.0%})")
+                    st.write(f"**Evictions:** {cache_stats['evictions']}")
+                with st.expander("⏱️ Startup"):
+                    # Server-side timings of this process; bench_startup.py tracks them over releases
+                    timings = startup_report()
+                    st.write(f"**Bootstrap:** {timings['bootstrap_ms']:.0f} ms")
+                    if timings['first_run_ms'] is not None:
+                        st.write(f"**First run (imports included):** {timings['first_run_ms']:.0f} ms")
+                    if timings['reruns']:
+                        st.write(f"**Reruns:** {timings['reruns']}, median {timings['rerun_median_ms']:.0f} ms, "
+                                 f"p95 {timings['rerun_p95_ms']:.0f} ms")
+                    st.write(f"**Not imported yet:** {', '.join(timings['deferred_imports']) or 'none'}")
+
         # Show appropriate dashboard
         if st.session_state.is_admin:
             admin_dashboard()
@@ -691,4 +618,5 @@ def main():
             employee_dashboard()
 
 if __name__ == "__main__":
-    main()
+    with script_run():
+        main()
@@ -0,0 +1,474 @@
+"""Year-partitioned archive of closed leave years.
+
+``leave_requests`` keeps the last ``LEAVE_HOT_YEARS`` leave years (and
+anything still pending); every older year whose requests are all decided
+can be moved to an archive database of its own next to the main file
+(``leave_management-2019.db`` for 2019), so the hot table and its indexes
+stop growing with the history. A request belongs to the year its leave
+starts in, like the leave year of the ledger. ``leave_archive`` catalogues
+the archived years: readers (``leave_queries``, ``team_calendar``,
+``export``, and the rollup and counter rebuilds) read the hot table first
+and then only the archives a query can reach - none for pending-only
+filters, and only the years overlapping a date window - ATTACHing them to
+the connection on first use.
+
+Archiving is online and resumable; each step commits on its own:
+
+1. the year is recorded as ``copying``, provided nothing in it is pending;
+   from then on triggers reject inserts into the year and updates of its
+   requests, so it cannot change while it is copied
+2. its rows are copied into the archive ``LEAVE_ARCHIVE_CHUNK`` request ids
+   at a time, together with the department each employee has (the
+   department the year's rollups are filed under), then indexed like the
+   hot table and checked against it
+3. the year becomes ``purging``: readers take it from the archive and skip
+   what is left of it in the hot table
+4. its hot rows are deleted in chunks, with the ``AFTER DELETE`` triggers
+   suspended in each chunk's transaction so the counters and rollups keep
+   the archived requests
+5. the year becomes ``archived``
+
+Archived requests can be read but not changed or decided. Run it with::
+
+    python archive.py --status
+    python archive.py --run [--hot-years N] [--chunk-size N]
+"""
+import argparse
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date
+
+import database
+from database import configure_connection, execute_script, main_file
+
+HOT_YEARS = int(os.environ.get('LEAVE_HOT_YEARS', '2'))
+ARCHIVE_CHUNK = int(os.environ.get('LEAVE_ARCHIVE_CHUNK', '2000'))
+# Seconds between purge chunks, so the front-ends' writes get the lock in between
+ARCHIVE_PAUSE = float(os.environ.get('LEAVE_ARCHIVE_PAUSE', '0.01'))
+# SQLite's default limit on databases attached to one connection
+ATTACH_LIMIT = 10
+
+STATES = ('copying', 'purging', 'archived')
+# States in which readers take the year from its archive
+READABLE_STATES = ('purging', 'archived')
+
+_YEAR = "CAST(substr({row}.start_date, 1, 4) AS INTEGER)"
+
+ARCHIVE_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS leave_archive (
+        year INTEGER PRIMARY KEY,
+        file TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'copying' CHECK (state IN ('copying', 'purging', 'archived')),
+        requests INTEGER,
+        last_applied TEXT,
+        last_end TEXT,
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        archived_at TIMESTAMP
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_archive_insert
+    BEFORE INSERT ON leave_requests
+    WHEN EXISTS (SELECT 1 FROM leave_archive WHERE year = {_YEAR.format(row='NEW')})
+    BEGIN
+        SELECT RAISE(ABORT, 'leave year is archived');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_archive_update
+    BEFORE UPDATE ON leave_requests
+    WHEN EXISTS (SELECT 1 FROM leave_archive
+                 WHERE year IN ({_YEAR.format(row='OLD')}, {_YEAR.format(row='NEW')}))
+    BEGIN
+        SELECT RAISE(ABORT, 'leave year is archived');
+    END;
+'''
+
+# Inside each archive file, next to its leave_requests
+ARCHIVE_DEPARTMENTS = '''
+    CREATE TABLE IF NOT EXISTS {schema}.employee_departments (
+        emp_id NUMERIC PRIMARY KEY,
+        department TEXT
+    )
+'''
+
+
+def install_archive(conn):
+    """Create the archive catalog and the triggers that freeze catalogued years"""
+    execute_script(conn, ARCHIVE_SCHEMA)
+
+
+def archive_schema(year):
+    """Name an archive is attached under"""
+    return f'archive_{int(year)}'
+
+
+def archive_path(conn, entry):
+    """Path of the archive of catalog ``entry``: its file, in the main file's directory"""
+    return os.path.join(os.path.dirname(main_file(conn)), entry['file'])
+
+
+def archive_file(conn, year):
+    """File name of ``year``'s archive: the main file's name with the year, in its directory"""
+    stem = os.path.splitext(os.path.basename(main_file(conn)))[0]
+    return f'{stem}-{int(year)}.db'
+
+
+def read_catalog(conn):
+    """Catalogued years, newest first, as dicts (none before the archive migration)"""
+    columns = ('year', 'file', 'state', 'requests', 'last_applied', 'last_end', 'started_at')
+    try:
+        rows = conn.execute(f'SELECT {", ".join(columns)} FROM leave_archive ORDER BY year DESC').fetchall()
+    except sqlite3.OperationalError as e:
+        if 'no such table' not in str(e):
+            raise
+        return []
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def hot_only(statuses):
+    """True for a status filter of pending requests only: they are never archived or being purged"""
+    return statuses is not None and set(statuses) <= {'Pending'}
+
+
+@contextmanager
+def read_snapshot(conn, statuses=None):
+    """Read the catalog and the hot table from one snapshot; yields the catalog
+
+    The snapshot keeps a year that is being purged from showing up in
+    neither place. Archives are read after it ends (they do not change, and
+    can only be attached outside a transaction). Inside the caller's own
+    transaction that transaction is the snapshot. Reads of pending requests
+    only (``statuses``) need neither and get an empty catalog.
+    """
+    if hot_only(statuses):
+        yield []
+    elif conn.in_transaction:
+        yield read_catalog(conn)
+    else:
+        conn.execute('BEGIN')
+        try:
+            yield read_catalog(conn)
+        finally:
+            conn.rollback()
+
+
+def hot_exclusion(catalog, column='lr.start_date'):
+    """``(clauses, params)`` leaving the rows of years being purged out of a hot table query"""
+    clauses, params = [], []
+    for entry in catalog:
+        if entry['state'] == 'purging':
+            clauses.append(f'({column} < ? OR {column} >= ?)')
+            params.extend((f'{entry["year"]}-01-01', f'{entry["year"] + 1}-01-01'))
+    return clauses, params
+
+
+def routed_archives(catalog, date_from=None, date_to=None, statuses=None):
+    """Catalog entries of the archives a query with these filters has to read, newest first
+
+    Archives only hold decided requests, so pending-only queries read none;
+    a date window (requests overlapping it) skips the years that start after
+    it or end before it.
+    """
+    if hot_only(statuses):
+        return []
+    return [entry for entry in catalog
+            if entry['state'] in READABLE_STATES
+            and (date_to is None or entry['year'] <= int(str(date_to)[:4]))
+            and (date_from is None or entry['last_end'] >= str(date_from)[:10])]
+
+
+def partition_sql(sql, schema):
+    """``sql`` reading ``schema``'s ``leave_requests lr`` instead of the hot table's"""
+    return sql.replace('leave_requests lr', f'{schema}.leave_requests lr')
+
+
+def attach_archive(conn, entry):
+    """Attach the archive of catalog ``entry`` to ``conn`` unless it is; returns its schema name
+
+    When the attach limit is reached the oldest other archive is detached.
+    """
+    schema = archive_schema(entry['year'])
+    attached = [row[1] for row in conn.execute('PRAGMA database_list') if row[1] not in ('main', 'temp')]
+    if schema in attached:
+        return schema
+    if conn.in_transaction:
+        raise RuntimeError(f'the {entry["year"]} archive must be attached before the transaction starts')
+    archives = sorted(name for name in attached if name.startswith('archive_'))
+    if len(attached) >= ATTACH_LIMIT and archives:
+        conn.execute(f'DETACH DATABASE {archives[0]}')
+    conn.execute('ATTACH DATABASE ? AS ' + schema, (archive_path(conn, entry),))
+    return schema
+
+
+def iter_archived(conn, catalog, sql, params=()):
+    """Rows of ``sql`` run in each readable archive of ``catalog`` in turn, on a connection of its own
+
+    For aggregates over the whole history inside a transaction (rebuilds),
+    where archives cannot be attached.
+    """
+    for entry in catalog:
+        if entry['state'] not in READABLE_STATES:
+            continue
+        archive = sqlite3.connect(f'file:{archive_path(conn, entry)}?mode=ro', uri=True)
+        try:
+            yield from archive.execute(sql, params)
+        finally:
+            archive.close()
+
+
+def is_archived_year(conn, day):
+    """True if requests starting on ``day`` can no longer be added or changed"""
+    return conn.execute('SELECT 1 FROM leave_archive WHERE year = ?', (int(str(day)[:4]),)).fetchone() is not None
+
+
+def _year_totals(conn):
+    """``{year: (requests, pending, days, request id sum)}`` of the hot table, in one scan"""
+    return {row[0]: row[1:] for row in conn.execute(f'''
+        SELECT {_YEAR.format(row='leave_requests')}, COUNT(*), SUM(status = 'Pending'), SUM(days), SUM(request_id)
+        FROM leave_requests
+        GROUP BY 1
+    ''')}
+
+
+def _year_bounds(year):
+    return f'{year}-01-01', f'{year + 1}-01-01'
+
+
+def _claim(conn, year):
+    """Record ``year`` as ``copying`` unless it has pending requests; True if it was"""
+    database.begin_immediate(conn)
+    try:
+        first, following = _year_bounds(year)
+        pending = conn.execute('''
+            SELECT 1 FROM leave_requests
+            WHERE status = 'Pending' AND start_date >= ? AND start_date < ? LIMIT 1
+        ''', (first, following)).fetchone()
+        if not pending:
+            conn.execute('INSERT OR IGNORE INTO leave_archive (year, file) VALUES (?, ?)',
+                         (year, archive_file(conn, year)))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return not pending
+
+
+def _create_archive(conn, schema):
+    """The archive's ``leave_requests`` with the hot table's columns, and its department table"""
+    columns = [f'{name} INTEGER PRIMARY KEY' if primary_key else f'{name} {declared}'.rstrip()
+               for _, name, declared, _, _, primary_key in conn.execute('PRAGMA main.table_info(leave_requests)')]
+    conn.execute(f'CREATE TABLE IF NOT EXISTS {schema}.leave_requests ({", ".join(columns)})')
+    conn.execute(ARCHIVE_DEPARTMENTS.format(schema=schema))
+
+
+def _hot_indexes(conn, schema=None):
+    """``CREATE INDEX`` statements of the hot table's indexes, made on ``schema`` if given"""
+    prefix = f'{schema}.' if schema else ''
+    return [re.sub(r'^CREATE INDEX (IF NOT EXISTS )?', f'CREATE INDEX IF NOT EXISTS {prefix}', sql)
+            for (sql,) in conn.execute('''
+                SELECT sql FROM main.sqlite_master
+                WHERE type = 'index' AND tbl_name = 'leave_requests' AND sql IS NOT NULL
+            ''').fetchall()]
+
+
+def _index_archive(conn, schema):
+    """Give the archive the hot table's indexes, so both partitions get the same plans"""
+    for sql in _hot_indexes(conn, schema):
+        conn.execute(sql)
+    conn.execute(f'ANALYZE {schema}')
+
+
+def index_archives(conn):
+    """Give the readable archives the hot table's indexes they lack, after a migration adds one
+
+    Each archive is indexed on a connection of its own, so this also runs
+    inside the migration's transaction, where archives cannot be attached.
+    """
+    statements = _hot_indexes(conn)
+    for entry in read_catalog(conn):
+        if entry['state'] not in READABLE_STATES:
+            continue
+        archive = configure_connection(sqlite3.connect(archive_path(conn, entry)))
+        try:
+            with archive:
+                for sql in statements:
+                    archive.execute(sql)
+                archive.execute('ANALYZE leave_requests')
+        finally:
+            archive.close()
+
+
+def _copy(conn, entries, chunk_size):
+    """Copy the hot rows of the ``copying`` years into their archives, in one pass over the request ids"""
+    columns = ', '.join(row[1] for row in conn.execute('PRAGMA main.table_info(leave_requests)'))
+    resume = {}
+    for entry in entries:
+        schema = attach_archive(conn, entry)
+        _create_archive(conn, schema)
+        resume[entry['year']] = conn.execute(
+            f'SELECT COALESCE(MAX(request_id), 0) FROM {schema}.leave_requests').fetchone()[0]
+    last = conn.execute('SELECT COALESCE(MAX(request_id), 0) FROM main.leave_requests').fetchone()[0]
+    low = min(resume.values())
+    copied = 0
+    while low < last:
+        high = low + chunk_size
+        with conn:  # commits into the archives only; the hot table is just read
+            for year, done in resume.items():
+                first, following = _year_bounds(year)
+                copied += conn.execute(f'''
+                    INSERT INTO {archive_schema(year)}.leave_requests ({columns})
+                    SELECT {columns} FROM main.leave_requests
+                    WHERE request_id > ? AND request_id <= ? AND start_date >= ? AND start_date < ?
+                ''', (max(low, done), high, first, following)).rowcount
+        low = high
+    return copied
+
+
+def _seal(conn, entry, totals):
+    """Index and check a copied archive, then hand its reads over to it"""
+    year = entry['year']
+    schema = archive_schema(year)
+    with conn:
+        conn.execute(f'''
+            INSERT OR REPLACE INTO {schema}.employee_departments (emp_id, department)
+            SELECT emp_id, department FROM main.employees
+            WHERE emp_id IN (SELECT emp_id FROM {schema}.leave_requests)
+        ''')
+        _index_archive(conn, schema)
+    archived = conn.execute(f'''
+        SELECT COUNT(*), SUM(status = 'Pending'), SUM(days), SUM(request_id), MAX(applied_date), MAX(end_date)
+        FROM {schema}.leave_requests
+    ''').fetchone()
+    if archived[:4] != totals.get(year, (0, None, None, None)):
+        raise RuntimeError(f'{year} archive does not match the hot table: '
+                           f'{archived[:4]} archived, {totals.get(year)} in leave_requests')
+    with conn:
+        conn.execute('''
+            UPDATE leave_archive SET state = 'purging', requests = ?, last_applied = ?, last_end = ?
+            WHERE year = ? AND state = 'copying'
+        ''', (archived[0], archived[4], archived[5], year))
+
+
+def _delete_triggers(conn):
+    return conn.execute('''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'trigger' AND tbl_name = 'leave_requests' AND sql LIKE '%AFTER DELETE ON leave_requests%'
+    ''').fetchall()
+
+
+def _purge(conn, entry, chunk_size, pause):
+    """Delete a ``purging`` year's hot rows in chunks, then mark it ``archived``; returns rows deleted"""
+    schema = attach_archive(conn, entry)
+    deleted, last = 0, 0
+    while True:
+        database.begin_immediate(conn)
+        try:
+            high = conn.execute(f'''
+                SELECT MAX(request_id) FROM (SELECT request_id FROM {schema}.leave_requests
+                                             WHERE request_id > ? ORDER BY request_id LIMIT ?)
+            ''', (last, chunk_size)).fetchone()[0]
+            triggers = _delete_triggers(conn)
+            for name, _ in triggers:
+                conn.execute(f'DROP TRIGGER {name}')
+            if high is not None:
+                deleted += conn.execute(f'''
+                    DELETE FROM main.leave_requests
+                    WHERE request_id IN (SELECT request_id FROM {schema}.leave_requests
+                                         WHERE request_id > ? AND request_id <= ?)
+                ''', (last, high)).rowcount
+            else:
+                conn.execute('''
+                    UPDATE leave_archive SET state = 'archived', archived_at = CURRENT_TIMESTAMP
+                    WHERE year = ? AND state = 'purging'
+                ''', (entry['year'],))
+            for _, sql in triggers:
+                conn.execute(sql)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if high is None:
+            return deleted
+        last = high
+        time.sleep(pause)
+
+
+def _detach_archives(conn):
+    for (schema,) in conn.execute("SELECT name FROM pragma_database_list WHERE name LIKE 'archive_%'").fetchall():
+        conn.execute(f'DETACH DATABASE {schema}')
+
+
+def blocked_years(conn, hot_years=HOT_YEARS, today=None):
+    """``{year: pending requests}`` of the closed years kept in the hot table by pending requests"""
+    newest_closed = (today or date.today()).year - hot_years
+    return {year: totals[1] for year, totals in sorted(_year_totals(conn).items())
+            if year <= newest_closed and totals[1]}
+
+
+def run_archive(conn, hot_years=HOT_YEARS, chunk_size=ARCHIVE_CHUNK, pause=ARCHIVE_PAUSE, today=None):
+    """Archive every closed year and finish interrupted runs; returns ``{year: requests purged}``
+
+    A year is closed once it is older than the ``hot_years`` most recent
+    leave years; years with pending requests are left for a later run.
+    ``conn`` must not be in a transaction.
+    """
+    newest_closed = (today or date.today()).year - hot_years
+    totals = _year_totals(conn)
+    for year in sorted(totals):
+        if year <= newest_closed and not totals[year][1]:
+            _claim(conn, year)
+    catalog = read_catalog(conn)
+    copying = [entry for entry in catalog if entry['state'] == 'copying']
+    # One pass copies as many years as can be attached at once
+    for start in range(0, len(copying), ATTACH_LIMIT - 1):
+        group = copying[start:start + ATTACH_LIMIT - 1]
+        _detach_archives(conn)
+        _copy(conn, group, chunk_size)
+        totals = _year_totals(conn)
+        for entry in group:
+            _seal(conn, entry, totals)
+    purged = {}
+    for entry in read_catalog(conn):
+        if entry['state'] == 'purging':
+            purged[entry['year']] = _purge(conn, entry, chunk_size, pause)
+    if purged:
+        # Full statistics of the smaller hot table; sampled ones mislead the planner
+        conn.execute('ANALYZE main.leave_requests')
+    _detach_archives(conn)
+    return purged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move closed leave years to per-year archive databases')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--run', action='store_true', help='archive every closed year')
+    parser.add_argument('--hot-years', type=int, default=HOT_YEARS, help='recent leave years kept in the hot table')
+    parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK, help='request ids per copy or delete chunk')
+    parser.add_argument('--status', action='store_true', help='list the archived years')
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        if args.run:
+            started = time.perf_counter()
+            purged = run_archive(conn, args.hot_years, args.chunk_size)
+            for year, requests in sorted(purged.items()):
+                print(f'{year}: {requests:,} requests moved to {archive_file(conn, year)}')
+            print(f'Archived {len(purged)} years in {time.perf_counter() - started:.1f}s')
+            for year, pending in blocked_years(conn, args.hot_years).items():
+                print(f'{year}: not archived, {pending:,} requests still pending')
+        if args.status or not args.run:
+            for entry in reversed(read_catalog(conn)):
+                present = '' if os.path.exists(archive_path(conn, entry)) else ' (file missing)'
+                print(f'{entry["year"]}: {entry["state"]:<8} {entry["requests"] or 0:>10,} requests '
+                      f'in {entry["file"]}{present}')
+            hot = conn.execute('SELECT COUNT(*) FROM leave_requests').fetchone()[0]
+            print(f'{hot:,} requests in the hot table')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
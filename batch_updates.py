@@ -0,0 +1,125 @@
+"""Single-transaction bulk approval/rejection of leave requests.
+
+Managers clear hundreds of requests at once after holidays. Instead of one
+connection, commit and page rerun per request, :func:`apply_status_batch`
+takes many ``(request_id, status)`` decisions and applies them in one
+``BEGIN IMMEDIATE`` transaction. Status changes go through ``executemany``
+and ``used_leaves`` adjustments are aggregated to one update per employee.
+
+Only requests that are still ``Pending`` are decided. Anything else (already
+decided by another manager, unknown id, repeated in the batch, invalid
+status) is reported back as a conflict rather than failing the whole batch.
+With ``reports_only``, requests of employees outside the approver's reporting
+line (see ``hierarchy``) are reported back as forbidden.
+"""
+from collections import defaultdict
+
+from hierarchy import reports_among
+
+DECISION_STATUSES = ('Approved', 'Rejected')
+CHUNK_SIZE = 500
+
+# Per-item outcomes
+UPDATED = 'updated'
+CONFLICT = 'conflict'
+NOT_FOUND = 'not_found'
+INVALID = 'invalid'
+FORBIDDEN = 'forbidden'
+# Approved at one step of a multi-level chain and passed to the next approver (see ``workflow``)
+FORWARDED = 'forwarded'
+
+
+def _load_requests(conn, id_column, request_ids):
+    """Map request id -> (emp_id, days, status, start_date, end_date) for the given ids"""
+    found = {}
+    request_ids = list(request_ids)
+    for start in range(0, len(request_ids), CHUNK_SIZE):
+        chunk = request_ids[start:start + CHUNK_SIZE]
+        rows = conn.execute(f'''
+            SELECT {id_column}, emp_id, days, status, start_date, end_date FROM leave_requests
+            WHERE {id_column} IN ({', '.join('?' * len(chunk))})
+        ''', chunk)
+        for request_id, *fields in rows:
+            found[request_id] = tuple(fields)
+    return found
+
+
+def apply_status_batch(conn, decisions, approver_id, id_column='request_id', reports_only=False):
+    """Apply ``(request_id, status)`` decisions atomically
+
+    Returns one dict per decision, in input order, with keys ``request_id``,
+    ``status``, ``result`` (``updated``/``conflict``/``not_found``/``invalid``/``forbidden``)
+    and ``detail``; requests that exist also carry their ``start_date`` and
+    ``end_date``. The caller's connection must not be inside a transaction.
+    """
+    if not decisions:
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        results = decide_batch(conn, decisions, approver_id, id_column, reports_only)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results
+
+
+def decide_batch(conn, decisions, approver_id, id_column='request_id', reports_only=False):
+    """:func:`apply_status_batch` inside the caller's write transaction (e.g. ``write_transaction``)"""
+    decisions = [(int(request_id), status) for request_id, status in decisions]
+    if not decisions:
+        return []
+
+    current = _load_requests(conn, id_column, {request_id for request_id, _ in decisions})
+    if reports_only:
+        reports = reports_among(conn, approver_id, {fields[0] for fields in current.values()}, CHUNK_SIZE)
+
+    results = []
+    updates = []
+    used_delta = defaultdict(int)
+    seen = set()
+    for request_id, status in decisions:
+        result = {'request_id': request_id, 'status': status, 'result': UPDATED, 'detail': ''}
+        results.append(result)
+        if status not in DECISION_STATUSES:
+            result.update(result=INVALID, detail=f'Unknown status {status!r}')
+            continue
+        if request_id not in current:
+            result.update(result=NOT_FOUND, detail='No such leave request')
+            continue
+        if request_id in seen:
+            result.update(result=CONFLICT, detail='Decided earlier in this batch')
+            continue
+        emp_id, days, old_status, start_date, end_date = current[request_id]
+        if reports_only and emp_id not in reports:
+            result.update(result=FORBIDDEN, detail='Not in your reporting line')
+            continue
+        result.update(start_date=start_date, end_date=end_date)
+        if old_status != 'Pending':
+            result.update(result=CONFLICT, detail=f'Already {old_status}')
+            continue
+        seen.add(request_id)
+        updates.append((status, approver_id, request_id))
+        if status == 'Approved':
+            used_delta[emp_id] += days
+
+    conn.executemany(f'''
+        UPDATE leave_requests
+        SET status = ?, approved_by = ?, approved_date = CURRENT_TIMESTAMP
+        WHERE {id_column} = ? AND status = 'Pending'
+    ''', updates)
+    conn.executemany('''
+        UPDATE employees SET used_leaves = used_leaves + ? WHERE emp_id = ?
+    ''', [(days, emp_id) for emp_id, days in used_delta.items()])
+    return results
+
+
+def summarize_batch(results):
+    """Count batch results by outcome, e.g. ``{'updated': 40, 'conflict': 2}``"""
+    summary = defaultdict(int)
+    for result in results:
+        summary[result['result']] += 1
+    return dict(summary)
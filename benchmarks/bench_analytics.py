@@ -0,0 +1,121 @@
+"""Department analytics: monthly rollups vs. aggregating ``leave_requests``.
+
+Generates a dataset spanning ``--years`` years, then times the same reports
+answered from ``leave_rollups`` (``analytics.query_rollups``) and by grouping
+the requests joined to their employees, and checks that both agree. Also
+reports the cost the rollup triggers add to a write: approving requests one
+at a time with and without the triggers installed.
+
+Usage:
+    python benchmarks/bench_analytics.py [--employees N] [--requests N] [--years N]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytics import ROLLUP_SCHEMA, query_rollups  # noqa: E402
+from database import configure_connection, execute_script  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+
+SCAN_QUERY = '''
+    SELECT {columns}, COUNT(*), SUM(days)
+    FROM (SELECT COALESCE(e.department, '') AS department, substr(lr.start_date, 1, 7) AS month,
+                 lr.leave_type, lr.status, lr.days
+          FROM leave_requests lr LEFT JOIN employees e ON e.emp_id = lr.emp_id
+          WHERE lr.start_date >= ? AND lr.start_date < ? {department})
+    GROUP BY {columns}
+    ORDER BY {columns}
+'''
+
+REPORTS = [
+    ('department x month, all years', ('department', 'month'), None),
+    ('department x leave type x status', ('department', 'leave_type', 'status'), None),
+    ('one department by month and status', ('month', 'status'), 'Engineering'),
+]
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def scan(conn, month_from, month_to, department, group_by):
+    columns = ', '.join(group_by)
+    end = date(int(month_to[:4]), int(month_to[5:7]), 1)
+    end = date(end.year + end.month // 12, end.month % 12 + 1, 1)
+    params = [f'{month_from}-01', end.isoformat()] + ([department] if department else [])
+    sql = SCAN_QUERY.format(columns=columns, department='AND e.department = ?' if department else '')
+    return conn.execute(sql, params).fetchall()
+
+
+def approval_cost(conn, id_column, count):
+    """Median milliseconds per single approval transaction"""
+    ids = [row[0] for row in conn.execute(
+        f"SELECT {id_column} FROM leave_requests WHERE status = 'Pending' LIMIT ?", (count,))]
+    samples = []
+    for request_id in ids:
+        started = time.perf_counter()
+        with conn:
+            conn.execute(f"UPDATE leave_requests SET status = 'Approved' WHERE {id_column} = ?", (request_id,))
+        samples.append((time.perf_counter() - started) * 1000)
+    with conn:
+        conn.executemany(f"UPDATE leave_requests SET status = 'Pending' WHERE {id_column} = ?",
+                         [(request_id,) for request_id in ids])
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=1_000_000)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-analytics-')
+    db_path = os.path.join(workdir, 'analytics.db')
+    print(f'Generating {args.requests:,} requests over {args.years} years...')
+    build_dataset(db_path, employees=args.employees, requests=args.requests, years=args.years)
+    conn = configure_connection(sqlite3.connect(db_path))
+    month_from = conn.execute('SELECT substr(MIN(start_date), 1, 7) FROM leave_requests').fetchone()[0]
+    month_to = conn.execute('SELECT substr(MAX(start_date), 1, 7) FROM leave_requests').fetchone()[0]
+    rollup_rows = conn.execute('SELECT COUNT(*) FROM leave_rollups').fetchone()[0]
+    print(f'{rollup_rows:,} rollup rows for {month_from}..{month_to}\n')
+
+    for name, group_by, department in REPORTS:
+        fast, fast_ms = timed(lambda: query_rollups(conn, month_from, month_to, department, group_by),
+                              args.iterations)
+        slow, slow_ms = timed(lambda: scan(conn, month_from, month_to, department, group_by),
+                              args.iterations)
+        status = 'same result' if fast == slow else 'MISMATCH'
+        print(f'{name:<36} rollup {fast_ms:8.2f} ms   scan {slow_ms:9.1f} ms   '
+              f'{slow_ms / max(fast_ms, 1e-6):7,.0f}x   {len(fast):,} rows, {status}')
+
+    with_triggers = approval_cost(conn, 'request_id', 500)
+    with conn:
+        for trigger in ('insert', 'delete', 'update'):
+            conn.execute(f'DROP TRIGGER trg_leave_rollups_{trigger}')
+    without_triggers = approval_cost(conn, 'request_id', 500)
+    with conn:
+        execute_script(conn, ROLLUP_SCHEMA)
+    print(f'\nsingle approval: {with_triggers:.3f} ms with rollup triggers, '
+          f'{without_triggers:.3f} ms without')
+    conn.close()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
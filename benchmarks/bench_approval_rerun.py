@@ -0,0 +1,105 @@
+"""Server time per approval click: full-page rerun vs fragment-scoped rerun.
+
+Seeds a throw-away leave_management.py database with ``--pending`` pending
+requests and drives the app headlessly with ``streamlit.testing.v1.AppTest``.
+
+* before: a click used to run the whole script for the click and then again for
+  ``st.rerun()`` (CSS, every stats query, the request list, every row).
+* after: the click runs the row's ``on_click`` callback and reruns only the
+  ``approval_row`` fragment.
+
+Usage:
+    python benchmarks/bench_approval_rerun.py [--pending 1000] [--clicks 20]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MANAGER = {'emp_id': 1002, 'name': 'Jane Smith', 'email': 'jane.smith@acme.com',
+           'department': 'Engineering', 'role': 'Manager', 'total_leaves': 20, 'used_leaves': 3}
+
+
+def seed(pending):
+    import leave_management as lm
+    from database import get_connection
+
+    lm.init_database()
+    start = date(2030, 1, 1)
+    with get_connection() as conn:
+        conn.executemany('''
+            INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status)
+            VALUES (?, 'Casual Leave', ?, ?, 1, 'benchmark', 'Pending')
+        ''', [(1001 + i % 7, str(start + timedelta(days=i)), str(start + timedelta(days=i)))
+              for i in range(pending)])
+    with get_connection() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT request_id FROM leave_requests WHERE status = 'Pending' ORDER BY applied_date DESC, request_id DESC")]
+
+
+def approval_row_script(row, manager_id):
+    import leave_management as lm
+    lm.approval_row(row, manager_id)
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pending', type=int, default=1000)
+    parser.add_argument('--clicks', type=int, default=20)
+    args = parser.parse_args()
+
+    from streamlit.testing.v1 import AppTest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        database.set_db_path(os.path.join(tmp, 'bench.db'))
+        pending_ids = seed(args.pending)
+
+        import leave_management as lm
+
+        # Before: every click paid for two full script runs plus the update
+        full = AppTest.from_file(os.path.join(ROOT, 'leave_management.py'), default_timeout=120)
+        full.session_state['logged_in'] = True
+        full.session_state['user'] = MANAGER
+        full.run()
+        before = []
+        for request_id in pending_ids[:args.clicks]:
+            started = time.perf_counter()
+            lm.update_leave_statuses([(request_id, 'Approved')], MANAGER['emp_id'])
+            full.run()
+            full.run()
+            before.append(time.perf_counter() - started)
+
+        # After: callback + a rerun of the single row fragment
+        after = []
+        for request_id in pending_ids[args.clicks:args.clicks * 2]:
+            row = {'request_id': request_id, 'name': 'John Doe', 'department': 'Engineering',
+                   'leave_type': 'Casual Leave', 'days': 1, 'start_date': '2030-01-01',
+                   'end_date': '2030-01-01', 'reason': 'benchmark', 'status': 'Pending'}
+            fragment = AppTest.from_function(approval_row_script, args=(row, MANAGER['emp_id']))
+            started = time.perf_counter()
+            lm.update_leave_statuses([(request_id, 'Approved')], MANAGER['emp_id'])  # decide_request's work
+            fragment.run()
+            after.append(time.perf_counter() - started)
+
+        database.close_pools()
+
+    for label, samples in (('full-page rerun (before)', before), ('fragment rerun (after)', after)):
+        print(f'{label:<28} mean {statistics.fmean(samples) * 1000:8.1f} ms   '
+              f'p50 {percentile(samples, 0.5) * 1000:8.1f} ms   p95 {percentile(samples, 0.95) * 1000:8.1f} ms')
+    print(f'{args.pending} pending rows, {args.clicks} clicks each')
+
+
+if __name__ == '__main__':
+    main()
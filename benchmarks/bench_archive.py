@@ -0,0 +1,266 @@
+"""Year-partitioned archive: hot-path queries on a ten-year history, before and after archiving.
+
+Generates ``--employees`` and ``--requests`` spread over ``--years`` of
+history and rejects the requests of closed years still pending (the
+clean-up that lets a year close). It times the hot-path reads the
+front-ends make (queues, this month's requests and calendar, an
+employee's history, overlap checks) on the whole history in one table,
+then moves every closed year to its archive with ``archive.run_archive``
+and times them again on the hot table plus the archives, checking that
+every query returns the same rows as before.
+
+Archiving is then repeated on a fresh copy the way it runs in production:
+a ``python archive.py --run`` process is killed after ``--interrupt``
+seconds and the run is resumed while another connection keeps applying
+for and deciding leave. Afterwards every request is in exactly one
+partition and the counters, rollups, ledger and query plans still agree.
+
+Usage:
+    python benchmarks/bench_archive.py [--employees N] [--requests N] [--years N]
+                                       [--chunk-size N] [--interrupt SECONDS]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from analytics import check_rollups  # noqa: E402
+from archive import ARCHIVE_CHUNK, HOT_YEARS, archive_path, read_catalog, run_archive  # noqa: E402
+from counters import rebuild_leave_counters  # noqa: E402
+from database import begin_immediate, configure_connection  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+from hierarchy import top_manager  # noqa: E402
+from leave_queries import count_leaves, fetch_leave_records  # noqa: E402
+from ledger import reconcile  # noqa: E402
+from migrations import check_query_plans  # noqa: E402
+from overlaps import find_overlap  # noqa: E402
+from schema import LEAVE_MANAGEMENT  # noqa: E402
+from team_calendar import _load_month  # noqa: E402
+
+REPEAT = 30
+SELECT = '''
+    SELECT lr.request_id, e.name, e.department, lr.leave_type,
+           lr.start_date, lr.end_date, lr.days, lr.reason, lr.status, lr.applied_date
+    FROM leave_requests lr
+    JOIN employees e ON lr.emp_id = e.emp_id
+'''
+
+
+def hot_path(today):
+    """``(name, function(conn, emp_id))`` of the reads timed; ``emp_id`` varies per call"""
+    month_first = today.replace(day=1)
+    month_last = (month_first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+    history_year = today.year - HOT_YEARS - 3
+
+    def page(**filters):
+        return lambda conn, emp_id: fetch_leave_records(conn, SELECT, 'request_id', **filters)
+
+    return [
+        ('pending queue, page 1', page(statuses=['Pending'])),
+        ('all requests, page 1', page()),
+        ('this month, page 1', page(date_from=month_first, date_to=month_last)),
+        ('this month, count',
+         lambda conn, emp_id: count_leaves(conn, date_from=month_first, date_to=month_last)),
+        ('approved this year, count',
+         lambda conn, emp_id: count_leaves(conn, statuses=['Approved'], date_from=date(today.year, 1, 1))),
+        ('all approved, count', lambda conn, emp_id: count_leaves(conn, statuses=['Approved'])),
+        ('employee pending, page 1',
+         lambda conn, emp_id: fetch_leave_records(conn, SELECT, 'request_id', emp_id=emp_id, statuses=['Pending'])),
+        ('employee history, page 1',
+         lambda conn, emp_id: fetch_leave_records(conn, SELECT, 'request_id', emp_id=emp_id)),
+        (f'employee history {history_year}',
+         lambda conn, emp_id: fetch_leave_records(conn, SELECT, 'request_id', emp_id=emp_id,
+                                                  date_from=date(history_year, 1, 1),
+                                                  date_to=date(history_year, 12, 31))),
+        ('overlap check',
+         lambda conn, emp_id: find_overlap(conn, emp_id, today + timedelta(days=30), today + timedelta(days=34))),
+    ]
+
+
+def time_hot_path(db_path, queries, emp_ids, department, manager, today):
+    """``({name: median ms}, {name: results})``; results come from the first call of each query"""
+    conn = configure_connection(sqlite3.connect(db_path))
+    database.set_db_path(db_path)
+    queries = queries + [
+        ('manager queue, page 1',
+         lambda conn, emp_id: fetch_leave_records(conn, SELECT, 'request_id', manager_id=manager,
+                                                  statuses=['Pending'])),
+        ('team calendar, this month',
+         lambda conn, emp_id: _load_month(department, today.year, today.month)['matrix'].tobytes()),
+    ]
+    timings, results = {}, {}
+    for name, query in queries:
+        query(conn, emp_ids[0])  # warm the page cache and attach the archives it reads
+        samples = []
+        for emp_id in emp_ids:
+            started = time.perf_counter()
+            result = query(conn, emp_id)
+            samples.append((time.perf_counter() - started) * 1000)
+            results.setdefault(name, result)
+        timings[name] = statistics.median(samples)
+    conn.close()
+    database.close_pools()
+    return timings, results
+
+
+def close_years(db_path, today):
+    """Reject the pending requests of the years old enough to archive; returns how many"""
+    conn = configure_connection(sqlite3.connect(db_path))
+    with conn:
+        closed = conn.execute('''
+            UPDATE leave_requests SET status = 'Rejected', approved_date = CURRENT_TIMESTAMP
+            WHERE status = 'Pending' AND start_date < ?
+        ''', (f'{today.year - HOT_YEARS + 1}-01-01',)).rowcount
+    conn.close()
+    return closed
+
+
+def writer(db_path, stop, latencies, today):
+    """Apply for leave and reject the oldest pending request until ``stop`` is set, recording transaction times"""
+    conn = configure_connection(sqlite3.connect(db_path, timeout=30))
+    rng = random.Random(11)
+    emp_ids = [row[0] for row in conn.execute('SELECT emp_id FROM employees')]
+    while not stop.is_set():
+        started = time.perf_counter()
+        begin_immediate(conn)
+        day = today + timedelta(days=rng.randrange(60, 400))
+        conn.execute('''
+            INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status)
+            VALUES (?, 'Casual Leave', ?, ?, 1, 'archive benchmark', 'Pending')
+        ''', (rng.choice(emp_ids), day.isoformat(), day.isoformat()))
+        pending = conn.execute('''
+            SELECT request_id FROM leave_requests WHERE status = 'Pending' ORDER BY applied_date LIMIT 1
+        ''').fetchone()
+        conn.execute("UPDATE leave_requests SET status = 'Rejected' WHERE request_id = ?", pending)
+        conn.commit()
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.005)
+    conn.close()
+
+
+def online_run(db_path, chunk_size, interrupt, today):
+    """Kill an archiving process part way, resume it under concurrent writes; returns a list of problems"""
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archive.py')
+    process = subprocess.Popen([sys.executable, script, '--db', db_path, '--run', '--chunk-size', str(chunk_size)],
+                               stdout=subprocess.DEVNULL)
+    time.sleep(interrupt)
+    process.kill()
+    process.wait()
+    conn = configure_connection(sqlite3.connect(db_path, timeout=30))
+    states = [f'{entry["year"]} {entry["state"]}' for entry in reversed(read_catalog(conn))]
+    print(f'Killed the archiving process after {interrupt:.1f}s: {", ".join(states) or "nothing catalogued"}')
+    total = conn.execute('SELECT total FROM leave_counters').fetchone()[0]
+
+    stop, latencies = threading.Event(), []
+    thread = threading.Thread(target=writer, args=(db_path, stop, latencies, today))
+    thread.start()
+    started = time.perf_counter()
+    try:
+        purged = run_archive(conn, chunk_size=chunk_size, today=today)
+    finally:
+        stop.set()
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f'Resumed: {len(purged)} years purged in {elapsed:.1f}s while {len(latencies):,} write transactions '
+          f'committed (median {statistics.median(latencies):.1f} ms, '
+          f'p99 {latencies[int(len(latencies) * 0.99)]:.1f} ms, max {latencies[-1]:.0f} ms)')
+
+    problems = []
+    catalog = read_catalog(conn)
+    if any(entry['state'] != 'archived' for entry in catalog):
+        problems.append(f'years left unfinished: {[(e["year"], e["state"]) for e in catalog]}')
+    hot = conn.execute('SELECT COUNT(*) FROM leave_requests').fetchone()[0]
+    archived = sum(entry['requests'] for entry in catalog)
+    if hot + archived != total + len(latencies):
+        problems.append(f'{hot:,} hot + {archived:,} archived requests, expected {total + len(latencies):,}')
+    stored = conn.execute('SELECT * FROM employee_leave_counters ORDER BY emp_id').fetchall()
+    conn.execute('BEGIN IMMEDIATE')
+    rebuild_leave_counters(conn)
+    rebuilt = conn.execute('SELECT * FROM employee_leave_counters ORDER BY emp_id').fetchall()
+    conn.rollback()
+    if stored != rebuilt:
+        problems.append('counters differ from a rebuild over the partitions')
+    for label, found in (('rollups', check_rollups(conn)), ('ledger', reconcile(conn)),
+                         ('plans', check_query_plans(conn))):
+        if found:
+            problems.append(f'{label}: {len(found)} problems')
+    conn.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=20_000)
+    parser.add_argument('--requests', type=int, default=1_000_000)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK, help='request ids per archive chunk')
+    parser.add_argument('--interrupt', type=float, default=3.0, help='seconds before killing the first run')
+    args = parser.parse_args()
+
+    today = date.today()
+    workdir = tempfile.mkdtemp(prefix='leave-archive-')
+    db_path = os.path.join(workdir, 'leave.db')
+    history_path = os.path.join(workdir, 'history.db')
+    problems = []
+    try:
+        print(f'Generating {args.requests:,} requests of {args.employees:,} employees over {args.years} years...')
+        build_dataset(db_path, LEAVE_MANAGEMENT, args.employees, args.requests, years=args.years, today=today)
+        print(f'{close_years(db_path, today):,} stale pending requests of closed years rejected')
+        shutil.copyfile(db_path, history_path)
+
+        conn = configure_connection(sqlite3.connect(db_path))
+        rng = random.Random(7)
+        emp_ids = rng.sample([row[0] for row in conn.execute('SELECT emp_id FROM employees')], REPEAT)
+        department = conn.execute('''
+            SELECT department FROM employees GROUP BY department ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()[0]
+        manager = top_manager(conn)
+        conn.close()
+        queries = hot_path(today)
+        before, expected = time_hot_path(db_path, queries, emp_ids, department, manager, today)
+
+        conn = configure_connection(sqlite3.connect(db_path))
+        started = time.perf_counter()
+        purged = run_archive(conn, chunk_size=args.chunk_size, today=today)
+        elapsed = time.perf_counter() - started
+        hot = conn.execute('SELECT COUNT(*) FROM leave_requests').fetchone()[0]
+        sizes = sum(os.path.getsize(archive_path(conn, entry)) for entry in read_catalog(conn))
+        conn.close()
+        print(f'Archived {len(purged)} years ({sum(purged.values()):,} requests, {sizes / 2**20:.0f} MB of archives) '
+              f'in {elapsed:.1f}s; {hot:,} requests left in the hot table')
+
+        after, results = time_hot_path(db_path, queries, emp_ids, department, manager, today)
+        print(f'{"query":<28} {"one table":>10} {"archived":>10}')
+        for name in before:
+            print(f'{name:<28} {before[name]:>8.2f}ms {after[name]:>8.2f}ms {before[name] / after[name]:>6.1f}x')
+            if results[name] != expected[name]:
+                problems.append(f'{name}: results differ after archiving')
+
+        print('Archiving again on a fresh copy, interrupted and resumed under writes...')
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(history_path + suffix):
+                os.remove(history_path + suffix)
+        problems += online_run(history_path, args.chunk_size, args.interrupt, today)
+    finally:
+        shutil.rmtree(workdir)
+    for problem in problems:
+        print(f'FAIL {problem}')
+    if problems:
+        raise SystemExit(1)
+    print('Every query returns the same rows from the partitions; counters, rollups and ledger agree')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Per-call latency of the data functions: fresh sqlite3.connect vs the shared pool.
+
+Runs the queries behind the balance card, the full leave list of an employee
+and the pending count against a throw-away database, once opening a
+new connection per call (the old behaviour) and once through ``database``.
+
+Usage:
+    python benchmarks/bench_connection_pool.py [--employees N] [--requests N] [--calls N]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionPool  # noqa: E402
+
+QUERIES = {
+    'get_leave_statistics': (
+        'SELECT total_leaves, used_leaves FROM employees WHERE emp_id = ?',
+        lambda i, n: (1000 + i % n,),
+    ),
+    'get_employee_leaves': (
+        '''SELECT request_id, leave_type, start_date, end_date, days, reason, status, applied_date
+           FROM leave_requests WHERE emp_id = ? ORDER BY applied_date DESC''',
+        lambda i, n: (1000 + i % n,),
+    ),
+    'pending_count': (
+        "SELECT COUNT(*) FROM leave_requests WHERE status = 'Pending'",
+        lambda i, n: (),
+    ),
+}
+
+
+def build_database(path, employees, requests):
+    """Create a leave_management.py-flavoured database with synthetic rows"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE employees (
+            emp_id INTEGER PRIMARY KEY, name TEXT NOT NULL, email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL, department TEXT NOT NULL, role TEXT NOT NULL,
+            total_leaves INTEGER DEFAULT 20, used_leaves INTEGER DEFAULT 0);
+        CREATE TABLE leave_requests (
+            request_id INTEGER PRIMARY KEY AUTOINCREMENT, emp_id INTEGER NOT NULL,
+            leave_type TEXT NOT NULL, start_date DATE NOT NULL, end_date DATE NOT NULL,
+            days INTEGER NOT NULL, reason TEXT, status TEXT DEFAULT 'Pending',
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP, approved_by INTEGER,
+            approved_date TIMESTAMP);
+    ''')
+    conn.executemany(
+        'INSERT INTO employees VALUES (?, ?, ?, ?, ?, ?, 20, 0)',
+        ((1000 + i, f'Employee {i}', f'e{i}@acme.com', 'x', 'Engineering', 'Employee')
+         for i in range(employees)))
+    statuses = ('Pending', 'Approved', 'Rejected')
+    conn.executemany(
+        '''INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status, applied_date)
+           VALUES (?, 'Casual Leave', '2025-01-01', '2025-01-02', 2, 'bench', ?, datetime('2025-01-01', ? || ' minutes'))''',
+        ((1000 + i % employees, statuses[i % 3], i) for i in range(requests)))
+    conn.commit()
+    conn.close()
+
+
+def time_calls(run_query, calls, employees):
+    samples = []
+    for i in range(calls):
+        started = time.perf_counter()
+        run_query(i, employees)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        'mean_us': statistics.fmean(samples),
+        'p50_us': samples[len(samples) // 2],
+        'p95_us': samples[int(len(samples) * 0.95)],
+    }
+
+
+def legacy_runner(path, sql, params):
+    def run(i, n):
+        conn = sqlite3.connect(path)
+        conn.execute(sql, params(i, n)).fetchall()
+        conn.close()
+    return run
+
+
+def pooled_runner(pool, sql, params):
+    def run(i, n):
+        with pool.connection() as conn:
+            conn.execute(sql, params(i, n)).fetchall()
+    return run
+
+
+def concurrent_throughput(make_runner, threads, calls, employees):
+    """Calls per second with ``threads`` sessions issuing queries at once"""
+    def worker():
+        run = make_runner()
+        for i in range(calls):
+            run(i, employees)
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return threads * calls / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        build_database(path, args.employees, args.requests)
+        pool = ConnectionPool(path, size=args.threads)
+
+        print(f"{'query':<24}{'mode':<8}{'mean us':>10}{'p50 us':>10}{'p95 us':>10}")
+        for name, (sql, params) in QUERIES.items():
+            for mode, run in (('connect', legacy_runner(path, sql, params)),
+                              ('pooled', pooled_runner(pool, sql, params))):
+                r = time_calls(run, args.calls, args.employees)
+                print(f"{name:<24}{mode:<8}{r['mean_us']:>10.1f}{r['p50_us']:>10.1f}{r['p95_us']:>10.1f}")
+
+        sql, params = QUERIES['get_leave_statistics']
+        for mode, factory in (('connect', lambda: legacy_runner(path, sql, params)),
+                              ('pooled', lambda: pooled_runner(pool, sql, params))):
+            rate = concurrent_throughput(factory, args.threads, args.calls // args.threads, args.employees)
+            print(f"{args.threads} threads, get_leave_statistics, {mode}: {rate:,.0f} calls/s")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
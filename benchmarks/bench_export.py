@@ -0,0 +1,137 @@
+"""Leave report export: streamed CSV/XLSX vs. a pandas DataFrame round trip.
+
+Each method runs in a fresh child process so that its peak memory is
+measured on its own: ``ru_maxrss`` after the export minus the resident size
+once the modules are imported. The streamed writers from ``export`` go over
+every request; the old approach (``pd.read_sql_query`` of the whole history,
+then ``DataFrame.to_csv``) needs memory in proportion to the rows, so it runs
+on the first ``--baseline-rows`` requests and the streamed CSV is timed on
+the same slice for comparison.
+
+Usage:
+    python benchmarks/bench_export.py [--employees N] [--requests N] [--baseline-rows N] [--db PATH]
+
+``--db`` exports an existing database instead of generating one, e.g. one
+built with ``python datagen.py --db big.db --requests 5000000``.
+"""
+import argparse
+import os
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import build_dataset  # noqa: E402
+from export import EXPORT_CHUNK, EXPORT_COLUMNS, iter_csv, iter_leave_chunks, iter_xlsx  # noqa: E402
+from schema import LEAVE_MANAGEMENT, REQUEST_ID_COLUMN, detect_flavor  # noqa: E402
+
+WRITERS = {'csv': iter_csv, 'xlsx': iter_xlsx}
+
+
+def resident_mb():
+    """Current resident set size in MB (Linux)"""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+def export_streamed(conn, fmt, rows, output):
+    chunks = iter_leave_chunks(conn, EXPORT_CHUNK)
+    if rows:
+        chunks = islice(chunks, -(-rows // EXPORT_CHUNK))
+    with open(output, 'wb') as handle:
+        for block in WRITERS[fmt](chunks):
+            handle.write(block)
+
+
+def export_pandas(conn, rows, output):
+    import pandas as pd
+
+    id_column = REQUEST_ID_COLUMN[detect_flavor(conn) or LEAVE_MANAGEMENT]
+    columns = ', '.join(f'{expression.format(id_column=id_column)} AS {name}'
+                        for name, expression in EXPORT_COLUMNS)
+    df = pd.read_sql_query(f'''
+        SELECT {columns}
+        FROM leave_requests lr LEFT JOIN employees e ON e.emp_id = lr.emp_id
+        ORDER BY lr.{id_column} LIMIT ?
+    ''', conn, params=(rows or -1,))
+    df.to_csv(output, index=False)
+
+
+def child(method, db_path, rows, output):
+    """Run one export in this process and print ``seconds peak_mb``"""
+    import pandas  # noqa: F401  (loaded by every method so that the baselines match)
+
+    conn = sqlite3.connect(db_path)
+    baseline = resident_mb()
+    started = time.perf_counter()
+    if method == 'pandas':
+        export_pandas(conn, rows, output)
+    else:
+        export_streamed(conn, method, rows, output)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+    print(elapsed, peak - baseline)
+
+
+def measure(method, db_path, rows, output):
+    """``(seconds, peak MB, output MB)`` of one export run in a child process"""
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', method, '--db', db_path,
+         '--rows', str(rows), '--output', output],
+        capture_output=True, text=True, check=True)
+    elapsed, peak = map(float, result.stdout.split())
+    size = os.path.getsize(output) / 1e6
+    os.remove(output)
+    return elapsed, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=20_000)
+    parser.add_argument('--requests', type=int, default=5_000_000)
+    parser.add_argument('--baseline-rows', type=int, default=1_000_000,
+                        help='rows exported through pandas (0 = all; needs a lot of memory)')
+    parser.add_argument('--db', help='existing database to export instead of generating one')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--rows', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.db, args.rows, args.output)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='leave-export-')
+    db_path = args.db
+    if db_path is None:
+        db_path = os.path.join(workdir, 'export.db')
+        print(f'Generating {args.requests:,} requests...')
+        build_dataset(db_path, employees=args.employees, requests=args.requests)
+    conn = sqlite3.connect(db_path)
+    total = conn.execute('SELECT COUNT(*) FROM leave_requests').fetchone()[0]
+    conn.close()
+    baseline_rows = min(args.baseline_rows or total, total)
+
+    runs = [('csv', total), ('xlsx', total)]
+    if baseline_rows < total:
+        runs.append(('csv', baseline_rows))
+    runs.append(('pandas', baseline_rows))
+    print(f'{"method":<26} {"rows":>10} {"seconds":>8} {"rows/s":>9} {"peak MB":>8} {"file MB":>8}')
+    try:
+        for method, rows in runs:
+            output = os.path.join(workdir, f'export-{method}.{"xlsx" if method == "xlsx" else "csv"}')
+            elapsed, peak, size = measure(method, db_path, 0 if rows == total else rows, output)
+            name = 'pandas read_sql + to_csv' if method == 'pandas' else f'streamed {method}'
+            print(f'{name:<26} {rows:>10,} {elapsed:>8.1f} {rows / elapsed:>9,.0f} {peak:>8.1f} {size:>8.1f}')
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Reporting lines: team approval queues on a deep org chart.
+
+Reshapes a generated company into a ``--fanout``-ary tree (``--employees``
+50k with fan-out 3 is 11 levels: a CEO and 10 levels below), one manager
+change at a time through the ``reporting_lines`` triggers, and checks the
+closure against a recursive walk of ``employees.manager_id``. Then, for one
+manager per level, times the first two pages and the count of their team's
+pending queue through ``leave_queries`` (as the service layer runs them),
+next to a recursive-CTE query that walks the org chart on every call, and
+checks both return the same rows. Finally it times reorgs on the big tree:
+moving a whole department, hiring and leaving, and a batch of decisions
+restricted to the approver's reports.
+
+Usage:
+    python benchmarks/bench_hierarchy.py [--employees N] [--requests N] [--fanout N] [--db PATH]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_updates import decide_batch  # noqa: E402
+from database import configure_connection  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+from hierarchy import check_reporting_lines, count_reports, set_manager  # noqa: E402
+from leave_queries import count_leaves, fetch_leave_records, is_large_team  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+REPEAT = 5
+QUEUE_SELECT = '''
+    SELECT lr.request_id, e.name, e.department, lr.leave_type,
+           lr.start_date, lr.end_date, lr.days, lr.reason, lr.status, lr.applied_date
+    FROM leave_requests lr
+    JOIN employees e ON lr.emp_id = e.emp_id
+'''
+# Baseline: walk the org chart below the manager on every query
+RECURSIVE_QUEUE = '''
+    WITH RECURSIVE team (emp_id) AS (
+        SELECT emp_id FROM employees WHERE manager_id = ?
+        UNION ALL
+        SELECT e.emp_id FROM employees e JOIN team ON e.manager_id = team.emp_id
+    )
+    SELECT lr.request_id, e.name, e.department, lr.leave_type,
+           lr.start_date, lr.end_date, lr.days, lr.reason, lr.status, lr.applied_date
+    FROM leave_requests lr
+    JOIN employees e ON lr.emp_id = e.emp_id
+    WHERE lr.status = 'Pending' AND lr.emp_id IN (SELECT emp_id FROM team)
+    ORDER BY lr.applied_date DESC, lr.request_id DESC
+    LIMIT ?
+'''
+
+
+def timed(func, *args, repeat=REPEAT, **kwargs):
+    """``(median milliseconds, last result)`` of ``repeat`` calls"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def reshape(conn, emp_ids, fanout):
+    """Make ``emp_ids[i]`` report to ``emp_ids[(i - 1) // fanout]``, top-down; returns seconds"""
+    started = time.perf_counter()
+    with conn:
+        set_manager(conn, emp_ids[0], None)
+        for index, emp_id in enumerate(emp_ids[1:], 1):
+            set_manager(conn, emp_id, emp_ids[(index - 1) // fanout])
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=50_000)
+    parser.add_argument('--requests', type=int, default=500_000)
+    parser.add_argument('--fanout', type=int, default=3, help='direct reports per manager')
+    parser.add_argument('--db', help='copy this lean-management database instead of generating one')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-hierarchy-')
+    db_path = os.path.join(workdir, 'hierarchy.db')
+    try:
+        if args.db:
+            shutil.copyfile(args.db, db_path)
+        else:
+            print(f'Generating {args.employees:,} employees and {args.requests:,} requests...')
+            build_dataset(db_path, employees=args.employees, requests=args.requests)
+        conn = configure_connection(sqlite3.connect(db_path))
+        run_migrations(conn)
+        emp_ids = [row[0] for row in conn.execute('SELECT emp_id FROM employees ORDER BY emp_id')]
+        rng = random.Random(7)
+
+        seconds = reshape(conn, emp_ids, args.fanout)
+        conn.execute('ANALYZE')
+        closure, depth = conn.execute('SELECT COUNT(*), MAX(depth) FROM reporting_lines').fetchone()
+        problems = check_reporting_lines(conn)
+        print(f'Reorg of {len(emp_ids):,} employees into a {depth + 1}-level tree: {seconds:.1f}s '
+              f'({seconds / len(emp_ids) * 1000:.2f} ms per move), {closure:,} closure rows, '
+              f'{len(problems)} differences from a recursive walk')
+
+        print(f'\n{"level":>5} {"reports":>8} {"pending":>8} {"plan":>6} {"page 1":>9} {"page 2":>9} '
+              f'{"count":>9} {"recursive":>10}')
+        mismatches = 0
+        level_first = 0
+        for level in range(depth + 1):
+            manager_id = emp_ids[level_first]
+            level_first = level_first * args.fanout + 1
+            filters = {'statuses': ['Pending'], 'manager_id': manager_id}
+            page1, (records, cursor) = timed(fetch_leave_records, conn, QUEUE_SELECT, 'request_id', **filters)
+            page2, _ = timed(fetch_leave_records, conn, QUEUE_SELECT, 'request_id', cursor, **filters)
+            count_ms, pending = timed(count_leaves, conn, **filters)
+            recursive_ms, baseline = timed(lambda: conn.execute(RECURSIVE_QUEUE, (manager_id, 51)).fetchall())
+            if [record['request_id'] for record in records] != [row[0] for row in baseline[:50]]:
+                mismatches += 1
+            print(f'{level:>5} {count_reports(conn, manager_id):>8,} {pending:>8,} '
+                  f'{"scan" if is_large_team(conn, manager_id) else "team":>6} {page1:>7.2f}ms {page2:>7.2f}ms '
+                  f'{count_ms:>7.2f}ms {recursive_ms:>8.2f}ms')
+        print(f'{mismatches} levels where the closure queue differs from the recursive walk')
+
+        # Reorgs on the full tree
+        department, new_parent = emp_ids[4], emp_ids[2]  # a level-2 manager moves to another level-1 manager
+        size = count_reports(conn, department) + 1
+        started = time.perf_counter()
+        with conn:
+            set_manager(conn, department, new_parent)
+        move_ms = (time.perf_counter() - started) * 1000
+        leaves = emp_ids[-len(emp_ids) // 2:]
+        hires = range(emp_ids[-1] + 1, emp_ids[-1] + 1001)
+        started = time.perf_counter()
+        with conn:
+            conn.executemany('''
+                INSERT INTO employees (emp_id, name, email, password, department, role, total_leaves, manager_id)
+                VALUES (?, 'New Hire', ?, '', 'Engineering', 'Employee', 20, ?)
+            ''', [(emp_id, f'hire.{emp_id}@acme.com', rng.choice(leaves)) for emp_id in hires])
+        hire_ms = (time.perf_counter() - started) * 1000 / len(hires)
+        leaver = emp_ids[(args.fanout ** 5 - 1) // (args.fanout - 1)]  # a level-5 manager
+        leaver_reports = count_reports(conn, leaver)
+        started = time.perf_counter()
+        with conn:
+            conn.execute('DELETE FROM employees WHERE emp_id = ?', (leaver,))
+        leave_ms = (time.perf_counter() - started) * 1000
+        problems = check_reporting_lines(conn)
+        print(f'\nMove a {size:,}-person department: {move_ms:.1f} ms; hire under a random leaf: '
+              f'{hire_ms:.2f} ms each; a manager with {leaver_reports} reports leaves: {leave_ms:.1f} ms; '
+              f'{len(problems)} differences from a recursive walk')
+
+        # Batch decisions restricted to the approver's reports
+        approver = emp_ids[1]
+        pending = [row[0] for row in conn.execute('''
+            SELECT request_id FROM leave_requests WHERE status = 'Pending' ORDER BY random() LIMIT 2000
+        ''')]
+        timings = {}
+        for label, batch, reports_only in (('unrestricted', pending[:1000], False),
+                                           ('reports only', pending[1000:], True)):
+            conn.execute('BEGIN IMMEDIATE')
+            started = time.perf_counter()
+            results = decide_batch(conn, [(request_id, 'Approved') for request_id in batch], approver,
+                                   'request_id', reports_only)
+            timings[label] = (time.perf_counter() - started) * 1000
+            conn.rollback()
+            refused = sum(result['result'] == 'forbidden' for result in results)
+            print(f'Decide 1,000 requests, {label}: {timings[label]:.1f} ms ({refused} outside the reporting line)')
+        conn.close()
+        if problems or mismatches:
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
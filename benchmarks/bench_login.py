@@ -0,0 +1,138 @@
+"""Login throughput under a burst, and what the burst does to other sessions.
+
+Fires ``--burst`` concurrent logins (one thread per simulated session) at
+``leave_service.authenticate_user`` on a generated database, while a probe
+thread keeps issuing a cheap dashboard query and records its latency. Runs
+each scenario twice: the first pass logs in against the legacy SHA-256
+digests (verify + rehash), the second against the upgraded scrypt hashes.
+
+Scenarios compare the bounded verification pool (``--workers``) with an
+effectively unbounded one (a worker per login), i.e. hashing inline on
+every session thread.
+
+Usage:
+    python benchmarks/bench_login.py [--burst N] [--workers N] [--queue-limit N]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import leave_service  # noqa: E402
+import passwords  # noqa: E402
+from cache import query_cache  # noqa: E402
+from datagen import DEFAULT_PASSWORD, build_dataset  # noqa: E402
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000 if samples else float('nan')
+
+
+def run_burst(emails, emp_ids):
+    latencies, failures, busy = [], [], []
+    barrier = threading.Barrier(len(emails) + 1)
+    lock = threading.Lock()
+
+    def login(email):
+        barrier.wait()
+        started = time.perf_counter()
+        try:
+            user = leave_service.authenticate_user(email, DEFAULT_PASSWORD)
+        except passwords.HashingBusy:
+            with lock:
+                busy.append(email)
+            return
+        elapsed = time.perf_counter() - started
+        with lock:
+            (latencies if user else failures).append(elapsed)
+
+    probe_samples = []
+    stop = threading.Event()
+
+    def probe():
+        # Another session refreshing its dashboard during the spike
+        i = 0
+        while not stop.is_set():
+            query_cache.clear()
+            started = time.perf_counter()
+            leave_service.get_leave_statistics(emp_ids[i % len(emp_ids)])
+            probe_samples.append(time.perf_counter() - started)
+            i += 1
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=login, args=(email,)) for email in emails]
+    probe_thread = threading.Thread(target=probe)
+    for thread in threads:
+        thread.start()
+    probe_thread.start()
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    probe_thread.join()
+    return {
+        'logins_per_sec': len(latencies) / elapsed,
+        'login_p50_ms': percentile(latencies, 0.5),
+        'login_p99_ms': percentile(latencies, 0.99),
+        'probe_p50_ms': percentile(probe_samples, 0.5),
+        'probe_p99_ms': percentile(probe_samples, 0.99),
+        'probe_mean_ms': statistics.fmean(probe_samples) * 1000 if probe_samples else float('nan'),
+        'failed': len(failures),
+        'busy': len(busy),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--burst', type=int, default=100, help='concurrent logins')
+    parser.add_argument('--workers', type=int, default=passwords.HASH_WORKERS)
+    parser.add_argument('--queue-limit', type=int, default=passwords.HASH_QUEUE_LIMIT)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-login-')
+    scenarios = [
+        (f'bounded pool ({args.workers} workers, queue {args.queue_limit})',
+         lambda: passwords.VerificationPool(args.workers, args.queue_limit)),
+        (f'inline ({args.burst} workers)',
+         lambda: passwords.VerificationPool(args.burst, args.burst)),
+    ]
+    print(f'scrypt n={passwords.SCRYPT_N} r={passwords.SCRYPT_R} p={passwords.SCRYPT_P}, '
+          f'{os.cpu_count()} CPUs, burst of {args.burst} logins\n')
+    for name, make_pool in scenarios:
+        db_path = os.path.join(workdir, 'login.db')
+        build_dataset(db_path, employees=args.burst, requests=args.burst * 10)
+        conn = sqlite3.connect(db_path)
+        users = conn.execute('SELECT email, emp_id FROM employees').fetchall()
+        conn.close()
+        database.close_pools()
+        database.set_db_path(db_path)
+        emails = [email for email, _ in users]
+        emp_ids = [emp_id for _, emp_id in users]
+
+        old_pool = passwords.set_pool(make_pool())
+        if old_pool is not None:
+            old_pool.shutdown()
+        for phase in ('legacy sha256 -> rehash', 'scrypt'):
+            result = run_burst(emails, emp_ids)
+            print(f'{name:<40} {phase:<24} {result["logins_per_sec"]:7.1f} logins/s  '
+                  f'login p50 {result["login_p50_ms"]:8.1f} ms  p99 {result["login_p99_ms"]:8.1f} ms  '
+                  f'| other session p50 {result["probe_p50_ms"]:6.2f} ms  '
+                  f'p99 {result["probe_p99_ms"]:7.2f} ms  busy {result["busy"]}  failed {result["failed"]}')
+    database.close_pools()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
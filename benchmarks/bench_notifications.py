@@ -0,0 +1,198 @@
+"""Decision emails: outbox cost on approvals and dispatcher throughput.
+
+Bulk-approves pending requests through ``leave_service`` (as the approval
+grid does) and compares the time per batch with and without the outbox
+trigger. Then drains the outbox through ``notifications.Dispatcher`` into a
+local stub SMTP server that rejects a share of messages with a temporary
+error and drops the connection every few messages, and checks that every
+decision was delivered exactly once, one digest per employee.
+
+Usage:
+    python benchmarks/bench_notifications.py [--employees N] [--requests N] [--decisions N]
+                                             [--fail-rate F] [--drop-every N]
+"""
+import argparse
+import email
+import os
+import random
+import socketserver
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import leave_service  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+from hierarchy import top_manager  # noqa: E402
+from notifications import OUTBOX_SCHEMA, Dispatcher, SMTPMailer, outbox_counts  # noqa: E402
+
+BATCH = 500
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal SMTP server that records messages and misbehaves on purpose"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, fail_rate=0.0, drop_every=0, seed=1):
+        super().__init__(('127.0.0.1', 0), StubSMTPHandler)
+        self.fail_rate = fail_rate
+        self.drop_every = drop_every
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self.rejected = 0
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 stub ESMTP')
+        delivered = 0
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO', 'NOOP', 'MAIL')):
+                self.reply('250 OK')
+            elif command.startswith('RSET'):
+                recipients = []
+                self.reply('250 OK')
+            elif command.startswith('RCPT'):
+                recipients.append(line.decode().strip()[8:].strip('<>'))
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for raw in iter(self.rfile.readline, b''):
+                    if raw in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(raw.decode())
+                with server.lock:
+                    rejected = server.rng.random() < server.fail_rate
+                    if rejected:
+                        server.rejected += 1
+                    else:
+                        server.messages.append((recipients, ''.join(data)))
+                recipients = []
+                if rejected:
+                    self.reply('451 Try again later')
+                    continue
+                self.reply('250 Queued')
+                delivered += 1
+                if server.drop_every and delivered % server.drop_every == 0:
+                    return  # hang up without QUIT, as an overloaded relay does
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+def decide_batches(pending, batches, manager_id):
+    """Approve ``batches`` batches of pending requests; median milliseconds per batch"""
+    samples = []
+    for _ in range(batches):
+        batch, pending[:] = pending[:BATCH], pending[BATCH:]
+        started = time.perf_counter()
+        leave_service.update_leave_statuses([(request_id, 'Approved') for request_id in batch], manager_id)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=250_000)
+    parser.add_argument('--decisions', type=int, default=5000, help='requests approved with the outbox')
+    parser.add_argument('--fail-rate', type=float, default=0.1, help='share of messages rejected with 451')
+    parser.add_argument('--drop-every', type=int, default=50, help='messages per SMTP connection (0 = no limit)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-notify-')
+    db_path = os.path.join(workdir, 'notify.db')
+    print(f'Generating {args.requests:,} requests...')
+    build_dataset(db_path, employees=args.employees, requests=args.requests)
+    database.set_db_path(db_path)
+    conn = database.configure_connection(sqlite3.connect(db_path))
+    manager_id = top_manager(conn)
+    pending = [row[0] for row in conn.execute(
+        "SELECT request_id FROM leave_requests WHERE status = 'Pending' ORDER BY random()")]
+    batches = max(args.decisions // BATCH, 1)
+    if len(pending) < 2 * batches * BATCH:
+        raise SystemExit(f'Only {len(pending):,} pending requests; use more --requests')
+
+    with conn:
+        conn.execute('DROP TRIGGER trg_notification_outbox_decision')
+    without_outbox = decide_batches(pending, batches, manager_id)
+    with conn:
+        database.execute_script(conn, OUTBOX_SCHEMA.format(emp_id_type='INTEGER', id_column='request_id'))
+    with_outbox = decide_batches(pending, batches, manager_id)
+    queued = conn.execute('SELECT COUNT(*), COUNT(DISTINCT recipient) FROM notification_outbox').fetchone()
+    print(f'{batches} batches of {BATCH} approvals: {with_outbox:.1f} ms per batch with the outbox, '
+          f'{without_outbox:.1f} ms without')
+
+    server = StubSMTPServer(args.fail_rate, args.drop_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    mailer = SMTPMailer('127.0.0.1', server.server_address[1])
+    dispatcher = Dispatcher(conn, mailer, digest_delay=0, backoff=0.05)
+    totals = Counter()
+    started = time.perf_counter()
+    while True:
+        stats = dispatcher.dispatch_once()
+        totals.update(stats)
+        counts = outbox_counts(conn)
+        if not counts.get('pending') and not counts.get('sending'):
+            break
+        if not any(stats.values()):
+            time.sleep(0.05)  # only retries left, waiting for their backoff
+    elapsed = time.perf_counter() - started
+    mailer.close()
+    server.shutdown()
+
+    print(f'{queued[0]:,} notifications for {queued[1]:,} employees sent as {totals["messages"]:,} '
+          f'messages in {elapsed:.2f}s ({totals["messages"] / elapsed:,.0f} messages/s, '
+          f'{queued[0] / elapsed:,.0f} notifications/s)')
+    print(f'{server.rejected:,} messages rejected and retried, {mailer.connections} SMTP connections '
+          f'(server dropped one every {args.drop_every or "-"} messages), '
+          f'outbox: {outbox_counts(conn)}')
+
+    # Every approved request must appear in exactly one delivered message, addressed to its owner
+    owners = dict(conn.execute('''
+        SELECT o.request_id, o.recipient FROM notification_outbox o WHERE o.state = 'sent'
+    '''))
+    delivered = Counter()
+    for recipients, body in server.messages:
+        for request_id in email.message_from_string(body)['X-Leave-Requests'].split(','):
+            delivered[int(request_id)] += 1
+            assert owners[int(request_id)] == recipients[0], request_id
+    duplicates = sum(count - 1 for count in delivered.values())
+    missing = len(set(owners) - set(delivered))
+    print(f'{len(delivered):,} requests delivered, {duplicates} duplicates, {missing} missing')
+    conn.close()
+    database.close_pools()
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+    if duplicates or missing:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
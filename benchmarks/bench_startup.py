@@ -0,0 +1,138 @@
+"""Cold start and rerun time of the Streamlit front-ends.
+
+Each sample is a fresh Python process that drives one app headlessly with
+``streamlit.testing.v1.AppTest`` (Streamlit itself is imported before the
+clock starts, as the server has loaded it before the first script run):
+
+* first paint: the first run of the login page, which imports the app's
+  modules and bootstraps the database (``--fresh`` starts from no database
+  file, otherwise a seeded one is reused)
+* login reruns: later runs of the login page
+* dashboard: the first run after login (manager / admin view) and its reruns
+
+It also records whether pandas was imported for the login page. The run fails
+(exit 1) when the median first paint exceeds ``--budget-ms`` or the login
+page imports pandas, so a startup regression shows up like a failing test.
+``--compare DIR`` runs the same samples against another checkout, e.g. one
+made with ``git worktree add /tmp/base HEAD~1``.
+
+Usage:
+    python benchmarks/bench_startup.py [--samples 5] [--reruns 10] [--fresh]
+                                       [--budget-ms 2000] [--compare DIR]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = ('leave_management.py', 'app.py')
+# Session state of a logged-in manager (leave_management.py) and of ADMIN (app.py)
+LOGGED_IN = {
+    'leave_management.py': {'logged_in': True, 'user': {
+        'emp_id': 1002, 'name': 'Jane Smith', 'email': 'jane.smith@acme.com', 'department': 'Engineering',
+        'role': 'Manager', 'total_leaves': 20, 'used_leaves': 3}},
+    'app.py': {'logged_in': True, 'user_id': 'ADMIN', 'user_name': 'Admin User', 'is_admin': True},
+}
+
+# Runs in the child process: argv = root, script, database, reruns, session state as JSON
+CHILD = '''
+import json, os, sys, time
+root, script, db, reruns, state = sys.argv[1:6]
+sys.path.insert(0, root)
+os.chdir(root)
+os.environ['LEAVE_DB_PATH'] = db
+from streamlit.testing.v1 import AppTest
+
+
+def run(at):
+    started = time.perf_counter()
+    at.run()
+    if at.exception:
+        raise SystemExit(at.exception[0].value)
+    return (time.perf_counter() - started) * 1000
+
+
+at = AppTest.from_file(os.path.join(root, script), default_timeout=300)
+result = {'first_paint': run(at)}
+result['pandas_on_login'] = 'pandas' in sys.modules
+result['login_reruns'] = [run(at) for _ in range(int(reruns))]
+for key, value in json.loads(state).items():
+    at.session_state[key] = value
+result['dashboard'] = run(at)
+result['dashboard_reruns'] = [run(at) for _ in range(int(reruns))]
+print(json.dumps(result))
+'''
+
+
+def sample(root, script, db_path, reruns):
+    """One cold process; returns its timings in milliseconds"""
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, root, script, db_path, str(reruns), json.dumps(LOGGED_IN[script])],
+        capture_output=True, text=True, check=False)
+    if output.returncode:
+        raise SystemExit(f'{script} in {root} failed:\n{output.stderr[-2000:]}')
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def measure(root, script, samples, reruns, fresh, workdir):
+    """Median timings of ``samples`` cold starts of ``script``"""
+    db_path = os.path.join(workdir, f'{os.path.basename(root)}-{script}.db')
+    results = []
+    for _ in range(samples + (0 if fresh else 1)):
+        if fresh or not results:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+        results.append(sample(root, script, db_path, reruns))
+    if not fresh:
+        results = results[1:]  # the first sample only created the database
+    return {
+        'first_paint': statistics.median(r['first_paint'] for r in results),
+        'login_rerun': statistics.median(t for r in results for t in r['login_reruns']),
+        'dashboard': statistics.median(r['dashboard'] for r in results),
+        'dashboard_rerun': statistics.median(t for r in results for t in r['dashboard_reruns']),
+        'pandas_on_login': any(r['pandas_on_login'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--samples', type=int, default=5, help='cold processes per app')
+    parser.add_argument('--reruns', type=int, default=10, help='reruns timed per page and process')
+    parser.add_argument('--fresh', action='store_true', help='start every sample without a database file')
+    parser.add_argument('--budget-ms', type=float, default=2000, help='most median first-paint time')
+    parser.add_argument('--compare', metavar='DIR', help='another checkout to measure the same way')
+    args = parser.parse_args()
+
+    roots = [('current', ROOT)] + ([('compare', os.path.abspath(args.compare))] if args.compare else [])
+    workdir = tempfile.mkdtemp(prefix='leave-startup-')
+    failures = []
+    try:
+        print(f'{"app":<21} {"tree":<8} {"first paint":>12} {"login rerun":>12} {"dashboard":>10} '
+              f'{"dash rerun":>11}  pandas on login')
+        for script in APPS:
+            for label, root in roots:
+                m = measure(root, script, args.samples, args.reruns, args.fresh, workdir)
+                print(f'{script:<21} {label:<8} {m["first_paint"]:>10.0f}ms {m["login_rerun"]:>10.1f}ms '
+                      f'{m["dashboard"]:>8.0f}ms {m["dashboard_rerun"]:>9.1f}ms  '
+                      f'{"yes" if m["pandas_on_login"] else "no"}')
+                if label == 'current':
+                    if m['first_paint'] > args.budget_ms:
+                        failures.append(f'{script}: first paint {m["first_paint"]:.0f} ms > {args.budget_ms:.0f} ms')
+                    if m['pandas_on_login']:
+                        failures.append(f'{script}: the login page imports pandas')
+    finally:
+        shutil.rmtree(workdir)
+    for failure in failures:
+        print(f'FAIL {failure}')
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
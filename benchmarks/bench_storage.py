@@ -0,0 +1,204 @@
+"""Canonical storage: converting legacy databases in place, and both front-ends on one file.
+
+For each legacy flavour, generates a database of ``--employees`` and
+``--requests`` in that flavour's shape (migrated up to, but not including,
+the conversion), then times
+``storage.convert_to_canonical`` on it (``--chunk-size`` rows per copy
+statement). After the conversion it checks that:
+
+* the tables, indexes and triggers match those of a new canonical database
+* every table has the same rows as before (a checksum over the columns both
+  schemas share, with ``leave_requests.id`` read as ``request_id``)
+* the hot queries still use their indexes, and the reporting lines, ledger,
+  rollups and workflow steps still agree with the requests
+
+and times a few employee-keyed lookups before and after (the key moves from
+the rowid or a UNIQUE column to the NUMERIC primary key). Finally both
+front-ends work on the converted ``app.py`` database in one process: each
+applies for leave and decides the other's request.
+
+Usage:
+    python benchmarks/bench_storage.py [--employees N] [--requests N] [--chunk-size N]
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from analytics import check_rollups  # noqa: E402
+from database import configure_connection  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+from hierarchy import check_reporting_lines, top_manager  # noqa: E402
+from ledger import reconcile  # noqa: E402
+from migrations import check_query_plans, run_migrations  # noqa: E402
+from schema import APP, LEAVE_MANAGEMENT  # noqa: E402
+from storage import CHUNK_SIZE, check_storage, convert_to_canonical  # noqa: E402
+from workflow import check_workflow  # noqa: E402
+
+LOOKUPS = 2000
+# Columns renamed by the conversion, per table
+RENAMED = {'leave_requests': {'id': 'request_id'}}
+# Employee-keyed lookups timed before and after; {id} is the request key column
+QUERIES = {
+    'employee by id': 'SELECT name, department, total_leaves - used_leaves FROM employees WHERE emp_id = ?',
+    'employee history': '''SELECT lr.{id}, lr.status, e.name FROM leave_requests lr
+                           JOIN employees e ON e.emp_id = lr.emp_id
+                           WHERE lr.emp_id = ? ORDER BY lr.applied_date DESC LIMIT 20''',
+}
+
+
+def checksum(conn, table, columns):
+    """``(rows, sha256)`` of ``columns`` of ``table``, in a canonical order"""
+    digest = hashlib.sha256()
+    rows = 0
+    order = ', '.join(str(position) for position in range(1, len(columns) + 1))
+    for row in conn.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY {order}'):
+        digest.update(repr(row).encode())
+        rows += 1
+    return rows, digest.hexdigest()
+
+
+def shared_checksums(before, after, flavor):
+    """Checksums of the columns each table has before (``before``) and after (``after``) the conversion"""
+    renamed = RENAMED if flavor == APP else {}
+    result = {}
+    for (table,) in before.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                   "AND name NOT LIKE 'sqlite_%' ORDER BY name").fetchall():
+        old = [row[1] for row in before.execute(f'PRAGMA table_info({table})')]
+        new = {row[1] for row in after.execute(f'PRAGMA table_info({table})')}
+        pairs = [(column, renamed.get(table, {}).get(column, column)) for column in old]
+        result[table] = [pair for pair in pairs if pair[1] in new]
+    return result
+
+
+def time_lookups(conn, emp_ids, id_column='request_id'):
+    """Median microseconds of each query in ``QUERIES`` over ``emp_ids``"""
+    result = {}
+    for name, sql in QUERIES.items():
+        sql = sql.format(id=id_column)
+        samples = []
+        for emp_id in emp_ids:
+            started = time.perf_counter()
+            conn.execute(sql, (emp_id,)).fetchall()
+            samples.append((time.perf_counter() - started) * 1e6)
+        result[name] = statistics.median(samples)
+    return result
+
+
+def convert(db_path, flavor, chunk_size):
+    """Convert one legacy database; returns a list of problems found"""
+    conn = configure_connection(sqlite3.connect(db_path))
+    emp_ids = [row[0] for row in conn.execute('SELECT emp_id FROM employees')]
+    sample = random.Random(5).choices(emp_ids, k=LOOKUPS)
+    # The legacy leave_requests key is id in app.py databases
+    legacy_times = time_lookups(conn, sample, 'id' if flavor == APP else 'request_id')
+
+    snapshot = db_path + '.legacy'
+    shutil.copyfile(db_path, snapshot)
+    size = os.path.getsize(db_path)
+    conn.execute('BEGIN IMMEDIATE')
+    started = time.perf_counter()
+    copied = convert_to_canonical(conn, chunk_size)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    run_migrations(conn)  # records the version; the conversion itself is done
+    conn.execute('VACUUM')
+    rows = sum(copied.values())
+    print(f'{flavor}: {rows:,} rows in {len(copied)} tables converted in {elapsed:.1f}s '
+          f'({rows / elapsed:,.0f} rows/s); file {size / 2**20:.0f} MB -> {os.path.getsize(db_path) / 2**20:.0f} MB')
+
+    problems = [f'schema: {problem}' for problem in check_storage(conn)]
+    before = sqlite3.connect(snapshot)
+    for table, pairs in shared_checksums(before, conn, flavor).items():
+        old = checksum(before, table, [pair[0] for pair in pairs])
+        new = checksum(conn, table, [pair[1] for pair in pairs])
+        if old != new:
+            problems.append(f'{table}: rows differ after the conversion ({old[0]:,} before, {new[0]:,} after)')
+    before.close()
+    os.remove(snapshot)
+    problems += [f'plan: {problem}' for problem in check_query_plans(conn)]
+    for label, found in (('reporting lines', check_reporting_lines(conn)), ('ledger', reconcile(conn)),
+                         ('rollups', check_rollups(conn)), ('workflow', check_workflow(conn))):
+        if found:
+            problems.append(f'{label}: {len(found)} rows disagree')
+
+    canonical_times = time_lookups(conn, sample)
+    for name in QUERIES:
+        print(f'  {name:<18} {legacy_times[name]:>7.1f} µs legacy, {canonical_times[name]:>7.1f} µs canonical')
+    conn.close()
+    return problems
+
+
+def both_front_ends(db_path):
+    """Each front-end applies for leave and decides the other's request; returns a list of problems"""
+    os.environ['LEAVE_DB_PATH'] = db_path
+    database.set_db_path(db_path)
+    import app
+    import leave_service
+
+    conn = configure_connection(sqlite3.connect(db_path))
+    top = top_manager(conn)
+    first, second = [row[0] for row in conn.execute('''
+        SELECT emp_id FROM employees WHERE manager_id IS NOT NULL
+        ORDER BY total_leaves - used_leaves - reserved_leaves DESC, emp_id LIMIT 2
+    ''')]
+    day = date(2031, 3, 3)  # a Monday, clear of the generated history
+    problems = []
+    try:
+        from_app = app.apply_leave(first, 'Vacation', day, day, 'storage benchmark')
+    except leave_service.LeaveValidationError as e:
+        from_app = None
+        problems.append(f'app.py could not apply: {e}')
+    new_request = leave_service.apply_leave(second, 'Casual Leave', day + timedelta(days=1),
+                                            day + timedelta(days=1), 'storage benchmark')
+    leave_service.update_leave_statuses([(from_app, 'Approved')], top)
+    app.update_leave_statuses([(new_request, 'Rejected')], top)
+    conn.execute('BEGIN')  # read both decisions from a fresh snapshot
+    statuses = dict(conn.execute('SELECT request_id, status FROM leave_requests WHERE request_id IN (?, ?)',
+                                 (from_app, new_request)).fetchall())
+    conn.rollback()
+    conn.close()
+    print(f'Both front-ends on one database: request {from_app} (app.py) {statuses.get(from_app)} '
+          f'by leave_service, request {new_request} (leave_service) {statuses.get(new_request)} by app.py')
+    if statuses != {from_app: 'Approved', new_request: 'Rejected'}:
+        problems.append(f'decisions across front-ends were not applied: {statuses}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=50_000)
+    parser.add_argument('--requests', type=int, default=500_000)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows per copy statement')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-storage-')
+    problems = []
+    try:
+        for flavor in (LEAVE_MANAGEMENT, APP):
+            db_path = os.path.join(workdir, f'{flavor}.db')
+            print(f'Generating a {flavor} database of {args.employees:,} employees and {args.requests:,} requests...')
+            build_dataset(db_path, flavor, args.employees, args.requests, legacy=True)
+            problems += [f'{flavor}: {problem}' for problem in convert(db_path, flavor, args.chunk_size)]
+        problems += both_front_ends(os.path.join(workdir, f'{APP}.db'))
+    finally:
+        shutil.rmtree(workdir)
+    for problem in problems:
+        print(f'FAIL {problem}')
+    if problems:
+        raise SystemExit(1)
+    print('Converted databases match new canonical ones and keep every row')
+
+
+if __name__ == '__main__':
+    main()
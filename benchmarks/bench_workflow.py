@@ -0,0 +1,232 @@
+"""Approval workflow: approver inboxes and step transitions at scale.
+
+Generates a company (``--employees`` reshaped into a ``--fanout``-ary org
+chart, like ``bench_hierarchy``), then submits pending requests until
+``--in-flight`` are waiting, each starting its approval chain through the
+``approval_workflow`` insert trigger, and times that trigger against plain
+inserts. Managers, busiest first, then approve their inboxes (at most
+``--batch`` per transaction) through ``workflow.decide_steps`` until
+``--decisions`` are made (long and parental leave moves on to HR, the rest is
+decided), and one HR approver decides a batch of its queue.
+
+With everything in flight, it times page 1, page 2 and the count of the inbox
+of a typical manager, the busiest manager, the top of the org chart and an HR
+approver, as the service layer reads them, next to a query that works out
+who is waiting for HR from the rules and the approval history on every call
+(checking both find the same requests). Finally it checks that every pending
+request has exactly one workflow step and that each inbox query plan merges
+index ranges without sorting.
+
+Usage:
+    python benchmarks/bench_workflow.py [--employees N] [--requests N] [--in-flight N] [--fanout N]
+                                        [--batch N] [--decisions N]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_updates import summarize_batch  # noqa: E402
+from database import configure_connection  # noqa: E402
+from datagen import DURATION_MIX, LEAVE_TYPES, build_dataset  # noqa: E402
+from hierarchy import set_manager  # noqa: E402
+from migrations import explain_query_plan  # noqa: E402
+from schema import LEAVE_MANAGEMENT  # noqa: E402
+from workflow import (HR_STAGE, build_inbox_query, check_workflow, count_inbox, decide_steps,  # noqa: E402
+                      fetch_inbox, inbox_keys, workflow_counts)
+
+REPEAT = 5
+INBOX_COLUMNS = '''e.name, e.department, lr.leave_type, lr.start_date, lr.end_date, lr.days, lr.reason,
+                   lr.status, lr.applied_date'''
+SUBMIT = '''
+    INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status, applied_date)
+    VALUES (?, ?, ?, ?, ?, 'benchmark', 'Pending', ?)
+'''
+# Baseline: evaluate the rules and the history on every read to find the
+# requests waiting for HR: those of the top of the org chart (nobody else in
+# their chain), and those whose first matching rule has an HR stage once
+# their manager has approved
+RULES_ON_READ = '''
+    FROM leave_requests lr
+    JOIN employees e ON e.emp_id = lr.emp_id
+    WHERE lr.status = 'Pending' AND lr.emp_id != :approver
+      AND (e.manager_id IS NULL OR (
+          EXISTS (SELECT 1 FROM approval_chain c
+                  WHERE c.stage = :stage AND c.rule_id = (
+                      SELECT r.rule_id FROM approval_rules r
+                      WHERE (r.leave_type IS NULL OR r.leave_type = lr.leave_type)
+                        AND (r.min_days IS NULL OR lr.days >= r.min_days)
+                      ORDER BY r.priority, r.rule_id LIMIT 1))
+          AND EXISTS (SELECT 1 FROM approval_history h
+                      WHERE h.request_id = lr.request_id AND h.stage = 'manager' AND h.decision = 'Approved')))
+'''
+
+
+def timed(func, *args, repeat=REPEAT, **kwargs):
+    """``(median milliseconds, last result)`` of ``repeat`` calls"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def weighted(rng, mix):
+    values, weights = zip(*mix)
+    return rng.choices(values, weights)[0]
+
+
+def new_requests(emp_ids, count, rng):
+    """``count`` pending submissions over the coming year, applied within the last 60 days"""
+    now = datetime.now().replace(microsecond=0)
+    rows = []
+    for _ in range(count):
+        start = date.today() + timedelta(days=rng.randrange(1, 365))
+        days = weighted(rng, DURATION_MIX)
+        applied = now - timedelta(seconds=rng.randrange(60 * 86400))
+        rows.append((rng.choice(emp_ids), weighted(rng, LEAVE_TYPES[LEAVE_MANAGEMENT]), start.isoformat(),
+                     (start + timedelta(days=days - 1)).isoformat(), days, applied.isoformat(' ')))
+    return rows
+
+
+def decide_inboxes(conn, approvers, batch, decisions, status='Approved'):
+    """Approvers in turn decide up to ``batch`` requests of their inbox in one transaction, until
+    ``decisions`` are made; returns (ms per transaction, decisions per transaction, outcomes)"""
+    samples, sizes, outcomes = [], [], Counter()
+    for approver in approvers:
+        if sum(sizes) >= decisions:
+            break
+        records, _ = fetch_inbox(conn, INBOX_COLUMNS, 'request_id', approver, page_size=batch)
+        if not records:
+            continue
+        sizes.append(len(records))
+        conn.execute('BEGIN IMMEDIATE')
+        started = time.perf_counter()
+        results = decide_steps(conn, [(record['request_id'], status) for record in records], approver)
+        conn.commit()
+        samples.append((time.perf_counter() - started) * 1000)
+        outcomes.update(summarize_batch(results))
+    return samples, sizes, outcomes
+
+
+def hr_approvers(conn):
+    """Members of the HR approval group"""
+    return [row[0] for row in conn.execute('SELECT emp_id FROM approval_groups WHERE stage = ? ORDER BY emp_id',
+                                           (HR_STAGE,))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=50_000)
+    parser.add_argument('--requests', type=int, default=200_000, help='history generated before the run')
+    parser.add_argument('--in-flight', type=int, default=100_000, help='pending requests to reach')
+    parser.add_argument('--fanout', type=int, default=8, help='direct reports per manager (0: keep departments)')
+    parser.add_argument('--batch', type=int, default=500, help='most decisions per transaction')
+    parser.add_argument('--decisions', type=int, default=20_000, help='manager decisions before timing inboxes')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-workflow-')
+    db_path = os.path.join(workdir, 'workflow.db')
+    try:
+        print(f'Generating {args.employees:,} employees and {args.requests:,} requests...')
+        build_dataset(db_path, employees=args.employees, requests=args.requests)
+        conn = configure_connection(sqlite3.connect(db_path))
+        emp_ids = [row[0] for row in conn.execute('SELECT emp_id FROM employees ORDER BY emp_id')]
+        rng = random.Random(11)
+        if args.fanout:
+            started = time.perf_counter()
+            with conn:
+                set_manager(conn, emp_ids[0], None)
+                for index, emp_id in enumerate(emp_ids[1:], 1):
+                    set_manager(conn, emp_id, emp_ids[(index - 1) // args.fanout])
+            print(f'Org chart reshaped to fan-out {args.fanout}: {time.perf_counter() - started:.1f}s')
+
+        # Submissions: the insert trigger evaluates the rules once per request
+        pending = conn.execute("SELECT COUNT(*) FROM leave_requests WHERE status = 'Pending'").fetchone()[0]
+        rows = new_requests(emp_ids, max(args.in_flight - pending, 0), rng)
+        sample = new_requests(emp_ids, 10_000, rng)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DROP TRIGGER trg_approval_workflow_insert')
+        started = time.perf_counter()
+        conn.executemany(SUBMIT, sample)
+        plain = (time.perf_counter() - started) / len(sample) * 1e6
+        conn.rollback()
+        started = time.perf_counter()
+        with conn:
+            conn.executemany(SUBMIT, rows)
+        submit = (time.perf_counter() - started) / max(len(rows), 1) * 1e6
+        conn.execute('ANALYZE')
+        print(f'Submitted {len(rows):,} requests: {submit:.0f} µs each with the workflow trigger, '
+              f'{plain:.0f} µs without')
+
+        # Step transitions: managers clear their inboxes (busiest first), then HR decides one batch
+        managers = [row[0] for row in conn.execute('''
+            SELECT assignee FROM approval_workflow WHERE stage = 'manager' GROUP BY assignee ORDER BY COUNT(*) DESC
+        ''')]
+        for label, approvers, decisions in (('managers', managers, args.decisions), ('HR', hr_approvers(conn), 1)):
+            samples, sizes, outcomes = decide_inboxes(conn, approvers, args.batch, decisions)
+            print(f'{label}: {sum(sizes):,} decisions in {len(samples):,} transactions of {min(sizes)}-{max(sizes)}, '
+                  f'median {statistics.median(samples):.2f} ms per transaction '
+                  f'({sum(samples) * 1000 / sum(sizes):.0f} µs per decision); {dict(outcomes)}')
+        # Top the in-flight count back up after the decisions
+        pending = conn.execute('SELECT COUNT(*) FROM approval_workflow').fetchone()[0]
+        with conn:
+            conn.executemany(SUBMIT, new_requests(emp_ids, max(args.in_flight - pending, 0), rng))
+        conn.execute('ANALYZE approval_workflow')
+        print(f'In flight: {sum(workflow_counts(conn).values()):,} {workflow_counts(conn)}')
+
+        # Inbox latency
+        sizes = [row for row in conn.execute('''
+            SELECT assignee, COUNT(*) FROM approval_workflow WHERE stage = 'manager' GROUP BY assignee ORDER BY 2
+        ''')]
+        approvers = [('typical manager', sizes[len(sizes) // 2][0]), ('busiest manager', sizes[-1][0])]
+        if args.fanout:
+            approvers.append(('top of the org', emp_ids[0]))
+        hr = hr_approvers(conn)[0]
+        approvers.append(('HR approver', hr))
+        print(f'\n{"approver":<16} {"inbox":>7} {"page 1":>9} {"page 2":>9} {"count":>9}')
+        sorts = 0
+        for label, approver in approvers:
+            page1, (records, cursor) = timed(fetch_inbox, conn, INBOX_COLUMNS, 'request_id', approver)
+            page2, _ = timed(fetch_inbox, conn, INBOX_COLUMNS, 'request_id', approver, cursor)
+            count_ms, size = timed(count_inbox, conn, approver)
+            sql, params = build_inbox_query(INBOX_COLUMNS, 'request_id', inbox_keys(conn, approver), approver,
+                                            cursor)
+            sorts += any('TEMP B-TREE' in detail for detail in explain_query_plan(conn, sql, params))
+            print(f'{label:<16} {size:>7,} {page1:>7.2f}ms {page2:>7.2f}ms {count_ms:>7.2f}ms')
+
+        # The same HR queue derived from the rules and history on every read
+        params = {'approver': hr, 'stage': HR_STAGE}
+        read_ms, _ = timed(lambda: conn.execute(f'''
+            SELECT lr.request_id, lr.applied_date {RULES_ON_READ} ORDER BY lr.applied_date LIMIT 51
+        ''', params).fetchall())
+        count_read_ms, _ = timed(lambda: conn.execute(f'SELECT COUNT(*) {RULES_ON_READ}', params).fetchone())
+        stored = {row[0] for row in conn.execute('''
+            SELECT request_id FROM approval_workflow WHERE assignee = ? AND emp_id != ?
+        ''', (HR_STAGE, hr))}
+        evaluated = {row[0] for row in conn.execute(f'SELECT lr.request_id {RULES_ON_READ}', params)}
+        print(f'{"HR, rules on read":<16} {len(evaluated):>7,} {read_ms:>7.2f}ms {"":>9} {count_read_ms:>7.2f}ms '
+              f'({len(stored ^ evaluated)} requests differ from the stored steps)')
+
+        problems = check_workflow(conn)
+        print(f'\n{len(problems)} requests whose workflow step disagrees with their status; '
+              f'{sorts} inbox plans sort with a temp b-tree')
+        conn.close()
+        if problems or sorts or stored != evaluated:
+            raise SystemExit(1)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Write throughput: single-writer group commit vs. a transaction per write.
+
+Simulates many sessions writing at once. ``--threads`` threads each submit
+``--writes`` leave applications (``leave_service.apply_leave``), every third
+one followed by an approval. Each scenario runs on a freshly generated
+database, once with writes going through the write queue
+(``LEAVE_DB_WRITE_QUEUE=1``) and once with each write taking SQLite's write
+lock on its own pooled connection. It does this for ``synchronous=NORMAL``
+(the app default) and ``synchronous=FULL`` (an fsync per commit).
+
+Reports writes/s, latency percentiles, lock errors and, for the queue, the
+average number of writes per commit.
+
+Usage:
+    python benchmarks/bench_writes.py [--threads N] [--writes N] [--employees N]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import leave_service  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000 if samples else float('nan')
+
+
+def prepare(db_path, employees):
+    build_dataset(db_path, employees=employees, requests=0)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('UPDATE employees SET total_leaves = 100000, used_leaves = 0, reserved_leaves = 0')
+    emp_ids = [row[0] for row in conn.execute('SELECT emp_id FROM employees')]
+    manager = conn.execute("SELECT emp_id FROM employees WHERE role = 'Manager'").fetchone()[0]
+    conn.close()
+    return emp_ids, manager
+
+
+def run(db_path, threads, writes, emp_ids, manager):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def session(index):
+        # Each session books its own employees on consecutive weeks, so nothing is rejected
+        own = emp_ids[index::threads]
+        local = []
+        barrier.wait()
+        for i in range(writes):
+            start = date(2031, 1, 6) + timedelta(weeks=i // len(own))
+            started = time.perf_counter()
+            try:
+                request_id = leave_service.apply_leave(own[i % len(own)], 'Casual Leave',
+                                                       start, start, 'bench')
+                if i % 3 == 0:
+                    leave_service.update_leave_status(request_id, 'Approved', manager)
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=session, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    writes_done = sum(1 + (i % 3 == 0) for i in range(writes)) * threads - len(errors)
+    return elapsed, writes_done, latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32, help='concurrent sessions')
+    parser.add_argument('--writes', type=int, default=100, help='applications per session')
+    parser.add_argument('--employees', type=int, default=256)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-writes-')
+    default_pragmas = database.PRAGMAS
+    print(f'{args.threads} sessions x {args.writes} applications (+1 approval per 3), '
+          f'{os.cpu_count()} CPUs\n')
+    for synchronous in ('NORMAL', 'FULL'):
+        baseline = None
+        for queued in (False, True):
+            db_path = os.path.join(workdir, f'writes-{synchronous}-{int(queued)}.db')
+            emp_ids, manager = prepare(db_path, args.employees)
+            database.PRAGMAS = tuple((name, synchronous if name == 'synchronous' else value)
+                                     for name, value in default_pragmas)
+            database.WRITE_QUEUE = queued
+            database.set_db_path(db_path)
+            elapsed, writes, latencies, errors = run(db_path, args.threads, args.writes, emp_ids, manager)
+            stats = database.get_writer(db_path).stats() if queued else None
+            database.close_pools()
+
+            rate = writes / elapsed
+            baseline = baseline or rate
+            name = 'write queue' if queued else 'transaction per write'
+            grouping = f'  {stats["writes_per_commit"]:5.1f} writes/commit' if stats else ''
+            print(f'synchronous={synchronous:<6} {name:<22} {rate:8,.0f} writes/s ({rate / baseline:4.1f}x)  '
+                  f'p50 {percentile(latencies, 0.5):7.2f} ms  p99 {percentile(latencies, 0.99):8.2f} ms  '
+                  f'errors {len(errors)}{grouping}')
+    database.PRAGMAS = default_pragmas
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
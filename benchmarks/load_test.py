@@ -0,0 +1,206 @@
+"""Requests/sec of the JSON API under a mixed read/write workload.
+
+Starts ``api_server.py`` as a subprocess on a generated database (or targets
+an already running instance with ``--url``), then drives it from client
+threads for a fixed duration with a mix of list, stats, apply and approve
+calls. Reports throughput, latency percentiles and the response status
+histogram, and optionally writes them as JSON.
+
+Usage:
+    python benchmarks/load_test.py [--db PATH] [--url http://host:port] [--clients N]
+        [--duration SECONDS] [--workers N] [--employees N] [--requests N] [--output FILE]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datagen import build_dataset  # noqa: E402
+
+# (operation, weight)
+MIX = [
+    ('list_employee', 35),
+    ('list_pending', 15),
+    ('list_department', 10),
+    ('stats_employee', 20),
+    ('stats_global', 5),
+    ('apply', 10),
+    ('approve', 5),
+]
+
+
+def sample_ids(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        employees = [row[0] for row in conn.execute('SELECT emp_id FROM employees')]
+        managers = [row[0] for row in conn.execute("SELECT emp_id FROM employees WHERE role = 'Manager'")]
+        departments = [row[0] for row in conn.execute('SELECT DISTINCT department FROM employees')]
+        pending = [row[0] for row in conn.execute(
+            "SELECT request_id FROM leave_requests WHERE status = 'Pending'")]
+    finally:
+        conn.close()
+    return employees, managers, departments, pending
+
+
+def build_request(operation, rng, ids):
+    """Return (method, path, body) for one operation"""
+    employees, managers, departments, pending = ids
+    if operation == 'list_employee':
+        return 'GET', f'/api/leaves?emp_id={rng.choice(employees)}', None
+    if operation == 'list_pending':
+        return 'GET', '/api/leaves?status=Pending', None
+    if operation == 'list_department':
+        return 'GET', f'/api/leaves?department={rng.choice(departments).replace(" ", "%20")}', None
+    if operation == 'stats_employee':
+        return 'GET', f'/api/stats?emp_id={rng.choice(employees)}', None
+    if operation == 'stats_global':
+        return 'GET', '/api/stats', None
+    if operation == 'apply':
+        start = f'2030-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+        return 'POST', '/api/leaves', {'emp_id': rng.choice(employees), 'leave_type': 'Casual Leave',
+                                       'start_date': start, 'end_date': start, 'reason': 'load test'}
+    request_id = pending.pop() if pending else 0
+    return 'POST', f'/api/leaves/{request_id}/approve', {'manager_id': rng.choice(managers)}
+
+
+def client(host, port, ids, deadline, seed, samples, statuses, lock):
+    rng = random.Random(seed)
+    operations, weights = zip(*MIX)
+    local_samples, local_statuses = [], Counter()
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        with lock:
+            method, path, body = build_request(operation, rng, ids)
+        payload = json.dumps(body).encode() if body is not None else None
+        started = time.perf_counter()
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            conn.request(method, path, body=payload,
+                         headers={'Content-Type': 'application/json'} if payload else {})
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            local_statuses[response.status] += 1
+        except OSError as e:
+            local_statuses[type(e).__name__] += 1
+            continue
+        local_samples.append(time.perf_counter() - started)
+    with lock:
+        samples.extend(local_samples)
+        statuses.update(local_statuses)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'API server on {host}:{port} did not become ready')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='existing leave_management.py database (generated if omitted)')
+    parser.add_argument('--url', help='target an already running server instead of starting one')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=8, help='server worker threads')
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    workdir = None
+    db_path = args.db
+    if db_path is None:
+        workdir = tempfile.mkdtemp(prefix='leave-load-')
+        db_path = os.path.join(workdir, 'load.db')
+        print(f'Generating {args.requests:,} requests for {args.employees:,} employees ...', flush=True)
+        build_dataset(db_path, employees=args.employees, requests=args.requests, seed=args.seed)
+    ids = sample_ids(db_path)
+
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        env = dict(os.environ, LEAVE_DB_POOL_SIZE=str(args.workers))
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, 'api_server.py'), '--db', db_path,
+             '--host', host, '--port', str(port), '--workers', str(args.workers)],
+            env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_until_ready(host, port)
+        samples, statuses, lock = [], Counter(), threading.Lock()
+        deadline = time.perf_counter() + args.duration
+        threads = [threading.Thread(target=client,
+                                    args=(host, port, ids, deadline, args.seed + i, samples, statuses, lock))
+                   for i in range(args.clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    samples.sort()
+
+    def percentile(fraction):
+        return round(samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000, 3) if samples else None
+
+    results = {
+        'clients': args.clients,
+        'workers': args.workers,
+        'duration_s': round(elapsed, 2),
+        'requests': len(samples),
+        'requests_per_sec': round(len(samples) / elapsed, 1),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'statuses': {str(key): value for key, value in sorted(statuses.items(), key=str)},
+    }
+    print(f"{results['requests']:,} requests in {results['duration_s']}s with {args.clients} clients: "
+          f"{results['requests_per_sec']:,} req/s  p50 {results['p50_ms']} ms  "
+          f"p95 {results['p95_ms']} ms  p99 {results['p99_ms']} ms")
+    print(f"Status codes: {results['statuses']}")
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+    if workdir:
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+"""Time every public data function of both front-ends on generated data.
+
+Builds one seeded dataset per database flavour with ``datagen``, then runs
+each case in a fresh process (so the reported peak RSS belongs to that
+function alone) and records p50/p95/p99 latency, rows returned per second
+and peak RSS. Cached functions are timed through ``.uncached`` unless
+``--cached`` is given. Results are written as JSON; ``--compare`` prints the
+p50 change against an earlier results file.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--employees N] [--requests N] [--years N]
+        [--seed N] [--iterations N] [--full-iterations N] [--only NAME]
+        [--flavor leave_management|app] [--cached] [--data-dir DIR]
+        [--output results.json] [--compare old.json]
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from datagen import DEFAULT_PASSWORD, build_dataset  # noqa: E402
+from hierarchy import top_manager  # noqa: E402
+from schema import APP, CANONICAL, LEAVE_MANAGEMENT, REQUEST_ID_COLUMN  # noqa: E402
+
+MODULES = {LEAVE_MANAGEMENT: 'leave_management', APP: 'app'}
+# Cases the page script does not import are timed on its service layer
+SERVICE_MODULES = {LEAVE_MANAGEMENT: 'leave_service'}
+BATCH_SIZE = 20
+
+
+def _leave_dates(i):
+    start = date.today() + timedelta(days=30 + i % 300)
+    return start, start + timedelta(days=1)
+
+
+# flavor -> [(case name, function, full_scan, args_for(ctx, i) -> (args, kwargs))]
+CASES = {
+    LEAVE_MANAGEMENT: [
+        ('authenticate_user', 'authenticate_user', False,
+         lambda ctx, i: ((ctx['email'](i), DEFAULT_PASSWORD), {})),
+        ('get_employee_leaves_page', 'get_employee_leaves_page', False,
+         lambda ctx, i: ((ctx['emp'](i),), {})),
+        ('get_leave_requests_page[pending]', 'get_leave_requests_page', False,
+         lambda ctx, i: ((), {'statuses': ['Pending']})),
+        ('get_leave_requests_page[department]', 'get_leave_requests_page', False,
+         lambda ctx, i: ((), {'department': ctx['department'](i)})),
+        ('count_leave_requests[pending]', 'count_leave_requests', False,
+         lambda ctx, i: ((), {'statuses': ['Pending']})),
+        ('count_leave_requests[department]', 'count_leave_requests', False,
+         lambda ctx, i: ((), {'department': ctx['department'](i)})),
+        ('get_leave_counters', 'get_leave_counters', False,
+         lambda ctx, i: ((), {})),
+        ('get_leave_counters[employee]', 'get_leave_counters', False,
+         lambda ctx, i: ((ctx['emp'](i),), {})),
+        ('get_department_names', 'get_department_names', False,
+         lambda ctx, i: ((), {})),
+        ('get_leave_statistics', 'get_leave_statistics', False,
+         lambda ctx, i: ((ctx['emp'](i),), {})),
+        ('get_department_analytics', 'get_department_analytics', False,
+         lambda ctx, i: ((f'{date.today().year}-01', f'{date.today().year}-12'), {})),
+        ('apply_leave', 'apply_leave', False,
+         lambda ctx, i: ((ctx['emp'](i), 'Casual Leave', *_leave_dates(i), 'benchmark'), {})),
+        ('update_leave_status', 'update_leave_status', False,
+         lambda ctx, i: ((ctx['pending'](i), 'Approved', ctx['manager']), {})),
+        ('update_leave_statuses', 'update_leave_statuses', False,
+         lambda ctx, i: ((ctx['pending_batch'](i), ctx['manager']), {})),
+    ],
+    APP: [
+        ('authenticate_user', 'authenticate_employee', False,
+         lambda ctx, i: ((ctx['emp'](i), DEFAULT_PASSWORD), {})),
+        ('get_employee_leaves_page', 'get_employee_leaves_page', False,
+         lambda ctx, i: ((ctx['emp'](i),), {})),
+        ('get_leaves_page[pending]', 'get_leaves_page', False,
+         lambda ctx, i: ((), {'statuses': ['Pending']})),
+        ('get_leaves_page[department]', 'get_leaves_page', False,
+         lambda ctx, i: ((), {'department': ctx['department'](i)})),
+        ('count_matching_leaves[pending]', 'count_leave_requests', False,
+         lambda ctx, i: ((), {'statuses': ['Pending']})),
+        ('count_matching_leaves[department]', 'count_leave_requests', False,
+         lambda ctx, i: ((), {'department': ctx['department'](i)})),
+        ('get_department_names', 'get_department_names', False,
+         lambda ctx, i: ((), {})),
+        ('get_employee_overview', 'get_employee_overview', True,
+         lambda ctx, i: ((), {})),
+        ('get_employee_overview[department]', 'get_employee_overview', False,
+         lambda ctx, i: ((ctx['department'](i),), {})),
+        ('get_leave_rollups[department]', 'get_leave_rollups', False,
+         lambda ctx, i: ((f'{date.today().year}-01', f'{date.today().year}-12', ctx['department'](i)), {})),
+        ('get_dashboard_stats', 'get_dashboard_stats', False,
+         lambda ctx, i: ((), {})),
+        ('get_dashboard_stats[employee]', 'get_dashboard_stats', False,
+         lambda ctx, i: ((ctx['emp'](i),), {})),
+        ('apply_leave', 'apply_leave', False,
+         lambda ctx, i: ((ctx['emp'](i), 'Vacation', *_leave_dates(i), 'benchmark'), {})),
+        # app.py decides a single request as a batch of one
+        ('update_leave_status', 'update_leave_statuses', False,
+         lambda ctx, i: (([(ctx['pending'](i), 'Approved')], ctx['manager']), {})),
+        ('update_leave_statuses', 'update_leave_statuses', False,
+         lambda ctx, i: ((ctx['pending_batch'](i), ctx['manager']), {})),
+    ],
+}
+
+
+def load_context(db_path, seed):
+    """Sample employee ids, departments and pending requests to feed the cases"""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        employees = conn.execute('SELECT emp_id, email FROM employees ORDER BY emp_id').fetchall()
+        departments = [row[0] for row in conn.execute(
+            'SELECT DISTINCT department FROM employees ORDER BY 1')]
+        pending = [row[0] for row in conn.execute(
+            f"SELECT {REQUEST_ID_COLUMN[CANONICAL]} FROM leave_requests WHERE status = 'Pending' "
+            f"ORDER BY {REQUEST_ID_COLUMN[CANONICAL]} DESC")]
+        # Decisions are limited to the approver's reports, so decide as the top of the org chart
+        manager = top_manager(conn)
+    finally:
+        conn.close()
+    rng.shuffle(employees)
+    rng.shuffle(pending)
+    pending = pending or [0]
+    return {
+        'emp': lambda i: employees[i % len(employees)][0],
+        'email': lambda i: employees[i % len(employees)][1],
+        'department': lambda i: departments[i % len(departments)],
+        'pending': lambda i: pending[i % len(pending)],
+        'pending_batch': lambda i: [
+            (pending[(i * BATCH_SIZE + k) % len(pending)], 'Approved' if k % 4 else 'Rejected')
+            for k in range(BATCH_SIZE)],
+        'manager': manager,
+    }
+
+
+def row_count(result):
+    """Rows produced by one call: DataFrames, (DataFrame, cursor) pages, rows or scalars"""
+    if isinstance(result, tuple) and len(result) == 2 and hasattr(result[0], 'shape'):
+        return len(result[0])
+    if hasattr(result, 'shape') or isinstance(result, list):
+        return len(result)
+    return 1
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run_case(flavor, db_path, case_name, iterations, use_cache, seed):
+    """Run one case in the current (fresh) process and return its measurements"""
+    os.environ['LEAVE_DB_PATH'] = db_path
+    os.environ.setdefault('STREAMLIT_LOGGER_LEVEL', 'error')
+    # database is already imported through datagen, so the env var alone is too late
+    import database
+    database.set_db_path(db_path)
+    # Importing a Streamlit script outside ``streamlit run`` prints bare-mode warnings
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        module = importlib.import_module(MODULES[flavor])
+    import_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    _, function_name, _, args_for = next(case for case in CASES[flavor] if case[0] == case_name)
+    function = getattr(module, function_name, None)
+    if function is None and flavor in SERVICE_MODULES:
+        function = getattr(importlib.import_module(SERVICE_MODULES[flavor]), function_name)
+    if not use_cache:
+        function = getattr(function, 'uncached', function)
+    # Wrappers over cached service functions have no .uncached; empty the cache instead
+    from cache import query_cache
+    ctx = load_context(db_path, seed)
+
+    # One warm-up call: page cache, prepared statements, lazy imports
+    args, kwargs = args_for(ctx, iterations)
+    try:
+        function(*args, **kwargs)
+    except ValueError:
+        pass
+
+    samples = []
+    rows = 0
+    rejected = 0
+    for i in range(iterations):
+        args, kwargs = args_for(ctx, i)
+        if not use_cache:
+            query_cache.clear()
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except ValueError:
+            # Business-rule rejections (balance, overlap) are timed like any other outcome
+            result = None
+            rejected += 1
+        samples.append(time.perf_counter() - started)
+        rows += row_count(result) if result is not None else 0
+    elapsed = sum(samples)
+    samples.sort()
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return {
+        'flavor': flavor,
+        'case': case_name,
+        'function': function_name,
+        'iterations': iterations,
+        'cached': use_cache,
+        'mean_ms': round(elapsed / iterations * 1000, 4),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 4),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 4),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 4),
+        'rejected': rejected,
+        'rows_per_call': round(rows / iterations, 2),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed else None,
+        'import_rss_mb': round(import_rss * scale / 2**20, 1),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20, 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as handle:
+        baseline = {(r['flavor'], r['case']): r for r in json.load(handle)['results']}
+    print(f'\n{"case":<50} {"old p50":>10} {"new p50":>10} {"change":>8}')
+    for result in results:
+        old = baseline.get((result['flavor'], result['case']))
+        if old is None or not old['p50_ms']:
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100
+        print(f"{result['flavor'] + ':' + result['case']:<50} {old['p50_ms']:>10.3f} "
+              f"{result['p50_ms']:>10.3f} {change:>+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--full-iterations', type=int, default=5,
+                        help='iterations for cases that read whole tables')
+    parser.add_argument('--flavor', choices=sorted(CASES), action='append',
+                        help='restrict to one flavour (repeatable)')
+    parser.add_argument('--only', action='append', help='run only this case name (repeatable)')
+    parser.add_argument('--cached', action='store_true', help='time through the query cache')
+    parser.add_argument('--data-dir', help='keep generated databases here and reuse them')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file to diff p50 against')
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='leave-bench-')
+    os.makedirs(data_dir, exist_ok=True)
+    datasets = {}
+    results = []
+    # Spawned single-use workers: a clean interpreter and an RSS high-water mark per case
+    context = multiprocessing.get_context('spawn')
+    try:
+        for flavor in args.flavor or sorted(CASES):
+            db_path = os.path.join(data_dir, f'{flavor}-{args.employees}-{args.requests}-'
+                                             f'{args.years}-{args.seed}.db')
+            if not os.path.exists(db_path):
+                print(f'Generating {db_path} ...', flush=True)
+                datasets[flavor] = build_dataset(db_path, flavor, args.employees, args.requests,
+                                                 args.years, args.seed)
+            else:
+                datasets[flavor] = {'flavor': flavor, 'reused': db_path}
+            for case_name, _, full_scan, _ in CASES[flavor]:
+                if args.only and case_name not in args.only:
+                    continue
+                iterations = args.full_iterations if full_scan else args.iterations
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(run_case, flavor, db_path, case_name, iterations,
+                                         args.cached, args.seed).result()
+                results.append(result)
+                print(f"{flavor + ':' + case_name:<50} p50 {result['p50_ms']:>9.3f} ms  "
+                      f"p99 {result['p99_ms']:>9.3f} ms  {result['rows_per_sec'] or 0:>12,.0f} rows/s  "
+                      f"{result['peak_rss_mb']:>7.1f} MB", flush=True)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'datasets': datasets,
+            'options': vars(args),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as handle:
+        json.dump(report, handle, indent=2)
+    print(f'\nWrote {len(results)} results to {args.output}')
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
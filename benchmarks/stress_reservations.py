@@ -0,0 +1,219 @@
+"""Stress test: concurrent leave applications must never over-commit a balance.
+
+Generates a small database where every employee has 20 days and nothing
+used or pending, then fires ``--applications`` applications at once from
+``--threads`` threads (all released by one barrier) while manager threads
+approve and reject pending requests and a monitor thread keeps checking
+that no employee's ``total - used - reserved`` is negative. Few employees
+and long leaves make most applications compete for the same balances.
+
+At the end it also checks that ``reserved_leaves`` equals the pending days
+of every employee, that balances agree with the leave ledger and that no two
+active requests overlap. Exits non-zero
+on any violation.
+
+Usage:
+    python benchmarks/stress_reservations.py [--flavor leave_management|app]
+        [--applications N] [--threads N] [--employees N]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+from hierarchy import top_manager  # noqa: E402
+from ledger import reconcile  # noqa: E402
+from overlaps import audit_overlaps  # noqa: E402
+from reservations import overcommitted  # noqa: E402
+from schema import APP, CANONICAL, LEAVE_MANAGEMENT, REQUEST_ID_COLUMN  # noqa: E402
+
+
+def reset_balances(db_path):
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('DELETE FROM leave_requests')
+        conn.execute('UPDATE employees SET total_leaves = 20, used_leaves = 0, reserved_leaves = 0')
+    employees = [row[0] for row in conn.execute('SELECT emp_id FROM employees')]
+    conn.close()
+    return employees
+
+
+def front_end(flavor):
+    """``(apply(emp_id, start, end) -> outcome, decide(request_id, status))`` for a flavour
+
+    Decisions go through the batch path, which only decides requests that are
+    still pending, so two managers picking the same request cannot both apply it.
+    Decisions are made by the top of the reporting lines, who may decide for everyone else.
+    """
+    if flavor == APP:
+        import app
+
+        def apply(emp_id, start, end):
+            try:
+                app.apply_leave(emp_id, 'Vacation', start, end, 'stress')
+            except app.LeaveValidationError:
+                return 'rejected'
+            return 'accepted'
+        return apply, lambda request_id, status: app.update_leave_statuses([(request_id, status)], 'ADMIN')
+
+    import leave_service
+
+    def apply(emp_id, start, end):
+        try:
+            leave_service.apply_leave(emp_id, 'Casual Leave', start, end, 'stress')
+        except leave_service.LeaveValidationError:
+            return 'rejected'
+        return 'accepted'
+    with database.get_connection() as conn:
+        approver = top_manager(conn)
+    return apply, lambda request_id, status: leave_service.update_leave_statuses([(request_id, status)], approver)
+
+
+def check_invariants(db_path, id_column):
+    conn = sqlite3.connect(db_path)
+    try:
+        problems = [f'employee {emp_id} over-committed: {used} used + {reserved} reserved > {total}'
+                    for emp_id, total, used, reserved in overcommitted(conn)]
+        problems += [f'employee {emp_id}: reserved {reserved} but {pending} pending days'
+                     for emp_id, reserved, pending in conn.execute('''
+            SELECT e.emp_id, e.reserved_leaves, COALESCE(SUM(lr.days), 0)
+            FROM employees e
+            LEFT JOIN leave_requests lr ON lr.emp_id = e.emp_id AND lr.status = 'Pending'
+            GROUP BY e.emp_id
+            HAVING e.reserved_leaves != COALESCE(SUM(lr.days), 0)
+        ''')]
+        problems += [f'employee {emp_id}: approved {used} days but used_leaves is {recorded}'
+                     for emp_id, recorded, used in conn.execute('''
+            SELECT e.emp_id, e.used_leaves, COALESCE(SUM(lr.days), 0)
+            FROM employees e
+            LEFT JOIN leave_requests lr ON lr.emp_id = e.emp_id AND lr.status = 'Approved'
+            GROUP BY e.emp_id
+            HAVING e.used_leaves != COALESCE(SUM(lr.days), 0)
+        ''')]
+        problems += [f'employee {emp_id}: used {used} of {total} but the ledger says {ledger_used} of {ledger_total}'
+                     for emp_id, total, used, ledger_total, ledger_used, _ in reconcile(conn)]
+        problems += [f'employee {row[0]}: request #{row[1]} overlaps an earlier active request'
+                     for row in audit_overlaps(conn, id_column)]
+    finally:
+        conn.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--flavor', choices=(LEAVE_MANAGEMENT, APP), default=LEAVE_MANAGEMENT)
+    parser.add_argument('--applications', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--employees', type=int, default=20)
+    parser.add_argument('--managers', type=int, default=4, help='threads deciding pending requests')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='leave-stress-')
+    db_path = os.path.join(workdir, 'stress.db')
+    build_dataset(db_path, flavor=args.flavor, employees=args.employees, requests=0)
+    employees = reset_balances(db_path)
+    os.environ['LEAVE_DB_PATH'] = db_path
+    database.set_db_path(db_path)
+    apply, decide = front_end(args.flavor)
+    id_column = REQUEST_ID_COLUMN[CANONICAL]
+
+    rng = random.Random(args.seed)
+    first_day = date(2031, 1, 6)
+    applications = []
+    for _ in range(args.applications):
+        start = first_day + timedelta(days=rng.randrange(365))
+        applications.append((rng.choice(employees), start, start + timedelta(days=rng.randint(0, 9))))
+
+    outcomes, errors = Counter(), []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads + args.managers + 1)
+    applying = threading.Event()
+    violations = []
+
+    def applicant(batch):
+        barrier.wait()
+        local = Counter()
+        for emp_id, start, end in batch:
+            try:
+                local[apply(emp_id, start, end)] += 1
+            except Exception as e:  # noqa: BLE001 - every failure is reported
+                with lock:
+                    errors.append(repr(e))
+        with lock:
+            outcomes.update(local)
+
+    def manager(seed):
+        manager_rng = random.Random(seed)
+        conn = sqlite3.connect(db_path)
+        barrier.wait()
+        while applying.is_set():
+            row = conn.execute(f"SELECT {id_column} FROM leave_requests WHERE status = 'Pending' "
+                               'ORDER BY random() LIMIT 1').fetchone()
+            if row:
+                try:
+                    decide(row[0], manager_rng.choice(('Approved', 'Rejected')))
+                    with lock:
+                        outcomes['decided'] += 1
+                except Exception as e:  # noqa: BLE001
+                    with lock:
+                        errors.append(repr(e))
+        conn.close()
+
+    def monitor():
+        conn = sqlite3.connect(db_path)
+        while applying.is_set():
+            rows = overcommitted(conn)
+            if rows:
+                violations.extend(rows)
+            time.sleep(0.01)
+        conn.close()
+
+    applying.set()
+    threads = [threading.Thread(target=applicant, args=(applications[i::args.threads],))
+               for i in range(args.threads)]
+    managers = [threading.Thread(target=manager, args=(args.seed + i,)) for i in range(args.managers)]
+    checker = threading.Thread(target=monitor)
+    for thread in threads + managers:
+        thread.start()
+    checker.start()
+    started = time.perf_counter()
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    applying.clear()
+    for thread in managers:
+        thread.join()
+    checker.join()
+    database.close_pools()
+
+    problems = check_invariants(db_path, id_column)
+    problems += [f'monitor saw employee {row[0]} over-committed: {row[2]} used + {row[3]} reserved > {row[1]}'
+                 for row in violations[:20]]
+    problems += errors[:20]
+    print(f'{args.flavor}: {args.applications:,} applications from {args.threads} threads in {elapsed:.1f}s '
+          f'({args.applications / elapsed:,.0f}/s): {outcomes["accepted"]:,} accepted, '
+          f'{outcomes["rejected"]:,} rejected, {outcomes["decided"]:,} decided, {len(errors)} errors')
+    for problem in problems:
+        print(f'FAIL {problem}')
+    for name in os.listdir(workdir):
+        os.remove(os.path.join(workdir, name))
+    os.rmdir(workdir)
+    if problems:
+        raise SystemExit(1)
+    print('OK: no balance went negative, reservations match pending days, ledger agrees, no overlaps')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""One-time database bootstrap and script-run timings for the front-ends.
+
+Streamlit runs ``app.py`` and ``leave_management.py`` from the top on every
+rerun, so schema setup called from the script opened connections, ran its
+``CREATE TABLE IF NOT EXISTS`` statements, the migration check and the
+sample-data ``COUNT(*)`` on every click. :func:`bootstrap` does that work once
+per process and database file: later calls return after a dictionary lookup,
+without touching the database.
+
+The first call is safe to race. Sessions of one process (one thread each)
+wait on a lock and then find the work done. Separate processes on one
+database file (several Streamlit or API workers) are serialised by SQLite's
+write lock: the tables use ``IF NOT EXISTS``, migrations re-check
+``user_version`` inside ``BEGIN IMMEDIATE``, and the sample data is only
+inserted if ``employees`` is still empty inside its own ``BEGIN IMMEDIATE``
+transaction, so exactly one worker seeds a new database. By default the seed
+runs before the migrations, whose backfills (reporting lines, ledger,
+approval groups) then cover the sample rows like any existing data;
+``migrate_first`` reverses that for a seed that fills migrated columns.
+
+:func:`script_run` times each run of a page script, and
+:func:`startup_report` returns the bootstrap, cold-start (first run, which
+includes the module imports) and rerun timings of this process; ``app.py``
+shows them in the admin sidebar. ``benchmarks/bench_startup.py`` measures cold
+starts and reruns of both apps in fresh processes and fails when time to
+first paint exceeds a budget.
+"""
+import statistics
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import database
+from cache import bump_data_version
+from database import begin_immediate, get_connection
+
+# The page scripts import this module before their other modules, so the cold
+# start is timed from here. migrations (and numpy through it) is imported by
+# bootstrap() itself, to be counted too.
+IMPORTED_AT = time.perf_counter()
+RUN_HISTORY = 500
+# Modules the first paint should not have to import (see bench_startup)
+DEFERRED_MODULES = ('pandas',)
+
+_lock = threading.Lock()
+_bootstrapped = {}  # database path -> seconds spent bootstrapping it
+_runs = deque(maxlen=RUN_HISTORY)
+_first_run = None
+
+
+def _seed_if_empty(conn, seed):
+    """Run ``seed(conn)`` if there are no employees yet; returns True if it did"""
+    begin_immediate(conn)
+    try:
+        # Re-checked under the write lock: another worker may have just seeded
+        if conn.execute('SELECT 1 FROM employees LIMIT 1').fetchone() is not None:
+            conn.rollback()
+            return False
+        seed(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    bump_data_version()
+    return True
+
+
+def bootstrap(flavor, seed=None, db_path=None, migrate_first=False):
+    """Create the tables of ``flavor``, seed an empty database and migrate it, once per process
+
+    ``seed(conn)`` inserts the sample data without committing. Returns True
+    if this call did the work and False if it was already done.
+    """
+    path = db_path or database.DB_PATH
+    if path in _bootstrapped:
+        return False
+    from migrations import run_migrations
+    from schema import create_tables
+
+    with _lock:
+        if path in _bootstrapped:
+            return False
+        started = time.perf_counter()
+        with get_connection(path) as conn:
+            create_tables(conn, flavor)
+            conn.commit()
+            if migrate_first:
+                run_migrations(conn)
+            if seed is not None:
+                _seed_if_empty(conn, seed)
+            if not migrate_first:
+                run_migrations(conn)
+        _bootstrapped[path] = time.perf_counter() - started
+    return True
+
+
+@contextmanager
+def script_run():
+    """Time one run of a page script; the first run of the process counts from the imports"""
+    global _first_run
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        # Also reached when st.rerun() or st.stop() ends the run early
+        if _first_run is None:
+            _first_run = time.perf_counter() - IMPORTED_AT
+        else:
+            _runs.append(time.perf_counter() - started)
+
+
+def startup_report():
+    """Bootstrap, first-run and rerun timings of this process, in milliseconds"""
+    runs = sorted(_runs)
+    return {
+        'bootstrap_ms': sum(_bootstrapped.values()) * 1000,
+        'first_run_ms': _first_run * 1000 if _first_run is not None else None,
+        'reruns': len(runs),
+        'rerun_median_ms': statistics.median(runs) * 1000 if runs else None,
+        'rerun_p95_ms': runs[int(len(runs) * 0.95)] * 1000 if runs else None,
+        'last_rerun_ms': _runs[-1] * 1000 if runs else None,
+        'deferred_imports': [name for name in DEFERRED_MODULES if name not in sys.modules],
+    }
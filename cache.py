@@ -0,0 +1,132 @@
+"""Process-wide query result cache shared by every Streamlit session.
+
+Read functions are wrapped with :func:`cached`. Entries are keyed by the
+function, the database file, its arguments (employee, filter set, cursor,
+...) and the current data-version stamp. The stamp combines SQLite's
+``PRAGMA data_version``, which changes with every commit to the file by any
+process (the API, other Streamlit workers, CLI jobs such as ``accrual.py``),
+with a local counter that write paths bump with :func:`bump_data_version`
+after committing. Either change makes all earlier entries unreachable, so a
+balance or list is never served from before a write. Unreachable and idle
+entries are removed by LRU and TTL eviction.
+
+Cached values are shared between sessions: callers must treat returned
+DataFrames and dicts as read-only (copy before modifying).
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import database
+
+CACHE_MAX_ENTRIES = int(os.environ.get('LEAVE_CACHE_MAX_ENTRIES', '2048'))
+CACHE_TTL_SECONDS = float(os.environ.get('LEAVE_CACHE_TTL', '300'))
+
+
+class QueryCache:
+    """A thread-safe LRU cache whose entries also expire after ``ttl`` seconds"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return ``(True, value)`` on a hit, ``(False, None)`` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for sizing the cache"""
+        version = data_version()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'data_version': version,
+            }
+
+
+query_cache = QueryCache()
+
+# Local part of the data-version stamp; bumped by every write path
+_data_version = 0
+_version_lock = threading.Lock()
+
+
+def data_version(db_path=None):
+    """``(local version, database data_version)`` of ``db_path`` (defaults to ``database.DB_PATH``)"""
+    return _data_version, database.data_version(db_path)
+
+
+def bump_data_version():
+    """Invalidate every cached result; call after committing a write"""
+    global _data_version
+    with _version_lock:
+        _data_version += 1
+    return _data_version
+
+
+def _freeze(value):
+    """Turn filter arguments (lists, sets, dicts) into hashable key parts"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def cached(func):
+    """Decorator caching a read function's result in :data:`query_cache`"""
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Capture the version before reading so a concurrent write can only
+        # make this entry unreachable, never stale
+        db_path = database.DB_PATH
+        key = (name, db_path, data_version(db_path), _freeze(args), _freeze(kwargs))
+        hit, value = query_cache.get(key)
+        if hit:
+            return value
+        value = func(*args, **kwargs)
+        query_cache.put(key, value)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
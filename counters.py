@@ -0,0 +1,195 @@
+"""Incrementally maintained leave request counters.
+
+``leave_counters`` holds one global row and ``employee_leave_counters`` one row
+per employee, each with pending/approved/rejected/total request counts. SQLite
+triggers on ``leave_requests`` and ``employees`` keep them exact for every
+write path, so dashboards read them with a primary-key lookup instead of
+``COUNT(*)`` scans. Archiving a year (see ``archive``) leaves them as they
+are, so they keep counting its requests.
+
+If the counters are ever suspected to be wrong (e.g. after editing the
+database by hand with triggers dropped), rebuild them from scratch with::
+
+    python counters.py --rebuild
+"""
+import argparse
+import sqlite3
+
+import database
+from archive import hot_exclusion, iter_archived, read_catalog
+from database import configure_connection, execute_script
+
+COUNTER_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS leave_counters (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        pending INTEGER NOT NULL DEFAULT 0,
+        approved INTEGER NOT NULL DEFAULT 0,
+        rejected INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        employees INTEGER NOT NULL DEFAULT 0
+    );
+
+    -- emp_id is left untyped so it matches either front-end's employee ids
+    CREATE TABLE IF NOT EXISTS employee_leave_counters (
+        emp_id PRIMARY KEY,
+        pending INTEGER NOT NULL DEFAULT 0,
+        approved INTEGER NOT NULL DEFAULT 0,
+        rejected INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0
+    );
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_counters_insert
+    AFTER INSERT ON leave_requests
+    BEGIN
+        UPDATE leave_counters
+        SET pending = pending + (NEW.status = 'Pending'),
+            approved = approved + (NEW.status = 'Approved'),
+            rejected = rejected + (NEW.status = 'Rejected'),
+            total = total + 1
+        WHERE id = 1;
+        INSERT INTO employee_leave_counters (emp_id, pending, approved, rejected, total)
+        VALUES (NEW.emp_id, NEW.status = 'Pending', NEW.status = 'Approved', NEW.status = 'Rejected', 1)
+        ON CONFLICT (emp_id) DO UPDATE
+        SET pending = pending + excluded.pending,
+            approved = approved + excluded.approved,
+            rejected = rejected + excluded.rejected,
+            total = total + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_counters_delete
+    AFTER DELETE ON leave_requests
+    BEGIN
+        UPDATE leave_counters
+        SET pending = pending - (OLD.status = 'Pending'),
+            approved = approved - (OLD.status = 'Approved'),
+            rejected = rejected - (OLD.status = 'Rejected'),
+            total = total - 1
+        WHERE id = 1;
+        UPDATE employee_leave_counters
+        SET pending = pending - (OLD.status = 'Pending'),
+            approved = approved - (OLD.status = 'Approved'),
+            rejected = rejected - (OLD.status = 'Rejected'),
+            total = total - 1
+        WHERE emp_id = OLD.emp_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_counters_update
+    AFTER UPDATE OF status, emp_id ON leave_requests
+    WHEN OLD.status IS NOT NEW.status OR OLD.emp_id IS NOT NEW.emp_id
+    BEGIN
+        UPDATE leave_counters
+        SET pending = pending - (OLD.status = 'Pending') + (NEW.status = 'Pending'),
+            approved = approved - (OLD.status = 'Approved') + (NEW.status = 'Approved'),
+            rejected = rejected - (OLD.status = 'Rejected') + (NEW.status = 'Rejected')
+        WHERE id = 1;
+        UPDATE employee_leave_counters
+        SET pending = pending - (OLD.status = 'Pending'),
+            approved = approved - (OLD.status = 'Approved'),
+            rejected = rejected - (OLD.status = 'Rejected'),
+            total = total - 1
+        WHERE emp_id = OLD.emp_id;
+        INSERT INTO employee_leave_counters (emp_id, pending, approved, rejected, total)
+        VALUES (NEW.emp_id, NEW.status = 'Pending', NEW.status = 'Approved', NEW.status = 'Rejected', 1)
+        ON CONFLICT (emp_id) DO UPDATE
+        SET pending = pending + excluded.pending,
+            approved = approved + excluded.approved,
+            rejected = rejected + excluded.rejected,
+            total = total + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_employee_counter_insert
+    AFTER INSERT ON employees
+    BEGIN
+        UPDATE leave_counters SET employees = employees + 1 WHERE id = 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_employee_counter_delete
+    AFTER DELETE ON employees
+    BEGIN
+        UPDATE leave_counters SET employees = employees - 1 WHERE id = 1;
+    END;
+'''
+
+
+# Per-employee counts of one partition's requests, without the rows of {where}
+EMPLOYEE_COUNTS = '''
+    SELECT emp_id,
+           SUM(status = 'Pending'), SUM(status = 'Approved'), SUM(status = 'Rejected'), COUNT(*)
+    FROM leave_requests
+    {where}
+    GROUP BY emp_id
+'''
+
+
+def install_counters(conn):
+    """Create the counter tables and triggers, then fill them from the data"""
+    execute_script(conn, COUNTER_SCHEMA)
+    rebuild_leave_counters(conn)
+
+
+def rebuild_leave_counters(conn):
+    """Recompute every counter from ``leave_requests``, the archived years and ``employees``"""
+    catalog = read_catalog(conn)
+    clauses, params = hot_exclusion(catalog, 'start_date')
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    conn.execute('DELETE FROM employee_leave_counters')
+    conn.execute(f'''
+        INSERT INTO employee_leave_counters (emp_id, pending, approved, rejected, total)
+        {EMPLOYEE_COUNTS.format(where=where)}
+    ''', params)
+    conn.executemany('''
+        INSERT INTO employee_leave_counters (emp_id, pending, approved, rejected, total)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (emp_id) DO UPDATE
+        SET pending = pending + excluded.pending,
+            approved = approved + excluded.approved,
+            rejected = rejected + excluded.rejected,
+            total = total + excluded.total
+    ''', iter_archived(conn, catalog, EMPLOYEE_COUNTS.format(where='')))
+    conn.execute('DELETE FROM leave_counters')
+    conn.execute('''
+        INSERT INTO leave_counters (id, pending, approved, rejected, total, employees)
+        SELECT 1,
+               COALESCE(SUM(pending), 0), COALESCE(SUM(approved), 0),
+               COALESCE(SUM(rejected), 0), COALESCE(SUM(total), 0),
+               (SELECT COUNT(*) FROM employees)
+        FROM employee_leave_counters
+    ''')
+
+
+def get_global_counters(conn):
+    """Company-wide request counts and head count as a dict"""
+    row = conn.execute('''
+        SELECT pending, approved, rejected, total, employees FROM leave_counters WHERE id = 1
+    ''').fetchone() or (0, 0, 0, 0, 0)
+    return dict(zip(('pending', 'approved', 'rejected', 'total', 'employees'), row))
+
+
+def get_employee_counters(conn, emp_id):
+    """Request counts for one employee as a dict (zeros if they have none)"""
+    row = conn.execute('''
+        SELECT pending, approved, rejected, total FROM employee_leave_counters WHERE emp_id = ?
+    ''', (emp_id,)).fetchone() or (0, 0, 0, 0)
+    return dict(zip(('pending', 'approved', 'rejected', 'total'), row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or repair the leave request counters')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--rebuild', action='store_true', help='recompute all counters from scratch')
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        if args.rebuild:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_leave_counters(conn)
+            conn.commit()
+            print('Counters rebuilt')
+        print(get_global_counters(conn))
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,392 @@
+"""Shared SQLite data-access layer for the ACME Leave Management front-ends.
+
+Both ``leave_management.py`` and ``app.py`` borrow connections from a
+process-wide pool instead of calling ``sqlite3.connect`` for every query, so
+connection setup, pragma configuration and schema parsing are paid once per
+pooled connection rather than once per call.
+
+Writes go through :func:`write_transaction`. By default it hands them to a
+:class:`WriteQueue`: one writer thread per database that owns the process's
+write connection, runs queued write functions back to back in a single
+``BEGIN IMMEDIATE`` transaction (each inside its own savepoint) and commits
+the group once. Sessions no longer contend for SQLite's write lock and a
+burst of writes pays for one commit instead of one each. Reads stay on the
+pool.
+"""
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# Configuration (overridable through the environment)
+DB_PATH = os.environ.get('LEAVE_DB_PATH', 'leave_management.db')
+POOL_SIZE = int(os.environ.get('LEAVE_DB_POOL_SIZE', '8'))
+POOL_TIMEOUT = float(os.environ.get('LEAVE_DB_POOL_TIMEOUT', '30'))
+WRITE_RETRIES = int(os.environ.get('LEAVE_DB_WRITE_RETRIES', '5'))
+WRITE_BACKOFF = float(os.environ.get('LEAVE_DB_WRITE_BACKOFF', '0.05'))
+WRITE_QUEUE = os.environ.get('LEAVE_DB_WRITE_QUEUE', '1') == '1'
+WRITE_BATCH = int(os.environ.get('LEAVE_DB_WRITE_BATCH', '64'))
+WRITE_WINDOW = float(os.environ.get('LEAVE_DB_WRITE_WINDOW', '0'))
+
+# Applied to every new connection, in order
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),
+    ('cache_size', -16000),     # negative means KiB, i.e. ~16 MB of page cache
+    ('mmap_size', 268435456),   # 256 MB memory-mapped I/O
+    ('temp_store', 'MEMORY'),
+)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+def configure_connection(conn):
+    """Apply the standard pragmas to a freshly opened connection"""
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def main_file(conn):
+    """Path of the file ``conn`` opened as its main database (``''`` in memory)"""
+    return next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+
+
+def execute_script(conn, script):
+    """Run a multi-statement SQL script without committing
+
+    Unlike ``Connection.executescript`` this keeps the caller's transaction
+    open, so DDL can be applied atomically together with other changes.
+    """
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ''
+    if statement.strip():
+        conn.execute(statement)
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of SQLite connections to one database file"""
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        configure_connection(conn)
+        with self._lock:
+            self._connections.append(conn)
+        return conn
+
+    def acquire(self):
+        """Borrow a connection, opening a new one if none is idle"""
+        if self._closed:
+            raise RuntimeError('Connection pool is closed')
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f'No connection to {self.db_path} available after {self.timeout}s')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, conn):
+        """Return a borrowed connection to the pool"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commit on success and roll back on error"""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def data_version(self):
+        """A number that changes whenever any connection, in any process, commits to the database
+
+        ``PRAGMA data_version`` ignores the commits of the connection that
+        runs it, so it is read on a dedicated connection that never writes.
+        """
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._watcher = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+            return self._watcher.execute('PRAGMA data_version').fetchone()[0]
+
+    def close(self):
+        """Close every idle connection; busy ones are closed when released"""
+        self._closed = True
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._connections.clear()
+
+
+# Process-wide pools, one per database file
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def set_db_path(db_path):
+    """Point the default pool at a different database file"""
+    global DB_PATH
+    DB_PATH = db_path
+
+
+def get_pool(db_path=None):
+    """Return the shared pool for ``db_path`` (defaults to ``DB_PATH``)"""
+    db_path = db_path or DB_PATH
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = _pools[db_path] = ConnectionPool(db_path)
+    return pool
+
+
+def get_connection(db_path=None):
+    """Context manager yielding a pooled connection to the leave database"""
+    return get_pool(db_path).connection()
+
+
+def data_version(db_path=None):
+    """See :meth:`ConnectionPool.data_version`"""
+    return get_pool(db_path).data_version()
+
+
+def is_busy_error(error):
+    """True for SQLITE_BUSY / SQLITE_LOCKED, i.e. another connection holds the lock"""
+    return isinstance(error, sqlite3.OperationalError) and (
+        'locked' in str(error) or 'busy' in str(error))
+
+
+def begin_immediate(conn, retries=WRITE_RETRIES):
+    """``BEGIN IMMEDIATE``, retried with jittered exponential backoff while the database is busy
+
+    The write lock is taken before anything is read, so checks made inside
+    the transaction (balances, overlaps) still hold at commit. Each attempt
+    already waits up to ``busy_timeout`` for the lock.
+    """
+    delay = WRITE_BACKOFF
+    for attempt in range(retries + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            return
+        except sqlite3.OperationalError as e:
+            if not is_busy_error(e) or attempt == retries:
+                raise
+        time.sleep(delay * random.uniform(0.5, 1.5))
+        delay *= 2
+
+
+class WriteQueue:
+    """A writer thread owning one write connection; queued writes are group-committed
+
+    ``submit(func, *args)`` queues ``func(conn, *args)`` and returns a
+    ``Future``. The writer takes up to ``max_batch`` queued writes, waiting at
+    most ``max_wait`` seconds for the group to fill, runs each in its own
+    savepoint inside one ``BEGIN IMMEDIATE`` transaction and commits once.
+    A write that raises is rolled back to its savepoint without affecting
+    the rest of its group. Futures are resolved only after the commit.
+    """
+
+    def __init__(self, db_path, max_batch=WRITE_BATCH, max_wait=WRITE_WINDOW, retries=WRITE_RETRIES):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.retries = retries
+        self.commits = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='leave-db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args):
+        if self._closed:
+            raise RuntimeError('Write queue is closed')
+        future = Future()
+        self._queue.put((func, args, future))
+        return future
+
+    def call(self, func, *args):
+        """Run ``func(conn, *args)`` on the writer and wait for its committed result"""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('write functions must not queue further writes')
+        return self.submit(func, *args).result()
+
+    def stats(self):
+        return {'writes': self.writes, 'commits': self.commits,
+                'writes_per_commit': self.writes / self.commits if self.commits else 0.0}
+
+    def close(self):
+        """Finish the queued writes, then stop the writer"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _collect(self):
+        """Block for one write, then gather more until the group is full or the window ends"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        group = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(group) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0)) \
+                    if self.max_wait else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop after this group
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=POOL_TIMEOUT, check_same_thread=False)
+        configure_connection(conn)
+        try:
+            while True:
+                group = self._collect()
+                if group is None:
+                    break
+                self._commit_group(conn, [(func, args, future) for func, args, future in group
+                                          if future.set_running_or_notify_cancel()])
+        finally:
+            conn.close()
+
+    def _commit_group(self, conn, group):
+        try:
+            begin_immediate(conn, self.retries)
+        except Exception as e:
+            for _, _, future in group:
+                future.set_exception(e)
+            return
+
+        outcomes = []
+        try:
+            for func, args, future in group:
+                conn.execute('SAVEPOINT queued_write')
+                try:
+                    result = func(conn, *args)
+                except Exception as e:
+                    conn.execute('ROLLBACK TO queued_write')
+                    conn.execute('RELEASE queued_write')
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute('RELEASE queued_write')
+                    outcomes.append((future, result, None))
+            conn.commit()
+        except Exception as e:
+            # The transaction itself failed (I/O error, a write that ended it): nothing was kept
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.commits += 1
+        self.writes += len(outcomes)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+# Process-wide writers, one per database file
+_writers = {}
+
+
+def get_writer(db_path=None):
+    """Return the shared :class:`WriteQueue` for ``db_path`` (defaults to ``DB_PATH``)"""
+    db_path = db_path or DB_PATH
+    writer = _writers.get(db_path)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.get(db_path)
+            if writer is None:
+                writer = _writers[db_path] = WriteQueue(db_path)
+    return writer
+
+
+def write_transaction(func, *args, db_path=None, retries=WRITE_RETRIES):
+    """Run ``func(conn, *args)`` in a ``BEGIN IMMEDIATE`` transaction and return its result
+
+    With the write queue enabled (``LEAVE_DB_WRITE_QUEUE``, the default) the
+    function runs on the database's writer thread and may share its commit
+    with other queued writes; an exception it raises rolls back only its own
+    changes and is re-raised here. Otherwise it runs on a pooled connection
+    in a transaction of its own. Either way the result is returned after the
+    commit, and ``func`` must not commit, roll back or queue other writes.
+    """
+    if WRITE_QUEUE:
+        return get_writer(db_path).call(func, *args)
+    with get_connection(db_path) as conn:
+        begin_immediate(conn, retries)
+        return func(conn, *args)
+
+
+def execute_write(sql, params=()):
+    """Run one write statement through :func:`write_transaction`; returns the row count"""
+    return write_transaction(lambda conn: conn.execute(sql, params).rowcount)
+
+
+def close_pools():
+    """Stop every writer and close every pool (used by tests, benchmarks and shutdown hooks)"""
+    with _pools_lock:
+        for writer in _writers.values():
+            writer.close()
+        _writers.clear()
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
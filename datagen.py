@@ -0,0 +1,224 @@
+"""Seeded synthetic data for either database flavour.
+
+Produces a reproducible dataset of a configurable size: departments with a
+skewed head count, a realistic status mix (history is mostly decided, the
+recent and future window is mostly pending) and several years of requests.
+Rows are streamed through ``executemany`` in chunks so memory stays flat,
+and the migrations (indexes, counters) run after the bulk load so index
+builds happen once instead of per row. The rows are generated in a legacy
+flavour's shape and the last migration converts them to the canonical
+schema both front-ends use; ``--legacy`` stops before it, to keep a legacy
+database (e.g. to time the conversion in ``benchmarks/bench_storage.py``).
+
+Usage:
+    python datagen.py --db bench.db [--flavor leave_management|app]
+                      [--employees N] [--requests N] [--years N] [--seed N] [--legacy]
+"""
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+from database import configure_connection
+from migrations import LATEST_VERSION, run_migrations
+from schema import APP, LEAVE_MANAGEMENT, create_tables
+from storage import CANONICAL_VERSION
+
+CHUNK_SIZE = 50_000
+DEFAULT_PASSWORD = 'password123'
+
+# (department, relative head count)
+DEPARTMENTS = [
+    ('Engineering', 40), ('Sales', 18), ('Operations', 12), ('Marketing', 8),
+    ('Customer Support', 8), ('Finance', 5), ('HR', 4), ('Legal', 3), ('Management', 2),
+]
+LEAVE_TYPES = {
+    LEAVE_MANAGEMENT: [('Casual Leave', 35), ('Sick Leave', 30), ('Annual Leave', 30),
+                       ('Maternity Leave', 2), ('Paternity Leave', 3)],
+    APP: [('Vacation', 40), ('Sick Leave', 30), ('Personal Leave', 18),
+          ('Emergency Leave', 7), ('Other', 5)],
+}
+# Status weights for requests that start in the past vs. those still ahead
+PAST_STATUS_MIX = [('Approved', 84), ('Rejected', 11), ('Pending', 5)]
+UPCOMING_STATUS_MIX = [('Pending', 60), ('Approved', 35), ('Rejected', 5)]
+# Short absences dominate, long ones form a thin tail
+DURATION_MIX = [(1, 30), (2, 22), (3, 16), (4, 8), (5, 10), (7, 5), (10, 5), (15, 3), (30, 1)]
+REASONS = ['Family event', 'Medical appointment', 'Vacation', 'Flu', 'Personal errand',
+           'Moving house', 'Wedding', 'Conference', 'Childcare', None]
+FIRST_NAMES = ['John', 'Jane', 'Bob', 'Alice', 'Charlie', 'Diana', 'Eve', 'Frank', 'Grace',
+               'Heidi', 'Ivan', 'Judy', 'Mallory', 'Niaj', 'Olivia', 'Peggy', 'Rupert', 'Sybil']
+LAST_NAMES = ['Doe', 'Smith', 'Johnson', 'Williams', 'Brown', 'Prince', 'Davis', 'Miller',
+              'Wilson', 'Moore', 'Taylor', 'Anderson', 'Thomas', 'Jackson', 'White', 'Harris']
+
+
+def _weighted(choices):
+    """Split [(value, weight), ...] into parallel lists for random.choices"""
+    values, weights = zip(*choices)
+    return list(values), list(weights)
+
+
+def employee_key(flavor, index):
+    """emp_id of the ``index``-th generated employee"""
+    return 1000 + index if flavor == LEAVE_MANAGEMENT else f'EMP{index:06d}'
+
+
+def generate_employees(flavor, count, rng):
+    """Yield employee rows in the column order of the flavour's INSERT"""
+    departments, weights = _weighted(DEPARTMENTS)
+    hash_function = hashlib.sha256 if flavor == LEAVE_MANAGEMENT else hashlib.md5
+    password = hash_function(DEFAULT_PASSWORD.encode()).hexdigest()
+    for index in range(count):
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        email = f'{name.lower().replace(" ", ".")}.{index}@acme.com'
+        department = rng.choices(departments, weights)[0]
+        is_manager = rng.random() < 0.08
+        if flavor == LEAVE_MANAGEMENT:
+            yield (employee_key(flavor, index), name, email, password, department,
+                   'Manager' if is_manager else 'Employee', 20, 0)
+        else:
+            yield (employee_key(flavor, index), name, email, department,
+                   f'{department} {"Manager" if is_manager else "Specialist"}', password, 20, 0)
+
+
+def generate_requests(flavor, employees, count, years, rng, today=None):
+    """Yield leave request rows spread over ``years`` of history plus a quarter ahead"""
+    today = today or date.today()
+    first_day = today - timedelta(days=365 * years)
+    span = (today + timedelta(days=90) - first_day).days
+    leave_types, type_weights = _weighted(LEAVE_TYPES[flavor])
+    durations, duration_weights = _weighted(DURATION_MIX)
+    past_statuses, past_weights = _weighted(PAST_STATUS_MIX)
+    upcoming_statuses, upcoming_weights = _weighted(UPCOMING_STATUS_MIX)
+    # A few employees take far more leave than the rest
+    activity = [rng.paretovariate(2.0) for _ in range(employees)]
+    approvers = [employee_key(flavor, index) for index in range(min(employees, 50))]
+    # Date formatting dominates generation time, so format each day once.
+    # Index 0 is 45 days before first_day: the earliest possible applied_date.
+    lead = 45
+    days_iso = [(first_day + timedelta(days=offset - lead)).isoformat()
+                for offset in range(span + lead + 45)]
+    cutoff = (today - timedelta(days=14) - first_day).days
+    # Pre-draw in bulk: random.choices is much cheaper per call with k > 1
+    for offset in range(0, count, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, count - offset)
+        owners = rng.choices(range(employees), activity, k=size)
+        types = rng.choices(leave_types, type_weights, k=size)
+        lengths = rng.choices(durations, duration_weights, k=size)
+        for owner, leave_type, days in zip(owners, types, lengths):
+            start = rng.randrange(span)
+            applied = start - rng.randint(1, lead)
+            seconds = rng.randrange(86400)
+            clock = f' {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+            if start <= cutoff:
+                status = rng.choices(past_statuses, past_weights)[0]
+            else:
+                status = rng.choices(upcoming_statuses, upcoming_weights)[0]
+            decided = status != 'Pending'
+            yield (employee_key(flavor, owner), leave_type, days_iso[start + lead],
+                   days_iso[start + lead + days - 1], days, rng.choice(REASONS), status,
+                   days_iso[applied + lead] + clock,
+                   rng.choice(approvers) if decided else None,
+                   days_iso[applied + lead + rng.randint(0, 5)] + clock if decided else None)
+
+EMPLOYEE_INSERT = {
+    LEAVE_MANAGEMENT: '''INSERT INTO employees
+        (emp_id, name, email, password, department, role, total_leaves, used_leaves)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+    APP: '''INSERT INTO employees
+        (emp_id, name, email, department, position, password, total_leaves, used_leaves)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+}
+REQUEST_INSERT = '''INSERT INTO leave_requests
+    (emp_id, leave_type, start_date, end_date, days, reason, status, applied_date,
+     approved_by, approved_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+
+def _insert_chunked(conn, sql, rows):
+    """executemany ``rows`` in CHUNK_SIZE batches, one transaction per batch"""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == CHUNK_SIZE:
+            with conn:
+                conn.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        with conn:
+            conn.executemany(sql, batch)
+        total += len(batch)
+    return total
+
+
+def build_dataset(db_path, flavor=LEAVE_MANAGEMENT, employees=1000, requests=100_000,
+                  years=3, seed=42, today=None, legacy=False):
+    """Create a fresh database at ``db_path`` and fill it; returns load statistics
+
+    ``legacy`` keeps the tables in ``flavor``'s shape instead of converting them.
+    """
+    if flavor not in EMPLOYEE_INSERT:
+        raise ValueError(f'Unknown flavour {flavor!r}')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    configure_connection(conn)
+    # The file is throw-away until the load finishes; skip the per-commit fsync
+    conn.execute('PRAGMA synchronous=OFF')
+    started = time.perf_counter()
+    create_tables(conn, flavor)
+    conn.commit()
+    _insert_chunked(conn, EMPLOYEE_INSERT[flavor], generate_employees(flavor, employees, rng))
+    _insert_chunked(conn, REQUEST_INSERT,
+                    generate_requests(flavor, employees, requests, years, rng, today))
+    loaded = time.perf_counter() - started
+    # used_leaves mirrors this year's approved days, like the UI keeps it; set
+    # before migrating so the opening ledger is built from the final figures
+    year_start = f'{(today or date.today()).year}-01-01'
+    # (one grouped pass: the per-employee indexes do not exist yet)
+    with conn:
+        conn.execute('UPDATE employees SET used_leaves = 0')
+        conn.execute('''
+            UPDATE employees SET used_leaves = approved.days
+            FROM (SELECT emp_id, SUM(days) AS days FROM leave_requests
+                  WHERE status = 'Approved' AND start_date >= ?
+                  GROUP BY emp_id) AS approved
+            WHERE approved.emp_id = employees.emp_id
+        ''', (year_start,))
+    run_migrations(conn, CANONICAL_VERSION - 1 if legacy else LATEST_VERSION)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.close()
+    return {
+        'flavor': flavor, 'employees': employees, 'requests': requests,
+        'years': years, 'seed': seed,
+        'load_seconds': round(loaded, 3),
+        'total_seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic leave database.')
+    parser.add_argument('--db', required=True, help='output path (overwritten)')
+    parser.add_argument('--flavor', choices=sorted(EMPLOYEE_INSERT), default=LEAVE_MANAGEMENT,
+                        help='legacy flavour the rows are generated in')
+    parser.add_argument('--employees', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=100_000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--legacy', action='store_true', help='do not convert to the canonical schema')
+    args = parser.parse_args()
+    stats = build_dataset(args.db, args.flavor, args.employees, args.requests, args.years, args.seed,
+                          legacy=args.legacy)
+    print(f"{stats['requests']:,} requests for {stats['employees']:,} employees "
+          f"({stats['flavor']}) loaded in {stats['load_seconds']}s, "
+          f"ready in {stats['total_seconds']}s")
+
+
+if __name__ == '__main__':
+    main()
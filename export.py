@@ -0,0 +1,299 @@
+"""Streaming CSV and XLSX export of leave requests.
+
+Rows are read with ``fetchmany`` in chunks of ``LEAVE_EXPORT_CHUNK`` from a
+single cursor and each chunk is encoded and handed on before the next one is
+read, so memory stays constant however long the history is. Both writers are
+generators of ``bytes``: the API streams them straight into the HTTP response
+and :func:`export_to_file` / :func:`spool_export` write them to disk (the
+Streamlit download buttons spool to a temporary file when clicked).
+
+XLSX output is produced with the standard library only: a write-only
+workbook of inline-string cells, zipped as it is written. A sheet holds at
+most 1,048,576 rows, so longer exports continue on further sheets.
+
+Exporting reads one snapshot of the database, and the archived years (see
+``archive``) from their own files; writers are not blocked (WAL)::
+
+    python export.py --output leaves.csv
+    python export.py --output leaves.xlsx --date-from 2026-09-01 --date-to 2026-09-30
+"""
+import argparse
+import csv
+import io
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+from archive import attach_archive, hot_exclusion, partition_sql, read_catalog, read_snapshot, routed_archives
+from leave_queries import build_leave_filters, plan_filters
+from schema import LEAVE_MANAGEMENT, REQUEST_ID_COLUMN, detect_flavor
+
+EXPORT_CHUNK = int(os.environ.get('LEAVE_EXPORT_CHUNK', '5000'))
+FORMATS = ('csv', 'xlsx')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+# (header, SQL expression) of the exported columns
+EXPORT_COLUMNS = (
+    ('request_id', 'lr.{id_column}'),
+    ('emp_id', 'lr.emp_id'),
+    ('name', 'e.name'),
+    ('department', 'e.department'),
+    ('leave_type', 'lr.leave_type'),
+    ('start_date', 'lr.start_date'),
+    ('end_date', 'lr.end_date'),
+    ('days', 'lr.days'),
+    ('status', 'lr.status'),
+    ('reason', 'lr.reason'),
+    ('applied_date', 'lr.applied_date'),
+    ('approved_by', 'lr.approved_by'),
+    ('approved_date', 'lr.approved_date'),
+)
+EXPORT_HEADER = tuple(name for name, _ in EXPORT_COLUMNS)
+
+MAX_SHEET_ROWS = 1_048_576
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_STATIC = {
+    '[Content_Types].xml':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '</Types>',
+    '_rels/.rels':
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>',
+}
+_SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _fetch_chunks(cursor, chunk_size):
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def iter_leave_chunks(conn, chunk_size=EXPORT_CHUNK, **filters):
+    """Yield lists of export rows (see ``EXPORT_HEADER``), ``chunk_size`` at a time
+
+    ``filters`` are those of :func:`leave_queries.build_leave_filters`. The
+    archived years the filters reach come first, oldest first, then the hot
+    table; each in request id order, which needs no sort.
+    """
+    id_column = REQUEST_ID_COLUMN[detect_flavor(conn) or LEAVE_MANAGEMENT]
+    columns = ', '.join(expression.format(id_column=id_column) for _, expression in EXPORT_COLUMNS)
+    filters = plan_filters(conn, filters)
+    clauses, params = build_leave_filters(**filters)
+
+    def query(clauses):
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        return f'''
+            SELECT {columns}
+            FROM leave_requests lr
+            LEFT JOIN employees e ON e.emp_id = lr.emp_id
+            {where}
+            ORDER BY lr.{id_column}
+        '''
+
+    def archives(catalog):
+        return reversed(routed_archives(catalog, filters.get('date_from'), filters.get('date_to'),
+                                        filters.get('statuses')))
+
+    exported = set()
+    for entry in archives(read_catalog(conn)):
+        yield from _fetch_chunks(conn.execute(partition_sql(query(clauses), attach_archive(conn, entry)), params),
+                                 chunk_size)
+        exported.add(entry['year'])
+    with read_snapshot(conn, filters.get('statuses')) as catalog:
+        excluded, excluded_params = hot_exclusion(catalog)
+        yield from _fetch_chunks(conn.execute(query(clauses + excluded), params + excluded_params), chunk_size)
+    # Years handed over to their archive while the others were exported
+    for entry in archives(catalog):
+        if entry['year'] not in exported:
+            yield from _fetch_chunks(conn.execute(partition_sql(query(clauses), attach_archive(conn, entry)),
+                                                  params), chunk_size)
+
+
+def iter_csv(chunks):
+    """Encode row chunks as UTF-8 CSV with a header, one ``bytes`` block per chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADER)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _Drain:
+    """Write-only sink that hands back what was written since the last ``take``"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, str):
+        return f'<c t="inlineStr"><is><t>{escape(value)}</t></is></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _rows_xml(rows):
+    # Cells carry no reference, so empty ones are written as <c/> to keep their
+    # column; characters XML cannot hold are dropped from the whole batch at once
+    xml = ''.join(['<row>' + ''.join(map(_cell, values)) + '</row>' for values in rows])
+    return _ILLEGAL_XML.sub('', xml).encode()
+
+
+def iter_xlsx(chunks, sheet_rows=MAX_SHEET_ROWS):
+    """Encode row chunks as an XLSX workbook, one ``bytes`` block per chunk
+
+    The zip is written to a non-seekable sink, so every entry carries a data
+    descriptor and the archive can be sent before it is complete.
+    """
+    drain = _Drain()
+    archive = zipfile.ZipFile(drain, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1)
+    for name, content in _XLSX_STATIC.items():
+        archive.writestr(name, content)
+    sheets, sheet, row_number = 0, None, 0
+
+    def start_sheet():
+        nonlocal sheets, sheet, row_number
+        sheets += 1
+        sheet = archive.open(f'xl/worksheets/sheet{sheets}.xml', 'w')
+        sheet.write(_SHEET_START.encode() + _rows_xml([EXPORT_HEADER]))
+        row_number = 1
+
+    start_sheet()
+    for rows in chunks:
+        while rows:
+            if row_number == sheet_rows:
+                sheet.write(_SHEET_END.encode())
+                sheet.close()
+                start_sheet()
+            batch, rows = rows[:sheet_rows - row_number], rows[sheet_rows - row_number:]
+            sheet.write(_rows_xml(batch))
+            row_number += len(batch)
+        yield drain.take()
+    sheet.write(_SHEET_END.encode())
+    sheet.close()
+
+    names = ''.join(f'<sheet name="Leaves {i}" sheetId="{i}" r:id="rId{i}"/>' for i in range(1, sheets + 1))
+    archive.writestr('xl/workbook.xml',
+                     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                     'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                     f'<sheets>{names}</sheets></workbook>')
+    targets = ''.join(
+        f'<Relationship Id="rId{i}" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        f'Target="worksheets/sheet{i}.xml"/>' for i in range(1, sheets + 1))
+    archive.writestr('xl/_rels/workbook.xml.rels',
+                     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                     f'{targets}</Relationships>')
+    archive.close()
+    yield drain.take()
+
+
+def iter_export(conn, fmt, chunk_size=EXPORT_CHUNK, **filters):
+    """``bytes`` blocks of the filtered leave requests encoded as ``fmt`` (``csv`` or ``xlsx``)"""
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}')
+    encode = iter_csv if fmt == 'csv' else iter_xlsx
+    return encode(iter_leave_chunks(conn, chunk_size, **filters))
+
+
+def export_to_file(conn, path, fmt=None, chunk_size=EXPORT_CHUNK, **filters):
+    """Write an export to ``path`` (format from the extension by default); returns bytes written"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    written = 0
+    with open(path, 'wb') as handle:
+        for block in iter_export(conn, fmt, chunk_size, **filters):
+            handle.write(block)
+            written += len(block)
+    return written
+
+
+def spool_export(blocks):
+    """Write export blocks to an anonymous temporary file and return it rewound
+
+    For consumers that need a file rather than a stream, such as a Streamlit
+    download; the file is deleted when closed.
+    """
+    handle = tempfile.TemporaryFile()
+    for block in blocks:
+        handle.write(block)
+    handle.seek(0)
+    return handle
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export leave requests to CSV or XLSX')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--output', required=True, help='file to write; .csv or .xlsx')
+    parser.add_argument('--date-from', help='requests overlapping this date or later (YYYY-MM-DD)')
+    parser.add_argument('--date-to', help='requests overlapping this date or earlier (YYYY-MM-DD)')
+    parser.add_argument('--department')
+    parser.add_argument('--status', action='append', help='repeat for several statuses')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK)
+    args = parser.parse_args()
+    if os.path.splitext(args.output)[1].lstrip('.').lower() not in FORMATS:
+        parser.error('--output must end in .csv or .xlsx')
+
+    from database import DB_PATH, configure_connection
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        started = time.perf_counter()
+        written = export_to_file(conn, args.output, chunk_size=args.chunk_size,
+                                 date_from=args.date_from, date_to=args.date_to,
+                                 department=args.department, statuses=args.status)
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    print(f'{args.output}: {written / 1e6:,.1f} MB in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
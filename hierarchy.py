@@ -0,0 +1,264 @@
+"""Reporting lines: who manages whom, directly and transitively.
+
+``employees.manager_id`` holds each employee's direct manager (``NULL`` at
+the top). ``reporting_lines`` is its closure table: one row per manager and
+employee anywhere below them, with the number of levels in between (and a
+depth-0 row per employee for itself). Triggers on ``employees`` keep it
+exact when people join, move to another manager (their whole team moves
+with them) or leave (their reports move up to their manager), and refuse a
+change that would make someone their own manager.
+
+Approval queues filter on ``reporting_lines`` by manager, which is a range
+of its primary key, so "all requests of everyone below me" costs one
+indexed join however deep the org chart is (``leave_queries`` picks which
+side of the join drives, by the size of the team).
+
+When the column is first added, existing employees are given a manager from
+what the schema already knows: the first manager of their department (or of
+the company, for departments without one), and in the ``app.py`` schema the
+``ADMIN`` account above the department managers. Fix reporting lines with::
+
+    python hierarchy.py --set 1004 1002     # 1004 now reports to 1002
+    python hierarchy.py --chain 1004        # 1004's managers, nearest first
+    python hierarchy.py --check             # compare with employees.manager_id
+"""
+import argparse
+import sqlite3
+
+import database
+from database import configure_connection, execute_script
+from schema import APP, detect_flavor
+from storage import employee_key
+
+# Longest chain the rebuild follows; anything deeper is a cycle in the data
+MAX_DEPTH = 64
+
+HIERARCHY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS reporting_lines (
+        manager_id {emp_id_type} NOT NULL,
+        emp_id {emp_id_type} NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (manager_id, emp_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_reporting_lines_emp ON reporting_lines (emp_id, depth);
+    CREATE INDEX IF NOT EXISTS idx_employees_manager ON employees (manager_id);
+    -- A team's queue merges its members' requests of one status, newest first
+    CREATE INDEX IF NOT EXISTS idx_leave_requests_emp_status_applied
+        ON leave_requests (emp_id, status, applied_date);
+
+    CREATE TRIGGER IF NOT EXISTS trg_reporting_lines_cycle_insert
+    BEFORE INSERT ON employees
+    WHEN NEW.manager_id = NEW.emp_id OR EXISTS (
+        SELECT 1 FROM employees child
+        JOIN reporting_lines sub ON sub.manager_id = child.emp_id
+        WHERE child.manager_id = NEW.emp_id AND sub.emp_id = NEW.manager_id)
+    BEGIN
+        SELECT RAISE(ABORT, 'reporting line cycle: an employee cannot manage their own manager');
+    END;
+
+    -- Link the newcomer under its manager's chain, together with anyone already reporting to it
+    CREATE TRIGGER IF NOT EXISTS trg_reporting_lines_insert
+    AFTER INSERT ON employees
+    BEGIN
+        INSERT INTO reporting_lines (manager_id, emp_id, depth) VALUES (NEW.emp_id, NEW.emp_id, 0);
+        INSERT INTO reporting_lines (manager_id, emp_id, depth)
+        SELECT super.manager_id, sub.emp_id, super.depth + sub.depth + 1
+        FROM employees child
+        JOIN reporting_lines sub ON sub.manager_id = child.emp_id
+        JOIN reporting_lines super ON super.emp_id = NEW.emp_id
+        WHERE child.manager_id = NEW.emp_id;
+        INSERT INTO reporting_lines (manager_id, emp_id, depth)
+        SELECT super.manager_id, sub.emp_id, super.depth + sub.depth + 1
+        FROM reporting_lines super, reporting_lines sub
+        WHERE super.emp_id = NEW.manager_id AND sub.manager_id = NEW.emp_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_reporting_lines_cycle_update
+    BEFORE UPDATE OF manager_id ON employees
+    WHEN EXISTS (SELECT 1 FROM reporting_lines WHERE manager_id = NEW.emp_id AND emp_id = NEW.manager_id)
+    BEGIN
+        SELECT RAISE(ABORT, 'reporting line cycle: an employee cannot manage their own manager');
+    END;
+
+    -- Detach the subtree from its old managers, then attach it under the new one
+    CREATE TRIGGER IF NOT EXISTS trg_reporting_lines_update
+    AFTER UPDATE OF manager_id ON employees
+    WHEN OLD.manager_id IS NOT NEW.manager_id
+    BEGIN
+        DELETE FROM reporting_lines
+        WHERE emp_id IN (SELECT emp_id FROM reporting_lines WHERE manager_id = NEW.emp_id)
+          AND manager_id IN (SELECT manager_id FROM reporting_lines WHERE emp_id = NEW.emp_id AND depth > 0);
+        INSERT INTO reporting_lines (manager_id, emp_id, depth)
+        SELECT super.manager_id, sub.emp_id, super.depth + sub.depth + 1
+        FROM reporting_lines super, reporting_lines sub
+        WHERE super.emp_id = NEW.manager_id AND sub.manager_id = NEW.emp_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_reporting_lines_delete
+    AFTER DELETE ON employees
+    BEGIN
+        UPDATE employees SET manager_id = OLD.manager_id WHERE manager_id = OLD.emp_id;
+        DELETE FROM reporting_lines WHERE emp_id = OLD.emp_id;
+        DELETE FROM reporting_lines WHERE manager_id = OLD.emp_id;
+    END;
+'''
+
+# The closure computed from employees.manager_id, walking up one level per step
+CLOSURE_QUERY = f'''
+    WITH RECURSIVE lines (manager_id, emp_id, depth) AS (
+        SELECT emp_id, emp_id, 0 FROM employees
+        UNION ALL
+        SELECT e.manager_id, lines.emp_id, lines.depth + 1
+        FROM lines JOIN employees e ON e.emp_id = lines.manager_id
+        WHERE e.manager_id IS NOT NULL AND lines.depth < {MAX_DEPTH}
+    )
+    SELECT manager_id, emp_id, depth FROM lines
+'''
+
+def install_hierarchy(conn):
+    """Add ``employees.manager_id``, derive reporting lines for existing staff, build the closure"""
+    columns = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(employees)')}
+    if 'manager_id' not in columns:
+        conn.execute(f"ALTER TABLE employees ADD COLUMN manager_id {columns['emp_id']}")
+        assign_default_managers(conn)
+    execute_script(conn, HIERARCHY_SCHEMA.format(emp_id_type=columns['emp_id']))
+    rebuild_reporting_lines(conn)
+    conn.execute('ANALYZE reporting_lines')
+    conn.execute('ANALYZE leave_requests')
+
+
+def assign_default_managers(conn):
+    """Give employees without a manager the first manager of their department
+
+    Department heads (the first manager in each department) report to the
+    ``ADMIN`` account where there is one; staff of departments without a
+    manager report to the company's first manager (or ``ADMIN``).
+    """
+    if detect_flavor(conn) == APP:
+        is_head = "head.position LIKE '%Manager%' AND head.emp_id != 'ADMIN'"
+    else:
+        is_head = "head.role = 'Manager' AND head.emp_id != 'ADMIN'"
+    top = conn.execute("SELECT emp_id FROM employees WHERE emp_id = 'ADMIN'").fetchone()
+    top = top[0] if top else conn.execute(f'SELECT MIN(head.emp_id) FROM employees head WHERE {is_head}').fetchone()[0]
+    conn.execute(f'''
+        UPDATE employees
+        SET manager_id = COALESCE(
+            (SELECT MIN(head.emp_id) FROM employees head WHERE head.department = employees.department AND {is_head}),
+            ?)
+        WHERE manager_id IS NULL
+    ''', (top,))
+    # Department heads report to the top, and the top to no one
+    conn.execute('UPDATE employees SET manager_id = ? WHERE manager_id = emp_id', (top,))
+    conn.execute('UPDATE employees SET manager_id = NULL WHERE emp_id = ?', (top,))
+
+
+def rebuild_reporting_lines(conn):
+    """Recompute every closure row from ``employees.manager_id``"""
+    conn.execute('DELETE FROM reporting_lines')
+    conn.execute(f'INSERT INTO reporting_lines (manager_id, emp_id, depth) {CLOSURE_QUERY}')
+
+
+def check_reporting_lines(conn):
+    """Closure rows that differ from ``employees.manager_id``, as ``(manager, emp, stored, expected)``"""
+    stored = {(manager, emp): depth for manager, emp, depth in
+              conn.execute('SELECT manager_id, emp_id, depth FROM reporting_lines')}
+    expected = {(manager, emp): depth for manager, emp, depth in conn.execute(CLOSURE_QUERY)}
+    return [(*key, stored.get(key), expected.get(key))
+            for key in sorted(stored.keys() | expected.keys(), key=str)
+            if stored.get(key) != expected.get(key)]
+
+
+def set_manager(conn, emp_id, manager_id):
+    """Move ``emp_id`` (and everyone below them) under ``manager_id`` (``None`` for the top)"""
+    if conn.execute('UPDATE employees SET manager_id = ? WHERE emp_id = ?', (manager_id, emp_id)).rowcount != 1:
+        raise ValueError(f'Unknown employee {emp_id}')
+
+
+def is_report(conn, manager_id, emp_id):
+    """True if ``emp_id`` reports to ``manager_id`` directly or indirectly"""
+    return conn.execute('''
+        SELECT 1 FROM reporting_lines WHERE manager_id = ? AND emp_id = ? AND depth > 0
+    ''', (manager_id, emp_id)).fetchone() is not None
+
+
+def reports_among(conn, manager_id, emp_ids, chunk_size=500):
+    """The subset of ``emp_ids`` that report to ``manager_id`` directly or indirectly"""
+    reports = set()
+    emp_ids = list(emp_ids)
+    for start in range(0, len(emp_ids), chunk_size):
+        chunk = emp_ids[start:start + chunk_size]
+        reports.update(row[0] for row in conn.execute(f'''
+            SELECT emp_id FROM reporting_lines
+            WHERE manager_id = ? AND depth > 0 AND emp_id IN ({', '.join('?' * len(chunk))})
+        ''', [manager_id, *chunk]))
+    return reports
+
+
+def count_reports(conn, manager_id):
+    """Number of direct and indirect reports of ``manager_id``"""
+    return conn.execute('''
+        SELECT COUNT(*) FROM reporting_lines WHERE manager_id = ? AND depth > 0
+    ''', (manager_id,)).fetchone()[0]
+
+
+def top_manager(conn):
+    """The employee with the most direct and indirect reports (``None`` without any reporting lines)"""
+    row = conn.execute('''
+        SELECT manager_id FROM reporting_lines WHERE depth > 0
+        GROUP BY manager_id ORDER BY COUNT(*) DESC, manager_id LIMIT 1
+    ''').fetchone()
+    return row[0] if row else None
+
+
+def management_chain(conn, emp_id):
+    """``emp_id``'s managers as ``(manager_id, depth)``, nearest first"""
+    return conn.execute('''
+        SELECT manager_id, depth FROM reporting_lines WHERE emp_id = ? AND depth > 0 ORDER BY depth
+    ''', (emp_id,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or change reporting lines')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--check', action='store_true', help='compare the closure with employees.manager_id')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the closure from scratch')
+    parser.add_argument('--set', nargs=2, metavar=('EMP_ID', 'MANAGER_ID'),
+                        help="make EMP_ID report to MANAGER_ID ('-' for no manager)")
+    parser.add_argument('--chain', metavar='EMP_ID', help="list EMP_ID's managers, nearest first")
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        if args.set:
+            emp_id, manager_id = args.set
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                set_manager(conn, employee_key(emp_id), None if manager_id == '-' else employee_key(manager_id))
+                conn.commit()
+            except (ValueError, sqlite3.IntegrityError) as e:
+                conn.rollback()
+                parser.error(str(e))
+            print(f'{emp_id} now reports to {manager_id}')
+        if args.rebuild:
+            conn.execute('BEGIN IMMEDIATE')
+            rebuild_reporting_lines(conn)
+            conn.commit()
+            print('Reporting lines rebuilt')
+        if args.chain:
+            emp_id = employee_key(args.chain)
+            for manager_id, depth in management_chain(conn, emp_id):
+                print(f'{"  " * (depth - 1)}{manager_id} ({count_reports(conn, manager_id):,} reports)')
+        if args.check:
+            problems = check_reporting_lines(conn)
+            for manager_id, emp_id, stored, expected in problems[:50]:
+                print(f'{manager_id} -> {emp_id}: stored depth {stored}, expected {expected}')
+            print(f'{len(problems)} reporting line rows differ from employees.manager_id')
+            if problems:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,212 +1,438 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
 from datetime import datetime, timedelta
 import hashlib
 
+from bootstrap import bootstrap, script_run
+from schema import CANONICAL
+from styles import LEAVE_MANAGEMENT_STYLE
+from batch_updates import FORWARDED, UPDATED, summarize_batch
+from export import CONTENT_TYPES, spool_export
+from leave_queries import PAGE_SIZE
+from passwords import HashingBusy
+# Business logic lives in the service layer, shared with the JSON API
+from leave_service import (
+    EMPLOYEE_LEAVE_COLUMNS, INBOX_COLUMNS, LEAVE_REQUEST_COLUMNS, LEAVE_STATUSES, LEAVE_TYPES,
+    LeaveValidationError, apply_leave, authenticate_user, count_inbox_requests, count_leave_days,
+    count_leave_requests, export_leaves, get_approver_stages, get_department_names, get_leave_counters,
+    get_leave_statistics, get_team_calendar, list_employee_leaves, list_inbox, list_leave_requests,
+    update_leave_statuses,
+)
+from team_calendar import calendar_frames
+
+BULK_PAGE_SIZE = 500
+STATS_REFRESH = timedelta(seconds=15)
+
 # Database setup
-def init_database():
-    """Initialize the SQLite database with tables and sample data"""
-    conn = sqlite3.connect('leave_management.db')
+def insert_sample_data(conn):
+    """Insert the demo employees and leave requests (bootstrap commits them)"""
     cursor = conn.cursor()
-    
-    # Create employees table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS employees (
-            emp_id INTEGER PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            department TEXT NOT NULL,
-            role TEXT NOT NULL,
-            total_leaves INTEGER DEFAULT 20,
-            used_leaves INTEGER DEFAULT 0
+
+    # Insert sample employees (password is 'password123' hashed)
+    sample_employees = [
+        (1001, 'John Doe', 'john.doe@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Engineering', 'Employee', 20, 5),
+        (1002, 'Jane Smith', 'jane.smith@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Engineering', 'Manager', 20, 3),
+        (1003, 'Bob Johnson', 'bob.johnson@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'HR', 'Employee', 20, 8),
+        (1004, 'Alice Williams', 'alice.williams@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Marketing', 'Employee', 20, 2),
+        (1005, 'Charlie Brown', 'charlie.brown@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Sales', 'Manager', 20, 4),
+        (1006, 'Diana Prince', 'diana.prince@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Engineering', 'Employee', 20, 6),
+        (1007, 'Eve Davis', 'eve.davis@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'HR', 'Manager', 20, 1),
+    ]
+
+    # position starts as the role, as in converted leave_management.py databases
+    cursor.executemany('''
+        INSERT INTO employees (emp_id, name, email, password, department, role, position, total_leaves, used_leaves)
+        VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?6, ?7, ?8)
+    ''', sample_employees)
+
+    # Insert sample leave requests
+    sample_leaves = [
+        (1001, 'Sick Leave', '2025-11-15', '2025-11-17', 3, 'Medical appointment', 'Approved', 1002),
+        (1001, 'Casual Leave', '2025-12-20', '2025-12-22', 2, 'Personal work', 'Pending', None),
+        (1003, 'Annual Leave', '2025-11-01', '2025-11-08', 8, 'Vacation', 'Approved', 1007),
+        (1004, 'Casual Leave', '2025-11-25', '2025-11-26', 2, 'Family function', 'Approved', 1002),
+        (1006, 'Sick Leave', '2025-12-01', '2025-12-03', 3, 'Flu', 'Rejected', 1002),
+        (1006, 'Casual Leave', '2025-12-15', '2025-12-17', 3, 'Personal work', 'Pending', None),
+    ]
+
+    cursor.executemany('''
+        INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status, approved_by)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', sample_leaves)
+
+def init_database():
+    """Create, seed and migrate the database once per process (see bootstrap)"""
+    bootstrap(CANONICAL, insert_sample_data)
+
+# Leave list functions (DataFrames for the Streamlit pages)
+def get_employee_leaves_page(emp_id, statuses=None, leave_types=None, cursor=None, page_size=PAGE_SIZE):
+    """Get one page of an employee's leave requests, newest first"""
+    import pandas as pd
+
+    records, next_cursor = list_employee_leaves(emp_id, statuses, leave_types, cursor, page_size)
+    return pd.DataFrame(records, columns=EMPLOYEE_LEAVE_COLUMNS), next_cursor
+
+def get_leave_requests_page(statuses=None, department=None, date_from=None, date_to=None,
+                            cursor=None, page_size=PAGE_SIZE, manager_id=None):
+    """Get one page of leave requests (all, or a manager's reports'), newest first"""
+    import pandas as pd
+
+    records, next_cursor = list_leave_requests(statuses, department, date_from, date_to,
+                                               cursor, page_size, manager_id)
+    return pd.DataFrame(records, columns=LEAVE_REQUEST_COLUMNS), next_cursor
+
+def get_inbox_page(manager_id, department=None, cursor=None, page_size=PAGE_SIZE):
+    """Get one page of the requests waiting for the manager's approval step, oldest first"""
+    import pandas as pd
+
+    records, next_cursor = list_inbox(manager_id, department, cursor, page_size)
+    return pd.DataFrame(records, columns=INBOX_COLUMNS), next_cursor
+
+# Streamlit UI
+def page_cursor(key, filters):
+    """Return the keyset cursor of the page currently shown in a paged view"""
+    state = st.session_state.setdefault(key, {'filters': None, 'cursors': [None]})
+    if state['filters'] != filters:
+        # Filters changed, start again from the first page
+        state['filters'] = filters
+        state['cursors'] = [None]
+    return state['cursors'][-1]
+
+def page_controls(key, next_cursor):
+    """Render Previous/Next buttons for a paged view (call from inside its fragment)"""
+    state = st.session_state[key]
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if len(state['cursors']) > 1 and st.button("← Previous", key=f"{key}_prev", use_container_width=True):
+            state['cursors'].pop()
+            st.rerun(scope="fragment")
+    with col2:
+        st.caption(f"Page {len(state['cursors'])}")
+    with col3:
+        if next_cursor is not None and st.button("Next →", key=f"{key}_next", use_container_width=True):
+            state['cursors'].append(next_cursor)
+            st.rerun(scope="fragment")
+
+def bulk_approval_grid(pending_df, manager_id):
+    """Multi-select grid that approves or rejects the selected requests in one batch"""
+    with st.form("bulk_approval_form"):
+        grid = pending_df[['request_id', 'name', 'department', 'leave_type', 'start_date', 'end_date', 'days']].copy()
+        grid.insert(0, 'select', False)
+        edited = st.data_editor(
+            grid,
+            column_config={
+                "select": st.column_config.CheckboxColumn("Select"),
+                "request_id": "Request ID",
+                "name": "Employee",
+                "department": "Department",
+                "leave_type": "Leave Type",
+                "start_date": "Start Date",
+                "end_date": "End Date",
+                "days": "Days"
+            },
+            disabled=[c for c in grid.columns if c != 'select'],
+            hide_index=True,
+            use_container_width=True
         )
-    ''')
+        col1, col2 = st.columns(2)
+        with col1:
+            approve = st.form_submit_button("✅ Approve Selected", use_container_width=True)
+        with col2:
+            reject = st.form_submit_button("❌ Reject Selected", use_container_width=True)
     
-    # Create leave_requests table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS leave_requests (
-            request_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            emp_id INTEGER NOT NULL,
-            leave_type TEXT NOT NULL,
-            start_date DATE NOT NULL,
-            end_date DATE NOT NULL,
-            days INTEGER NOT NULL,
-            reason TEXT,
-            status TEXT DEFAULT 'Pending',
-            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            approved_by INTEGER,
-            approved_date TIMESTAMP,
-            FOREIGN KEY (emp_id) REFERENCES employees(emp_id)
+    if approve or reject:
+        selected = edited.loc[edited['select'], 'request_id'].tolist()
+        if not selected:
+            st.warning("Select at least one request.")
+            return
+        status = 'Approved' if approve else 'Rejected'
+        results = update_leave_statuses([(request_id, status) for request_id in selected], manager_id)
+        summary = summarize_batch(results)
+        decided = summary.get(UPDATED, 0) + summary.get(FORWARDED, 0)
+        st.session_state.bulk_message = (
+            f"{status} {decided} request(s), {summary.get(FORWARDED, 0)} of them forwarded to the next approver; "
+            f"{len(results) - decided} skipped (already decided, missing or not yours)"
         )
-    ''')
+        st.rerun(scope="fragment")
+
+# Fragments: each one reruns on its own when its widgets are used, so an
+# action only recomputes the data that fragment depends on
+@st.fragment(run_every=STATS_REFRESH)
+def stat_cards(emp_id):
+    """Leave balance cards; refreshed periodically from the cached statistics"""
+    stats = get_leave_statistics(emp_id)
     
-    # Check if sample data already exists
-    cursor.execute('SELECT COUNT(*) FROM employees')
-    if cursor.fetchone()[0] == 0:
-        # Insert sample employees (password is 'password123' hashed)
-        sample_employees = [
-            (1001, 'John Doe', 'john.doe@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Engineering', 'Employee', 20, 5),
-            (1002, 'Jane Smith', 'jane.smith@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Engineering', 'Manager', 20, 3),
-            (1003, 'Bob Johnson', 'bob.johnson@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'HR', 'Employee', 20, 8),
-            (1004, 'Alice Williams', 'alice.williams@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Marketing', 'Employee', 20, 2),
-            (1005, 'Charlie Brown', 'charlie.brown@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Sales', 'Manager', 20, 4),
-            (1006, 'Diana Prince', 'diana.prince@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'Engineering', 'Employee', 20, 6),
-            (1007, 'Eve Davis', 'eve.davis@acme.com', hashlib.sha256('password123'.encode()).hexdigest(), 'HR', 'Manager', 20, 1),
-        ]
-        
-        cursor.executemany('''
-            INSERT INTO employees (emp_id, name, email, password, department, role, total_leaves, used_leaves)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_employees)
-        
-        # Insert sample leave requests
-        sample_leaves = [
-            (1001, 'Sick Leave', '2025-11-15', '2025-11-17', 3, 'Medical appointment', 'Approved', 1002),
-            (1001, 'Casual Leave', '2025-12-20', '2025-12-22', 2, 'Personal work', 'Pending', None),
-            (1003, 'Annual Leave', '2025-11-01', '2025-11-08', 8, 'Vacation', 'Approved', 1007),
-            (1004, 'Casual Leave', '2025-11-25', '2025-11-26', 2, 'Family function', 'Approved', 1002),
-            (1006, 'Sick Leave', '2025-12-01', '2025-12-03', 3, 'Flu', 'Rejected', 1002),
-            (1006, 'Casual Leave', '2025-12-15', '2025-12-17', 3, 'Personal work', 'Pending', None),
-        ]
-        
-        cursor.executemany('''
-            INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status, approved_by)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_leaves)
-        
-        conn.commit()
+    col1, col2, col3 = st.columns(3)
     
-    conn.close()
+    with col1:
+        st.markdown(f"""
+            <div class="stat-card" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);">
+                <div class="stat-value">{stats['total']}</div>
+                <div class="stat-label">Total Leaves</div>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    with col2:
+        st.markdown(f"""
+            <div class="stat-card" style="background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);">
+                <div class="stat-value">{stats['used']}</div>
+                <div class="stat-label">Used Leaves</div>
+            </div>
+        """, unsafe_allow_html=True)
+    
+    with col3:
+        st.markdown(f"""
+            <div class="stat-card" style="background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);">
+                <div class="stat-value">{stats['available']}</div>
+                <div class="stat-label">Available Leaves</div>
+            </div>
+        """, unsafe_allow_html=True)
 
-# Authentication functions
-def hash_password(password):
-    """Hash password using SHA256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+def format_leave_dates(leaves_df):
+    """Copy of a leave DataFrame with display-formatted dates"""
+    import pandas as pd
 
-def authenticate_user(email, password):
-    """Authenticate user credentials"""
-    conn = sqlite3.connect('leave_management.db')
-    cursor = conn.cursor()
+    display_df = leaves_df.copy()
+    display_df['start_date'] = pd.to_datetime(display_df['start_date']).dt.strftime('%Y-%m-%d')
+    display_df['end_date'] = pd.to_datetime(display_df['end_date']).dt.strftime('%Y-%m-%d')
+    display_df['applied_date'] = pd.to_datetime(display_df['applied_date']).dt.strftime('%Y-%m-%d %H:%M')
+    return display_df
+
+@st.fragment
+def recent_requests(emp_id):
+    """The employee's ten most recent leave requests"""
+    leaves_df, _ = get_employee_leaves_page(emp_id, page_size=10)
+    
+    if not leaves_df.empty:
+        st.dataframe(
+            format_leave_dates(leaves_df),
+            column_config={
+                "request_id": "Request ID",
+                "leave_type": "Leave Type",
+                "start_date": "Start Date",
+                "end_date": "End Date",
+                "days": "Days",
+                "reason": "Reason",
+                "status": st.column_config.TextColumn(
+                    "Status",
+                ),
+                "applied_date": "Applied On"
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info("No leave requests found.")
+
+@st.fragment
+def apply_leave_form(emp_id):
+    """Leave application form; editing fields reruns only this form"""
+    col1, col2 = st.columns(2)
     
-    hashed_password = hash_password(password)
-    cursor.execute('''
-        SELECT emp_id, name, email, department, role, total_leaves, used_leaves
-        FROM employees
-        WHERE email = ? AND password = ?
-    ''', (email, hashed_password))
+    with col1:
+        leave_type = st.selectbox("Leave Type", LEAVE_TYPES)
+        start_date = st.date_input("Start Date", min_value=datetime.now().date())
     
-    user = cursor.fetchone()
-    conn.close()
+    with col2:
+        end_date = st.date_input("End Date", min_value=datetime.now().date())
+        
+    reason = st.text_area("Reason for Leave", placeholder="Please provide a reason for your leave request...")
     
-    if user:
-        return {
-            'emp_id': user[0],
-            'name': user[1],
-            'email': user[2],
-            'department': user[3],
-            'role': user[4],
-            'total_leaves': user[5],
-            'used_leaves': user[6]
-        }
-    return None
+    if st.button("Submit Leave Request", type="primary", use_container_width=True):
+        if start_date > end_date:
+            st.error("❌ End date must be after start date!")
+        elif not reason.strip():
+            st.error("❌ Please provide a reason for your leave request!")
+        else:
+            # The balance is checked and reserved atomically by apply_leave, not here:
+            # the cached statistics may already be stale
+            try:
+                request_id = apply_leave(emp_id, leave_type, start_date, end_date, reason)
+            except LeaveValidationError as e:
+                st.error(f"❌ {e}")
+            else:
+                days_requested = count_leave_days(emp_id, start_date, end_date)
+                st.success(f"✅ Leave request #{request_id} submitted successfully for {days_requested} days!")
+                st.balloons()
 
-# Leave management functions
-def apply_leave(emp_id, leave_type, start_date, end_date, reason):
-    """Apply for a new leave"""
-    conn = sqlite3.connect('leave_management.db')
-    cursor = conn.cursor()
+@st.fragment
+def leave_history(emp_id):
+    """Filterable, paged leave history; filters and paging rerun only this table"""
+    # Filter options (applied in SQL)
+    col1, col2 = st.columns(2)
+    with col1:
+        status_filter = st.multiselect(
+            "Filter by Status",
+            options=LEAVE_STATUSES,
+            default=LEAVE_STATUSES
+        )
     
-    # Calculate number of days
-    days = (end_date - start_date).days + 1
+    with col2:
+        leave_type_filter = st.multiselect(
+            "Filter by Leave Type",
+            options=LEAVE_TYPES,
+            default=LEAVE_TYPES
+        )
     
-    cursor.execute('''
-        INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status)
-        VALUES (?, ?, ?, ?, ?, ?, 'Pending')
-    ''', (emp_id, leave_type, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), days, reason))
+    filters = (tuple(status_filter), tuple(leave_type_filter))
+    cursor = page_cursor('my_leaves_page', filters)
+    leaves_df, next_cursor = get_employee_leaves_page(
+        emp_id, statuses=status_filter, leave_types=leave_type_filter, cursor=cursor
+    )
     
-    conn.commit()
-    conn.close()
-    return True
+    if not leaves_df.empty:
+        st.dataframe(
+            format_leave_dates(leaves_df),
+            column_config={
+                "request_id": "Request ID",
+                "leave_type": "Leave Type",
+                "start_date": "Start Date",
+                "end_date": "End Date",
+                "days": "Days",
+                "reason": "Reason",
+                "status": "Status",
+                "applied_date": "Applied On"
+            },
+            hide_index=True,
+            use_container_width=True
+        )
+        
+        matching = count_leave_requests(emp_id, statuses=status_filter, leave_types=leave_type_filter)
+        total = get_leave_counters(emp_id)['total']
+        st.info(f"📊 {matching} of {total} leave requests match the filters")
+        page_controls('my_leaves_page', next_cursor)
+    else:
+        st.info("No leave requests found.")
 
-def get_employee_leaves(emp_id):
-    """Get all leave requests for an employee"""
-    conn = sqlite3.connect('leave_management.db')
-    query = '''
-        SELECT request_id, leave_type, start_date, end_date, days, reason, status, applied_date
-        FROM leave_requests
-        WHERE emp_id = ?
-        ORDER BY applied_date DESC
-    '''
-    df = pd.read_sql_query(query, conn, params=(emp_id,))
-    conn.close()
-    return df
+def decide_request(request_id, status, manager_id):
+    """Button callback: record a decision (or the step it moved to) before the row fragment reruns"""
+    result, = update_leave_statuses([(request_id, status)], manager_id)
+    outcome = {UPDATED: status, FORWARDED: result['detail']}.get(result['result'], f"Not decided: {result['detail']}")
+    st.session_state.setdefault('decided_requests', {})[request_id] = outcome
 
-def get_all_leave_requests():
-    """Get all leave requests (for managers)"""
-    conn = sqlite3.connect('leave_management.db')
-    query = '''
-        SELECT lr.request_id, e.name, e.department, lr.leave_type, 
-               lr.start_date, lr.end_date, lr.days, lr.reason, lr.status, lr.applied_date
-        FROM leave_requests lr
-        JOIN employees e ON lr.emp_id = e.emp_id
-        ORDER BY lr.applied_date DESC
-    '''
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+@st.fragment
+def approval_row(row, manager_id):
+    """One request in the approval queue; its buttons rerun only this row"""
+    request_id = row['request_id']
+    status = st.session_state.get('decided_requests', {}).get(request_id, row['status'])
+    
+    with st.container():
+        col1, col2, col3, col4 = st.columns([2, 2, 3, 2])
+        
+        with col1:
+            st.write(f"**{row['name']}**")
+            st.caption(f"{row['department']}")
+        
+        with col2:
+            st.write(f"**{row['leave_type']}**")
+            st.caption(f"{row['days']} days" + (f" · {row['stage']} approval" if row.get('stage') else ""))
+        
+        with col3:
+            st.write(f"{row['start_date']} to {row['end_date']}")
+            st.caption(f"Reason: {row['reason']}")
+        
+        with col4:
+            if status == 'Pending':
+                col_a, col_b = st.columns(2)
+                with col_a:
+                    st.button("✅", key=f"approve_{request_id}", use_container_width=True,
+                              on_click=decide_request, args=(request_id, 'Approved', manager_id))
+                with col_b:
+                    st.button("❌", key=f"reject_{request_id}", use_container_width=True,
+                              on_click=decide_request, args=(request_id, 'Rejected', manager_id))
+            else:
+                status_color = {'Approved': 'green', 'Rejected': 'red'}.get(status, 'blue')
+                st.markdown(f":{status_color}[{status}]")
+        
+        st.divider()
 
-def update_leave_status(request_id, status, manager_id):
-    """Update leave request status"""
-    conn = sqlite3.connect('leave_management.db')
-    cursor = conn.cursor()
+def export_button(statuses, department, manager_id):
+    """Download the filtered requests; the file is only built when the button is clicked"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        fmt = st.radio("Format", ["csv", "xlsx"], format_func=lambda f: "Excel" if f == "xlsx" else "CSV",
+                       horizontal=True, key="export_format")
+    with col2:
+        date_from = st.date_input("From", value=None, key="export_from")
+    with col3:
+        date_to = st.date_input("To", value=None, key="export_to")
+    st.download_button(
+        "⬇️ Download", on_click="ignore", mime=CONTENT_TYPES[fmt],
+        file_name=f"leave_requests_{datetime.now():%Y%m%d}.{fmt}",
+        data=lambda: spool_export(export_leaves(fmt, statuses, department, date_from, date_to, manager_id)),
+    )
+
+@st.fragment
+def approval_queue(manager_id):
+    """Paged queue of the requests awaiting the manager's approval step, with the bulk grid
+
+    "Show All Requests" lists every request of the manager's direct and indirect reports instead.
+    """
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col2:
+        department = st.selectbox("Department", ["All"] + get_department_names())
+    with col3:
+        show_all = st.checkbox("Show All Requests")
     
-    cursor.execute('''
-        UPDATE leave_requests
-        SET status = ?, approved_by = ?, approved_date = CURRENT_TIMESTAMP
-        WHERE request_id = ?
-    ''', (status, manager_id, request_id))
+    statuses = None if show_all else ['Pending']
+    department = None if department == "All" else department
+    pending_count = count_inbox_requests(manager_id, department)
+    with col1:
+        st.subheader(f"Awaiting Your Approval ({pending_count})")
     
-    # If approved, update employee's used leaves
-    if status == 'Approved':
-        cursor.execute('''
-            UPDATE employees
-            SET used_leaves = used_leaves + (
-                SELECT days FROM leave_requests WHERE request_id = ?
-            )
-            WHERE emp_id = (
-                SELECT emp_id FROM leave_requests WHERE request_id = ?
-            )
-        ''', (request_id, request_id))
+    cursor = page_cursor('approval_page', (show_all, department))
+    if show_all:
+        display_df, next_cursor = get_leave_requests_page(
+            statuses=statuses, department=department, cursor=cursor, manager_id=manager_id
+        )
+    else:
+        display_df, next_cursor = get_inbox_page(manager_id, department, cursor)
     
-    conn.commit()
-    conn.close()
-
-def get_leave_statistics(emp_id):
-    """Get leave statistics for an employee"""
-    conn = sqlite3.connect('leave_management.db')
-    cursor = conn.cursor()
+    if 'bulk_message' in st.session_state:
+        st.success(st.session_state.pop('bulk_message'))
     
-    cursor.execute('''
-        SELECT total_leaves, used_leaves
-        FROM employees
-        WHERE emp_id = ?
-    ''', (emp_id,))
+    if pending_count:
+        # The bulk grid covers up to BULK_PAGE_SIZE waiting rows, independent of the list page
+        pending_df, _ = get_inbox_page(manager_id, department, page_size=BULK_PAGE_SIZE)
+        if not pending_df.empty:
+            with st.expander(f"☑️ Bulk approve / reject ({len(pending_df)} pending)"):
+                bulk_approval_grid(pending_df, manager_id)
     
-    result = cursor.fetchone()
-    conn.close()
+    with st.expander("⬇️ Export requests"):
+        export_button(statuses, department, manager_id)
     
-    if result:
-        total, used = result
-        return {
-            'total': total,
-            'used': used,
-            'available': total - used
-        }
-    return None
+    if not display_df.empty:
+        for row in display_df.to_dict('records'):
+            approval_row(row, manager_id)
+        
+        page_controls('approval_page', next_cursor)
+    else:
+        st.info("No pending leave requests.")
+
+@st.fragment
+def team_calendar_view(department, can_switch):
+    """Who is out on which day in a department, one month at a time"""
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        if can_switch:
+            departments = get_department_names()
+            department = st.selectbox("Department", departments,
+                                      index=departments.index(department) if department in departments else 0,
+                                      key="calendar_department")
+    with col2:
+        month = st.date_input("Month", value=datetime.now().date().replace(day=1), key="calendar_month")
+    
+    start = month.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    calendar = get_team_calendar(department, start, end)
+    if not calendar['emp_ids']:
+        st.info("No employees in this department.")
+        return
+    
+    grid_df, headcount_df = calendar_frames(calendar)
+    st.caption(f"Most out on one day: {calendar['out'].max()} of {len(calendar['emp_ids'])} · 🟢 Approved · 🟡 Pending")
+    st.bar_chart(headcount_df, color=["#28a745", "#ffc107"], height=200)
+    st.dataframe(grid_df, use_container_width=True)
 
-# Streamlit UI
 def main():
     st.set_page_config(
         page_title="ACME Leave Management System",
@@ -217,55 +443,8 @@ def main():
     # Initialize database
     init_database()
     
-    # Custom CSS
-    st.markdown("""
-        <style>
-        .main-header {
-            font-size: 2.5rem;
-            font-weight: bold;
-            color: #1f77b4;
-            text-align: center;
-            margin-bottom: 2rem;
-        }
-        .stat-card {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 1.5rem;
-            border-radius: 10px;
-            color: white;
-            text-align: center;
-            margin: 0.5rem 0;
-        }
-        .stat-value {
-            font-size: 2rem;
-            font-weight: bold;
-        }
-        .stat-label {
-            font-size: 0.9rem;
-            opacity: 0.9;
-        }
-        .status-pending {
-            background-color: #ffc107;
-            color: black;
-            padding: 0.3rem 0.8rem;
-            border-radius: 15px;
-            font-weight: bold;
-        }
-        .status-approved {
-            background-color: #28a745;
-            color: white;
-            padding: 0.3rem 0.8rem;
-            border-radius: 15px;
-            font-weight: bold;
-        }
-        .status-rejected {
-            background-color: #dc3545;
-            color: white;
-            padding: 0.3rem 0.8rem;
-            border-radius: 15px;
-            font-weight: bold;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    # Custom CSS (minified once per process)
+    st.markdown(LEAVE_MANAGEMENT_STYLE, unsafe_allow_html=True)
     
     # Session state initialization
     if 'logged_in' not in st.session_state:
@@ -287,12 +466,16 @@ def main():
                 submit = st.form_submit_button("Login", use_container_width=True)
                 
                 if submit:
-                    user = authenticate_user(email, password)
+                    try:
+                        user = authenticate_user(email, password)
+                    except HashingBusy:
+                        st.warning("⏳ Many people are signing in right now. Please try again in a moment.")
+                        user = False
                     if user:
                         st.session_state.logged_in = True
                         st.session_state.user = user
                         st.rerun()
-                    else:
+                    elif user is None:
                         st.error("❌ Invalid credentials. Please try again.")
             
             st.info("💡 **Demo Credentials:**\n\n**Employee:** john.doe@acme.com / password123\n\n**Manager:** jane.smith@acme.com / password123")
@@ -315,224 +498,45 @@ def main():
         
         st.divider()
         
-        # Navigation tabs
-        if user['role'] == 'Manager':
-            tab1, tab2, tab3, tab4 = st.tabs(["📊 Dashboard", "➕ Apply Leave", "📋 My Leaves", "✅ Approve Leaves"])
+        # Navigation tabs; approval group members (e.g. HR) approve too
+        is_approver = user['role'] == 'Manager' or bool(get_approver_stages(user['emp_id']))
+        if is_approver:
+            tab1, tab2, tab3, tab5, tab4 = st.tabs(["📊 Dashboard", "➕ Apply Leave", "📋 My Leaves", "📅 Team Calendar", "✅ Approve Leaves"])
         else:
-            tab1, tab2, tab3 = st.tabs(["📊 Dashboard", "➕ Apply Leave", "📋 My Leaves"])
+            tab1, tab2, tab3, tab5 = st.tabs(["📊 Dashboard", "➕ Apply Leave", "📋 My Leaves", "📅 Team Calendar"])
         
         # Dashboard Tab
         with tab1:
             st.header("📊 Leave Dashboard")
-            
-            stats = get_leave_statistics(user['emp_id'])
-            
-            col1, col2, col3 = st.columns(3)
-            
-            with col1:
-                st.markdown(f"""
-                    <div class="stat-card" style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);">
-                        <div class="stat-value">{stats['total']}</div>
-                        <div class="stat-label">Total Leaves</div>
-                    </div>
-                """, unsafe_allow_html=True)
-            
-            with col2:
-                st.markdown(f"""
-                    <div class="stat-card" style="background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);">
-                        <div class="stat-value">{stats['used']}</div>
-                        <div class="stat-label">Used Leaves</div>
-                    </div>
-                """, unsafe_allow_html=True)
-            
-            with col3:
-                st.markdown(f"""
-                    <div class="stat-card" style="background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%);">
-                        <div class="stat-value">{stats['available']}</div>
-                        <div class="stat-label">Available Leaves</div>
-                    </div>
-                """, unsafe_allow_html=True)
+            stat_cards(user['emp_id'])
             
             st.markdown("---")
             
             # Recent leave requests
             st.subheader("📅 Recent Leave Requests")
-            leaves_df = get_employee_leaves(user['emp_id'])
-            
-            if not leaves_df.empty:
-                # Format the dataframe for display
-                display_df = leaves_df.copy()
-                display_df['start_date'] = pd.to_datetime(display_df['start_date']).dt.strftime('%Y-%m-%d')
-                display_df['end_date'] = pd.to_datetime(display_df['end_date']).dt.strftime('%Y-%m-%d')
-                display_df['applied_date'] = pd.to_datetime(display_df['applied_date']).dt.strftime('%Y-%m-%d %H:%M')
-                
-                st.dataframe(
-                    display_df,
-                    column_config={
-                        "request_id": "Request ID",
-                        "leave_type": "Leave Type",
-                        "start_date": "Start Date",
-                        "end_date": "End Date",
-                        "days": "Days",
-                        "reason": "Reason",
-                        "status": st.column_config.TextColumn(
-                            "Status",
-                        ),
-                        "applied_date": "Applied On"
-                    },
-                    hide_index=True,
-                    use_container_width=True
-                )
-            else:
-                st.info("No leave requests found.")
+            recent_requests(user['emp_id'])
         
         # Apply Leave Tab
         with tab2:
             st.header("➕ Apply for Leave")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                leave_type = st.selectbox(
-                    "Leave Type",
-                    ["Casual Leave", "Sick Leave", "Annual Leave", "Maternity Leave", "Paternity Leave"]
-                )
-                start_date = st.date_input("Start Date", min_value=datetime.now().date())
-            
-            with col2:
-                end_date = st.date_input("End Date", min_value=datetime.now().date())
-                
-            reason = st.text_area("Reason for Leave", placeholder="Please provide a reason for your leave request...")
-            
-            if st.button("Submit Leave Request", type="primary", use_container_width=True):
-                if start_date > end_date:
-                    st.error("❌ End date must be after start date!")
-                elif not reason.strip():
-                    st.error("❌ Please provide a reason for your leave request!")
-                else:
-                    days_requested = (end_date - start_date).days + 1
-                    stats = get_leave_statistics(user['emp_id'])
-                    
-                    if days_requested > stats['available']:
-                        st.error(f"❌ Insufficient leave balance! You have only {stats['available']} days available.")
-                    else:
-                        apply_leave(user['emp_id'], leave_type, start_date, end_date, reason)
-                        st.success(f"✅ Leave request submitted successfully for {days_requested} days!")
-                        st.balloons()
+            apply_leave_form(user['emp_id'])
         
         # My Leaves Tab
         with tab3:
             st.header("📋 My Leave History")
-            
-            leaves_df = get_employee_leaves(user['emp_id'])
-            
-            if not leaves_df.empty:
-                # Filter options
-                col1, col2 = st.columns(2)
-                with col1:
-                    status_filter = st.multiselect(
-                        "Filter by Status",
-                        options=['Pending', 'Approved', 'Rejected'],
-                        default=['Pending', 'Approved', 'Rejected']
-                    )
-                
-                with col2:
-                    leave_type_filter = st.multiselect(
-                        "Filter by Leave Type",
-                        options=leaves_df['leave_type'].unique(),
-                        default=leaves_df['leave_type'].unique()
-                    )
-                
-                # Apply filters
-                filtered_df = leaves_df[
-                    (leaves_df['status'].isin(status_filter)) &
-                    (leaves_df['leave_type'].isin(leave_type_filter))
-                ]
-                
-                # Format the dataframe
-                display_df = filtered_df.copy()
-                display_df['start_date'] = pd.to_datetime(display_df['start_date']).dt.strftime('%Y-%m-%d')
-                display_df['end_date'] = pd.to_datetime(display_df['end_date']).dt.strftime('%Y-%m-%d')
-                display_df['applied_date'] = pd.to_datetime(display_df['applied_date']).dt.strftime('%Y-%m-%d %H:%M')
-                
-                st.dataframe(
-                    display_df,
-                    column_config={
-                        "request_id": "Request ID",
-                        "leave_type": "Leave Type",
-                        "start_date": "Start Date",
-                        "end_date": "End Date",
-                        "days": "Days",
-                        "reason": "Reason",
-                        "status": "Status",
-                        "applied_date": "Applied On"
-                    },
-                    hide_index=True,
-                    use_container_width=True
-                )
-                
-                st.info(f"📊 Showing {len(filtered_df)} of {len(leaves_df)} leave requests")
-            else:
-                st.info("No leave requests found.")
+            leave_history(user['emp_id'])
+        
+        # Team Calendar Tab (managers can look at other departments)
+        with tab5:
+            st.header("📅 Team Calendar")
+            team_calendar_view(user['department'], user['role'] == 'Manager')
         
-        # Approve Leaves Tab (Manager only)
-        if user['role'] == 'Manager':
+        # Approve Leaves Tab (managers and approval group members only)
+        if is_approver:
             with tab4:
                 st.header("✅ Approve Leave Requests")
-                
-                all_leaves_df = get_all_leave_requests()
-                
-                if not all_leaves_df.empty:
-                    # Filter for pending requests
-                    pending_df = all_leaves_df[all_leaves_df['status'] == 'Pending']
-                    
-                    col1, col2 = st.columns([2, 1])
-                    with col1:
-                        st.subheader(f"Pending Requests ({len(pending_df)})")
-                    with col2:
-                        show_all = st.checkbox("Show All Requests")
-                    
-                    display_df = all_leaves_df if show_all else pending_df
-                    
-                    if not display_df.empty:
-                        for idx, row in display_df.iterrows():
-                            with st.container():
-                                col1, col2, col3, col4 = st.columns([2, 2, 3, 2])
-                                
-                                with col1:
-                                    st.write(f"**{row['name']}**")
-                                    st.caption(f"{row['department']}")
-                                
-                                with col2:
-                                    st.write(f"**{row['leave_type']}**")
-                                    st.caption(f"{row['days']} days")
-                                
-                                with col3:
-                                    st.write(f"{row['start_date']} to {row['end_date']}")
-                                    st.caption(f"Reason: {row['reason']}")
-                                
-                                with col4:
-                                    if row['status'] == 'Pending':
-                                        col_a, col_b = st.columns(2)
-                                        with col_a:
-                                            if st.button("✅", key=f"approve_{row['request_id']}", use_container_width=True):
-                                                update_leave_status(row['request_id'], 'Approved', user['emp_id'])
-                                                st.success("Approved!")
-                                                st.rerun()
-                                        with col_b:
-                                            if st.button("❌", key=f"reject_{row['request_id']}", use_container_width=True):
-                                                update_leave_status(row['request_id'], 'Rejected', user['emp_id'])
-                                                st.error("Rejected!")
-                                                st.rerun()
-                                    else:
-                                        status_color = "green" if row['status'] == 'Approved' else "red"
-                                        st.markdown(f":{status_color}[{row['status']}]")
-                                
-                                st.divider()
-                    else:
-                        st.info("No pending leave requests.")
-                else:
-                    st.info("No leave requests found.")
+                approval_queue(user['emp_id'])
 
 if __name__ == "__main__":
-    main()
+    with script_run():
+        main()
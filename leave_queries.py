@@ -0,0 +1,230 @@
+"""Filtered, keyset-paginated leave request queries shared by both front-ends.
+
+Filters are pushed down into SQL and results are returned one page at a time,
+newest first, using a keyset cursor on ``(applied_date, id)`` so that fetching
+page N costs the same as fetching page 1 and never pulls the whole table into
+pandas. The caller supplies the ``SELECT ... FROM leave_requests lr`` part of
+the query (optionally joined to ``employees e``) and the name of the request
+id column, which differs between the two database flavours.
+
+Pages and counts cover the archived years too (see ``archive``): the same
+query runs on the hot table and on each archive the filters can reach, and
+the pages are merged by the cursor key.
+
+Some filters are planned from the data, because SQLite cannot estimate them
+from its statistics: a manager filter picks one of two forms by team size
+(:func:`is_large_team`), and a date window that ends before most requests
+start is read through ``idx_leave_requests_span`` instead of walking the
+newest-first index past every newer request (:func:`is_old_window`).
+
+:func:`fetch_leave_page` returns a DataFrame for the Streamlit pages;
+:func:`fetch_leave_records` returns plain dicts and does not need pandas.
+"""
+from operator import itemgetter
+
+from archive import archive_path, attach_archive, hot_exclusion, partition_sql, read_snapshot, routed_archives
+from cache import QueryCache
+
+PAGE_SIZE = 50
+
+# Counts of archived requests matching a filter set; archives never change
+archive_counts = QueryCache(ttl=float('inf'))
+
+# Managers whose reports are at least this share of all employees have their
+# queue read newest-first from the status/date index, checking each request's
+# owner against ``reporting_lines``; smaller teams gather their reports'
+# requests through the per-employee index and sort them.
+LARGE_TEAM_SHARE = 0.03
+
+# Date windows ending before at least this many requests start select their
+# requests through the start/end date index and sort them; other windows walk
+# the newest-first index, which reaches their requests after fewer rows.
+OLD_WINDOW_REQUESTS = 20_000
+
+
+def build_leave_filters(emp_id=None, statuses=None, leave_types=None,
+                        date_from=None, date_to=None, department=None, manager_id=None,
+                        large_team=False, old_window=False):
+    """Return ``(clauses, params)`` for the given filters on ``lr``/``e`` aliases
+
+    ``statuses``, ``leave_types`` are collections (``None`` means no filter, an
+    empty collection matches nothing). ``date_from``/``date_to`` select requests
+    whose leave period overlaps the window. ``department`` requires the query
+    to join ``employees e``. ``manager_id`` keeps the requests of that
+    manager's direct and indirect reports (see ``hierarchy``); ``large_team``
+    picks the form of that filter (see :func:`is_large_team`) and
+    ``old_window`` the form of the date window (see :func:`is_old_window`).
+    """
+    clauses, params = [], []
+    if emp_id is not None:
+        clauses.append('lr.emp_id = ?')
+        params.append(emp_id)
+    if manager_id is not None and large_team:
+        clauses.append('''EXISTS (SELECT 1 FROM reporting_lines rl
+                                  WHERE rl.manager_id = ? AND rl.emp_id = lr.emp_id AND rl.depth > 0)''')
+        params.append(manager_id)
+    elif manager_id is not None:
+        clauses.append('lr.emp_id IN (SELECT emp_id FROM reporting_lines WHERE manager_id = ? AND depth > 0)')
+        params.append(manager_id)
+    for column, values in (('lr.status', statuses), ('lr.leave_type', leave_types)):
+        if values is None:
+            continue
+        values = sorted(values)
+        if not values:
+            clauses.append('0')
+        else:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    window = []
+    if date_from is not None:
+        window.append(('lr.end_date >= ?', str(date_from)))
+    if date_to is not None:
+        window.append(('lr.start_date <= ?', str(date_to)))
+    if window and old_window:
+        # Spelled with the lr alias so archive.partition_sql redirects it too
+        clauses.append(f'''lr.rowid IN (SELECT lr.rowid FROM leave_requests lr
+                                         WHERE {' AND '.join(clause for clause, _ in window)})''')
+        params.extend(value for _, value in window)
+    else:
+        for clause, value in window:
+            clauses.append(clause)
+            params.append(value)
+    if department is not None:
+        clauses.append('e.department = ?')
+        params.append(department)
+    return clauses, params
+
+
+def is_large_team(conn, manager_id):
+    """True if ``manager_id``'s reports are at least ``LARGE_TEAM_SHARE`` of all employees"""
+    employees = conn.execute('SELECT employees FROM leave_counters WHERE id = 1').fetchone()
+    threshold = max(int(LARGE_TEAM_SHARE * (employees[0] if employees else 0)), 1)
+    reports = conn.execute('''
+        SELECT COUNT(*) FROM (SELECT 1 FROM reporting_lines WHERE manager_id = ? AND depth > 0 LIMIT ?)
+    ''', (manager_id, threshold)).fetchone()[0]
+    return reports >= threshold
+
+
+def is_old_window(conn, date_to):
+    """True if at least ``OLD_WINDOW_REQUESTS`` requests start after ``date_to``"""
+    newer = conn.execute('''
+        SELECT COUNT(*) FROM (SELECT 1 FROM leave_requests WHERE start_date > ? LIMIT ?)
+    ''', (str(date_to), OLD_WINDOW_REQUESTS)).fetchone()[0]
+    return newer >= OLD_WINDOW_REQUESTS
+
+
+def plan_filters(conn, filters):
+    """``filters`` with the forms of the reporting-line and date-window filters chosen for this data"""
+    if filters.get('manager_id') is not None:
+        filters['large_team'] = is_large_team(conn, filters['manager_id'])
+    # One employee's or a small team's requests are gathered per employee anyway
+    per_employee = filters.get('emp_id') is not None or (
+        filters.get('manager_id') is not None and not filters['large_team'])
+    if filters.get('date_to') is not None and not per_employee:
+        filters['old_window'] = is_old_window(conn, filters['date_to'])
+    return filters
+
+
+def build_page_query(select, id_column, cursor=None, page_size=PAGE_SIZE, excluded=((), ()), **filters):
+    """Return ``(sql, params)`` for one page, fetching one extra row to detect the next page
+
+    ``excluded`` is a further ``(clauses, params)`` pair (see ``archive.hot_exclusion``).
+    """
+    clauses, params = build_leave_filters(**filters)
+    clauses, params = clauses + list(excluded[0]), params + list(excluded[1])
+    if cursor is not None:
+        clauses.append(f'(lr.applied_date, lr.{id_column}) < (?, ?)')
+        params.extend(cursor)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'''{select}
+              {where}
+              ORDER BY lr.applied_date DESC, lr.{id_column} DESC
+              LIMIT ?'''
+    return sql, params + [page_size + 1]
+
+
+def _page_rows(conn, select, id_column, cursor, page_size, filters):
+    """``(columns, rows)`` of one page plus one row, newest first, merged from the partitions
+
+    The hot table is read first; an archive only when the page is not full
+    yet or the archive has requests applied after the page's last row.
+    """
+    filters = plan_filters(conn, filters)
+    with read_snapshot(conn, filters.get('statuses')) as catalog:
+        sql, params = build_page_query(select, id_column, cursor, page_size,
+                                       excluded=hot_exclusion(catalog), **filters)
+        result = conn.execute(sql, params)
+        columns = [description[0] for description in result.description]
+        rows = result.fetchall()
+    archives = routed_archives(catalog, filters.get('date_from'), filters.get('date_to'), filters.get('statuses'))
+    if not archives:
+        return columns, rows
+    key = itemgetter(columns.index('applied_date'), columns.index(id_column))
+    sql, params = build_page_query(select, id_column, cursor, page_size, **filters)
+    for entry in sorted(archives, key=itemgetter('last_applied'), reverse=True):
+        if len(rows) > page_size and entry['last_applied'] < rows[page_size][columns.index('applied_date')]:
+            break  # this archive and the ones after it only hold older requests
+        schema = attach_archive(conn, entry)
+        rows = sorted(rows + conn.execute(partition_sql(sql, schema), params).fetchall(),
+                      key=key, reverse=True)[:page_size + 1]
+    return columns, rows
+
+
+def fetch_leave_page(conn, select, id_column, cursor=None, page_size=PAGE_SIZE, **filters):
+    """Fetch one page of leave requests, newest first
+
+    Returns ``(df, next_cursor)``; ``next_cursor`` is ``None`` on the last page
+    and otherwise is passed back as ``cursor`` to get the following page.
+    """
+    import pandas as pd
+
+    columns, rows = _page_rows(conn, select, id_column, cursor, page_size, filters)
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (last['applied_date'], int(last[id_column]))
+    return df, next_cursor
+
+
+def fetch_leave_records(conn, select, id_column, cursor=None, page_size=PAGE_SIZE, **filters):
+    """Like :func:`fetch_leave_page` but returns ``(list of dicts, next_cursor)``"""
+    columns, rows = _page_rows(conn, select, id_column, cursor, page_size, filters)
+    records = [dict(zip(columns, row)) for row in rows]
+
+    next_cursor = None
+    if len(records) > page_size:
+        del records[page_size:]
+        next_cursor = (records[-1]['applied_date'], records[-1][id_column])
+    return records, next_cursor
+
+
+def count_leaves(conn, join_employees=False, **filters):
+    """Count the leave requests matching ``filters`` (served from the indexes)
+
+    Archives do not change, so their share of a count is computed once.
+    """
+    clauses, params = build_leave_filters(**filters)
+    join = 'JOIN employees e ON lr.emp_id = e.emp_id' if join_employees else ''
+    with read_snapshot(conn, filters.get('statuses')) as catalog:
+        excluded, excluded_params = hot_exclusion(catalog)
+        where = f"WHERE {' AND '.join(clauses + excluded)}" if clauses or excluded else ''
+        total = conn.execute(f'SELECT COUNT(*) FROM leave_requests lr {join} {where}',
+                             params + excluded_params).fetchone()[0]
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'SELECT COUNT(*) FROM leave_requests lr {join} {where}'
+    for entry in routed_archives(catalog, filters.get('date_from'), filters.get('date_to'), filters.get('statuses')):
+        key = (archive_path(conn, entry), entry['started_at'], sql, tuple(params))
+        hit, count = archive_counts.get(key)
+        if not hit:
+            count = conn.execute(partition_sql(sql, attach_archive(conn, entry)), params).fetchone()[0]
+            archive_counts.put(key, count)
+        total += count
+    return total
+
+
+def get_departments(conn):
+    """Distinct department names, for filter widgets"""
+    return [row[0] for row in conn.execute('SELECT DISTINCT department FROM employees ORDER BY department')]
@@ -0,0 +1,381 @@
+"""Leave business logic, independent of Streamlit and pandas.
+
+The Streamlit pages in ``leave_management.py`` and ``app.py`` and the JSON
+API in ``api_server.py`` all call these functions, so a rule (balance check,
+status transition, cache invalidation) lives in one place. Everything here
+works on the canonical schema (see ``storage``), borrows pooled connections
+from ``database`` and returns plain dicts and lists. Read functions go
+through the shared query cache; write functions bump the data version
+after committing.
+"""
+from datetime import date
+
+from analytics import DIMENSIONS, department_balances, query_rollups
+from archive import is_archived_year
+from batch_updates import DECISION_STATUSES, FORBIDDEN, UPDATED
+from bootstrap import bootstrap
+from cache import bump_data_version, cached
+from counters import get_employee_counters, get_global_counters
+from database import execute_write, get_connection, write_transaction
+from export import iter_export
+from hierarchy import count_reports
+from ledger import balance_on
+from leave_queries import PAGE_SIZE, count_leaves, fetch_leave_records, get_departments
+from overlaps import describe_overlap, find_overlap
+from passwords import hash_in_pool, verify_in_pool
+from schema import CANONICAL, LEAVE_MANAGEMENT
+from storage import EMPLOYEE_COLUMNS
+from team_calendar import invalidate_decided, invalidate_months, team_calendar
+from workdays import employee_location, working_days
+from workflow import approver_stages, count_inbox, decide_steps, fetch_inbox
+
+LEAVE_TYPES = ["Casual Leave", "Sick Leave", "Annual Leave", "Maternity Leave", "Paternity Leave"]
+# The types offered by app.py; both front-ends share one database
+APP_LEAVE_TYPES = ["Sick Leave", "Vacation", "Personal Leave", "Emergency Leave", "Other"]
+LEAVE_STATUSES = ['Pending', 'Approved', 'Rejected']
+
+EMPLOYEE_LEAVE_COLUMNS = ['request_id', 'leave_type', 'start_date', 'end_date', 'days',
+                          'reason', 'status', 'applied_date']
+LEAVE_REQUEST_COLUMNS = ['request_id', 'name', 'department', 'leave_type', 'start_date',
+                         'end_date', 'days', 'reason', 'status', 'applied_date']
+LEAVE_REQUEST_SELECT = '''
+    SELECT lr.request_id, e.name, e.department, lr.leave_type,
+           lr.start_date, lr.end_date, lr.days, lr.reason, lr.status, lr.applied_date
+    FROM leave_requests lr
+    JOIN employees e ON lr.emp_id = e.emp_id
+'''
+INBOX_COLUMNS = LEAVE_REQUEST_COLUMNS + ['stage', 'entered_at']
+EMPLOYEE_BALANCE_COLUMNS = ['emp_id', 'name', 'email', 'department', 'position', 'total_leaves',
+                            'used_leaves', 'reserved_leaves', 'available_leaves']
+
+
+class LeaveValidationError(ValueError):
+    """Raised when a leave application breaks a business rule"""
+
+
+def ensure_schema():
+    """Create the tables and apply pending migrations once per process (no sample data)"""
+    bootstrap(CANONICAL)
+
+
+def authenticate_user(email, password):
+    """Authenticate user credentials
+
+    The password is verified on the bounded hashing pool (without holding a
+    database connection) and a legacy or outdated hash is replaced on
+    success. May raise :class:`passwords.HashingBusy` during a login spike.
+    """
+    return _authenticate('email', email, password)
+
+
+def authenticate_employee(emp_id, password):
+    """Authenticate by employee id (the ``app.py`` login); see :func:`authenticate_user`"""
+    return _authenticate('emp_id', emp_id, password)
+
+
+def _authenticate(column, value, password):
+    with get_connection() as conn:
+        user = conn.execute(f'''
+            SELECT {EMPLOYEE_COLUMNS[LEAVE_MANAGEMENT]}
+            FROM employees
+            WHERE {column} = ?
+        ''', (value,)).fetchone()
+
+    matches, rehash = verify_in_pool(password, user[7] if user else None)
+    if not matches:
+        return None
+    if rehash:
+        upgrade_password_hash(user[0], user[7], password)
+    return {
+        'emp_id': user[0],
+        'name': user[1],
+        'email': user[2],
+        'department': user[3],
+        'role': user[4],
+        'total_leaves': user[5],
+        'used_leaves': user[6]
+    }
+
+
+def upgrade_password_hash(emp_id, old_hash, password):
+    """Store a current-scheme hash, unless the password changed in the meantime"""
+    new_hash = hash_in_pool(password)
+    execute_write('UPDATE employees SET password = ? WHERE emp_id = ? AND password = ?',
+                  (new_hash, emp_id, old_hash))
+
+
+def get_employee(emp_id):
+    """Public profile of one employee, or ``None``"""
+    with get_connection() as conn:
+        row = conn.execute('''
+            SELECT emp_id, name, email, department, role, total_leaves, used_leaves
+            FROM employees WHERE emp_id = ?
+        ''', (emp_id,)).fetchone()
+    if row is None:
+        return None
+    return dict(zip(('emp_id', 'name', 'email', 'department', 'role',
+                     'total_leaves', 'used_leaves'), row))
+
+
+def apply_leave(emp_id, leave_type, start_date, end_date, reason):
+    """Apply for a new leave; returns the new request id
+
+    Raises :class:`LeaveValidationError` for an unknown leave type, an empty
+    reason, an end date before the start date, a start in an archived leave
+    year, a range without working days, an insufficient balance or an overlap
+    with the employee's pending/approved leave. ``days`` is counted in working
+    days (see workdays) and is reserved against the balance while the request
+    is pending (see reservations). The checks and the insert run in one
+    ``BEGIN IMMEDIATE`` transaction, retried while the database is busy, so
+    concurrent applications cannot over-commit the balance or both pass the
+    overlap check.
+    """
+    if leave_type not in LEAVE_TYPES and leave_type not in APP_LEAVE_TYPES:
+        raise LeaveValidationError(f'Unknown leave type {leave_type!r}')
+    if not isinstance(start_date, date) or not isinstance(end_date, date):
+        raise LeaveValidationError('start_date and end_date must be dates')
+    if start_date > end_date:
+        raise LeaveValidationError('End date must be after start date')
+    if not reason or not reason.strip():
+        raise LeaveValidationError('A reason is required')
+
+    request_id = write_transaction(_reserve_leave, emp_id, leave_type, start_date, end_date, reason)
+    bump_data_version()
+    invalidate_months(start_date, end_date)
+    return request_id
+
+
+def _reserve_leave(conn, emp_id, leave_type, start_date, end_date, reason):
+    balance = conn.execute(
+        'SELECT total_leaves - used_leaves - reserved_leaves, location FROM employees WHERE emp_id = ?',
+        (emp_id,)
+    ).fetchone()
+    if balance is None:
+        raise LeaveValidationError(f'Unknown employee {emp_id}')
+    if is_archived_year(conn, start_date):
+        raise LeaveValidationError(f'Leave year {start_date.year} is archived')
+    days = working_days(conn, balance[1], start_date, end_date)
+    if days == 0:
+        raise LeaveValidationError('The selected dates contain no working days')
+    if days > balance[0]:
+        raise LeaveValidationError(f'Insufficient leave balance: {max(balance[0], 0)} days available')
+    overlap = find_overlap(conn, emp_id, start_date, end_date)
+    if overlap:
+        raise LeaveValidationError(describe_overlap(overlap))
+    # The insert trigger adds the days to reserved_leaves in this transaction
+    return conn.execute('''
+        INSERT INTO leave_requests (emp_id, leave_type, start_date, end_date, days, reason, status)
+        VALUES (?, ?, ?, ?, ?, ?, 'Pending')
+    ''', (emp_id, leave_type, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'),
+          days, reason)).lastrowid
+
+
+def count_leave_days(emp_id, start_date, end_date):
+    """Working days a leave from ``start_date`` to ``end_date`` would cost ``emp_id``"""
+    with get_connection() as conn:
+        return working_days(conn, employee_location(conn, emp_id), start_date, end_date)
+
+
+@cached
+def list_employee_leaves(emp_id, statuses=None, leave_types=None, cursor=None, page_size=PAGE_SIZE):
+    """One page of an employee's leave requests, newest first: ``(records, next_cursor)``"""
+    select = f'''
+        SELECT {', '.join('lr.' + column for column in EMPLOYEE_LEAVE_COLUMNS)}
+        FROM leave_requests lr
+    '''
+    with get_connection() as conn:
+        return fetch_leave_records(conn, select, 'request_id', cursor, page_size,
+                                   emp_id=emp_id, statuses=statuses, leave_types=leave_types)
+
+
+@cached
+def list_leave_requests(statuses=None, department=None, date_from=None, date_to=None,
+                        cursor=None, page_size=PAGE_SIZE, manager_id=None):
+    """One page of leave requests (all, or a manager's reports'), newest first: ``(records, next_cursor)``"""
+    with get_connection() as conn:
+        return fetch_leave_records(conn, LEAVE_REQUEST_SELECT, 'request_id', cursor, page_size,
+                                   statuses=statuses, department=department,
+                                   date_from=date_from, date_to=date_to, manager_id=manager_id)
+
+
+@cached
+def count_leave_requests(emp_id=None, statuses=None, leave_types=None, department=None, manager_id=None):
+    """Count leave requests matching the given filters"""
+    with get_connection() as conn:
+        return count_leaves(conn, join_employees=department is not None, emp_id=emp_id,
+                            statuses=statuses, leave_types=leave_types, department=department,
+                            manager_id=manager_id)
+
+
+@cached
+def list_inbox(manager_id, department=None, cursor=None, page_size=PAGE_SIZE):
+    """One page of the requests waiting for ``manager_id``'s decision, oldest first: ``(records, next_cursor)``"""
+    columns = ', '.join(f'e.{column}' if column in ('name', 'department') else f'lr.{column}'
+                        for column in LEAVE_REQUEST_COLUMNS[1:])
+    with get_connection() as conn:
+        return fetch_inbox(conn, columns, 'request_id', manager_id, cursor, page_size, department)
+
+
+@cached
+def count_inbox_requests(manager_id, department=None):
+    """Number of requests waiting for ``manager_id``'s decision"""
+    with get_connection() as conn:
+        return count_inbox(conn, manager_id, department)
+
+
+@cached
+def get_report_count(emp_id):
+    """Number of direct and indirect reports of ``emp_id``"""
+    with get_connection() as conn:
+        return count_reports(conn, emp_id)
+
+
+@cached
+def get_approver_stages(emp_id):
+    """The approval groups (e.g. ``hr``) ``emp_id`` belongs to"""
+    with get_connection() as conn:
+        return approver_stages(conn, emp_id)
+
+
+@cached
+def get_leave_counters(emp_id=None):
+    """Get pending/approved/rejected/total request counts (company-wide or for one employee)"""
+    with get_connection() as conn:
+        if emp_id is None:
+            return get_global_counters(conn)
+        return get_employee_counters(conn, emp_id)
+
+
+@cached
+def get_department_names():
+    """Get the list of departments for filter widgets"""
+    with get_connection() as conn:
+        return get_departments(conn)
+
+
+@cached
+def get_leave_statistics(emp_id):
+    """Get leave statistics for an employee; pending days count against ``available``"""
+    with get_connection() as conn:
+        result = conn.execute('''
+            SELECT total_leaves, used_leaves, reserved_leaves
+            FROM employees
+            WHERE emp_id = ?
+        ''', (emp_id,)).fetchone()
+
+    if result:
+        total, used, reserved = result
+        return {
+            'total': total,
+            'used': used,
+            'reserved': reserved,
+            'available': total - used - reserved
+        }
+    return None
+
+
+@cached
+def get_balance_on(emp_id, on_date):
+    """Leave balance of an employee at the end of ``on_date``, from the ledger"""
+    with get_connection() as conn:
+        if not conn.execute('SELECT 1 FROM employees WHERE emp_id = ?', (emp_id,)).fetchone():
+            return None
+        return balance_on(conn, emp_id, on_date)
+
+
+@cached
+def get_department_analytics(month_from, month_to, department=None, group_by=DIMENSIONS):
+    """Requests and days per department/month/type/status from the rollups (see analytics)"""
+    with get_connection() as conn:
+        rows = query_rollups(conn, month_from, month_to, department, group_by)
+    return [dict(zip(tuple(group_by) + ('requests', 'days'), row)) for row in rows]
+
+
+@cached
+def list_employee_balances(department=None, exclude=()):
+    """Employees (optionally of one department) with their balances, by id; ``exclude`` lists ids left out"""
+    query = '''
+        SELECT emp_id, name, email, department, position, total_leaves, used_leaves, reserved_leaves,
+               total_leaves - used_leaves - reserved_leaves
+        FROM employees
+        WHERE 1 = 1
+    '''
+    params = list(exclude)
+    if exclude:
+        query += f' AND emp_id NOT IN ({", ".join("?" * len(exclude))})'
+    if department is not None:
+        query += ' AND department = ?'
+        params.append(department)
+    with get_connection() as conn:
+        return conn.execute(query + ' ORDER BY emp_id', params).fetchall()
+
+
+@cached
+def get_department_balances(exclude=()):
+    """Head count and summed leave balances per department; ``exclude`` lists employee ids left out"""
+    with get_connection() as conn:
+        rows = department_balances(conn, exclude)
+    return [dict(zip(('department', 'employees', 'total', 'used', 'reserved', 'available'), row))
+            for row in rows]
+
+
+def export_leaves(fmt, statuses=None, department=None, date_from=None, date_to=None, manager_id=None):
+    """The filtered leave requests encoded as ``fmt`` (csv or xlsx), as ``bytes`` blocks
+
+    Not cached: rows are streamed from one cursor, and the pooled connection
+    is held until the generator is exhausted or closed.
+    """
+    with get_connection() as conn:
+        yield from iter_export(conn, fmt, statuses=statuses, department=department,
+                               date_from=date_from, date_to=date_to, manager_id=manager_id)
+
+
+def update_leave_status(request_id, status, manager_id):
+    """Approve or reject a pending leave request at the manager's step of its approval chain
+
+    Raises :class:`LeaveValidationError` for a status other than Approved or
+    Rejected, a request that is no longer pending, a request in an archived
+    leave year or a step the manager may not decide.
+    """
+    span = write_transaction(_set_leave_status, request_id, status, manager_id)
+    bump_data_version()
+    if span:
+        invalidate_months(*span)
+
+
+def _set_leave_status(conn, request_id, status, manager_id):
+    if status not in DECISION_STATUSES:
+        raise LeaveValidationError(f'Unknown status {status!r}')
+    leave = conn.execute(
+        'SELECT status, start_date, end_date FROM leave_requests WHERE request_id = ?', (request_id,)
+    ).fetchone()
+    if leave is None:
+        return None
+    old_status, start_date, end_date = leave
+    if is_archived_year(conn, start_date):
+        raise LeaveValidationError(f'Leave year {str(start_date)[:4]} is archived')
+    if old_status != 'Pending':
+        # Re-deciding would skip the balance, overlap and approval-chain checks
+        raise LeaveValidationError(f'Leave request {request_id} is already {old_status}')
+    result, = decide_steps(conn, [(request_id, status)], manager_id)
+    if result['result'] == FORBIDDEN:
+        raise LeaveValidationError(result['detail'])
+    return (start_date, end_date) if result['result'] == UPDATED else None
+
+
+def update_leave_statuses(decisions, manager_id, unrestricted=False):
+    """Approve/reject many requests at the manager's steps in one transaction; returns per-item results
+
+    Approvals with a further step in the request's chain come back
+    ``forwarded`` (see workflow) and leave the request pending.
+    ``unrestricted`` lets the ``app.py`` admin decide any step.
+    """
+    results = write_transaction(decide_steps, decisions, manager_id, 'request_id', unrestricted)
+    bump_data_version()
+    invalidate_decided(results)
+    return results
+
+
+def get_team_calendar(department, start_date, end_date):
+    """Occupancy matrix, daily headcount out and stripes for a department (see team_calendar)"""
+    return team_calendar(department, start_date, end_date)
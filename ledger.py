@@ -0,0 +1,284 @@
+"""Append-only ledger of leave balance movements with point-in-time balances.
+
+Every change to an employee's leave balance is a row in ``leave_ledger``
+with a signed ``days`` amount, the date it took effect and its kind:
+
+* ``grant`` (+) - allowance for the leave year (opening balance of a new employee)
+* ``carry_forward`` (+) - unused days brought into a new leave year
+* ``expire`` (-) - days closed out at the end of a leave year
+* ``consume`` (-) - a request was approved
+* ``reverse`` (+) - an approved request was rejected again
+* ``adjust`` (+/-) - the working days of an approved request were recounted,
+  or the usage recorded before the ledger existed
+
+Rows are never updated or deleted. Triggers on ``employees`` and
+``leave_requests`` post the entries in the same transaction as the change,
+so every write path is covered. The balance on any date is the sum of the
+entries up to it; ``leave_balance_snapshots`` stores that sum per employee
+at period ends, so :func:`balance_on` is one index seek for the latest
+snapshot plus a short index range scan over the entries since.
+
+``employees.used_leaves`` and ``total_leaves`` remain the fast, denormalized
+figures for the current leave year; :func:`reconcile` checks them against the
+ledger for all employees at once::
+
+    python ledger.py --reconcile [--fix]
+    python ledger.py --snapshot 2026-09-30
+    python ledger.py --balance 1001 2026-06-30
+"""
+import argparse
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+
+from database import configure_connection, execute_script
+from schema import LEAVE_MANAGEMENT, REQUEST_ID_COLUMN, detect_flavor
+
+# Kinds making up the year's allowance and the year's usage
+ALLOWANCE_KINDS = ('grant', 'carry_forward')
+USAGE_KINDS = ('consume', 'reverse', 'adjust')
+LEDGER_KINDS = ALLOWANCE_KINDS + USAGE_KINDS + ('expire',)
+
+LEDGER_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS leave_ledger (
+        entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emp_id {emp_id_type} NOT NULL,
+        entry_date DATE NOT NULL,
+        kind TEXT NOT NULL CHECK (kind IN {kinds}),
+        days INTEGER NOT NULL,
+        request_id INTEGER,
+        note TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Covers the point-in-time scan (seek to emp_id and date, read days) and reconcile
+    CREATE INDEX IF NOT EXISTS idx_leave_ledger_emp_date
+    ON leave_ledger (emp_id, entry_date, days, kind);
+
+    CREATE TABLE IF NOT EXISTS leave_balance_snapshots (
+        emp_id {emp_id_type} NOT NULL,
+        snapshot_date DATE NOT NULL,
+        balance INTEGER NOT NULL,
+        PRIMARY KEY (emp_id, snapshot_date)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_ledger_append_only
+    BEFORE UPDATE ON leave_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'leave_ledger is append-only');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_leave_ledger_no_delete
+    BEFORE DELETE ON leave_ledger
+    BEGIN
+        SELECT RAISE(ABORT, 'leave_ledger is append-only');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_employee_insert
+    AFTER INSERT ON employees
+    BEGIN
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, note)
+        VALUES (NEW.emp_id, date('now'), 'grant', NEW.total_leaves, 'opening allowance');
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, note)
+        SELECT NEW.emp_id, date('now'), 'adjust', -NEW.used_leaves, 'opening usage'
+        WHERE NEW.used_leaves != 0;
+    END;
+'''
+
+# Request triggers name the request id column, which differs between flavours.
+# A recount only moves used_leaves for this leave year's requests (see
+# workdays.recompute_days), so only those post an adjustment.
+REQUEST_TRIGGERS = '''
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_request_status
+    AFTER UPDATE OF status ON leave_requests
+    WHEN (OLD.status = 'Approved') != (NEW.status = 'Approved')
+    BEGIN
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, request_id)
+        VALUES (NEW.emp_id, date('now'),
+                CASE WHEN NEW.status = 'Approved' THEN 'consume' ELSE 'reverse' END,
+                CASE WHEN NEW.status = 'Approved' THEN -NEW.days ELSE OLD.days END,
+                NEW.{id_column});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_ledger_request_days
+    AFTER UPDATE OF days ON leave_requests
+    WHEN OLD.status = 'Approved' AND NEW.status = 'Approved' AND OLD.days != NEW.days
+     AND NEW.start_date >= strftime('%Y-01-01', 'now')
+    BEGIN
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, request_id, note)
+        VALUES (NEW.emp_id, date('now'), 'adjust', OLD.days - NEW.days, NEW.{id_column},
+                'working days recounted');
+    END;
+'''
+
+
+def leave_year_start(on_date=None):
+    on_date = on_date or date.today()
+    return date(on_date.year, 1, 1)
+
+
+def install_ledger(conn):
+    """Ledger tables and triggers, and an opening ledger for the existing employees
+
+    The opening ledger covers the current leave year: the allowance granted
+    on 1 January, one ``consume`` per approved request starting this year
+    (dated when it was approved) and an ``adjust`` for any usage recorded in
+    ``used_leaves`` that no approved request explains.
+    """
+    id_column = REQUEST_ID_COLUMN[detect_flavor(conn) or LEAVE_MANAGEMENT]
+    # Same emp_id type as employees, so joins between the two can use the indexes
+    emp_id_type = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(employees)')}['emp_id']
+    execute_script(conn, LEDGER_SCHEMA.format(emp_id_type=emp_id_type, kinds=LEDGER_KINDS))
+    execute_script(conn, REQUEST_TRIGGERS.format(id_column=id_column))
+    if conn.execute('SELECT 1 FROM leave_ledger LIMIT 1').fetchone():
+        return
+
+    year_start = leave_year_start().isoformat()
+    conn.execute('''
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, note)
+        SELECT emp_id, ?, 'grant', total_leaves, 'opening allowance' FROM employees
+    ''', (year_start,))
+    conn.execute(f'''
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, request_id)
+        SELECT emp_id, MAX(COALESCE(date(approved_date), start_date), ?), 'consume', -days, {id_column}
+        FROM leave_requests
+        WHERE status = 'Approved' AND start_date >= ?
+        ORDER BY 2
+    ''', (year_start, year_start))
+    conn.execute('''
+        INSERT INTO leave_ledger (emp_id, entry_date, kind, days, note)
+        SELECT e.emp_id, date('now'), 'adjust', -(e.used_leaves - COALESCE(c.consumed, 0)), 'opening usage'
+        FROM employees e
+        LEFT JOIN (SELECT emp_id, -SUM(days) AS consumed FROM leave_ledger
+                   WHERE kind = 'consume' GROUP BY emp_id) c ON c.emp_id = e.emp_id
+        WHERE e.used_leaves != COALESCE(c.consumed, 0)
+    ''')
+    conn.execute('ANALYZE leave_ledger')
+
+
+def balance_on(conn, emp_id, on_date):
+    """Balance of ``emp_id`` at the end of ``on_date``: latest snapshot plus the entries since"""
+    on_date = str(on_date)
+    snapshot = conn.execute('''
+        SELECT snapshot_date, balance FROM leave_balance_snapshots
+        WHERE emp_id = ? AND snapshot_date <= ?
+        ORDER BY snapshot_date DESC LIMIT 1
+    ''', (emp_id, on_date)).fetchone()
+    since, balance = snapshot or ('', 0)
+    movement = conn.execute('''
+        SELECT COALESCE(SUM(days), 0) FROM leave_ledger
+        WHERE emp_id = ? AND entry_date > ? AND entry_date <= ?
+    ''', (emp_id, since, on_date)).fetchone()[0]
+    return balance + movement
+
+
+def take_snapshots(conn, as_of):
+    """Store every employee's balance at the end of ``as_of`` (a past date); returns the row count
+
+    Entries are dated when they are posted, so only days that are over can
+    be snapshotted without missing later entries of the same day.
+    """
+    as_of = date.fromisoformat(str(as_of))
+    if as_of >= date.today():
+        raise ValueError('Snapshots can only be taken for past dates')
+    # Start from each employee's previous snapshot instead of summing the whole ledger
+    return conn.execute('''
+        INSERT OR REPLACE INTO leave_balance_snapshots (emp_id, snapshot_date, balance)
+        SELECT e.emp_id, :as_of,
+               COALESCE(s.balance, 0) + COALESCE((
+                   SELECT SUM(l.days) FROM leave_ledger l
+                   WHERE l.emp_id = e.emp_id AND l.entry_date > COALESCE(s.snapshot_date, '')
+                     AND l.entry_date <= :as_of), 0)
+        FROM employees e
+        LEFT JOIN leave_balance_snapshots s
+          ON s.emp_id = e.emp_id
+         AND s.snapshot_date = (SELECT MAX(snapshot_date) FROM leave_balance_snapshots
+                                WHERE emp_id = e.emp_id AND snapshot_date < :as_of)
+    ''', {'as_of': as_of.isoformat()}).rowcount
+
+
+def reconcile(conn, on_date=None):
+    """Compare ``total_leaves``/``used_leaves`` with the ledger for every employee
+
+    One grouped pass over the ledger yields, per employee, this leave year's
+    allowance and usage and the overall balance; the comparison is done on
+    whole arrays. Returns ``(emp_id, total, used, ledger_total, ledger_used,
+    ledger_balance)`` for the employees that disagree.
+    """
+    year_start = leave_year_start(on_date).isoformat()
+    rows = conn.execute(f'''
+        SELECT e.emp_id, e.total_leaves, e.used_leaves,
+               COALESCE(l.allowance, 0), COALESCE(l.usage, 0), COALESCE(l.balance, 0)
+        FROM employees e
+        LEFT JOIN (
+            SELECT emp_id,
+                   SUM(CASE WHEN kind IN {ALLOWANCE_KINDS} AND entry_date >= :year_start
+                            THEN days ELSE 0 END) AS allowance,
+                   -SUM(CASE WHEN kind IN {USAGE_KINDS} AND entry_date >= :year_start
+                             THEN days ELSE 0 END) AS usage,
+                   SUM(days) AS balance
+            FROM leave_ledger GROUP BY emp_id
+        ) l ON l.emp_id = e.emp_id
+    ''', {'year_start': year_start}).fetchall()
+    if not rows:
+        return []
+    emp_ids = [row[0] for row in rows]
+    total, used, allowance, usage, balance = np.array([row[1:] for row in rows], dtype=np.int64).T
+    mismatched = (total != allowance) | (used != usage) | (total - used != balance)
+    return [(emp_ids[i], int(total[i]), int(used[i]), int(allowance[i]), int(usage[i]), int(balance[i]))
+            for i in np.nonzero(mismatched)[0]]
+
+
+def fix_from_ledger(conn, mismatches):
+    """Set ``total_leaves``/``used_leaves`` to the ledger's figures for :func:`reconcile` rows"""
+    conn.executemany('UPDATE employees SET total_leaves = ?, used_leaves = ? WHERE emp_id = ?',
+                     [(ledger_total, ledger_used, emp_id)
+                      for emp_id, _, _, ledger_total, ledger_used, _ in mismatches])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Leave ledger reports and maintenance')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--reconcile', action='store_true', help='check balances against the ledger')
+    parser.add_argument('--fix', action='store_true', help='with --reconcile, reset balances from the ledger')
+    parser.add_argument('--snapshot', metavar='DATE', nargs='?', const='',
+                        help='snapshot balances at the end of DATE (default: yesterday)')
+    parser.add_argument('--balance', nargs=2, metavar=('EMP_ID', 'DATE'), help='balance on a date')
+    parser.add_argument('--limit', type=int, default=50, help='rows to print')
+    args = parser.parse_args()
+
+    from database import DB_PATH
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        if args.snapshot is not None:
+            as_of = args.snapshot or (date.today() - timedelta(days=1)).isoformat()
+            try:
+                with conn:
+                    count = take_snapshots(conn, as_of)
+            except ValueError as e:
+                parser.error(str(e))
+            print(f'{count} balances snapshotted at {as_of}')
+        if args.balance:
+            emp_id, on_date = args.balance
+            emp_key = int(emp_id) if emp_id.isdigit() else emp_id
+            print(f'employee {emp_id}: {balance_on(conn, emp_key, on_date)} days on {on_date}')
+        if args.reconcile:
+            mismatches = reconcile(conn)
+            for emp_id, total, used, ledger_total, ledger_used, balance in mismatches[:args.limit]:
+                print(f'employee {emp_id}: total {total} vs ledger {ledger_total}, '
+                      f'used {used} vs ledger {ledger_used}, ledger balance {balance}')
+            print(f'{len(mismatches)} employees disagree with the ledger')
+            if mismatches and args.fix:
+                with conn:
+                    fix_from_ledger(conn, mismatches)
+                print('Balances reset from the ledger')
+            elif mismatches:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""Versioned schema migrations tracked through ``PRAGMA user_version``.
+
+Each front-end creates its base tables with ``CREATE TABLE IF NOT EXISTS`` and
+then calls :func:`run_migrations`, which applies every migration newer than the
+database's ``user_version`` in order, one transaction per step. Existing
+``leave_management.db`` files are therefore upgraded in place the next time
+either app starts.
+
+Run ``python migrations.py`` to migrate a database by hand, or
+``python migrations.py --check-plans`` to verify that the hot queries are
+still served by their indexes.
+"""
+import argparse
+import sqlite3
+
+from accrual import install_accrual
+from analytics import install_rollups
+from archive import index_archives, install_archive
+from counters import install_counters
+from hierarchy import install_hierarchy
+from ledger import install_ledger
+from notifications import install_outbox
+from overlaps import install_overlap_index
+from reservations import install_reservations
+from storage import install_canonical_storage
+from workdays import install_calendar_version, install_work_calendars
+from workflow import install_workflow
+
+
+def _add_leave_request_indexes(conn):
+    """Composite indexes for the per-employee, status and date-ordered queries"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_leave_requests_emp_applied
+                    ON leave_requests (emp_id, applied_date)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_leave_requests_status_applied
+                    ON leave_requests (status, applied_date)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_leave_requests_emp_status
+                    ON leave_requests (emp_id, status)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_leave_requests_applied
+                    ON leave_requests (applied_date)''')
+    conn.execute('ANALYZE leave_requests')
+
+
+def _add_leave_window_index(conn):
+    """Start/end date index for date windows that end before most requests start (see leave_queries)"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_leave_requests_span
+                    ON leave_requests (start_date, end_date)''')
+    conn.execute('ANALYZE leave_requests')
+    index_archives(conn)
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, 'composite indexes on leave_requests', _add_leave_request_indexes),
+    (2, 'trigger-maintained leave counters', install_counters),
+    (3, 'interval index for overlapping-leave checks', install_overlap_index),
+    (4, 'working-day calendars and days recount', install_work_calendars),
+    (5, 'pending days reserved against the balance', install_reservations),
+    (6, 'append-only leave ledger with balance snapshots', install_ledger),
+    (7, 'year-end accrual checkpoints', install_accrual),
+    (8, 'monthly department rollups for analytics', install_rollups),
+    (9, 'notification outbox for leave decisions', install_outbox),
+    (10, 'reporting lines closure table', install_hierarchy),
+    (11, 'multi-level approval workflow', install_workflow),
+    (12, 'canonical storage for both front-ends', install_canonical_storage),
+    (13, 'year-partitioned archive of closed leave years', install_archive),
+    (14, 'calendar version bumped by calendar changes', install_calendar_version),
+    (15, 'start/end date index for date-window filters', _add_leave_window_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    """Return the migration version recorded in the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations(conn, target=LATEST_VERSION):
+    """Apply pending migrations up to version ``target``; returns the list of versions applied"""
+    if get_schema_version(conn) >= target:
+        return []
+
+    if conn.in_transaction:
+        conn.commit()
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version > target:
+            break
+        # BEGIN IMMEDIATE serialises concurrent starters; re-check inside the lock
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migrate(conn)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# Hot queries and the index each one must use. Column names are shared by the
+# schemas of both front-ends, so the same checks cover either database flavour.
+HOT_QUERIES = [
+    ('employee leave history',
+     'SELECT * FROM leave_requests WHERE emp_id = ? ORDER BY applied_date DESC',
+     (1001,), 'idx_leave_requests_emp_applied'),
+    ('pending queue',
+     "SELECT * FROM leave_requests WHERE status = 'Pending' ORDER BY applied_date DESC",
+     (), 'idx_leave_requests_status_applied'),
+    ('employee pending count',
+     "SELECT COUNT(*) FROM leave_requests WHERE emp_id = ? AND status = 'Pending'",
+     (1001,), 'idx_leave_requests_emp_status'),
+    ('status count',
+     "SELECT COUNT(*) FROM leave_requests WHERE status = 'Approved'",
+     (), 'idx_leave_requests_status_applied'),
+    ('all requests with employee',
+     '''SELECT lr.*, e.name, e.department
+        FROM leave_requests lr
+        JOIN employees e ON lr.emp_id = e.emp_id
+        ORDER BY lr.applied_date DESC''',
+     (), 'idx_leave_requests_applied'),
+    ('overlap probe',
+     '''SELECT * FROM leave_requests
+        WHERE emp_id = ? AND status IN ('Pending', 'Approved')
+          AND end_date >= ? AND start_date <= ?
+        ORDER BY end_date LIMIT 1''',
+     (1001, '2025-01-01', '2025-01-05'), 'idx_leave_requests_active_span'),
+    ('point-in-time balance',
+     '''SELECT COALESCE(SUM(days), 0) FROM leave_ledger
+        WHERE emp_id = ? AND entry_date > ? AND entry_date <= ?''',
+     (1001, '2025-06-30', '2025-09-30'), 'idx_leave_ledger_emp_date'),
+    ('large team pending queue',
+     '''SELECT * FROM leave_requests lr
+        WHERE lr.status = 'Pending' AND EXISTS (
+            SELECT 1 FROM reporting_lines rl WHERE rl.manager_id = ? AND rl.emp_id = lr.emp_id AND rl.depth > 0)
+        ORDER BY lr.applied_date DESC''',
+     (1002,), 'idx_leave_requests_status_applied'),
+    ('approver inbox',
+     '''SELECT * FROM approval_workflow
+        WHERE assignee = ? AND emp_id != ?
+        ORDER BY entered_at, request_id''',
+     (1002, 1002), 'idx_approval_workflow_inbox'),
+]
+
+
+def explain_query_plan(conn, sql, params=()):
+    """Return the ``detail`` column of ``EXPLAIN QUERY PLAN`` for a query"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+
+def check_query_plans(conn):
+    """Return a list of problems with the hot query plans (empty when healthy)"""
+    problems = []
+    for name, sql, params, index in HOT_QUERIES:
+        plan = explain_query_plan(conn, sql, params)
+        text = ' | '.join(plan)
+        if not any(index in detail for detail in plan):
+            problems.append(f'{name}: expected {index}, got: {text}')
+        if any('TEMP B-TREE' in detail for detail in plan):
+            problems.append(f'{name}: sorts with a temp b-tree: {text}')
+        if any(detail in ('SCAN lr', 'SCAN leave_requests') for detail in plan):
+            problems.append(f'{name}: full scan of leave_requests: {text}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate the leave database schema')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='fail if a hot query no longer uses its index')
+    args = parser.parse_args()
+
+    from database import DB_PATH, configure_connection
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        applied = run_migrations(conn)
+        print(f'Schema at version {get_schema_version(conn)} (applied: {applied or "none"})')
+        if args.check_plans:
+            problems = check_query_plans(conn)
+            for problem in problems:
+                print(f'FAIL {problem}')
+            if problems:
+                raise SystemExit(1)
+            print(f'All {len(HOT_QUERIES)} hot query plans use their indexes')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
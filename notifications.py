@@ -0,0 +1,403 @@
+"""Email notifications of leave decisions through a transactional outbox.
+
+A trigger on ``leave_requests`` writes a row to ``notification_outbox``
+whenever a request is approved or rejected, in the same transaction as the
+decision, so a click never waits for SMTP and a rolled-back decision never
+sends mail. A request decided again before its notification went out
+updates the pending row instead of queueing a second one.
+
+The dispatcher drains the outbox in the background: it claims up to
+``LEAVE_NOTIFY_BATCH`` due rows, sends one message per recipient listing
+all their decisions (a bulk approval of many requests of one employee is a
+single digest email) over one reused SMTP connection, and records the
+outcome. Temporary failures are retried with exponential backoff
+(``LEAVE_NOTIFY_BACKOFF`` seconds, doubling) up to ``LEAVE_NOTIFY_MAX_ATTEMPTS``
+times; permanent ones (5xx replies) are marked failed at once. Claimed rows
+are leased, so rows held by a dispatcher that died are picked up again.
+
+Run the dispatcher next to the apps::
+
+    python notifications.py              # until interrupted
+    python notifications.py --once       # send what is due and exit
+    python notifications.py --status     # outbox rows per state
+"""
+import argparse
+import logging
+import os
+import smtplib
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from email.message import EmailMessage
+from email.utils import make_msgid
+
+from database import begin_immediate, configure_connection, execute_script
+from schema import LEAVE_MANAGEMENT, REQUEST_ID_COLUMN, detect_flavor
+
+SMTP_HOST = os.environ.get('LEAVE_SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('LEAVE_SMTP_PORT', '25'))
+SMTP_USER = os.environ.get('LEAVE_SMTP_USER')
+SMTP_PASSWORD = os.environ.get('LEAVE_SMTP_PASSWORD')
+SMTP_STARTTLS = os.environ.get('LEAVE_SMTP_STARTTLS', '0') == '1'
+# Close the SMTP connection after this many idle seconds
+SMTP_IDLE = float(os.environ.get('LEAVE_SMTP_IDLE', '60'))
+MAIL_FROM = os.environ.get('LEAVE_MAIL_FROM', 'leave-noreply@acme.com')
+NOTIFY_BATCH = int(os.environ.get('LEAVE_NOTIFY_BATCH', '200'))
+NOTIFY_INTERVAL = float(os.environ.get('LEAVE_NOTIFY_INTERVAL', '5'))
+# A notification waits this long so that decisions made in quick succession share a digest
+NOTIFY_DIGEST_DELAY = float(os.environ.get('LEAVE_NOTIFY_DIGEST_DELAY', '30'))
+NOTIFY_MAX_ATTEMPTS = int(os.environ.get('LEAVE_NOTIFY_MAX_ATTEMPTS', '6'))
+NOTIFY_BACKOFF = float(os.environ.get('LEAVE_NOTIFY_BACKOFF', '30'))
+# Claimed rows not resolved within this many seconds are claimed again
+NOTIFY_LEASE = float(os.environ.get('LEAVE_NOTIFY_LEASE', '300'))
+
+logger = logging.getLogger(__name__)
+
+_EPOCH_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+OUTBOX_SCHEMA = f'''
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        notification_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emp_id {{emp_id_type}} NOT NULL,
+        recipient TEXT NOT NULL,
+        request_id INTEGER NOT NULL,
+        leave_type TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        days INTEGER,
+        status TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending'
+            CHECK (state IN ('pending', 'sending', 'sent', 'failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        queued_at REAL NOT NULL DEFAULT {_EPOCH_NOW},
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        sent_at TIMESTAMP,
+        last_error TEXT
+    );
+
+    -- At most one unsent notification per request: later decisions update it
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_notification_outbox_pending
+    ON notification_outbox (request_id) WHERE state = 'pending';
+
+    CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+    ON notification_outbox (next_attempt_at) WHERE state IN ('pending', 'sending');
+
+    CREATE INDEX IF NOT EXISTS idx_notification_outbox_recipient
+    ON notification_outbox (recipient) WHERE state IN ('pending', 'sending');
+
+    CREATE TRIGGER IF NOT EXISTS trg_notification_outbox_decision
+    AFTER UPDATE OF status ON leave_requests
+    WHEN NEW.status IN ('Approved', 'Rejected') AND OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO notification_outbox
+            (emp_id, recipient, request_id, leave_type, start_date, end_date, days, status)
+        SELECT NEW.emp_id, email, NEW.{{id_column}}, NEW.leave_type, NEW.start_date, NEW.end_date,
+               NEW.days, NEW.status
+        FROM employees WHERE emp_id = NEW.emp_id AND email != ''
+        ON CONFLICT (request_id) WHERE state = 'pending' DO UPDATE
+        SET status = excluded.status, leave_type = excluded.leave_type,
+            start_date = excluded.start_date, end_date = excluded.end_date, days = excluded.days;
+    END;
+'''
+
+# Rows to claim: up to a batch of due rows old enough to send (retries last), plus any
+# other due rows of the same recipients so that each gets a single digest
+CLAIM_QUERY = '''
+    WITH recipients AS (
+        SELECT DISTINCT recipient FROM (
+            SELECT recipient FROM notification_outbox
+            WHERE state IN ('pending', 'sending') AND next_attempt_at <= :now AND queued_at <= :cutoff
+            ORDER BY next_attempt_at LIMIT :batch
+        )
+    )
+    SELECT notification_id, recipient, request_id, leave_type, start_date, end_date, days, status,
+           attempts
+    FROM notification_outbox
+    WHERE state IN ('pending', 'sending') AND next_attempt_at <= :now
+      AND recipient IN (SELECT recipient FROM recipients)
+    ORDER BY notification_id
+'''
+
+
+def install_outbox(conn):
+    """Create the outbox and the decision trigger (nothing is queued for past decisions)"""
+    id_column = REQUEST_ID_COLUMN[detect_flavor(conn) or LEAVE_MANAGEMENT]
+    emp_id_type = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(employees)')}['emp_id']
+    execute_script(conn, OUTBOX_SCHEMA.format(emp_id_type=emp_id_type, id_column=id_column))
+
+
+class SMTPMailer:
+    """Sends messages over one SMTP connection, opened on demand and reused"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.connections = 0
+        self.sent = 0
+        self.last_used = 0.0
+        self._smtp = None
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.connections += 1
+        self._smtp = smtp
+
+    def send(self, message):
+        # A connection the server dropped while idle is reopened once
+        for attempt in range(2):
+            if self._smtp is None:
+                self._connect()
+            try:
+                self._smtp.send_message(message)
+                break
+            except smtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if attempt:
+                    raise
+            except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                raise  # the server answered: the connection is still usable
+            except OSError:
+                self._smtp.close()
+                self._smtp = None
+                raise
+        self.sent += 1
+        self.last_used = time.monotonic()
+
+    def close_if_idle(self, idle=SMTP_IDLE):
+        if self._smtp is not None and time.monotonic() - self.last_used >= idle:
+            self.close()
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+
+def is_reply(error):
+    """True if the server rejected the message, False if the connection failed"""
+    return isinstance(error, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused))
+
+
+def is_permanent(error):
+    """True for SMTP errors that a retry will not fix (5xx replies, refused recipients)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def build_message(recipient, rows, sender=MAIL_FROM):
+    """One email telling ``recipient`` about the decisions in ``rows``"""
+    message = EmailMessage()
+    message['From'] = sender
+    message['To'] = recipient
+    message['Message-ID'] = make_msgid(f'leave-{rows[0]["notification_id"]}')
+    message['X-Leave-Requests'] = ', '.join(str(row['request_id']) for row in rows)
+    if len(rows) == 1:
+        row = rows[0]
+        message['Subject'] = f'Your {row["leave_type"]} request was {row["status"].lower()}'
+    else:
+        message['Subject'] = f'{len(rows)} of your leave requests were decided'
+    lines = [f'{row["leave_type"]} {row["start_date"]} to {row["end_date"]} '
+             f'({row["days"]} day{"s" if row["days"] != 1 else ""}): {row["status"]}' for row in rows]
+    message.set_content('Your leave requests have been reviewed:\n\n' + '\n'.join(lines) + '\n')
+    return message
+
+
+class Dispatcher:
+    """Drains ``notification_outbox`` through a mailer, one batch at a time"""
+
+    def __init__(self, conn, mailer, batch_size=NOTIFY_BATCH, digest_delay=NOTIFY_DIGEST_DELAY,
+                 max_attempts=NOTIFY_MAX_ATTEMPTS, backoff=NOTIFY_BACKOFF, lease=NOTIFY_LEASE):
+        self.conn = conn
+        self.mailer = mailer
+        self.batch_size = batch_size
+        self.digest_delay = digest_delay
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+
+    def claim(self, now):
+        """Lease a batch of due rows; returns them as dicts"""
+        begin_immediate(self.conn)
+        try:
+            result = self.conn.execute(CLAIM_QUERY, {'now': now, 'cutoff': now - self.digest_delay,
+                                                     'batch': self.batch_size})
+            columns = [description[0] for description in result.description]
+            rows = [dict(zip(columns, row)) for row in result]
+            self.conn.executemany('''
+                UPDATE notification_outbox SET state = 'sending', next_attempt_at = ?
+                WHERE notification_id = ?
+            ''', [(now + self.lease, row['notification_id']) for row in rows])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return rows
+
+    def dispatch_once(self):
+        """Send one batch; returns counts of messages, notifications, retries and failures"""
+        now = time.time()
+        stats = {'messages': 0, 'notifications': 0, 'retried': 0, 'failed': 0}
+        rows = self.claim(now)
+        if not rows:
+            return stats
+
+        by_recipient = defaultdict(dict)
+        for row in rows:
+            # Newest row per request wins; an older one left over from a lapsed lease is superseded
+            by_recipient[row['recipient']][row['request_id']] = row
+        sent = [(row['notification_id'],) for row in rows
+                if by_recipient[row['recipient']][row['request_id']] is not row]
+        retry, failed = [], []
+        groups = [(recipient, sorted(latest.values(), key=lambda row: row['notification_id']))
+                  for recipient, latest in by_recipient.items()]
+        for index, (recipient, group) in enumerate(groups):
+            try:
+                self.mailer.send(build_message(recipient, group))
+            except (smtplib.SMTPException, OSError) as e:
+                error = f'{type(e).__name__}: {e}'[:500]
+                # A rejected message affects its recipient; a lost connection the rest of the batch
+                affected = group if is_reply(e) else [row for _, rest in groups[index:] for row in rest]
+                for row in affected:
+                    if is_permanent(e) or row['attempts'] + 1 >= self.max_attempts:
+                        failed.append((error, row['notification_id']))
+                    else:
+                        retry.append((now + self.backoff * 2 ** row['attempts'], error, row['notification_id']))
+                if is_reply(e):
+                    continue
+                break
+            stats['messages'] += 1
+            sent.extend((row['notification_id'],) for row in group)
+
+        begin_immediate(self.conn)
+        try:
+            self.conn.executemany('''
+                UPDATE notification_outbox SET state = 'sent', sent_at = CURRENT_TIMESTAMP
+                WHERE notification_id = ?
+            ''', sent)
+            # A request decided again meanwhile already has a newer pending row, which supersedes this one
+            superseded = self.conn.executemany('''
+                UPDATE notification_outbox SET state = 'sent', sent_at = CURRENT_TIMESTAMP
+                WHERE notification_id = ? AND request_id IN (
+                    SELECT request_id FROM notification_outbox WHERE state = 'pending')
+            ''', [(row[-1],) for row in retry]).rowcount
+            self.conn.executemany('''
+                UPDATE notification_outbox
+                SET state = 'pending', attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                WHERE notification_id = ? AND state = 'sending'
+            ''', retry)
+            self.conn.executemany('''
+                UPDATE notification_outbox SET state = 'failed', attempts = attempts + 1, last_error = ?
+                WHERE notification_id = ?
+            ''', failed)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        stats.update(notifications=len(sent) + superseded, retried=len(retry) - superseded, failed=len(failed))
+        return stats
+
+    def run(self, stop=None, interval=NOTIFY_INTERVAL, on_batch=None):
+        """Dispatch until ``stop`` (a ``threading.Event``) is set; full batches are followed at once
+
+        A batch that fails is logged and the loop carries on after ``interval``.
+        """
+        stop = stop or threading.Event()
+        try:
+            while not stop.is_set():
+                try:
+                    stats = self.dispatch_once()
+                except Exception:
+                    # The batch's rows stay leased and are claimed again once the lease lapses
+                    logger.exception('Notification batch failed')
+                    stop.wait(interval)
+                    continue
+                if on_batch and any(stats.values()):
+                    on_batch(stats)
+                if not any(stats.values()):
+                    self.mailer.close_if_idle()
+                    stop.wait(interval)
+        finally:
+            self.mailer.close()
+
+
+def outbox_counts(conn):
+    """Number of outbox rows per state"""
+    return dict(conn.execute('SELECT state, COUNT(*) FROM notification_outbox GROUP BY state'))
+
+
+def purge_outbox(conn, days):
+    """Delete sent and failed rows queued more than ``days`` days ago; returns the count"""
+    return conn.execute('''
+        DELETE FROM notification_outbox
+        WHERE state IN ('sent', 'failed') AND queued_at < ?
+    ''', (time.time() - days * 86400,)).rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send queued leave decision emails')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--once', action='store_true', help='send what is due, then exit')
+    parser.add_argument('--status', action='store_true', help='print outbox rows per state and exit')
+    parser.add_argument('--purge', type=float, metavar='DAYS',
+                        help='delete sent and failed notifications older than DAYS, then exit')
+    parser.add_argument('--smtp-host', default=SMTP_HOST)
+    parser.add_argument('--smtp-port', type=int, default=SMTP_PORT)
+    args = parser.parse_args()
+
+    from database import DB_PATH
+    from migrations import run_migrations
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        run_migrations(conn)
+        if args.status or args.purge is not None:
+            if args.purge is not None:
+                with conn:
+                    print(f'Purged {purge_outbox(conn, args.purge):,} notifications')
+            print(outbox_counts(conn) or 'Outbox is empty')
+            return
+
+        mailer = SMTPMailer(args.smtp_host, args.smtp_port)
+        dispatcher = Dispatcher(conn, mailer)
+
+        def report(stats):
+            print(f"{stats['messages']} messages for {stats['notifications']} notifications, "
+                  f"{stats['retried']} to retry, {stats['failed']} failed", flush=True)
+
+        if args.once:
+            while True:
+                stats = dispatcher.dispatch_once()
+                if not any(stats.values()):
+                    break
+                report(stats)
+            mailer.close()
+        else:
+            print(f'Dispatching to {args.smtp_host}:{args.smtp_port} every {NOTIFY_INTERVAL:g}s')
+            try:
+                dispatcher.run(on_batch=report)
+            except KeyboardInterrupt:
+                pass
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Overlapping-leave detection backed by an interval index.
+
+A leave request blocks the employee's calendar while it is ``Pending`` or
+``Approved``. ``idx_leave_requests_active_span`` is a partial index on
+``(emp_id, end_date, start_date)`` covering only those rows, so SQLite keeps
+it in sync with ``leave_requests`` itself (a request that is rejected drops
+out of it). An overlap probe for ``[start, end]`` seeks to
+``(emp_id, end_date >= start)`` and reads index entries only, which costs
+O(log n) plus the employee's active leaves ending after ``start``, i.e. it
+does not grow with the length of their history.
+
+:func:`find_overlaps_bulk` validates a whole import in one pass: the batch is
+sorted and swept for overlaps within itself, then loaded into a temp table
+and joined against the index in a single query.
+
+Run ``python overlaps.py --audit`` to list existing overlapping requests, or
+``python overlaps.py --check-csv import.csv`` to validate a file of
+``emp_id,start_date,end_date`` rows before importing it.
+"""
+import argparse
+import csv
+import sqlite3
+
+# Must match the WHERE of the partial index literally for SQLite to use it
+ACTIVE_CLAUSE = "status IN ('Pending', 'Approved')"
+
+
+def install_overlap_index(conn):
+    """Create the partial interval index over active leave requests"""
+    conn.execute(f'''CREATE INDEX IF NOT EXISTS idx_leave_requests_active_span
+                     ON leave_requests (emp_id, end_date, start_date)
+                     WHERE {ACTIVE_CLAUSE}''')
+    conn.execute('ANALYZE leave_requests')
+
+
+def find_overlap(conn, emp_id, start_date, end_date, id_column='request_id', exclude_id=None):
+    """First active request of ``emp_id`` overlapping ``[start_date, end_date]``
+
+    Returns ``(id, start_date, end_date, status)`` or ``None``. Dates may be
+    ``date`` objects or ISO strings; ``exclude_id`` skips one request (when
+    re-validating an existing one).
+    """
+    row = conn.execute(f'''
+        SELECT {id_column}, start_date, end_date, status FROM leave_requests
+        WHERE emp_id = ? AND {ACTIVE_CLAUSE}
+          AND end_date >= ? AND start_date <= ? AND {id_column} IS NOT ?
+        ORDER BY end_date
+        LIMIT 1
+    ''', (emp_id, str(start_date), str(end_date), exclude_id)).fetchone()
+    return tuple(row) if row else None
+
+
+def describe_overlap(overlap):
+    """Human-readable message for a :func:`find_overlap` result"""
+    request_id, start_date, end_date, status = overlap
+    return (f'Overlaps your {status.lower()} request #{request_id} '
+            f'({start_date} to {end_date})')
+
+
+def find_overlaps_bulk(conn, requests, id_column='request_id'):
+    """Validate many ``(key, emp_id, start_date, end_date)`` requests in one pass
+
+    Returns ``{key: [conflict, ...]}`` for the requests that overlap, where a
+    conflict is ``('existing', id)`` for an active request already in the
+    database or ``('batch', other_key)`` for another request of the batch.
+    Requests without conflicts are absent from the result.
+    """
+    requests = [(key, emp_id, str(start), str(end)) for key, emp_id, start, end in requests]
+    conflicts = {}
+
+    # Within the batch: sort by employee and start, track the furthest end so far
+    ordered = sorted(requests, key=lambda item: (item[1], item[2], item[3]))
+    reach = None  # (emp_id, end_date, key) of the interval reaching furthest
+    for key, emp_id, start, end in ordered:
+        if reach is not None and reach[0] == emp_id and reach[1] >= start:
+            conflicts.setdefault(key, []).append(('batch', reach[2]))
+            conflicts.setdefault(reach[2], []).append(('batch', key))
+        if reach is None or reach[0] != emp_id or end > reach[1]:
+            reach = (emp_id, end, key)
+
+    # Against the database: one indexed probe per row, all in one statement
+    conn.execute('''CREATE TEMP TABLE IF NOT EXISTS overlap_check
+                    (key INTEGER PRIMARY KEY, emp_id, start_date TEXT, end_date TEXT)''')
+    conn.execute('DELETE FROM temp.overlap_check')
+    keys = [key for key, *_ in requests]
+    conn.executemany('INSERT INTO temp.overlap_check VALUES (?, ?, ?, ?)',
+                     ((index, emp_id, start, end)
+                      for index, (_, emp_id, start, end) in enumerate(requests)))
+    rows = conn.execute(f'''
+        SELECT t.key, lr.{id_column}
+        FROM temp.overlap_check t
+        JOIN leave_requests lr INDEXED BY idx_leave_requests_active_span
+          ON lr.emp_id = t.emp_id AND lr.end_date >= t.start_date
+         AND lr.start_date <= t.end_date AND lr.{ACTIVE_CLAUSE}
+    ''')
+    for index, request_id in rows:
+        conflicts.setdefault(keys[index], []).append(('existing', request_id))
+    conn.execute('DELETE FROM temp.overlap_check')
+    return conflicts
+
+
+def audit_overlaps(conn, id_column='request_id', limit=None):
+    """Active requests that overlap an earlier active request of the same employee
+
+    Yields ``(emp_id, id, start_date, end_date, previous_end)`` in one ordered
+    pass using a running maximum of ``end_date`` per employee.
+    """
+    sql = f'''
+        SELECT emp_id, {id_column}, start_date, end_date, previous_end FROM (
+            SELECT emp_id, {id_column}, start_date, end_date,
+                   MAX(end_date) OVER (
+                       PARTITION BY emp_id ORDER BY start_date, {id_column}
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) AS previous_end
+            FROM leave_requests
+            WHERE {ACTIVE_CLAUSE}
+        )
+        WHERE previous_end >= start_date
+        ORDER BY emp_id, start_date
+    '''
+    if limit is not None:
+        sql += f' LIMIT {int(limit)}'
+    return conn.execute(sql)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find overlapping active leave requests')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--audit', action='store_true', help='list existing overlapping requests')
+    parser.add_argument('--check-csv', metavar='FILE',
+                        help='validate emp_id,start_date,end_date rows (with header) against the database')
+    parser.add_argument('--limit', type=int, default=50, help='rows to print')
+    args = parser.parse_args()
+
+    from database import DB_PATH, configure_connection
+    from schema import REQUEST_ID_COLUMN, detect_flavor
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        id_column = REQUEST_ID_COLUMN[detect_flavor(conn) or 'leave_management']
+        if args.audit:
+            count = 0
+            for emp_id, request_id, start_date, end_date, previous_end in audit_overlaps(conn, id_column):
+                if count < args.limit:
+                    print(f'employee {emp_id}: request #{request_id} {start_date}..{end_date} '
+                          f'starts before an earlier leave ends ({previous_end})')
+                count += 1
+            print(f'{count} overlapping active requests')
+        if args.check_csv:
+            with open(args.check_csv, newline='') as handle:
+                rows = [(line_number, row['emp_id'], row['start_date'], row['end_date'])
+                        for line_number, row in enumerate(csv.DictReader(handle), start=2)]
+            conflicts = find_overlaps_bulk(conn, rows, id_column)
+            for line_number in sorted(conflicts)[:args.limit]:
+                described = ', '.join(f'line {other}' if kind == 'batch' else f'request #{other}'
+                                      for kind, other in conflicts[line_number])
+                print(f'line {line_number}: overlaps {described}')
+            print(f'{len(conflicts)} of {len(rows)} rows overlap')
+            if conflicts:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Salted, parameterized password hashing with a bounded verification pool.
+
+New hashes use scrypt (or PBKDF2-SHA256) from ``hashlib`` and are stored as
+self-describing strings, so the cost parameters can be raised later without
+a migration::
+
+    scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+    pbkdf2_sha256$<iterations>$<salt b64>$<hash b64>
+
+The unsalted digests written by earlier versions (hex SHA-256 from
+``leave_management.py``, hex MD5 from ``app.py``) are still accepted;
+:func:`verify_password` reports them as needing a rehash so the login path
+can replace them transparently.
+
+A slow KDF on the Streamlit script thread would let a login spike starve
+every other session of CPU. :func:`verify_in_pool` therefore runs
+verification on a small fixed thread pool (``hashlib``'s KDFs release the
+GIL) and caps how many logins may wait for it; beyond that it raises
+:class:`HashingBusy` instead of queueing without bound.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Configuration (overridable through the environment)
+SCHEME = os.environ.get('LEAVE_PASSWORD_SCHEME', 'scrypt')
+SCRYPT_N = int(os.environ.get('LEAVE_SCRYPT_N', str(2 ** 15)))
+SCRYPT_R = int(os.environ.get('LEAVE_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('LEAVE_SCRYPT_P', '1'))
+PBKDF2_ITERATIONS = int(os.environ.get('LEAVE_PBKDF2_ITERATIONS', '600000'))
+HASH_WORKERS = int(os.environ.get('LEAVE_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.environ.get('LEAVE_HASH_QUEUE_LIMIT', '64'))
+HASH_TIMEOUT = float(os.environ.get('LEAVE_HASH_TIMEOUT', '30'))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+class HashingBusy(Exception):
+    """Raised when too many password verifications are already waiting, or one times out"""
+
+
+def _b64(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _unb64(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # maxmem must cover 128 * n * r bytes; leave headroom for the p lanes
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * max(p, 1), dklen=KEY_BYTES)
+
+
+def _pbkdf2(password, salt, iterations):
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=KEY_BYTES)
+
+
+def hash_password(password, scheme=None):
+    """Hash ``password`` with a fresh salt using ``scheme`` (default ``SCHEME``)"""
+    scheme = scheme or SCHEME
+    salt = secrets.token_bytes(SALT_BYTES)
+    if scheme == 'scrypt':
+        key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+    if scheme == 'pbkdf2_sha256':
+        key = _pbkdf2(password, salt, PBKDF2_ITERATIONS)
+        return f'pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64(salt)}${_b64(key)}'
+    raise ValueError(f'Unknown password scheme {scheme!r}')
+
+
+def identify(stored):
+    """Name the scheme of a stored hash: scrypt, pbkdf2_sha256, sha256, md5 or None"""
+    if not stored:
+        return None
+    if '$' in stored:
+        scheme = stored.split('$', 1)[0]
+        return scheme if scheme in ('scrypt', 'pbkdf2_sha256') else None
+    if len(stored) == 64:
+        return 'sha256'
+    if len(stored) == 32:
+        return 'md5'
+    return None
+
+
+def needs_rehash(stored):
+    """True if ``stored`` is a legacy digest or uses other than the current parameters"""
+    scheme = identify(stored)
+    if scheme != SCHEME:
+        return True
+    fields = stored.split('$')
+    if scheme == 'scrypt':
+        return (int(fields[1]), int(fields[2]), int(fields[3])) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return int(fields[1]) != PBKDF2_ITERATIONS
+
+
+def verify_password(password, stored):
+    """Check ``password`` against ``stored``; returns ``(matches, needs_rehash)``
+
+    Runs on the calling thread; interactive callers should use :func:`verify_in_pool`.
+    """
+    scheme = identify(stored)
+    try:
+        if scheme == 'scrypt':
+            _, n, r, p, salt, key = stored.split('$')
+            candidate = _scrypt(password, _unb64(salt), int(n), int(r), int(p))
+        elif scheme == 'pbkdf2_sha256':
+            _, iterations, salt, key = stored.split('$')
+            candidate = _pbkdf2(password, _unb64(salt), int(iterations))
+        elif scheme in ('sha256', 'md5'):
+            # Spend a KDF's time too: a fast answer would tell legacy accounts
+            # from unknown ones, which are checked against the dummy hash
+            verify_password(password, dummy_hash())
+            digest = hashlib.new(scheme, password.encode()).hexdigest()
+            return hmac.compare_digest(digest, stored.lower()), True
+        else:
+            return False, False
+    except ValueError:
+        # Malformed stored hash
+        return False, False
+    matches = hmac.compare_digest(candidate, _unb64(key))
+    return matches, matches and needs_rehash(stored)
+
+
+# Hash of a random password, verified when the user does not exist (and
+# alongside legacy digests) so that every account takes the same time to reject
+_DUMMY_HASH = None
+_dummy_lock = threading.Lock()
+
+
+def dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        with _dummy_lock:
+            if _DUMMY_HASH is None:
+                _DUMMY_HASH = hash_password(secrets.token_urlsafe(16))
+    return _DUMMY_HASH
+
+
+class VerificationPool:
+    """Fixed-size thread pool for password hashing with a cap on waiting callers"""
+
+    def __init__(self, workers=HASH_WORKERS, queue_limit=HASH_QUEUE_LIMIT, timeout=HASH_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._admission = threading.BoundedSemaphore(workers + queue_limit)
+
+    def submit(self, function, *args):
+        """Run ``function(*args)`` on the pool and wait for its result
+
+        Raises :class:`HashingBusy` when no slot frees up or the result does
+        not arrive within ``timeout``. A slot is held until its hash finishes,
+        even when the caller has stopped waiting for it.
+        """
+        if not self._admission.acquire(timeout=self.timeout):
+            raise HashingBusy('Too many logins in progress, please retry')
+        try:
+            future = self._executor.submit(function, *args)
+        except BaseException:
+            self._admission.release()
+            raise
+        future.add_done_callback(lambda _: self._admission.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusy('Password check timed out, please retry') from None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide verification pool, created on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = VerificationPool()
+    return _pool
+
+
+def set_pool(pool):
+    """Replace the process-wide pool (benchmarks, tuning); returns the old one"""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, pool
+    return old
+
+
+def verify_in_pool(password, stored):
+    """:func:`verify_password` on the bounded pool; ``stored=None`` burns equal time and fails"""
+    if stored is None:
+        get_pool().submit(verify_password, password, dummy_hash())
+        return False, False
+    return get_pool().submit(verify_password, password, stored)
+
+
+def hash_in_pool(password):
+    """:func:`hash_password` on the bounded pool"""
+    return get_pool().submit(hash_password, password)
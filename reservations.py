@@ -0,0 +1,100 @@
+"""Leave days reserved by pending requests.
+
+A pending request holds its days against the employee's balance until it is
+decided, so the bookable balance is ``total_leaves - used_leaves -
+reserved_leaves``. ``employees.reserved_leaves`` is the sum of ``days`` over
+the employee's ``Pending`` requests; SQLite triggers on ``leave_requests``
+keep it exact for every write path (apply, single and bulk decisions,
+edits, deletes), in the same transaction as the change.
+
+Balance checks must read it inside the ``BEGIN IMMEDIATE`` transaction that
+inserts the request (see :func:`database.write_transaction`), which makes
+check-and-reserve atomic across threads and processes.
+
+Rebuild the column from scratch with::
+
+    python reservations.py --rebuild
+"""
+import argparse
+import sqlite3
+
+import database
+from database import configure_connection, execute_script
+
+RESERVATION_TRIGGERS = '''
+    CREATE TRIGGER IF NOT EXISTS trg_reserved_leaves_insert
+    AFTER INSERT ON leave_requests
+    WHEN NEW.status = 'Pending'
+    BEGIN
+        UPDATE employees SET reserved_leaves = reserved_leaves + NEW.days
+        WHERE emp_id = NEW.emp_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_reserved_leaves_delete
+    AFTER DELETE ON leave_requests
+    WHEN OLD.status = 'Pending'
+    BEGIN
+        UPDATE employees SET reserved_leaves = reserved_leaves - OLD.days
+        WHERE emp_id = OLD.emp_id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_reserved_leaves_update
+    AFTER UPDATE OF status, days, emp_id ON leave_requests
+    WHEN OLD.status = 'Pending' OR NEW.status = 'Pending'
+    BEGIN
+        UPDATE employees SET reserved_leaves = reserved_leaves - OLD.days
+        WHERE emp_id = OLD.emp_id AND OLD.status = 'Pending';
+        UPDATE employees SET reserved_leaves = reserved_leaves + NEW.days
+        WHERE emp_id = NEW.emp_id AND NEW.status = 'Pending';
+    END;
+'''
+
+
+def rebuild_reservations(conn):
+    """Recompute ``reserved_leaves`` from the pending requests"""
+    conn.execute('''
+        UPDATE employees SET reserved_leaves = COALESCE((
+            SELECT SUM(days) FROM leave_requests lr
+            WHERE lr.emp_id = employees.emp_id AND lr.status = 'Pending'), 0)
+    ''')
+
+
+def install_reservations(conn):
+    """Add ``employees.reserved_leaves``, its triggers, and fill it"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(employees)')}
+    if 'reserved_leaves' not in columns:
+        conn.execute('ALTER TABLE employees ADD COLUMN reserved_leaves INTEGER NOT NULL DEFAULT 0')
+    execute_script(conn, RESERVATION_TRIGGERS)
+    rebuild_reservations(conn)
+
+
+def overcommitted(conn):
+    """``(emp_id, total, used, reserved)`` of employees whose bookings exceed their allowance"""
+    return conn.execute('''
+        SELECT emp_id, total_leaves, used_leaves, reserved_leaves FROM employees
+        WHERE total_leaves - used_leaves - reserved_leaves < 0
+    ''').fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check or rebuild reserved leave days')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--rebuild', action='store_true', help='recompute reserved_leaves')
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        if args.rebuild:
+            with conn:
+                rebuild_reservations(conn)
+            print('Reserved leave days rebuilt')
+        rows = overcommitted(conn)
+        for emp_id, total, used, reserved in rows[:50]:
+            print(f'employee {emp_id}: {used} used + {reserved} reserved > {total} allowed')
+        print(f'{len(rows)} over-committed employees')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
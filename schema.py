@@ -0,0 +1,127 @@
+"""Base table definitions for the canonical schema and the two legacy flavours.
+
+``leave_management.py`` and ``app.py`` were written against different
+schemas for the same file: the former keys employees by an INTEGER
+``emp_id`` with a ``role`` column, the latter by a TEXT ``emp_id`` with a
+surrogate ``id`` and a ``position`` column. Both front-ends now create and
+use the ``CANONICAL`` schema, which both can read: ``emp_id`` has NUMERIC
+affinity, so numeric keys are stored as integers and keys such as
+``EMP001`` as text in the same column, requests are keyed by ``request_id``,
+and employees have both a ``role`` and a ``position``. Databases of either
+legacy flavour are converted in place by ``storage.py`` (migration 12).
+Keeping the DDL here lets tools such as the data generator create any
+flavour without importing Streamlit.
+"""
+
+LEAVE_MANAGEMENT = 'leave_management'
+APP = 'app'
+CANONICAL = 'canonical'
+
+TABLES = {
+    LEAVE_MANAGEMENT: (
+        '''
+        CREATE TABLE IF NOT EXISTS employees (
+            emp_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            department TEXT NOT NULL,
+            role TEXT NOT NULL,
+            total_leaves INTEGER DEFAULT 20,
+            used_leaves INTEGER DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS leave_requests (
+            request_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            emp_id INTEGER NOT NULL,
+            leave_type TEXT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            days INTEGER NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'Pending',
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            approved_by INTEGER,
+            approved_date TIMESTAMP,
+            FOREIGN KEY (emp_id) REFERENCES employees(emp_id)
+        )
+        ''',
+    ),
+    APP: (
+        '''CREATE TABLE IF NOT EXISTS employees
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            emp_id TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL,
+            department TEXT NOT NULL,
+            position TEXT NOT NULL,
+            password TEXT NOT NULL,
+            total_leaves INTEGER DEFAULT 20,
+            used_leaves INTEGER DEFAULT 0)''',
+        '''CREATE TABLE IF NOT EXISTS leave_requests
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            emp_id TEXT NOT NULL,
+            leave_type TEXT NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            days INTEGER NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'Pending',
+            applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            approved_by TEXT,
+            approved_date TIMESTAMP,
+            FOREIGN KEY (emp_id) REFERENCES employees(emp_id))''',
+    ),
+}
+
+TABLES[CANONICAL] = (
+    '''
+    CREATE TABLE IF NOT EXISTS employees (
+        emp_id NUMERIC PRIMARY KEY NOT NULL,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        department TEXT NOT NULL,
+        role TEXT NOT NULL DEFAULT 'Employee',
+        position TEXT NOT NULL DEFAULT '',
+        total_leaves INTEGER DEFAULT 20,
+        used_leaves INTEGER DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS leave_requests (
+        request_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        emp_id NUMERIC NOT NULL,
+        leave_type TEXT NOT NULL,
+        start_date DATE NOT NULL,
+        end_date DATE NOT NULL,
+        days INTEGER NOT NULL,
+        reason TEXT,
+        status TEXT DEFAULT 'Pending',
+        applied_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        approved_by NUMERIC,
+        approved_date TIMESTAMP,
+        FOREIGN KEY (emp_id) REFERENCES employees(emp_id)
+    )
+    ''',
+)
+
+# Name of the leave request primary key column in each flavour
+REQUEST_ID_COLUMN = {LEAVE_MANAGEMENT: 'request_id', APP: 'id', CANONICAL: 'request_id'}
+
+
+def create_tables(conn, flavor):
+    """Create the base tables of ``flavor`` if they do not exist yet"""
+    for statement in TABLES[flavor]:
+        conn.execute(statement)
+
+
+def detect_flavor(conn):
+    """Return the flavour of an existing database, or ``None`` if it has no tables"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(employees)')}
+    if not columns:
+        return None
+    if 'role' in columns and 'position' in columns:
+        return CANONICAL
+    return LEAVE_MANAGEMENT if 'role' in columns else APP
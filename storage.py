@@ -0,0 +1,300 @@
+"""Canonical storage shared by both front-ends, and the in-place conversion to it.
+
+``app.py`` and ``leave_management.py`` used to create incompatible tables in
+the same file (see ``schema``), so whichever front-end started first decided
+the schema and the other one failed on it. Both now create the ``CANONICAL``
+tables, and :func:`convert_to_canonical` (migration 12) turns a database of
+either legacy flavour into them in place:
+
+* ``app.py`` databases: ``leave_requests.id`` is renamed to ``request_id``
+  first, with ``ALTER TABLE ... RENAME COLUMN`` so SQLite rewrites every
+  trigger and index that refers to it; the surrogate ``employees.id`` goes
+  and ``emp_id`` becomes the primary key; employees with direct reports (and
+  ``ADMIN``) get the ``Manager`` role
+* ``leave_management.py`` databases: ``position`` starts as the ``role``
+* every table with an employee key column (``emp_id``, ``manager_id``,
+  ``approved_by``, ``approver_id``) gets NUMERIC affinity for it, so ``1001``
+  and ``'1001'`` are the same key while ``EMP001`` stays text
+
+It is one pass over the data: each table that changes is copied once into
+its new definition, ``CHUNK_SIZE`` rows at a time in rowid order, with every
+change applied by the copying ``SELECT``; then it replaces the old table and
+gets its indexes back. Triggers are dropped for the copy (nothing fires
+twice) and recreated from their stored SQL at the end. All of it runs in the
+migration's transaction, so a failure leaves the legacy database as it was.
+
+Both front-ends reach the tables through ``leave_service``, which unpacks
+employee rows by position: :data:`EMPLOYEE_COLUMNS` is its projection of
+``employees`` in the order it was written against, and :func:`employee_key`
+turns an id typed into a form, URL or command line into a key. Convert or
+check a database with::
+
+    python storage.py --db leave_management.db          # convert if legacy
+    python storage.py --db leave_management.db --check  # compare with a new canonical database
+"""
+import argparse
+import os
+import re
+import sqlite3
+
+import database
+from database import configure_connection
+from schema import APP, CANONICAL, LEAVE_MANAGEMENT, TABLES, create_tables, detect_flavor
+
+# Migration that converts legacy databases (see migrations.MIGRATIONS)
+CANONICAL_VERSION = 12
+CHUNK_SIZE = int(os.environ.get('LEAVE_STORAGE_CHUNK', '20000'))
+# Columns holding an employee key, whatever table they are in
+EMPLOYEE_KEY_COLUMNS = ('emp_id', 'manager_id', 'approved_by', 'approver_id')
+
+# The service layer's projection of employees, in the column order it unpacks
+EMPLOYEE_COLUMNS = {
+    LEAVE_MANAGEMENT: 'emp_id, name, email, department, role, total_leaves, used_leaves, password',
+}
+
+# Values of the canonical employee columns a legacy flavour does not have
+DERIVED_EMPLOYEE_COLUMNS = {
+    APP: {'role': '''CASE WHEN emp_id = 'ADMIN' OR EXISTS (
+                         SELECT 1 FROM employees reports WHERE reports.manager_id = employees.emp_id)
+                     THEN 'Manager' ELSE 'Employee' END'''},
+    LEAVE_MANAGEMENT: {'position': 'role'},
+}
+
+_CONSTRAINT = re.compile(r'(CONSTRAINT|PRIMARY|UNIQUE|CHECK|FOREIGN)\b', re.IGNORECASE)
+_KEY_TYPE = re.compile(r'^("?\w+"?\s+)(INTEGER|TEXT)\b', re.IGNORECASE)
+
+
+def employee_key(value):
+    """The employee key for an id given as text: digits are a number, anything else (``EMP001``) text"""
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value
+
+
+def split_definitions(create_sql):
+    """Split a ``CREATE TABLE`` statement into its column and constraint definitions and what follows them"""
+    start = create_sql.index('(')
+    definitions, depth, quote, current = [], 0, None, start + 1
+    for position in range(start, len(create_sql)):
+        char = create_sql[position]
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                definitions.append(create_sql[current:position].strip())
+                return definitions, create_sql[position + 1:].strip()
+        elif char == ',' and depth == 1:
+            definitions.append(create_sql[current:position].strip())
+            current = position + 1
+    raise ValueError('Unbalanced parentheses in table definition')
+
+
+def _column_name(definition):
+    """Column defined by ``definition``, or None for a table constraint"""
+    if _CONSTRAINT.match(definition):
+        return None
+    return definition.split()[0].strip('"`[]')
+
+
+def _retype(definition):
+    """``definition`` with NUMERIC affinity if it is an INTEGER or TEXT employee key column"""
+    if _column_name(definition) in EMPLOYEE_KEY_COLUMNS:
+        return _KEY_TYPE.sub(r'\1NUMERIC', definition)
+    return definition
+
+
+def _declared_types(conn, table):
+    return {row[1]: row[2].upper() for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _tables(conn):
+    return [row[0] for row in conn.execute('''
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'
+        ORDER BY rowid
+    ''')]
+
+
+def plan_conversion(conn, flavor):
+    """``{table: (definitions, tail, columns, expressions)}`` for every table the conversion rebuilds
+
+    ``definitions`` are the new table's column and constraint definitions,
+    ``tail`` the table options after them, and ``expressions`` the ``SELECT``
+    list filling its ``columns`` from the old table.
+    """
+    plan = {}
+    for table in _tables(conn):
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        old, tail = split_definitions(sql)
+        types = _declared_types(conn, table)
+        if table in ('employees', 'leave_requests'):
+            index = 0 if table == 'employees' else 1
+            new = split_definitions(TABLES[CANONICAL][index])[0]
+            base = {_column_name(d) for d in split_definitions(TABLES[flavor][index])[0] + new}
+            # Canonical base columns, then the columns later migrations added
+            new += [_retype(d) for d in old if _column_name(d) and _column_name(d) not in base]
+        elif any(types.get(column) in ('INTEGER', 'TEXT') for column in EMPLOYEE_KEY_COLUMNS):
+            new = [_retype(d) for d in old]
+        else:
+            continue
+        # Column definitions first, then the table constraints
+        new = [d for d in new if _column_name(d)] + [d for d in new if not _column_name(d)]
+        columns = [_column_name(d) for d in new if _column_name(d)]
+        derived = DERIVED_EMPLOYEE_COLUMNS[flavor] if table == 'employees' else {}
+        plan[table] = (new, tail, columns, [derived.get(column, column) for column in columns])
+    return plan
+
+
+def _copy(conn, source, target, columns, expressions, without_rowid, chunk_size):
+    """Copy ``source`` into ``target`` in rowid ranges of ``chunk_size`` rows; returns the rows copied"""
+    insert = f'INSERT INTO {target} ({", ".join(columns)}) SELECT {", ".join(expressions)} FROM {source}'
+    if without_rowid:
+        return conn.execute(insert).rowcount
+    copied = 0
+    low = conn.execute(f'SELECT MIN(rowid) - 1 FROM {source}').fetchone()[0]
+    while low is not None:
+        high = conn.execute(f'SELECT rowid FROM {source} WHERE rowid > ? ORDER BY rowid LIMIT 1 OFFSET ?',
+                            (low, chunk_size - 1)).fetchone()
+        if high is None:
+            copied += conn.execute(f'{insert} WHERE rowid > ?', (low,)).rowcount
+            break
+        copied += conn.execute(f'{insert} WHERE rowid > ? AND rowid <= ?', (low, high[0])).rowcount
+        low = high[0]
+    return copied
+
+
+def check_unique_emails(conn):
+    """Raise ValueError if two employees share an email (the canonical schema requires unique emails)"""
+    duplicates = [row[0] for row in conn.execute('''
+        SELECT email FROM employees GROUP BY email HAVING COUNT(*) > 1 ORDER BY email LIMIT 5
+    ''')]
+    if duplicates:
+        raise ValueError(f'Employees share an email, fix them before converting: {", ".join(duplicates)}')
+
+
+def convert_to_canonical(conn, chunk_size=CHUNK_SIZE):
+    """Convert a legacy database to the canonical schema in the caller's transaction
+
+    Returns ``{table: rows copied}`` (empty when there was nothing to convert).
+    """
+    flavor = detect_flavor(conn)
+    if flavor in (None, CANONICAL):
+        return {}
+    check_unique_emails(conn)
+    if flavor == APP:
+        conn.execute('ALTER TABLE leave_requests RENAME COLUMN id TO request_id')
+
+    # Triggers and views refer to the tables being replaced: set them aside
+    dependents = conn.execute('''
+        SELECT type, name, sql FROM sqlite_master WHERE type IN ('trigger', 'view') ORDER BY rowid
+    ''').fetchall()
+    for kind, name, _ in dependents:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    sequences = dict(conn.execute('SELECT name, seq FROM sqlite_sequence').fetchall()) if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone() else {}
+
+    copied = {}
+    for table, (definitions, tail, columns, expressions) in plan_conversion(conn, flavor).items():
+        indexes = [row[0] for row in conn.execute('''
+            SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL
+        ''', (table,))]
+        staging = f'{table}__canonical'
+        body = ',\n    '.join(definitions)
+        conn.execute(f'CREATE TABLE {staging} (\n    {body}\n){" " + tail if tail else ""}')
+        copied[table] = _copy(conn, table, staging, columns, expressions,
+                              'WITHOUT ROWID' in tail.upper(), chunk_size)
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {staging} RENAME TO {table}')
+        for sql in indexes:
+            conn.execute(sql)
+
+    # AUTOINCREMENT never reuses an id, even of a row deleted before the copy (the
+    # surrogate employees.id of app.py databases is gone and keeps no sequence)
+    for table, seq in sequences.items():
+        autoincrement = conn.execute('''
+            SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ? AND sql LIKE '%AUTOINCREMENT%'
+        ''', (table,)).fetchone()
+        if not autoincrement:
+            continue
+        if not conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (seq, table)).rowcount:
+            conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, seq))
+    for _, _, sql in dependents:
+        conn.execute(sql)
+    conn.execute('ANALYZE')
+    return copied
+
+
+def install_canonical_storage(conn):
+    """Migration: convert a legacy database to the canonical schema"""
+    convert_to_canonical(conn)
+
+
+def describe_tables(conn):
+    """``{table: [(column, declared type, not null, primary key)]}``, to compare schemas"""
+    return {table: [(row[1], row[2].upper(), row[3], row[5]) for row in conn.execute(f'PRAGMA table_info({table})')]
+            for table in _tables(conn)}
+
+
+def _dependents(conn):
+    return {row for row in conn.execute('''
+        SELECT type, name FROM sqlite_master WHERE type IN ('index', 'trigger', 'view') AND name NOT LIKE 'sqlite_%'
+    ''')}
+
+
+def check_storage(conn):
+    """Differences between the tables, indexes and triggers of ``conn`` and those of a new canonical database"""
+    from migrations import run_migrations
+
+    reference = sqlite3.connect(':memory:')
+    try:
+        create_tables(reference, CANONICAL)
+        reference.commit()
+        run_migrations(reference)
+        expected, expected_dependents = describe_tables(reference), _dependents(reference)
+    finally:
+        reference.close()
+    actual = describe_tables(conn)
+    problems = [f'{table}: missing' for table in expected if table not in actual]
+    for table, columns in actual.items():
+        if table not in expected:
+            problems.append(f'{table}: not in a new database')
+        elif sorted(columns) != sorted(expected[table]):
+            differ = sorted(set(columns) ^ set(expected[table]))
+            problems.append(f'{table}: columns differ: {differ}')
+    dependents = _dependents(conn)
+    problems += [f'{kind} {name}: missing' for kind, name in sorted(expected_dependents - dependents)]
+    problems += [f'{kind} {name}: not in a new database' for kind, name in sorted(dependents - expected_dependents)]
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a leave database to the canonical schema')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--check', action='store_true', help='fail if the schema differs from a new database')
+    args = parser.parse_args()
+
+    from migrations import get_schema_version, run_migrations
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        flavor = detect_flavor(conn)
+        applied = run_migrations(conn)
+        print(f'{flavor or "empty"} database, now at version {get_schema_version(conn)} '
+              f'(applied: {applied or "none"})')
+        if args.check:
+            problems = check_storage(conn)
+            for problem in problems:
+                print(f'FAIL {problem}')
+            if problems:
+                raise SystemExit(1)
+            print('Tables, indexes and triggers match a new canonical database')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
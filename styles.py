@@ -0,0 +1,243 @@
+"""Page styles of the two front-ends.
+
+Streamlit runs the page script from the top on every rerun, and each run has
+to send the ``<style>`` element again or the styling is dropped. The style
+sheets therefore live here, in an imported module: they are minified once per
+process by :func:`style_tag`, and a rerun only passes the finished string on.
+
+No web fonts are fetched: ``app.py`` asks for Inter and falls back to the
+platform's UI font, so a first paint never waits on a third-party font
+server (nor fails without internet access).
+"""
+import re
+
+APP_CSS = """
+    * {
+        font-family: Inter, system-ui, -apple-system, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif;
+    }
+
+    .main {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        padding: 2rem;
+    }
+
+    .stApp {
+        background: transparent;
+    }
+
+    .block-container {
+        background: rgba(255, 255, 255, 0.95);
+        border-radius: 20px;
+        padding: 2rem;
+        box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
+        backdrop-filter: blur(10px);
+    }
+
+    h1 {
+        color: #667eea;
+        font-weight: 700;
+        text-align: center;
+        margin-bottom: 2rem;
+        font-size: 2.5rem;
+        text-shadow: 2px 2px 4px rgba(0, 0, 0, 0.1);
+    }
+
+    h2 {
+        color: #764ba2;
+        font-weight: 600;
+        margin-top: 2rem;
+        margin-bottom: 1rem;
+    }
+
+    h3 {
+        color: #667eea;
+        font-weight: 500;
+    }
+
+    .stButton>button {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white;
+        border: none;
+        border-radius: 10px;
+        padding: 0.75rem 2rem;
+        font-weight: 600;
+        transition: all 0.3s ease;
+        box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
+    }
+
+    .stButton>button:hover {
+        transform: translateY(-2px);
+        box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
+    }
+
+    .stTextInput>div>div>input, .stSelectbox>div>div>select, .stDateInput>div>div>input, .stTextArea>div>div>textarea {
+        border-radius: 10px;
+        border: 2px solid #e0e0e0;
+        padding: 0.75rem;
+        transition: all 0.3s ease;
+    }
+
+    .stTextInput>div>div>input:focus, .stSelectbox>div>div>select:focus, .stDateInput>div>div>input:focus, .stTextArea>div>div>textarea:focus {
+        border-color: #667eea;
+        box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
+    }
+
+    .metric-card {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        padding: 1.5rem;
+        border-radius: 15px;
+        color: white;
+        text-align: center;
+        box-shadow: 0 8px 20px rgba(102, 126, 234, 0.3);
+        margin-bottom: 1rem;
+        transition: transform 0.3s ease;
+    }
+
+    .metric-card:hover {
+        transform: translateY(-5px);
+    }
+
+    .metric-value {
+        font-size: 2.5rem;
+        font-weight: 700;
+        margin: 0.5rem 0;
+    }
+
+    .metric-label {
+        font-size: 0.9rem;
+        opacity: 0.9;
+        text-transform: uppercase;
+        letter-spacing: 1px;
+    }
+
+    .status-pending {
+        background: #fbbf24;
+        color: #78350f;
+        padding: 0.25rem 0.75rem;
+        border-radius: 20px;
+        font-weight: 600;
+        font-size: 0.85rem;
+    }
+
+    .status-approved {
+        background: #34d399;
+        color: #064e3b;
+        padding: 0.25rem 0.75rem;
+        border-radius: 20px;
+        font-weight: 600;
+        font-size: 0.85rem;
+    }
+
+    .status-rejected {
+        background: #f87171;
+        color: #7f1d1d;
+        padding: 0.25rem 0.75rem;
+        border-radius: 20px;
+        font-weight: 600;
+        font-size: 0.85rem;
+    }
+
+    .sidebar .sidebar-content {
+        background: linear-gradient(180deg, #667eea 0%, #764ba2 100%);
+    }
+
+    .stDataFrame {
+        border-radius: 10px;
+        overflow: hidden;
+    }
+
+    div[data-testid="stMetricValue"] {
+        font-size: 2rem;
+        font-weight: 700;
+        color: #667eea;
+    }
+
+    .success-message {
+        background: #d1fae5;
+        color: #065f46;
+        padding: 1rem;
+        border-radius: 10px;
+        border-left: 4px solid #10b981;
+        margin: 1rem 0;
+    }
+
+    .error-message {
+        background: #fee2e2;
+        color: #991b1b;
+        padding: 1rem;
+        border-radius: 10px;
+        border-left: 4px solid #ef4444;
+        margin: 1rem 0;
+    }
+
+    .info-card {
+        background: linear-gradient(135deg, #f0f9ff 0%, #e0f2fe 100%);
+        padding: 1.5rem;
+        border-radius: 15px;
+        border-left: 4px solid #0284c7;
+        margin: 1rem 0;
+    }
+"""
+
+LEAVE_MANAGEMENT_CSS = """
+    .main-header {
+        font-size: 2.5rem;
+        font-weight: bold;
+        color: #1f77b4;
+        text-align: center;
+        margin-bottom: 2rem;
+    }
+    .stat-card {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        padding: 1.5rem;
+        border-radius: 10px;
+        color: white;
+        text-align: center;
+        margin: 0.5rem 0;
+    }
+    .stat-value {
+        font-size: 2rem;
+        font-weight: bold;
+    }
+    .stat-label {
+        font-size: 0.9rem;
+        opacity: 0.9;
+    }
+    .status-pending {
+        background-color: #ffc107;
+        color: black;
+        padding: 0.3rem 0.8rem;
+        border-radius: 15px;
+        font-weight: bold;
+    }
+    .status-approved {
+        background-color: #28a745;
+        color: white;
+        padding: 0.3rem 0.8rem;
+        border-radius: 15px;
+        font-weight: bold;
+    }
+    .status-rejected {
+        background-color: #dc3545;
+        color: white;
+        padding: 0.3rem 0.8rem;
+        border-radius: 15px;
+        font-weight: bold;
+    }
+"""
+
+
+def minify_css(css):
+    """Drop comments and the whitespace around punctuation and between rules"""
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{}:;,>])\s*', r'\1', css).replace(';}', '}').strip()
+
+
+def style_tag(css):
+    """``<style>`` element for ``st.markdown(..., unsafe_allow_html=True)``"""
+    return f'<style>{minify_css(css)}</style>'
+
+
+APP_STYLE = style_tag(APP_CSS)
+LEAVE_MANAGEMENT_STYLE = style_tag(LEAVE_MANAGEMENT_CSS)
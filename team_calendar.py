@@ -0,0 +1,248 @@
+"""Team availability calendar backed by a vectorized occupancy matrix.
+
+For a department and date window, :func:`team_calendar` returns an
+employees x days ``int8`` matrix (0 = in, 1 = pending leave, 2 = approved
+leave; approved wins where both cover a day), the per-day headcount out and
+each person's leave as contiguous stripes. The matrix is built with NumPy:
+leave rows are mapped to matrix rows with ``searchsorted``, scattered into a
+difference array with ``np.add.at`` and integrated with ``cumsum``, so no
+Python loop runs per leave, per person or per day.
+
+Matrices are built and cached one calendar month per department. Every
+write that changes a request's dates or status calls
+:func:`invalidate_months` for the months it covers, which bumps those
+months' versions so only the affected months are rebuilt. Months of
+archived years are read from their archive (see ``archive``). Column names
+are shared by both database flavours, so either front-end can use it.
+"""
+import os
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+from archive import attach_archive, hot_exclusion, partition_sql, read_snapshot, routed_archives
+from cache import QueryCache
+from database import get_connection
+
+CALENDAR_CACHE_ENTRIES = int(os.environ.get('LEAVE_CALENDAR_CACHE_ENTRIES', '512'))
+MAX_WINDOW_DAYS = 366
+
+IN, PENDING, APPROVED = 0, 1, 2
+CODE_NAMES = {PENDING: 'Pending', APPROVED: 'Approved'}
+
+month_cache = QueryCache(max_entries=CALENDAR_CACHE_ENTRIES)
+
+# (year, month) -> version; bumped by writes touching that month
+_month_versions = defaultdict(int)
+_versions_lock = threading.Lock()
+
+
+def _as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def months_between(start_date, end_date):
+    """``(year, month)`` pairs covering ``[start_date, end_date]``"""
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    year, month = start_date.year, start_date.month
+    months = []
+    while (year, month) <= (end_date.year, end_date.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def month_bounds(year, month):
+    first = date(year, month, 1)
+    following = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return first, following - timedelta(days=1)
+
+
+def invalidate_months(start_date, end_date):
+    """Drop cached calendar months overlapping ``[start_date, end_date]``; call after committing"""
+    months = months_between(start_date, end_date)
+    with _versions_lock:
+        for month in months:
+            _month_versions[month] += 1
+
+
+def build_occupancy(emp_ids, leaves, first, last):
+    """Occupancy matrix for ``emp_ids`` over ``[first, last]``
+
+    ``leaves`` is a sequence of ``(emp_id, start_date, end_date, status)``
+    rows with ISO date strings; rows for other employees are ignored.
+    """
+    days = (last - first).days + 1
+    matrix = np.zeros((len(emp_ids), days), dtype=np.int8)
+    if not leaves or not emp_ids:
+        return matrix
+
+    owners, starts, ends, statuses = (np.asarray(column) for column in zip(*leaves))
+    # Map each leave to its matrix row
+    ids = np.asarray(emp_ids)
+    order = np.argsort(ids, kind='stable')
+    slots = np.searchsorted(ids[order], owners).clip(max=len(ids) - 1)
+    known = ids[order][slots] == owners
+    rows = order[slots]
+
+    origin = np.datetime64(first, 'D')
+    start_offsets = (starts.astype('datetime64[D]') - origin).astype(np.int64).clip(0, days - 1)
+    end_offsets = (ends.astype('datetime64[D]') - origin).astype(np.int64).clip(0, days - 1)
+
+    for code, status in ((PENDING, 'Pending'), (APPROVED, 'Approved')):
+        mask = known & (statuses == status)
+        if not mask.any():
+            continue
+        # +1 where a leave starts, -1 the day after it ends; cumsum = leaves covering the day
+        delta = np.zeros((len(emp_ids), days + 1), dtype=np.int32)
+        np.add.at(delta, (rows[mask], start_offsets[mask]), 1)
+        np.add.at(delta, (rows[mask], end_offsets[mask] + 1), -1)
+        covered = delta.cumsum(axis=1)[:, :days] > 0
+        matrix[covered] = code  # APPROVED is applied last and overrides PENDING
+    return matrix
+
+
+# Leave of one department overlapping a window, from ``leave_requests lr``
+MONTH_LEAVES = '''
+    SELECT lr.emp_id, lr.start_date, lr.end_date, lr.status
+    FROM employees e
+    JOIN leave_requests lr ON lr.emp_id = e.emp_id
+    WHERE e.department = ? AND lr.status IN ('Pending', 'Approved')
+      AND lr.end_date >= ? AND lr.start_date <= ?
+'''
+
+
+def _load_month(department, year, month):
+    first, last = month_bounds(year, month)
+    params = (department, first.isoformat(), last.isoformat())
+    with get_connection() as conn:
+        with read_snapshot(conn) as catalog:
+            employees = conn.execute('''
+                SELECT emp_id, name FROM employees WHERE department = ? ORDER BY name, emp_id
+            ''', (department,)).fetchall()
+            excluded, excluded_params = hot_exclusion(catalog)
+            leaves = conn.execute(''.join([MONTH_LEAVES, *(f' AND {clause}' for clause in excluded)]),
+                                  params + tuple(excluded_params)).fetchall()
+        for entry in routed_archives(catalog, first, last, CODE_NAMES.values()):
+            leaves += conn.execute(partition_sql(MONTH_LEAVES, attach_archive(conn, entry)), params).fetchall()
+    emp_ids = [row[0] for row in employees]
+    return {
+        'emp_ids': emp_ids,
+        'names': [row[1] for row in employees],
+        'matrix': build_occupancy(emp_ids, leaves, first, last),
+    }
+
+
+def get_month(department, year, month):
+    """Cached occupancy of one department for one calendar month"""
+    key = (department, year, month, _month_versions.get((year, month), 0))
+    hit, value = month_cache.get(key)
+    if hit:
+        return value
+    value = _load_month(department, year, month)
+    month_cache.put(key, value)
+    return value
+
+
+def _align(month, emp_ids):
+    """Month matrix with rows reordered to ``emp_ids`` (zeros for people it lacks)"""
+    if month['emp_ids'] == emp_ids:
+        return month['matrix']
+    position = {emp_id: index for index, emp_id in enumerate(month['emp_ids'])}
+    aligned = np.zeros((len(emp_ids), month['matrix'].shape[1]), dtype=np.int8)
+    for index, emp_id in enumerate(emp_ids):
+        if emp_id in position:
+            aligned[index] = month['matrix'][position[emp_id]]
+    return aligned
+
+
+def stripes(matrix):
+    """Runs of leave per row as arrays ``(rows, first_day, last_day, code)``"""
+    padded = np.pad(matrix, ((0, 0), (1, 1)))
+    rows, cols = np.nonzero(padded[:, 1:] != padded[:, :-1])
+    codes = padded[rows, cols + 1]
+    # Every row starts and ends at IN, so each run's closing change is the next change
+    opening = np.nonzero(codes != IN)[0]
+    return rows[opening], cols[opening], cols[opening + 1] - 1, codes[opening]
+
+
+def team_calendar(department, start_date, end_date):
+    """Occupancy of ``department`` over ``[start_date, end_date]``
+
+    Returns a dict with ``days`` (datetime64 array), ``emp_ids``, ``names``,
+    ``matrix`` (employees x days int8), ``out``/``approved_out``/
+    ``pending_out`` (per-day headcounts) and ``stripes`` (one list of
+    ``(first_day, last_day, status)`` per employee).
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    if end_date < start_date:
+        raise ValueError('end_date is before start_date')
+    if (end_date - start_date).days >= MAX_WINDOW_DAYS:
+        raise ValueError(f'Calendar window is limited to {MAX_WINDOW_DAYS} days')
+
+    months = [get_month(department, year, month)
+              for year, month in months_between(start_date, end_date)]
+    # The newest month defines who is on the team
+    emp_ids, names = months[-1]['emp_ids'], months[-1]['names']
+    matrix = np.hstack([_align(month, emp_ids) for month in months])
+    offset = start_date.day - 1
+    matrix = matrix[:, offset:offset + (end_date - start_date).days + 1]
+
+    days = np.arange(np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D') + 1)
+    person_stripes = [[] for _ in emp_ids]
+    for row, first, last, code in zip(*stripes(matrix)):
+        person_stripes[row].append((days[first].item(), days[last].item(), CODE_NAMES[int(code)]))
+    return {
+        'department': department,
+        'days': days,
+        'emp_ids': emp_ids,
+        'names': names,
+        'matrix': matrix,
+        'out': (matrix != IN).sum(axis=0),
+        'approved_out': (matrix == APPROVED).sum(axis=0),
+        'pending_out': (matrix == PENDING).sum(axis=0),
+        'stripes': person_stripes,
+    }
+
+
+def calendar_to_json(calendar):
+    """JSON-ready form of a :func:`team_calendar` result"""
+    return {
+        'department': calendar['department'],
+        'days': [str(day) for day in calendar['days']],
+        'out': calendar['out'].tolist(),
+        'approved_out': calendar['approved_out'].tolist(),
+        'pending_out': calendar['pending_out'].tolist(),
+        'people': [
+            {'emp_id': emp_id, 'name': name,
+             'stripes': [{'start': str(first), 'end': str(last), 'status': status}
+                         for first, last, status in person_stripes]}
+            for emp_id, name, person_stripes in zip(calendar['emp_ids'], calendar['names'],
+                                                    calendar['stripes'])
+        ],
+    }
+
+
+def invalidate_decided(results):
+    """:func:`invalidate_months` for every request a status batch actually updated"""
+    for result in results:
+        if result['result'] == 'updated':
+            invalidate_months(result['start_date'], result['end_date'])
+
+
+# Grid cell for each occupancy code
+CELL_SYMBOLS = np.array(['', '🟡', '🟢'])
+
+
+def calendar_frames(calendar):
+    """``(grid, headcount)`` DataFrames for display: people x days symbols and daily counts"""
+    import pandas as pd
+
+    labels = [day.strftime('%d %b') for day in calendar['days'].astype(object)]
+    grid = pd.DataFrame(CELL_SYMBOLS[calendar['matrix']], index=calendar['names'], columns=labels)
+    headcount = pd.DataFrame({'Approved': calendar['approved_out'],
+                              'Pending': calendar['pending_out']},
+                             index=pd.to_datetime(calendar['days']))
+    return grid, headcount
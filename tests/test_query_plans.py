@@ -0,0 +1,115 @@
+"""The hot queries keep using their indexes on a freshly migrated database.
+
+Builds the tables of each flavor in a temporary file, migrates them to the
+latest version and asserts that ``migrations.check_query_plans`` finds
+nothing, so a migration or query change that loses an index fails here.
+
+The leave request pages are checked as ``leave_queries.build_page_query``
+builds them, for each combination of filters, on a generated dataset large
+enough for the filters to be planned (see ``leave_queries.plan_filters``).
+
+Usage:
+    python -m pytest tests
+"""
+import itertools
+import os
+import sqlite3
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import configure_connection  # noqa: E402
+from datagen import build_dataset  # noqa: E402
+from hierarchy import top_manager  # noqa: E402
+from leave_queries import build_page_query, plan_filters  # noqa: E402
+from leave_service import LEAVE_REQUEST_SELECT  # noqa: E402
+from migrations import (HOT_QUERIES, LATEST_VERSION, check_query_plans, explain_query_plan,  # noqa: E402
+                        get_schema_version, run_migrations)
+from schema import APP, CANONICAL, LEAVE_MANAGEMENT, create_tables  # noqa: E402
+
+# Plan steps allowed although they scan or sort, and why
+KNOWN_SCANS = {
+    'SCAN e': 'a department filter reads the small employees table first, then its requests by index',
+    'USE TEMP B-TREE FOR ORDER BY': 'requests gathered per employee or by date span; the sorter keeps LIMIT rows',
+}
+# The newest-first walk of unwindowed pages; an old date window must not take it
+NEWEST_FIRST_WALK = 'SCAN lr USING INDEX idx_leave_requests_applied'
+# The dataset is generated as of 2026-01-01: requests start from 2023-01-01 to 2026-04-01
+WINDOWS = {
+    None: {},
+    'old': {'date_from': '2023-06-01', 'date_to': '2023-06-30'},
+    'recent': {'date_from': '2026-02-01', 'date_to': '2026-03-31'},
+}
+
+
+@pytest.fixture(params=[CANONICAL, LEAVE_MANAGEMENT, APP])
+def conn(request, tmp_path):
+    """A database created as ``request.param`` and migrated to the latest version"""
+    conn = configure_connection(sqlite3.connect(tmp_path / 'leave.db'))
+    create_tables(conn, request.param)
+    conn.commit()
+    run_migrations(conn)
+    yield conn
+    conn.close()
+
+
+def test_migrated_to_latest_version(conn):
+    assert get_schema_version(conn) == LATEST_VERSION
+
+
+def test_hot_queries_use_their_indexes(conn):
+    assert check_query_plans(conn) == []
+
+
+def test_lost_index_is_reported(conn):
+    name, _, _, index = HOT_QUERIES[0]
+    conn.execute(f'DROP INDEX {index}')
+    assert any(problem.startswith(f'{name}:') for problem in check_query_plans(conn))
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    """A generated database with 2000 employees and 40k requests"""
+    db_path = str(tmp_path_factory.mktemp('plans') / 'leave.db')
+    build_dataset(db_path, employees=2000, requests=40_000, today=date(2026, 1, 1))
+    conn = configure_connection(sqlite3.connect(db_path))
+    yield conn
+    conn.close()
+
+
+def _managers(conn):
+    """The managers with the fewest and the most reports, by team size"""
+    smallest = conn.execute('''
+        SELECT manager_id FROM reporting_lines WHERE depth > 0
+        GROUP BY manager_id ORDER BY COUNT(*), manager_id LIMIT 1
+    ''').fetchone()[0]
+    return {None: None, 'small': smallest, 'large': top_manager(conn)}
+
+
+@pytest.mark.parametrize('statuses, department, window, manager, employee', list(itertools.product(
+    [None, ['Pending'], ['Approved']], [None, 'Engineering'], list(WINDOWS),
+    [None, 'small', 'large'], [False, True])))
+def test_leave_pages_use_their_indexes(dataset, statuses, department, window, manager, employee):
+    filters = dict(statuses=statuses, department=department, manager_id=_managers(dataset)[manager],
+                   emp_id=1001 if employee else None, **WINDOWS[window])
+    filters = plan_filters(dataset, filters)
+    assert filters.get('large_team', False) == (manager == 'large')
+    sql, params = build_page_query(LEAVE_REQUEST_SELECT, 'request_id', **filters)
+    plan = explain_query_plan(dataset, sql, params)
+    text = ' | '.join(plan)
+    assert not any(detail in ('SCAN lr', 'SCAN leave_requests') for detail in plan), text
+    unexpected = [detail for detail in plan
+                  if (detail.startswith('SCAN') or 'TEMP B-TREE' in detail)
+                  and detail not in KNOWN_SCANS and detail != NEWEST_FIRST_WALK]
+    assert unexpected == [], text
+    if filters.get('old_window'):
+        assert any('idx_leave_requests_span' in detail for detail in plan), text
+        assert NEWEST_FIRST_WALK not in plan, text
+
+
+def test_old_windows_are_planned(dataset):
+    assert plan_filters(dataset, dict(WINDOWS['old']))['old_window']
+    assert not plan_filters(dataset, dict(WINDOWS['recent']))['old_window']
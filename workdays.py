@@ -0,0 +1,236 @@
+"""Working-day leave calculation with per-location holiday calendars.
+
+A leave request costs the number of working days it covers, not calendar
+days. Each employee has a ``location``; a location has a weekmask in
+``work_calendars`` (seven ``0``/``1`` characters, Monday first, defaulting to
+``LEAVE_WEEKMASK``) and its public holidays in ``holidays``. Holidays stored
+under location ``*`` apply to every location.
+
+Counting is done by ``numpy.busday_count`` against a ``busdaycalendar`` built
+once per database file, calendar version and location and cached, so a single
+request costs one cached lookup and one NumPy call. Triggers bump the one-row
+``calendar_version`` table in the transaction of every change to
+``work_calendars`` or ``holidays``, so a change made by any process (the CLI
+below, another front-end worker) makes earlier calendars unreachable. :func:`recompute_days` applies the same calendars to
+whole columns of stored requests at a time, which is how migration 4
+corrects the ``days`` of historical rows written with calendar-day counts.
+
+Manage calendars from the command line::
+
+    python workdays.py --weekmask Dubai 1111001
+    python workdays.py --import-holidays holidays.csv   # location,date,name rows
+    python workdays.py --recompute                      # after changing calendars
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+
+from cache import QueryCache
+from database import execute_script, main_file
+
+DEFAULT_LOCATION = os.environ.get('LEAVE_DEFAULT_LOCATION', 'default')
+DEFAULT_WEEKMASK = os.environ.get('LEAVE_WEEKMASK', '1111100')
+ALL_LOCATIONS = '*'
+RECOMPUTE_CHUNK = 200_000
+
+CALENDAR_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS work_calendars (
+           location TEXT PRIMARY KEY,
+           weekmask TEXT NOT NULL
+       )''',
+    '''CREATE TABLE IF NOT EXISTS holidays (
+           location TEXT NOT NULL,
+           holiday_date DATE NOT NULL,
+           name TEXT,
+           PRIMARY KEY (location, holiday_date)
+       ) WITHOUT ROWID''',
+)
+
+CALENDAR_VERSION_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS calendar_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO calendar_version (id, version) VALUES (1, 0);
+''' + ''.join(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_calendar_version_{table}_{event.lower()}
+    AFTER {event} ON {table}
+    BEGIN
+        UPDATE calendar_version SET version = version + 1 WHERE id = 1;
+    END;
+''' for table in ('work_calendars', 'holidays') for event in ('INSERT', 'UPDATE', 'DELETE'))
+
+calendar_cache = QueryCache(max_entries=256)
+
+
+def calendar_version(conn):
+    """Version of the calendars in ``conn``'s database; changes with every calendar write"""
+    return conn.execute('SELECT version FROM calendar_version WHERE id = 1').fetchone()[0]
+
+
+def get_calendar(conn, location):
+    """Cached ``numpy.busdaycalendar`` for ``location`` in ``conn``'s database"""
+    key = (main_file(conn), calendar_version(conn), location)
+    hit, calendar = calendar_cache.get(key)
+    if hit:
+        return calendar
+    row = conn.execute('SELECT weekmask FROM work_calendars WHERE location = ?', (location,)).fetchone()
+    holidays = [holiday for holiday, in conn.execute(
+        'SELECT holiday_date FROM holidays WHERE location IN (?, ?)', (location, ALL_LOCATIONS))]
+    calendar = np.busdaycalendar(weekmask=row[0] if row else DEFAULT_WEEKMASK,
+                                 holidays=np.array(holidays, dtype='datetime64[D]'))
+    calendar_cache.put(key, calendar)
+    return calendar
+
+
+def working_days(conn, location, start_date, end_date):
+    """Working days in ``[start_date, end_date]`` at ``location`` (0 if the range is empty)"""
+    begin = np.datetime64(str(start_date)[:10], 'D')
+    end = np.datetime64(str(end_date)[:10], 'D') + 1
+    return max(int(np.busday_count(begin, end, busdaycal=get_calendar(conn, location))), 0)
+
+
+def employee_location(conn, emp_id):
+    row = conn.execute('SELECT location FROM employees WHERE emp_id = ?', (emp_id,)).fetchone()
+    return row[0] if row else DEFAULT_LOCATION
+
+
+def set_weekmask(conn, location, weekmask):
+    """Set the working week of ``location``, e.g. ``'1111100'`` for Monday to Friday"""
+    np.busdaycalendar(weekmask=weekmask)  # raises ValueError for an invalid mask
+    conn.execute('''INSERT INTO work_calendars (location, weekmask) VALUES (?, ?)
+                    ON CONFLICT (location) DO UPDATE SET weekmask = excluded.weekmask''',
+                 (location, weekmask))
+
+
+def add_holidays(conn, rows):
+    """Insert or rename ``(location, date, name)`` holidays; returns the number of rows"""
+    rows = [(location, str(holiday)[:10], name) for location, holiday, name in rows]
+    conn.executemany('''INSERT INTO holidays (location, holiday_date, name) VALUES (?, ?, ?)
+                        ON CONFLICT (location, holiday_date) DO UPDATE SET name = excluded.name''',
+                     rows)
+    return len(rows)
+
+
+def recompute_days(conn, year_start=None, chunk_size=RECOMPUTE_CHUNK):
+    """Rewrite ``leave_requests.days`` as working days; returns ``(rows, changed)``
+
+    Reads requests in ``rowid`` order, ``chunk_size`` at a time, and counts
+    each chunk with one ``busday_count`` call per location. Only rows whose
+    count changes are written. ``used_leaves`` holds the current leave year's
+    approved days, so it is adjusted by the change of approved requests
+    starting on or after ``year_start`` (default: 1 January of this year).
+    Runs in the caller's transaction.
+    """
+    year_start = np.datetime64(year_start or date(date.today().year, 1, 1), 'D')
+    used_delta = defaultdict(int)
+    last_rowid, total, changed_total = 0, 0, 0
+    while True:
+        rows = conn.execute(f'''
+            SELECT lr.rowid, lr.emp_id, COALESCE(e.location, '{DEFAULT_LOCATION}'),
+                   substr(lr.start_date, 1, 10), substr(lr.end_date, 1, 10), lr.days, lr.status
+            FROM leave_requests lr
+            LEFT JOIN employees e ON e.emp_id = lr.emp_id
+            WHERE lr.rowid > ?
+            ORDER BY lr.rowid
+            LIMIT ?
+        ''', (last_rowid, chunk_size)).fetchall()
+        if not rows:
+            break
+        rowids, emp_ids, locations, starts, ends, old_days, statuses = zip(*rows)
+        last_rowid = rowids[-1]
+        total += len(rows)
+
+        starts = np.array(starts, dtype='datetime64[D]')
+        ends = np.array(ends, dtype='datetime64[D]') + 1
+        locations = np.array(locations, dtype=object)
+        new_days = np.zeros(len(rows), dtype=np.int64)
+        for location in set(locations):
+            mask = locations == location
+            new_days[mask] = np.busday_count(starts[mask], ends[mask],
+                                             busdaycal=get_calendar(conn, location))
+        np.maximum(new_days, 0, out=new_days)
+        old_days = np.array(old_days, dtype=np.int64)
+
+        changed = np.nonzero(new_days != old_days)[0]
+        changed_total += len(changed)
+        conn.executemany('UPDATE leave_requests SET days = ? WHERE rowid = ?',
+                         ((int(new_days[i]), rowids[i]) for i in changed))
+        statuses = np.array(statuses, dtype=object)
+        counted = changed[(statuses[changed] == 'Approved') & (starts[changed] >= year_start)]
+        for i in counted:
+            used_delta[emp_ids[i]] += int(new_days[i] - old_days[i])
+
+    conn.executemany('UPDATE employees SET used_leaves = MAX(used_leaves + ?, 0) WHERE emp_id = ?',
+                     [(delta, emp_id) for emp_id, delta in used_delta.items() if delta])
+    return total, changed_total
+
+
+def install_work_calendars(conn):
+    """Calendar tables, ``employees.location`` and working-day ``days`` for existing rows"""
+    for statement in CALENDAR_SCHEMA:
+        conn.execute(statement)
+    install_calendar_version(conn)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(employees)')}
+    if 'location' not in columns:
+        conn.execute(f"ALTER TABLE employees ADD COLUMN location TEXT NOT NULL DEFAULT '{DEFAULT_LOCATION}'")
+    recompute_days(conn)
+
+
+def install_calendar_version(conn):
+    """The ``calendar_version`` row and the triggers that bump it"""
+    execute_script(conn, CALENDAR_VERSION_SCHEMA)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage working-day calendars')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--weekmask', nargs=2, metavar=('LOCATION', 'MASK'),
+                        help='set the working week of a location, Monday first (e.g. 1111100)')
+    parser.add_argument('--import-holidays', metavar='FILE',
+                        help='load location,date,name rows (with header); location * means everywhere')
+    parser.add_argument('--recompute', action='store_true',
+                        help='recount days of every stored request with the current calendars')
+    args = parser.parse_args()
+
+    from database import DB_PATH, configure_connection
+    from migrations import run_migrations
+
+    conn = configure_connection(sqlite3.connect(args.db or DB_PATH))
+    try:
+        run_migrations(conn)
+        with conn:
+            if args.weekmask:
+                try:
+                    set_weekmask(conn, *args.weekmask)
+                except ValueError as e:
+                    parser.error(str(e))
+                print(f'{args.weekmask[0]}: weekmask {args.weekmask[1]}')
+            if args.import_holidays:
+                with open(args.import_holidays, newline='') as handle:
+                    rows = [(row['location'], row['date'], row.get('name')) for row in csv.DictReader(handle)]
+                print(f'{add_holidays(conn, rows)} holidays imported')
+        if args.recompute:
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows, changed = recompute_days(conn)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            elapsed = time.perf_counter() - started
+            print(f'{changed:,} of {rows:,} requests changed in {elapsed:.2f}s '
+                  f'({rows / max(elapsed, 1e-9):,.0f} rows/s)')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
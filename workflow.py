@@ -0,0 +1,521 @@
+"""Multi-level approval chains: who has to approve a request, and in what order.
+
+Rules in ``approval_rules`` pick a chain for each new request from its leave
+type and length (the first matching rule by ``priority`` wins), and
+``approval_chain`` lists the chain's stages in order. The ``manager`` stage
+is the requester's direct manager (see ``hierarchy``); any other stage is a
+group of approvers listed in ``approval_groups`` (e.g. ``hr``). By default
+Maternity/Paternity Leave and anything over ``LONG_LEAVE_DAYS`` days goes to
+the manager and then HR, everything else to the manager only.
+
+The chain is evaluated once, when the request is submitted: a trigger stores
+its current step in ``approval_workflow``, one row per in-flight request
+with its ``assignee`` (the manager's id, or the group name), so nothing is
+re-evaluated on read. An approver's inbox is one query over the
+``(assignee, entered_at)`` index: a merge of their own range and one range
+per group they belong to, oldest first. Stages nobody can fill (no manager)
+are skipped; a request with nobody in its chain goes to ``FALLBACK_STAGE``.
+
+:func:`decide_steps` applies a batch of decisions in the caller's write
+transaction: approving at a step with a next approver moves the request
+there (``forwarded``), approving at the last step or rejecting at any step
+decides it through ``batch_updates.decide_batch``. Besides the assignee,
+anyone above the requester in the reporting line may act on a manager step.
+Each step taken is recorded in ``approval_history``. Manage rules and
+groups with::
+
+    python workflow.py --rules                              # list the rules
+    python workflow.py --add-rule manager,hr --leave-type "Annual Leave" --min-days 10
+    python workflow.py --add-approver hr 1007               # 1007 approves the hr stage
+    python workflow.py --status                             # in-flight requests per stage
+"""
+import argparse
+import os
+import sqlite3
+from collections import defaultdict
+
+import database
+from batch_updates import (CHUNK_SIZE, CONFLICT, DECISION_STATUSES, FORBIDDEN, FORWARDED, UPDATED,
+                           decide_batch)
+from database import configure_connection, execute_script
+from hierarchy import reports_among, top_manager
+from leave_queries import PAGE_SIZE
+from schema import APP, LEAVE_MANAGEMENT, REQUEST_ID_COLUMN, detect_flavor
+from storage import employee_key
+
+MANAGER_STAGE = 'manager'
+HR_STAGE = 'hr'
+# Requests over this many days need HR approval after the manager's (default rules)
+LONG_LEAVE_DAYS = int(os.environ.get('LEAVE_LONG_LEAVE_DAYS', '5'))
+# Who decides requests whose chain has nobody in it (e.g. the top manager's own requests)
+FALLBACK_STAGE = os.environ.get('LEAVE_APPROVAL_FALLBACK', HR_STAGE)
+
+# (priority, leave_type, min_days, stages) installed when there are no rules yet
+DEFAULT_RULES = [
+    (10, 'Maternity Leave', None, (MANAGER_STAGE, HR_STAGE)),
+    (10, 'Paternity Leave', None, (MANAGER_STAGE, HR_STAGE)),
+    (20, None, LONG_LEAVE_DAYS + 1, (MANAGER_STAGE, HR_STAGE)),
+    (100, None, None, (MANAGER_STAGE,)),
+]
+
+WORKFLOW_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS approval_rules (
+        rule_id INTEGER PRIMARY KEY,
+        priority INTEGER NOT NULL,
+        leave_type TEXT,            -- NULL matches any type
+        min_days INTEGER            -- NULL matches any length
+    );
+
+    CREATE TABLE IF NOT EXISTS approval_chain (
+        rule_id INTEGER NOT NULL REFERENCES approval_rules (rule_id),
+        step INTEGER NOT NULL,
+        stage TEXT NOT NULL,
+        PRIMARY KEY (rule_id, step)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS approval_groups (
+        stage TEXT NOT NULL,
+        emp_id {emp_id_type} NOT NULL,
+        PRIMARY KEY (stage, emp_id)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_approval_groups_emp ON approval_groups (emp_id);
+
+    -- The current step of every in-flight (Pending) request. The assignee is the
+    -- manager's emp_id for the manager stage and the stage name otherwise
+    CREATE TABLE IF NOT EXISTS approval_workflow (
+        request_id INTEGER PRIMARY KEY,
+        emp_id {emp_id_type} NOT NULL,
+        rule_id INTEGER NOT NULL,
+        step INTEGER NOT NULL,
+        stage TEXT NOT NULL,
+        assignee NOT NULL,
+        entered_at TEXT NOT NULL
+    );
+
+    -- Inboxes, oldest first. emp_id keeps counts that leave out the approver index-only
+    CREATE INDEX IF NOT EXISTS idx_approval_workflow_inbox
+        ON approval_workflow (assignee, entered_at, request_id, emp_id);
+    CREATE INDEX IF NOT EXISTS idx_approval_workflow_emp ON approval_workflow (emp_id);
+
+    CREATE TABLE IF NOT EXISTS approval_history (
+        request_id INTEGER NOT NULL,
+        step INTEGER NOT NULL,
+        stage TEXT NOT NULL,
+        approver_id {emp_id_type} NOT NULL,
+        decision TEXT NOT NULL,
+        decided_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_approval_history_request ON approval_history (request_id);
+
+    CREATE TRIGGER IF NOT EXISTS trg_approval_workflow_insert
+    AFTER INSERT ON leave_requests
+    WHEN NEW.status = 'Pending'
+    BEGIN
+        {start_new}
+    END;
+
+    -- Decided (by the last step, or any other way) or withdrawn: out of every inbox
+    CREATE TRIGGER IF NOT EXISTS trg_approval_workflow_decided
+    AFTER UPDATE OF status ON leave_requests
+    WHEN OLD.status = 'Pending' AND NEW.status != 'Pending'
+    BEGIN
+        DELETE FROM approval_workflow WHERE request_id = NEW.{id_column};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_approval_workflow_delete
+    AFTER DELETE ON leave_requests
+    WHEN OLD.status = 'Pending'
+    BEGIN
+        DELETE FROM approval_workflow WHERE request_id = OLD.{id_column};
+    END;
+
+    -- Requests waiting for a manager follow the employee to their new manager
+    CREATE TRIGGER IF NOT EXISTS trg_approval_workflow_manager
+    AFTER UPDATE OF manager_id ON employees
+    WHEN OLD.manager_id IS NOT NEW.manager_id
+    BEGIN
+        UPDATE approval_workflow SET assignee = COALESCE(NEW.manager_id, '{fallback}')
+        WHERE emp_id = NEW.emp_id AND stage = '{manager}';
+    END;
+'''
+
+# First step of each matching request's chain that has someone to fill it
+# (SQLite takes the bare columns from the row with MIN(step)), then the
+# fallback stage for requests left without one
+START_WORKFLOW = '''
+    INSERT INTO approval_workflow (request_id, emp_id, rule_id, step, stage, assignee, entered_at)
+    SELECT lr.{id_column}, lr.emp_id, c.rule_id, MIN(c.step), c.stage,
+           CASE c.stage WHEN '{manager}' THEN e.manager_id ELSE c.stage END,
+           COALESCE(lr.applied_date, CURRENT_TIMESTAMP)
+    FROM leave_requests lr
+    JOIN employees e ON e.emp_id = lr.emp_id
+    JOIN approval_chain c ON c.rule_id = (
+        SELECT r.rule_id FROM approval_rules r
+        WHERE (r.leave_type IS NULL OR r.leave_type = lr.leave_type)
+          AND (r.min_days IS NULL OR lr.days >= r.min_days)
+        ORDER BY r.priority, r.rule_id LIMIT 1)
+    WHERE {where} AND (c.stage != '{manager}' OR e.manager_id IS NOT NULL)
+    GROUP BY lr.{id_column};
+    INSERT OR IGNORE INTO approval_workflow (request_id, emp_id, rule_id, step, stage, assignee, entered_at)
+    SELECT lr.{id_column}, lr.emp_id, 0, 0, '{fallback}', '{fallback}', COALESCE(lr.applied_date, CURRENT_TIMESTAMP)
+    FROM leave_requests lr
+    WHERE {where};
+'''
+
+# One assignee's part of an inbox, in index order
+INBOX_RANGE = '''
+    SELECT w.entered_at, w.request_id AS {id_column}, w.stage, {columns}
+    FROM approval_workflow w
+    JOIN leave_requests lr ON lr.{id_column} = w.request_id
+    JOIN employees e ON e.emp_id = w.emp_id
+    WHERE w.assignee = ? AND w.emp_id != ?{filters}
+'''
+
+
+def _id_column(conn):
+    return REQUEST_ID_COLUMN[detect_flavor(conn) or LEAVE_MANAGEMENT]
+
+
+def _start_workflow(id_column, where):
+    return START_WORKFLOW.format(id_column=id_column, where=where, manager=MANAGER_STAGE,
+                                 fallback=FALLBACK_STAGE)
+
+
+def install_workflow(conn):
+    """Create the workflow tables and triggers, the default rules and HR group, and start pending requests"""
+    id_column = _id_column(conn)
+    emp_id_type = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(employees)')}['emp_id']
+    start_new = _start_workflow(id_column, f'lr.{id_column} = NEW.{id_column}')
+    execute_script(conn, WORKFLOW_SCHEMA.format(
+        emp_id_type=emp_id_type, id_column=id_column, start_new=start_new,
+        manager=MANAGER_STAGE, fallback=FALLBACK_STAGE))
+    if conn.execute('SELECT 1 FROM approval_rules LIMIT 1').fetchone() is None:
+        for priority, leave_type, min_days, stages in DEFAULT_RULES:
+            add_rule(conn, stages, leave_type, min_days, priority)
+    if conn.execute('SELECT 1 FROM approval_groups WHERE stage = ? LIMIT 1', (HR_STAGE,)).fetchone() is None:
+        assign_default_approvers(conn)
+    conn.execute('DELETE FROM approval_workflow')
+    execute_script(conn, _start_workflow(id_column, "lr.status = 'Pending'"))
+    conn.execute('ANALYZE approval_workflow')
+
+
+def assign_default_approvers(conn):
+    """Put the HR department's managers in the ``hr`` group (anyone in HR for the ``app.py`` schema)
+
+    Without anyone in HR, the top of the reporting lines approves the HR stage.
+    """
+    is_hr = "department = 'HR'" if detect_flavor(conn) == APP else "department = 'HR' AND role = 'Manager'"
+    added = conn.execute(f'''
+        INSERT OR IGNORE INTO approval_groups (stage, emp_id) SELECT ?, emp_id FROM employees WHERE {is_hr}
+    ''', (HR_STAGE,)).rowcount
+    if not added and top_manager(conn) is not None:
+        add_approver(conn, HR_STAGE, top_manager(conn))
+
+
+def add_rule(conn, stages, leave_type=None, min_days=None, priority=None):
+    """Add a rule sending matching new requests through ``stages`` in order; returns its id
+
+    Without a ``priority`` the rule goes before the catch-all rules (no
+    leave type and no length). Requests already in flight keep their chain.
+    """
+    stages = [stage.strip() for stage in stages if stage.strip()]
+    if not stages:
+        raise ValueError('An approval chain needs at least one stage')
+    if priority is None:
+        priority = conn.execute('''
+            SELECT COALESCE(MIN(priority), 100) - 1 FROM approval_rules
+            WHERE leave_type IS NULL AND min_days IS NULL
+        ''').fetchone()[0]
+    rule_id = conn.execute('INSERT INTO approval_rules (priority, leave_type, min_days) VALUES (?, ?, ?)',
+                           (priority, leave_type, min_days)).lastrowid
+    conn.executemany('INSERT INTO approval_chain (rule_id, step, stage) VALUES (?, ?, ?)',
+                     [(rule_id, step, stage) for step, stage in enumerate(stages)])
+    return rule_id
+
+
+def remove_rule(conn, rule_id):
+    """Delete a rule that no in-flight request is following"""
+    if conn.execute('SELECT 1 FROM approval_workflow WHERE rule_id = ? LIMIT 1', (rule_id,)).fetchone():
+        raise ValueError(f'Rule {rule_id} still has requests in flight')
+    conn.execute('DELETE FROM approval_chain WHERE rule_id = ?', (rule_id,))
+    if conn.execute('DELETE FROM approval_rules WHERE rule_id = ?', (rule_id,)).rowcount != 1:
+        raise ValueError(f'Unknown rule {rule_id}')
+
+
+def list_rules(conn):
+    """``(rule_id, priority, leave_type, min_days, stages)`` in the order they are tried"""
+    chains = load_chains(conn)
+    return [(rule_id, priority, leave_type, min_days, [stage for _, stage in chains.get(rule_id, [])])
+            for rule_id, priority, leave_type, min_days in conn.execute('''
+                SELECT rule_id, priority, leave_type, min_days FROM approval_rules ORDER BY priority, rule_id
+            ''')]
+
+
+def load_chains(conn):
+    """Map rule id -> ``[(step, stage), ...]`` in order"""
+    chains = defaultdict(list)
+    for rule_id, step, stage in conn.execute('SELECT rule_id, step, stage FROM approval_chain ORDER BY rule_id, step'):
+        chains[rule_id].append((step, stage))
+    return dict(chains)
+
+
+def add_approver(conn, stage, emp_id):
+    """Let ``emp_id`` approve the ``stage`` step of any request"""
+    if stage == MANAGER_STAGE:
+        raise ValueError('The manager stage follows reporting lines')
+    if conn.execute('SELECT 1 FROM employees WHERE emp_id = ?', (emp_id,)).fetchone() is None:
+        raise ValueError(f'Unknown employee {emp_id}')
+    conn.execute('INSERT OR IGNORE INTO approval_groups (stage, emp_id) VALUES (?, ?)', (stage, emp_id))
+
+
+def remove_approver(conn, stage, emp_id):
+    conn.execute('DELETE FROM approval_groups WHERE stage = ? AND emp_id = ?', (stage, emp_id))
+
+
+def approver_stages(conn, emp_id):
+    """The group stages ``emp_id`` approves"""
+    return [row[0] for row in conn.execute('SELECT stage FROM approval_groups WHERE emp_id = ? ORDER BY stage',
+                                           (emp_id,))]
+
+
+def inbox_keys(conn, emp_id):
+    """The ``assignee`` values of ``emp_id``'s inbox: themselves and their groups"""
+    return [emp_id, *approver_stages(conn, emp_id)]
+
+
+def build_inbox_query(columns, id_column, keys, approver_id, cursor=None, page_size=PAGE_SIZE, department=None):
+    """Return ``(sql, params)`` for one page of the inbox, fetching one extra row to detect the next page
+
+    Each key's range is read in index order and the ranges are merged, so a
+    page costs the same however many requests are waiting.
+    """
+    clauses, filter_params = [], []
+    if cursor is not None:
+        clauses.append('(w.entered_at, w.request_id) > (?, ?)')
+        filter_params.extend(cursor)
+    if department is not None:
+        clauses.append('e.department = ?')
+        filter_params.append(department)
+    filters = ''.join(f' AND {clause}' for clause in clauses)
+    ranges, params = [], []
+    for key in keys:
+        ranges.append(INBOX_RANGE.format(id_column=id_column, columns=columns, filters=filters))
+        params.extend([key, approver_id, *filter_params])
+    sql = f"{' UNION ALL '.join(ranges)} ORDER BY entered_at, {id_column} LIMIT ?"
+    return sql, params + [page_size + 1]
+
+
+def fetch_inbox(conn, columns, id_column, approver_id, cursor=None, page_size=PAGE_SIZE, department=None):
+    """One page of the requests waiting for ``approver_id``, oldest first
+
+    ``columns`` are the ``lr``/``e`` columns to return besides ``entered_at``,
+    the request id and ``stage``. Returns ``(list of dicts, next_cursor)``
+    like ``leave_queries.fetch_leave_records``; the approver's own requests
+    are left out.
+    """
+    sql, params = build_inbox_query(columns, id_column, inbox_keys(conn, approver_id), approver_id,
+                                    cursor, page_size, department)
+    result = conn.execute(sql, params)
+    names = [description[0] for description in result.description]
+    records = [dict(zip(names, row)) for row in result]
+
+    next_cursor = None
+    if len(records) > page_size:
+        del records[page_size:]
+        next_cursor = (records[-1]['entered_at'], records[-1][id_column])
+    return records, next_cursor
+
+
+def count_inbox(conn, approver_id, department=None):
+    """Number of requests waiting for ``approver_id`` (served from the inbox index)"""
+    keys = inbox_keys(conn, approver_id)
+    join, params = '', [*keys, approver_id]
+    where = f"w.assignee IN ({', '.join('?' * len(keys))}) AND w.emp_id != ?"
+    if department is not None:
+        join = 'JOIN employees e ON e.emp_id = w.emp_id'
+        where += ' AND e.department = ?'
+        params.append(department)
+    return conn.execute(f'SELECT COUNT(*) FROM approval_workflow w {join} WHERE {where}', params).fetchone()[0]
+
+
+def _load_steps(conn, request_ids):
+    """Map request id -> (emp_id, rule_id, step, stage, assignee, manager_id) for in-flight requests"""
+    found = {}
+    request_ids = list(request_ids)
+    for start in range(0, len(request_ids), CHUNK_SIZE):
+        chunk = request_ids[start:start + CHUNK_SIZE]
+        rows = conn.execute(f'''
+            SELECT w.request_id, w.emp_id, w.rule_id, w.step, w.stage, w.assignee, e.manager_id
+            FROM approval_workflow w JOIN employees e ON e.emp_id = w.emp_id
+            WHERE w.request_id IN ({', '.join('?' * len(chunk))})
+        ''', chunk)
+        for request_id, *fields in rows:
+            found[request_id] = tuple(fields)
+    return found
+
+
+def next_step(chain, step, manager_id):
+    """``(step, stage, assignee)`` after ``step`` in ``chain``, skipping stages nobody fills; ``None`` at the end"""
+    for later, stage in chain:
+        if later <= step:
+            continue
+        if stage != MANAGER_STAGE:
+            return later, stage, stage
+        if manager_id is not None:
+            return later, stage, manager_id
+    return None
+
+
+def decide_steps(conn, decisions, approver_id, id_column='request_id', unrestricted=False):
+    """Act on ``(request_id, status)`` decisions at each request's current step
+
+    Runs inside the caller's write transaction. Returns one dict per decision
+    in input order, like ``batch_updates.decide_batch``, with ``forwarded``
+    (and the next stage in ``detail``) for approvals that moved a request on
+    to its next approver. A step the approver is not assigned to is
+    ``forbidden`` unless ``unrestricted`` (the ``app.py`` admin); nobody
+    decides their own request.
+    """
+    decisions = [(int(request_id), status) for request_id, status in decisions]
+    steps = _load_steps(conn, {request_id for request_id, _ in decisions})
+    stages = set(approver_stages(conn, approver_id))
+    reports = set() if unrestricted else reports_among(
+        conn, approver_id, {fields[0] for fields in steps.values() if fields[3] == MANAGER_STAGE}, CHUNK_SIZE)
+    chains = load_chains(conn)
+
+    results = [None] * len(decisions)
+    finals, final_positions = [], []
+    forwards, history = [], {}
+    for position, (request_id, status) in enumerate(decisions):
+        if status not in DECISION_STATUSES or request_id not in steps:
+            # Invalid, unknown or no longer pending: decide_batch says which
+            finals.append((request_id, status))
+            final_positions.append(position)
+            continue
+        result = {'request_id': request_id, 'status': status, 'result': UPDATED, 'detail': ''}
+        results[position] = result
+        if request_id in history:
+            result.update(result=CONFLICT, detail='Decided earlier in this batch')
+            continue
+        emp_id, rule_id, step, stage, assignee, manager_id = steps[request_id]
+        if emp_id == approver_id:
+            result.update(result=FORBIDDEN, detail='You cannot decide your own request')
+            continue
+        allowed = (unrestricted or assignee == approver_id or assignee in stages
+                   or (stage == MANAGER_STAGE and emp_id in reports))
+        if not allowed:
+            result.update(result=FORBIDDEN, detail=f'Waiting for {stage} approval')
+            continue
+        history[request_id] = (request_id, step, stage, approver_id, status)
+        following = next_step(chains.get(rule_id, []), step, manager_id) if status == 'Approved' else None
+        if following is None:
+            finals.append((request_id, status))
+            final_positions.append(position)
+        else:
+            forwards.append((*following, request_id))
+            result.update(result=FORWARDED, detail=f'Forwarded to {following[1]}')
+
+    for position, result in zip(final_positions, decide_batch(conn, finals, approver_id, id_column)):
+        results[position] = result
+    conn.executemany('''
+        UPDATE approval_workflow SET step = ?, stage = ?, assignee = ?, entered_at = CURRENT_TIMESTAMP
+        WHERE request_id = ?
+    ''', forwards)
+    conn.executemany('''
+        INSERT INTO approval_history (request_id, step, stage, approver_id, decision) VALUES (?, ?, ?, ?, ?)
+    ''', [history[result['request_id']] for result in results
+          if result['result'] in (UPDATED, FORWARDED) and result['request_id'] in history])
+    return results
+
+
+def approval_history(conn, request_id):
+    """Steps taken on a request as ``(step, stage, approver_id, decision, decided_at)``, in order"""
+    return conn.execute('''
+        SELECT step, stage, approver_id, decision, decided_at FROM approval_history
+        WHERE request_id = ? ORDER BY decided_at, rowid
+    ''', (request_id,)).fetchall()
+
+
+def workflow_counts(conn):
+    """In-flight requests per stage, e.g. ``{'manager': 812, 'hr': 95}``"""
+    return dict(conn.execute('SELECT stage, COUNT(*) FROM approval_workflow GROUP BY stage ORDER BY stage'))
+
+
+def check_workflow(conn):
+    """Requests whose workflow row disagrees with their status, as ``(request_id, problem)``"""
+    id_column = _id_column(conn)
+    problems = [(row[0], 'pending without a workflow step') for row in conn.execute(f'''
+        SELECT lr.{id_column} FROM leave_requests lr
+        WHERE lr.status = 'Pending'
+          AND NOT EXISTS (SELECT 1 FROM approval_workflow w WHERE w.request_id = lr.{id_column})
+    ''')]
+    problems += [(request_id, f'workflow step for a {status or "missing"} request') for request_id, status in
+                 conn.execute(f'''
+        SELECT w.request_id, lr.status FROM approval_workflow w
+        LEFT JOIN leave_requests lr ON lr.{id_column} = w.request_id
+        WHERE lr.status IS NOT 'Pending'
+    ''')]
+    return sorted(problems)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or change approval chains')
+    parser.add_argument('--db', help='database file (defaults to LEAVE_DB_PATH)')
+    parser.add_argument('--rules', action='store_true', help='list the rules, in the order they are tried')
+    parser.add_argument('--add-rule', metavar='STAGES', help="comma-separated stages, e.g. 'manager,hr'")
+    parser.add_argument('--leave-type', help='with --add-rule: only this leave type')
+    parser.add_argument('--min-days', type=int, help='with --add-rule: only requests of at least this many days')
+    parser.add_argument('--priority', type=int, help='with --add-rule: lower is tried first')
+    parser.add_argument('--remove-rule', type=int, metavar='RULE_ID')
+    parser.add_argument('--add-approver', nargs=2, metavar=('STAGE', 'EMP_ID'))
+    parser.add_argument('--remove-approver', nargs=2, metavar=('STAGE', 'EMP_ID'))
+    parser.add_argument('--status', action='store_true', help='in-flight requests per stage and approvers per group')
+    parser.add_argument('--check', action='store_true', help='compare workflow steps with request statuses')
+    args = parser.parse_args()
+
+    conn = configure_connection(sqlite3.connect(args.db or database.DB_PATH))
+    try:
+        changes = [args.add_rule, args.remove_rule, args.add_approver, args.remove_approver]
+        if any(change is not None for change in changes):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if args.add_rule:
+                    rule_id = add_rule(conn, args.add_rule.split(','), args.leave_type, args.min_days, args.priority)
+                    print(f'Added rule {rule_id}')
+                if args.remove_rule is not None:
+                    remove_rule(conn, args.remove_rule)
+                    print(f'Removed rule {args.remove_rule}')
+                if args.add_approver:
+                    add_approver(conn, args.add_approver[0], employee_key(args.add_approver[1]))
+                if args.remove_approver:
+                    remove_approver(conn, args.remove_approver[0], employee_key(args.remove_approver[1]))
+                conn.commit()
+            except (ValueError, sqlite3.IntegrityError) as e:
+                conn.rollback()
+                parser.error(str(e))
+        if args.rules:
+            for rule_id, priority, leave_type, min_days, stages in list_rules(conn):
+                print(f"{rule_id:>4} priority {priority:>4}  {leave_type or 'any type':<16} "
+                      f"{f'>= {min_days} days' if min_days else 'any length':<13} {' -> '.join(stages)}")
+        if args.status:
+            for stage, count in workflow_counts(conn).items():
+                print(f'{stage:<12} {count:>8,} in flight')
+            for stage, members in conn.execute('''
+                SELECT stage, GROUP_CONCAT(emp_id, ', ') FROM approval_groups GROUP BY stage ORDER BY stage
+            '''):
+                print(f'{stage} approvers: {members}')
+        if args.check:
+            problems = check_workflow(conn)
+            for request_id, problem in problems[:50]:
+                print(f'{request_id}: {problem}')
+            print(f'{len(problems)} requests with a workflow step that disagrees with their status')
+            if problems:
+                raise SystemExit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()